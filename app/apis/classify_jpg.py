@@ -0,0 +1,30 @@
+import pathlib
+
+from fastapi import APIRouter
+
+from app.workers.classify_jpg.schemas import ClassifyRequest, CleanDataResponse
+from app.workers.scheduler import run_worker_async
+
+router = APIRouter(
+    prefix="/classify_jpg",
+)
+
+
+@router.post("/classify", response_model=CleanDataResponse)
+async def classify(request: ClassifyRequest):
+    try:
+        # 经调度器执行：复制到 output_dir 前拿到路径锁，与其它工作流的移动互斥
+        summary = await run_worker_async(
+            "classify_directory",
+            source_dir=pathlib.Path(request.source_directory),
+            output_dir=pathlib.Path(request.output_directory),
+            model_spec=request.model,
+            dry_run=request.dry_run
+        )
+    except (NotADirectoryError, ValueError) as e:
+        return CleanDataResponse(status="error", message=str(e), summary={})
+
+    message = f"已完成 {len(summary['labels'])} 个文件的分类。"
+    if not request.dry_run:
+        message += f" 文件已按标签复制到{request.output_directory}."
+    return CleanDataResponse(status="success", message=message, summary=summary)
@@ -0,0 +1,58 @@
+from fastapi import APIRouter
+
+from app.apis.schemas import ClusterRunRequest, ShardRequest, StatusResponse
+from app.core.cluster import configured_nodes, run_sharded, shard_kwargs
+from app.core.sharding import Shard
+from app.workers.scheduler import current_priority, run_worker
+
+router = APIRouter(
+    prefix="/cluster",
+)
+
+
+@router.post("/shard", response_model=StatusResponse)
+def run_shard(request: ShardRequest):
+    """工作节点：只处理属于本分片的文件，由协调节点调用。"""
+    if request.index >= request.count:
+        return StatusResponse(status="error", message=f"分片序号 {request.index} 超出分片总数 {request.count}。")
+    try:
+        kwargs = shard_kwargs(request.worker, request.params)
+    except ValueError as e:
+        return StatusResponse(status="error", message=str(e))
+    if not kwargs["source_dir"].is_dir():
+        return StatusResponse(status="error", message=f"源文件夹 '{kwargs['source_dir']}' 不存在或不是一个有效的文件夹。")
+
+    try:
+        result = run_worker(request.worker, **kwargs, shard=Shard(request.index, request.count, request.strategy))
+    except (NotADirectoryError, TypeError) as e:
+        return StatusResponse(status="error", message=str(e))
+    return StatusResponse(message=f"分片 {request.index + 1}/{request.count} 执行完成。", details=result)
+
+
+@router.post("/run", response_model=StatusResponse)
+def run_cluster(request: ClusterRunRequest):
+    """协调节点：把 worker 的输入分片发给各工作节点，失败的分片换节点重试，最后合并统计和执行计划。"""
+    nodes = [node.rstrip("/") for node in request.nodes] if request.nodes else configured_nodes()
+    if not nodes:
+        return StatusResponse(status="error", message="未配置工作节点：请在请求中提供 nodes 或设置环境变量 CLUSTER_NODES。")
+    try:
+        shard_kwargs(request.worker, request.params)
+    except ValueError as e:
+        return StatusResponse(status="error", message=str(e))
+
+    # 本次请求的优先级一并转发给各工作节点的调度器
+    try:
+        report = run_sharded(request.worker, request.params, nodes, request.shards, request.strategy,
+                             request.retries, request.timeout, headers={"X-Priority": str(current_priority.get())})
+    except RuntimeError as e:
+        return StatusResponse(status="error", message=str(e))
+    if report["failed_shards"]:
+        message = f"{len(report['failed_shards'])}/{report['shards']} 个分片重试后仍失败。"
+        still_running = [run["index"] for run in report["runs"] if run["may_still_run"]]
+        if still_running:
+            message += f" 分片 {still_running} 可能仍在原节点上执行，确认结束后再重新发起。"
+        return StatusResponse(status="error", message=message, details=report)
+    message = f"{report['shards']} 个分片已在 {len(nodes)} 个节点上执行完成。"
+    if "plan" in report:
+        message += f" 合并后的执行计划: {report['plan']['plan_id']}"
+    return StatusResponse(message=message, details=report)
@@ -0,0 +1,97 @@
+import os
+import pathlib
+from typing import List, Optional
+from urllib.parse import quote
+
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from app.apis.ranges import parse_byte_range
+from app.core.metrics import worker_metrics
+from app.core.plans import iter_operations, load_plan
+from app.core.zipstream import ZipStream, iter_files, iter_folder, measure
+
+router = APIRouter(
+    prefix="/download",
+)
+
+
+def _zip_source(source_path: Optional[str], split: Optional[List[str]], plan_id: Optional[str]):
+    """返回 (下载文件名, 惰性的条目迭代器工厂)。"""
+    if sum(value is not None for value in (source_path, split, plan_id)) != 1:
+        raise HTTPException(status_code=400, detail="source_path、split 与 plan_id 必须且只能提供一个。")
+
+    if source_path is not None:
+        root = pathlib.Path(source_path)
+        if not root.is_dir():
+            raise HTTPException(status_code=404, detail=f"源文件夹 '{source_path}' 不存在或不是一个有效的文件夹。")
+        return root.name, lambda: iter_folder(root)
+
+    if split is not None:
+        split_dirs = {}
+        for item in split:
+            name, sep, path = item.partition("=")
+            if not sep or not name or not path:
+                raise HTTPException(status_code=400, detail=f"split 的格式应为 名称=文件夹路径: '{item}'")
+            if not pathlib.Path(path).is_dir():
+                raise HTTPException(status_code=404, detail=f"划分 '{name}' 的文件夹 '{path}' 不存在。")
+            split_dirs[name] = pathlib.Path(path)
+
+        def iter_splits():
+            for name, path in split_dirs.items():
+                yield from iter_folder(path, f"{name}/")
+        return "_".join(split_dirs), iter_splits
+
+    # 打包执行计划涉及的源文件，例如在执行前下载待移走的重复文件/不合格图片复核
+    try:
+        plan = load_plan(plan_id)
+    except (ValueError, FileNotFoundError) as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if not plan["operations"]:
+        raise HTTPException(status_code=404, detail=f"计划 '{plan_id}' 不包含任何文件。")
+    # 逐行读取计划的操作文件两遍（先求公共目录，再打包），不把源文件列表整个放进内存
+    root = None
+    for operation in iter_operations(plan_id):
+        parent = os.path.dirname(operation["src"])
+        root = parent if root is None else os.path.commonpath([root, parent])
+    root = pathlib.Path(root)
+    return (f"{plan['worker']}_{plan_id[:8]}",
+            lambda: iter_files((operation["src"] for operation in iter_operations(plan_id)), root))
+
+
+@router.get("/zip")
+def download_zip(source_path: Optional[str] = None,
+                 split: Optional[List[str]] = Query(None, description="名称=文件夹路径，可重复，例如 split=train=/data/train"),
+                 plan_id: Optional[str] = None,
+                 range_header: Optional[str] = Header(None, alias="Range"),
+                 if_range: Optional[str] = Header(None, alias="If-Range")):
+    """
+    把一个文件夹、若干划分或一个执行计划涉及的文件以 ZIP（store、ZIP64）直接流式写入响应，不生成临时文件。
+    不带 Range 的请求边遍历边输出，首字节时间与数据量无关；带 Range 的请求先遍历一次算出总长度和 ETag
+    （不保留文件列表），再只读取区间内的文件，用于断点续传（响应带 ETag，If-Range 不匹配时返回完整内容）。
+    区间之前的文件的 CRC 取自该 ETag 首次完整下载时保存的记录，没有记录时仍要把这些文件读一遍。
+    """
+    name, make_entries = _zip_source(source_path, split, plan_id)
+    metrics = worker_metrics("download_zip")
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f"attachment; filename*=UTF-8''{quote(name)}.zip",
+    }
+    if range_header is None:
+        stream = ZipStream(make_entries(), on_read=metrics.bytes_read)
+        return StreamingResponse(stream.iter_bytes(), media_type="application/zip", headers=headers)
+
+    total_size, etag_value = measure(make_entries())
+    stream = ZipStream(make_entries(), on_read=metrics.bytes_read, etag=etag_value)
+    etag = f'"{etag_value}"'
+    headers["ETag"] = etag
+    if if_range is not None and if_range != etag:
+        # 文件夹内容已变化，续传会得到拼不起来的压缩包，改为返回完整内容
+        headers["Content-Length"] = str(total_size)
+        return StreamingResponse(stream.iter_bytes(), media_type="application/zip", headers=headers)
+
+    start, end = parse_byte_range(range_header, total_size)
+    headers["Content-Length"] = str(end - start + 1)
+    headers["Content-Range"] = f"bytes {start}-{end}/{total_size}"
+    return StreamingResponse(stream.iter_bytes(start, end), status_code=206, media_type="application/zip",
+                             headers=headers)
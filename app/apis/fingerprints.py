@@ -0,0 +1,68 @@
+import pathlib
+from typing import Optional
+
+from fastapi import APIRouter, Header
+
+from app.apis.ndjson import report_response, wants_ndjson
+from app.apis.schemas import FingerprintDiffRequest, FingerprintRequest, StatusResponse
+from app.core.fingerprints import Fingerprint, build_fingerprint, diff_fingerprints, is_fingerprint_id
+from app.core.reports import iter_report
+from app.workers.scheduler import CPU, IO, run_scheduled
+
+router = APIRouter(
+    prefix="/fingerprints",
+)
+
+
+def _build(source_path: str, content: bool, mtime: bool, workers: int):
+    # 只读取目录，加共享锁；计算内容哈希时按 CPU 型任务调度，只看元数据时按 IO 型
+    return run_scheduled("build_fingerprint",
+                         lambda: build_fingerprint(pathlib.Path(source_path), content, mtime, workers),
+                         paths=[source_path], exclusive=False, resource=CPU if content else IO)
+
+
+@router.post("", response_model=StatusResponse)
+def create_fingerprint(request: FingerprintRequest):
+    """为文件夹生成并保存 Merkle 指纹，之后可以用指纹 id 与其他指纹或文件夹比较。"""
+    try:
+        summary = _build(request.source_path, request.content, request.mtime, request.workers)
+    except NotADirectoryError as e:
+        return StatusResponse(status="error", message=str(e))
+    return StatusResponse(message=f"已为 {summary['files']} 个文件、{summary['dirs']} 个文件夹生成指纹 "
+                                  f"{summary['fingerprint_id']}，用时 {summary['seconds']} 秒。",
+                          details=summary)
+
+
+@router.get("/{fingerprint_id}", response_model=StatusResponse)
+def get_fingerprint(fingerprint_id: str):
+    try:
+        with Fingerprint.load(fingerprint_id) as fingerprint:
+            summary = fingerprint.summary()
+    except (ValueError, FileNotFoundError) as e:
+        return StatusResponse(status="error", message=str(e))
+    return StatusResponse(message=f"根哈希 {summary['root_hash']}，共 {summary['files']} 个文件。", details=summary)
+
+
+@router.post("/diff", response_model=StatusResponse)
+def diff(request: FingerprintDiffRequest, accept: Optional[str] = Header(None)):
+    """
+    比较两个目录树，只进入哈希不同的子目录。left/right 可以是指纹 id，也可以是文件夹路径（先生成新指纹）。
+    请求头 Accept: application/x-ndjson 时逐行流式返回差异，否则在 JSON 的 changes 中一次返回。
+    """
+    try:
+        ids = [side if is_fingerprint_id(side)
+               else _build(side, request.content, request.mtime, request.workers)["fingerprint_id"]
+               for side in (request.left, request.right)]
+        result = diff_fingerprints(*ids)
+    except (ValueError, FileNotFoundError, NotADirectoryError) as e:
+        return StatusResponse(status="error", message=str(e))
+
+    if wants_ndjson(accept):
+        return report_response(result)
+    result["changes"] = list(iter_report(result["report"]["report_id"]))
+    if result["identical"]:
+        return StatusResponse(message="两侧完全一致。", details=result)
+    counts = result["counts"]
+    return StatusResponse(message=f"新增 {counts['added']} 项，删除 {counts['removed']} 项，修改 {counts['modified']} 项"
+                                  f"（比较了 {result['dirs_compared']} 个不同的文件夹）。",
+                          details=result)
@@ -0,0 +1,27 @@
+import time
+
+from fastapi import APIRouter, Request
+from fastapi.responses import PlainTextResponse
+
+from app.core.metrics import observe_request, render_metrics
+
+router = APIRouter()
+
+
+async def metrics_middleware(request: Request, call_next):
+    """按路由模板（而不是具体 URL）统计每个接口的请求数与耗时直方图。"""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        observe_request(request.method, path, status, time.perf_counter() - start)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,65 @@
+import itertools
+import pathlib
+from typing import Dict, Iterable, Iterator, Optional
+
+from fastapi import HTTPException, Response
+from fastapi.responses import StreamingResponse
+
+from app.core.ndjson import read_lines, read_page
+from app.core.reports import report_path
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+MAX_PAGE_ROWS = 10000
+_BATCH_BYTES = 64 * 1024
+
+
+def wants_ndjson(accept: Optional[str]) -> bool:
+    return bool(accept) and NDJSON_MEDIA_TYPE in accept
+
+
+def _batched(lines: Iterable[bytes]) -> Iterator[bytes]:
+    """把逐行内容攒成约 64 KB 的块再发送，避免每行一次写操作。"""
+    batch, size = [], 0
+    for line in lines:
+        batch.append(line)
+        size += len(line)
+        if size >= _BATCH_BYTES:
+            yield b"".join(batch)
+            batch, size = [], 0
+    if batch:
+        yield b"".join(batch)
+
+
+def ndjson_response(path: pathlib.Path, cursor: Optional[str] = None, limit: Optional[int] = None,
+                    headers: Optional[dict] = None) -> Response:
+    """
+    以 NDJSON 返回文件中的行。不带 limit 时从游标处流式输出到末尾，内存占用与行数无关；
+    带 limit 时只返回一页，还有下一页时在 X-Next-Cursor 响应头中给出下一页的游标。
+    """
+    try:
+        start = int(cursor) if cursor else 0
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"无效的游标: {cursor}")
+    headers = dict(headers or {})
+    try:
+        if limit is None:
+            lines = read_lines(path, start)
+            # 先取第一行，让无效游标在发送响应头之前报错
+            first = next(lines, None)
+            rest = lines if first is None else itertools.chain((first,), lines)
+            return StreamingResponse(_batched(rest), media_type=NDJSON_MEDIA_TYPE, headers=headers)
+        page, next_cursor = read_page(path, start, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = str(next_cursor)
+    return Response(b"".join(page), media_type=NDJSON_MEDIA_TYPE, headers=headers)
+
+
+
+def report_response(result: Dict) -> Response:
+    """流式返回 worker 结果中的明细报告；报告 id、行数和执行计划 id 放在响应头里。"""
+    headers = {"X-Report-Id": result["report"]["report_id"], "X-Report-Rows": str(result["report"]["rows"])}
+    if "plan" in result:
+        headers["X-Plan-Id"] = result["plan"]["plan_id"]
+    return ndjson_response(report_path(result["report"]["report_id"]), headers=headers)
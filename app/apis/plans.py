@@ -0,0 +1,66 @@
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+from app.apis.ndjson import MAX_PAGE_ROWS, ndjson_response
+from app.apis.schemas import StatusResponse
+from app.core.plans import execute_plan, iter_operations, load_plan, operations_path, summarize_plan
+from app.workers.scheduler import IO, infer_paths, pregenerate_thumbnails, run_scheduled
+
+router = APIRouter(
+    prefix="/plans",
+)
+
+
+@router.get("/{plan_id}", response_model=StatusResponse)
+def get_plan(plan_id: str, operations: bool = False):
+    """
+    查看演练生成的执行计划；operations=true 时在 JSON 中一并返回逐条操作。
+    操作很多时请改用 /plans/{plan_id}/operations 流式或分页读取。
+    """
+    try:
+        plan = load_plan(plan_id)
+        details = summarize_plan(plan)
+        if operations:
+            details["operations"] = list(iter_operations(plan_id))
+    except (ValueError, FileNotFoundError) as e:
+        return StatusResponse(status="error", message=str(e))
+    return StatusResponse(message=f"计划包含 {plan['operations']} 个操作，状态为 {plan['status']}。",
+                          details=details)
+
+
+@router.get("/{plan_id}/operations")
+def get_plan_operations(plan_id: str, cursor: Optional[str] = None,
+                        limit: Optional[int] = Query(None, gt=0, le=MAX_PAGE_ROWS)):
+    """以 NDJSON 读取计划的逐条操作；带 limit 时分页，下一页游标在 X-Next-Cursor 响应头中。"""
+    try:
+        path = operations_path(plan_id)
+    except (ValueError, FileNotFoundError) as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return ndjson_response(path, cursor, limit)
+
+
+@router.post("/{plan_id}/execute", response_model=StatusResponse)
+def execute(plan_id: str):
+    """
+    直接执行演练生成的计划，只重新检查源文件是否变化，不再重新扫描。
+    全部执行成功时 status 为 success；有操作因源文件变化、目标冲突或出错而未执行时，
+    部分执行为 partial、一个都没执行为 error，details 中列出这些操作，需要重新演练。
+    """
+    try:
+        plan = load_plan(plan_id)
+        # 与生成计划的 worker 一样，对计划涉及的源/目标文件夹加独占锁
+        result = run_scheduled(f"{plan['worker']}:execute_plan", lambda: execute_plan(plan_id),
+                               paths=infer_paths(plan["params"]), resource=IO)
+    except (ValueError, FileNotFoundError) as e:
+        return StatusResponse(status="error", message=str(e))
+    if result["applied"]:
+        pregenerate_thumbnails(plan["worker"], plan["params"])
+
+    message = f"已执行 {result['applied']} 个操作。"
+    skipped = len(result["stale"]) + len(result["conflicts"]) + len(result["errors"])
+    if not skipped:
+        return StatusResponse(message=message, details=result)
+    message += (f" 跳过 {len(result['stale'])} 个已变化的源文件、{len(result['conflicts'])} 个目标冲突，"
+                f"{len(result['errors'])} 个失败，请对这些文件重新演练。")
+    return StatusResponse(status="partial" if result["applied"] else "error", message=message, details=result)
@@ -1,24 +1,316 @@
 from importlib.util import source_hash
 
-from fastapi import APIRouter
+import asyncio
+import pathlib
+from typing import List, Optional
 
+from fastapi import APIRouter, Header, HTTPException, Query, Request
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+
+from app.apis.ndjson import report_response, wants_ndjson
 from app.apis.schemas import InputOutputPaths,SingleInputPath
 from app.apis.schemas import StatusResponse
-from app.workers.pre_process_script.schemas import DecompressRequest
-from app.workers.pre_process_script.decompress_recursively import decompress_recursively
+from app.workers.pre_process_script.schemas import DecompressRequest, BatchFolderRenameRequest, ScreenImageQualityRequest, \
+    DedupeFilesRequest, FindLongImagesRequest, MoveUnwantedFilesRequest, FusedPreProcessRequest, NormalizeImagesRequest, \
+    BatchRenameFilesRequest, RollbackFolderRenamesRequest
+from app.core.reports import iter_report
+from app.core.streams import ChunkPipe
+from app.workers.registry import lazy_worker
+from app.workers.scheduler import run_worker
+
+lookup_rename_mapping = lazy_worker("lookup_rename_mapping")
+upload_spill_name = lazy_worker("upload_spill_name")
 
 router = APIRouter(
     prefix="/pre_process",
 )
 
 @router.post("/decompress_recursively",response_model=StatusResponse)
-def decompress_recursively(request: DecompressRequest):
-    decompress_recursively(
-    source_path = request.source_path,
-    destination_path = request.destination_path
-    )
+def decompress_recursively_endpoint(request: DecompressRequest):
+    if not pathlib.Path(request.source_path).is_dir():
+        return StatusResponse(status="error", message=f"源文件夹 '{request.source_path}' 不存在或不是一个有效的目录。")
+    try:
+        run_worker(
+        "decompress_recursively",
+        source_folder = pathlib.Path(request.source_path),
+        output_folder = pathlib.Path(request.destination_path),
+        cache_dir = pathlib.Path(request.cache_dir) if request.cache_dir else None,
+        cache_max_bytes = int(request.cache_max_gb * 1024 ** 3)
+        )
+    except NotADirectoryError as e:
+        return StatusResponse(status="error", message=str(e))
 
     return StatusResponse(message=f"已成功从{request.source_path}解压到{request.destination_path}.")
 
 
+@router.post("/batch_rename_folders", response_model=StatusResponse)
+def batch_rename_folders(request: BatchFolderRenameRequest):
+    operations = None
+    if request.operations is not None:
+        operations = [operation.model_dump() for operation in request.operations]
+
+    try:
+        result = run_worker(
+            "migrate_folder_names",
+            root_dir=pathlib.Path(request.source_path),
+            operations=operations,
+            pattern=request.pattern,
+            template=request.template,
+            recursive=request.recursive,
+            dry_run=request.dry_run
+        )
+    except (ValueError, NotADirectoryError) as e:
+        return StatusResponse(status="error", message=str(e))
+
+    if result["conflicts"] or result["errors"]:
+        return StatusResponse(status="error",
+                              message=f"存在 {len(result['conflicts'])} 个冲突和 {len(result['errors'])} 个错误，未执行任何重命名。",
+                              details=result)
+    if result.get("failed"):
+        return StatusResponse(status="error",
+                              message=f"重命名中途失败，已完成 {result['steps_done']} 步，"
+                                      f"可用日志 '{pathlib.Path(result['journal']).name}' 调用 "
+                                      f"/pre_process/batch_rename_folders/rollback 回滚。",
+                              details=result)
+    if request.dry_run:
+        return StatusResponse(message=f"[演练] 计划重命名 {len(result['renames'])} 个文件夹。", details=result)
+    return StatusResponse(message=f"已重命名 {len(result['renames'])} 个文件夹。", details=result)
+
+
+@router.post("/batch_rename_folders/rollback", response_model=StatusResponse)
+def rollback_folder_renames_endpoint(request: RollbackFolderRenamesRequest):
+    """按 batch_rename_folders 留下的日志倒序撤销已完成的重命名。"""
+    try:
+        result = run_worker("rollback_folder_migration",
+                            root_dir=pathlib.Path(request.source_path), journal=request.journal)
+    except (ValueError, FileNotFoundError) as e:
+        return StatusResponse(status="error", message=str(e))
+    if result["failed"]:
+        return StatusResponse(status="error",
+                              message=f"回滚在第 {result['failed']['step']} 步失败，已撤销 {result['undone']}/{result['total']} 步："
+                                      f"{result['failed']['error']}。排除故障后可用同一份日志继续回滚。",
+                              details=result)
+    return StatusResponse(message=f"已撤销 {result['undone']} 步重命名。", details=result)
+
+
+@router.post("/batch_rename_files", response_model=StatusResponse)
+def batch_rename_files_endpoint(request: BatchRenameFilesRequest):
+    """把源文件夹中的文件复制到目标文件夹并按稳定编号重命名；再次执行只复制新增或内容变化的文件。"""
+    summary = run_worker(
+        "batch_rename_files",
+        source_dir=pathlib.Path(request.source_path),
+        destination_dir=pathlib.Path(request.destination_path),
+        prefix="",
+        start_counter=request.start_counter,
+        dry_run=request.dry_run
+    )
+    if summary is None:
+        return StatusResponse(status="error", message=f"源文件夹 '{request.source_path}' 无效或其中没有文件。")
+    if request.dry_run:
+        return StatusResponse(message=f"[演练] 计划复制 {summary['processed']} 个文件，{summary['unchanged']} 个已复制过。"
+                                      f"执行计划: {summary['plan']['plan_id']}",
+                              details=summary)
+    return StatusResponse(status="success" if not summary["skipped"] else "error",
+                          message=f"已复制 {summary['processed']} 个文件到{request.destination_path}，"
+                                  f"{summary['unchanged']} 个已复制过，{summary['skipped']} 个失败。",
+                          details=summary)
+
+
+@router.get("/batch_rename_files/mapping", response_model=StatusResponse)
+def batch_rename_mapping(destination_path: str,
+                         source: Optional[str] = None,
+                         name: Optional[str] = None,
+                         cursor: int = Query(0, ge=0),
+                         limit: int = Query(1000, gt=0, le=10000)):
+    """
+    查询原文件与编号的映射：source 为源文件相对路径，name 为目标文件名，都不给时分页列出全部记录；
+    下一页的游标在 details.next_cursor 中。
+    """
+    try:
+        result = lookup_rename_mapping(pathlib.Path(destination_path), source=source, name=name,
+                                       cursor=cursor, limit=limit)
+    except (FileNotFoundError, ValueError) as e:
+        return StatusResponse(status="error", message=str(e))
+    return StatusResponse(message=f"找到 {len(result['rows'])} 条映射。", details=result)
+
+
+@router.post("/screen_image_quality", response_model=StatusResponse)
+def screen_image_quality_endpoint(request: ScreenImageQualityRequest, accept: Optional[str] = Header(None)):
+    """请求头 Accept: application/x-ndjson 时逐行流式返回不合格图片，否则在 JSON 的 offenders 中一次返回。"""
+    try:
+        report = run_worker(
+            "screen_image_quality",
+            source_dir=pathlib.Path(request.source_path),
+            destination_dir=pathlib.Path(request.destination_path),
+            decode_size=request.decode_size,
+            blank_white_ratio=request.blank_white_ratio,
+            blur_threshold=request.blur_threshold,
+            contrast_threshold=request.contrast_threshold,
+            workers=request.workers,
+            dry_run=request.dry_run
+        )
+    except NotADirectoryError as e:
+        return StatusResponse(status="error", message=str(e))
+
+    if wants_ndjson(accept):
+        return report_response(report)
+    report["offenders"] = list(iter_report(report["report"]["report_id"]))
+    message = f"共检查 {report['scanned']} 张图片，不合格 {report['report']['rows']} 张。"
+    if request.dry_run:
+        message = f"[演练] {message} 执行计划: {report['plan']['plan_id']}"
+    return StatusResponse(message=message, details=report)
+
+
+@router.post("/dedupe_files", response_model=StatusResponse)
+def dedupe_files_endpoint(request: DedupeFilesRequest, accept: Optional[str] = Header(None)):
+    """请求头 Accept: application/x-ndjson 时逐行流式返回重复文件组，否则在 JSON 的 groups 中一次返回。"""
+    try:
+        report = run_worker(
+            "dedupe_files",
+            source_dir=pathlib.Path(request.source_path),
+            destination_dir=pathlib.Path(request.destination_path),
+            workers=request.workers,
+            use_cache=request.use_cache,
+            dry_run=request.dry_run
+        )
+    except NotADirectoryError as e:
+        return StatusResponse(status="error", message=str(e))
+
+    if wants_ndjson(accept):
+        return report_response(report)
+    report["groups"] = list(iter_report(report["report"]["report_id"]))
+    message = f"共发现 {report['group_count']} 组重复文件，{report['duplicate_count']} 个多余副本。"
+    if request.dry_run:
+        message = f"[演练] {message} 执行计划: {report['plan']['plan_id']}"
+    return StatusResponse(message=message, details=report)
+
+
+@router.post("/move_unwanted_files", response_model=StatusResponse)
+def move_unwanted_files_endpoint(request: MoveUnwantedFilesRequest):
+    source_path = pathlib.Path(request.source_path)
+    if not source_path.is_dir():
+        return StatusResponse(status="error", message=f"源文件夹 '{source_path}' 不存在或不是一个有效的文件夹。")
+
+    summary = run_worker(
+        "move_unwanted_files",
+        source_dir=source_path,
+        destination_dir=pathlib.Path(request.destination_path),
+        keep_extensions={ext.lower() for ext in request.keep_extensions},
+        dry_run=request.dry_run
+    )
+    if request.dry_run:
+        return StatusResponse(message=f"[演练] 计划移动 {summary['files_to_move']} 个文件。执行计划: {summary['plan']['plan_id']}",
+                              details=summary)
+    return StatusResponse(message=f"已移动 {summary['moved']} 个文件到{request.destination_path}.", details=summary)
+
+
+@router.post("/fused_pre_process", response_model=StatusResponse)
+def fused_pre_process_endpoint(request: FusedPreProcessRequest):
+    """解压、筛选、重命名、PDF 转图片在内存中一次完成，只写出最终图片，不生成中间文件夹。"""
+    try:
+        stats = run_worker(
+            "fused_pre_process",
+            source_folder=pathlib.Path(request.source_path),
+            destination_folder=pathlib.Path(request.destination_path),
+            keep_extensions={ext.lower() for ext in request.keep_extensions},
+            dpi=request.dpi,
+            start_counter=request.start_counter,
+            workers=request.workers,
+            max_buffer_bytes=request.max_buffer_mb * 1024 * 1024
+        )
+    except NotADirectoryError as e:
+        return StatusResponse(status="error", message=str(e))
+
+    message = f"已处理 {stats['files']} 个文件，写出 {stats['images'] + stats['pages']} 张图片到{request.destination_path}."
+    if stats["failed"]:
+        return StatusResponse(status="error", message=f"{message} {len(stats['failed'])} 个压缩包或 PDF 处理失败。",
+                              details=stats)
+    return StatusResponse(message=message, details=stats)
+
+
+@router.post("/normalize_images", response_model=StatusResponse)
+def normalize_images_endpoint(request: NormalizeImagesRequest):
+    """入库时一次性按 EXIF 方向摆正、缩小到目标长边并重新编码；已规范化的图片跳过。"""
+    try:
+        stats = run_worker(
+            "normalize_images",
+            source_dir=pathlib.Path(request.source_path),
+            destination_dir=pathlib.Path(request.destination_path),
+            long_edge=request.long_edge,
+            quality=request.quality,
+            workers=request.workers
+        )
+    except NotADirectoryError as e:
+        return StatusResponse(status="error", message=str(e))
+
+    message = (f"共 {stats['scanned']} 张图片，规范化 {stats['normalized']} 张，"
+               f"跳过已规范化的 {stats['skipped']} 张，输出到{request.destination_path}.")
+    if stats["failed"]:
+        return StatusResponse(status="error", message=f"{message} {len(stats['failed'])} 张失败。", details=stats)
+    return StatusResponse(message=message, details=stats)
+
+
+@router.post("/find_long_images", response_model=StatusResponse)
+def find_long_images(request: FindLongImagesRequest):
+    source_path = pathlib.Path(request.source_path)
+    if not source_path.is_dir():
+        return StatusResponse(status="error", message=f"源文件夹 '{source_path}' 不存在或不是一个有效的文件夹。")
+
+    run_worker(
+        "find_and_move_long_images",
+        source_dir=source_path,
+        dest_dir=pathlib.Path(request.destination_path),
+        ratio_threshold=request.ratio_threshold
+    )
+    return StatusResponse(message=f"已把{request.source_path}中的长图移动到{request.destination_path}.")
+
+
+@router.post("/upload_and_decompress", response_model=StatusResponse)
+async def upload_and_decompress(request: Request,
+                                destination_path: str,
+                                filename: str = "",
+                                keep_extensions: Optional[List[str]] = Query(None, description="只保留这些扩展名的文件，例如 .jpg"),
+                                cache_dir: Optional[str] = None,
+                                cache_max_gb: float = Query(20, gt=0)):
+    """
+    请求体就是压缩包本身（可用分块传输），边接收边解压到 destination_path，上传结束前就开始产出文件。
+    zip/tar 不落盘；rar、7z 等需要随机访问的格式才先写到磁盘再解压。
+    """
+    try:
+        upload_spill_name(filename)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    pipe = ChunkPipe()
+
+    def extract():
+        try:
+            return run_worker(
+                "decompress_stream",
+                stream=pipe,
+                output_folder=pathlib.Path(destination_path),
+                filename=filename,
+                keep_extensions={ext.lower() for ext in keep_extensions} if keep_extensions else None,
+                cache_dir=pathlib.Path(cache_dir) if cache_dir else None,
+                cache_max_bytes=int(cache_max_gb * 1024 ** 3)
+            )
+        finally:
+            # 解压提前结束（出错或 zip 已读到中央目录）时，让上传端不再等待
+            pipe.close()
+
+    job = asyncio.ensure_future(run_in_threadpool(extract))
+    disconnected = False
+    try:
+        async for chunk in request.stream():
+            if chunk and not pipe.try_feed(chunk):
+                await run_in_threadpool(pipe.feed, chunk)
+    except ClientDisconnect:
+        disconnected = True
+    finally:
+        pipe.finish()
 
+    try:
+        stats = await job
+    except ValueError as e:
+        return StatusResponse(status="error", message=f"{'上传中断，' if disconnected else ''}{e}")
+    return StatusResponse(message=f"已边上传边解压 {stats['extracted']} 个文件到{destination_path}.", details=stats)
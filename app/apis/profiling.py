@@ -0,0 +1,42 @@
+import re
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+
+from app.core.profiling import ProfileSession, profile_dir, profiling_session
+
+router = APIRouter(
+    prefix="/profiles",
+)
+
+_FALSE_VALUES = {"", "0", "false", "no", "off"}
+_FORMATS = {"pstats": ".pstats", "speedscope": ".speedscope.json"}
+
+
+async def profiling_middleware(request: Request, call_next):
+    """请求头 X-Profile: 1 或查询参数 ?profile=1 时，在分析器下执行本次请求并保存结果。"""
+    flag = request.headers.get("X-Profile") or request.query_params.get("profile") or ""
+    if flag.lower() in _FALSE_VALUES:
+        return await call_next(request)
+
+    session = ProfileSession()
+    with profiling_session(session):
+        response = await call_next(request)
+    await run_in_threadpool(session.save)
+    response.headers["X-Profile-Id"] = session.job_id
+    return response
+
+
+@router.get("/{job_id}")
+def download_profile(job_id: str, format: str = "speedscope"):
+    """下载某次请求的分析结果：format=pstats（cProfile 统计）或 speedscope（阶段时间线）。"""
+    if not re.fullmatch(r"[0-9a-f]{32}", job_id):
+        raise HTTPException(status_code=400, detail="无效的 job id。")
+    if format not in _FORMATS:
+        raise HTTPException(status_code=400, detail=f"format 只能是 {sorted(_FORMATS)} 之一。")
+
+    path = profile_dir() / f"{job_id}{_FORMATS[format]}"
+    if not path.is_file():
+        raise HTTPException(status_code=404, detail=f"未找到 {job_id} 的 {format} 分析结果。")
+    return FileResponse(path, filename=path.name)
@@ -0,0 +1,35 @@
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+
+
+def parse_byte_range(range_header: Optional[str], total_size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单段 HTTP Range 请求头，返回闭区间 (start, end)；没有 Range 头时返回 None。
+    支持 bytes=start-end、bytes=start- 和 bytes=-suffix 三种写法，不支持多段范围。
+    """
+    if not range_header:
+        return None
+
+    unit, _, spec = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        raise HTTPException(status_code=416, detail="只支持单段 bytes 范围请求。",
+                            headers={"Content-Range": f"bytes */{total_size}"})
+
+    start_text, _, end_text = spec.strip().partition("-")
+    try:
+        if start_text == "":
+            suffix = int(end_text)
+            start, end = max(0, total_size - suffix), total_size - 1
+        else:
+            start = int(start_text)
+            end = int(end_text) if end_text else total_size - 1
+    except ValueError:
+        raise HTTPException(status_code=416, detail=f"无法解析的范围: {range_header}",
+                            headers={"Content-Range": f"bytes */{total_size}"})
+
+    end = min(end, total_size - 1)
+    if start > end or start >= total_size:
+        raise HTTPException(status_code=416, detail=f"范围 {range_header} 超出内容长度 {total_size}。",
+                            headers={"Content-Range": f"bytes */{total_size}"})
+    return start, end
@@ -0,0 +1,24 @@
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+from app.apis.ndjson import MAX_PAGE_ROWS, ndjson_response
+from app.core.reports import report_path
+
+router = APIRouter(
+    prefix="/reports",
+)
+
+
+@router.get("/{report_id}")
+def get_report(report_id: str, cursor: Optional[str] = None,
+               limit: Optional[int] = Query(None, gt=0, le=MAX_PAGE_ROWS)):
+    """
+    以 NDJSON 读取 worker 生成的明细报告（每行一条记录）。
+    不带 limit 时流式返回全部行；带 limit 时分页返回，下一页游标在 X-Next-Cursor 响应头中。
+    """
+    try:
+        path = report_path(report_id)
+    except (ValueError, FileNotFoundError) as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return ndjson_response(path, cursor, limit)
@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+
+from app.apis.schemas import StatusResponse
+from app.workers.scheduler import SchedulerBusy, current_priority, get_scheduler
+
+router = APIRouter(
+    prefix="/scheduler",
+)
+
+
+async def priority_middleware(request: Request, call_next):
+    """请求头 X-Priority（整数，越大越先执行）决定本次请求提交给调度器的任务优先级。"""
+    value = request.headers.get("X-Priority")
+    if value is None:
+        return await call_next(request)
+    try:
+        priority = int(value)
+    except ValueError:
+        return JSONResponse(status_code=400, content={"detail": "X-Priority 必须是整数。"})
+
+    token = current_priority.set(priority)
+    try:
+        return await call_next(request)
+    finally:
+        current_priority.reset(token)
+
+
+async def scheduler_busy_handler(request: Request, exc: SchedulerBusy):
+    """排队的任务已达上限：返回 503，让调用方（例如 n8n 的重试）稍后再来，而不是占着请求线程干等。"""
+    return JSONResponse(status_code=503, headers={"Retry-After": "5"},
+                        content={"status": "error", "message": str(exc), "details": None})
+
+
+@router.get("/status", response_model=StatusResponse)
+async def scheduler_status():
+    # 异步接口不占用请求线程池，即使线程都被等待中的任务占着，也总能查看调度器状态
+    """查看调度器中正在执行与排队的任务、各设备的 IO 占用和持有的路径锁。"""
+    status = get_scheduler().status()
+    return StatusResponse(message=f"{len(status['running'])} 个任务执行中，{len(status['queued'])} 个排队中。",
+                          details=status)
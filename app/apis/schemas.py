@@ -1,7 +1,7 @@
 # app/apis/schemas_base.py
 
 from pydantic import BaseModel, Field, DirectoryPath, FilePath
-from typing import Optional, Any, List
+from typing import Optional, Any, List, Dict, Literal
 
 
 # --- 积木 1: 标准状态响应 (你已经定义得很好，我们稍作优化) ---
@@ -22,4 +22,56 @@ class SingleInputPath(BaseModel):
 class InputOutputPaths(BaseModel):
     """需要一个输入路径和一个输出路径的基础请求。"""
     source_path: str = Field(..., description="源文件夹的完整路径。")
-    destination_path: str = Field(..., description="目标文件夹的完整路径。")
\ No newline at end of file
+    destination_path: str = Field(..., description="目标文件夹的完整路径。")
+
+
+# --- 积木 4: 集群模式 ---
+class ShardRequest(BaseModel):
+    """协调节点发给工作节点的单个分片。"""
+    worker: str = Field(..., description="要执行的 worker 名称")
+    params: Dict[str, Any] = Field(..., description="worker 参数，路径参数使用各节点都能访问的路径")
+    index: int = Field(..., ge=0, description="分片序号，从 0 开始")
+    count: int = Field(..., gt=0, description="分片总数")
+    strategy: Literal["hash", "subtree"] = Field("hash", description="按文件相对路径哈希分片，或按第一级子文件夹分片")
+
+
+class ClusterRunRequest(BaseModel):
+    """在多个工作节点上分片执行一个 worker。"""
+    worker: str = Field(..., description="要执行的 worker 名称，例如 split_all_pdfs_in_folder、dedupe_files")
+    params: Dict[str, Any] = Field(..., description="worker 参数，路径参数使用各节点都能访问的路径")
+    nodes: Optional[List[str]] = Field(None, description="工作节点地址列表，默认读取环境变量 CLUSTER_NODES")
+    shards: Optional[int] = Field(None, gt=0, description="分片数，默认等于节点数")
+    strategy: Literal["hash", "subtree"] = Field("hash", description="按文件相对路径哈希分片，或按第一级子文件夹分片")
+    retries: int = Field(2, ge=0, description="单个分片失败后换节点重试的次数；非演练时超时或连接中断的分片不重试")
+    timeout: Optional[float] = Field(None, gt=0, description="单个分片请求的超时（秒），默认不限；"
+                                                            "非演练时超时的分片可能仍在原节点执行，不会换节点重跑")
+
+
+class ThrottleLimits(BaseModel):
+    """文件复制、移动与读取的限速，字段为空表示不限速。"""
+    bytes_per_sec: Optional[float] = Field(None, gt=0, description="每秒最多读写的字节数")
+    ops_per_sec: Optional[float] = Field(None, gt=0, description="每秒最多执行的文件操作数")
+
+
+class PregenerateThumbnailsRequest(BaseModel):
+    """为文件夹中的图片预生成缩略图。"""
+    source_path: str = Field(..., description="图片所在文件夹的完整路径")
+    size: int = Field(256, ge=32, le=1024, description="缩略图长边的像素数")
+    workers: Optional[int] = Field(None, gt=0, description="渲染缩略图的进程数，默认等于 CPU 核数")
+
+
+class FingerprintRequest(BaseModel):
+    """为目录树生成 Merkle 指纹。"""
+    source_path: str = Field(..., description="要生成指纹的文件夹")
+    content: bool = Field(False, description="是否计算文件内容哈希；未变化的文件沿用上一次的哈希")
+    mtime: bool = Field(True, description="是否把修改时间计入指纹；比较未保留 mtime 的副本时关闭")
+    workers: int = Field(8, gt=0, description="计算内容哈希的线程数")
+
+
+class FingerprintDiffRequest(BaseModel):
+    """比较两个目录树；两侧都可以是已保存的指纹 id 或文件夹路径（路径会先生成新的指纹）。"""
+    left: str = Field(..., description="旧的一侧：指纹 id 或文件夹路径")
+    right: str = Field(..., description="新的一侧：指纹 id 或文件夹路径")
+    content: bool = Field(False, description="为文件夹生成指纹时是否计算文件内容哈希")
+    mtime: bool = Field(True, description="为文件夹生成指纹时是否把修改时间计入指纹")
+    workers: int = Field(8, gt=0, description="计算内容哈希的线程数")
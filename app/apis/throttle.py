@@ -0,0 +1,70 @@
+import uuid
+
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+
+from app.apis.schemas import StatusResponse, ThrottleLimits
+from app.core.throttle import (GLOBAL_THROTTLE, Throttle, active_throttle, active_throttles, current_throttle,
+                               register_throttle, unregister_throttle)
+
+router = APIRouter(
+    prefix="/throttle",
+)
+
+
+async def throttle_middleware(request: Request, call_next):
+    """
+    请求头 X-Throttle-Bytes（字节/秒）与 X-Throttle-Ops（文件操作/秒）为本次请求的复制、移动和读取限速，
+    在全局限速之外再叠加一层。X-Throttle-Id 给这组限速命名（默认随机生成，见响应头），
+    执行过程中可以用 PUT /throttle/{id} 调整；在预热进程池中执行的 worker 同样受这组限速约束。
+    """
+    bytes_value = request.headers.get("X-Throttle-Bytes")
+    ops_value = request.headers.get("X-Throttle-Ops")
+    if bytes_value is None and ops_value is None:
+        return await call_next(request)
+    try:
+        bytes_per_sec = float(bytes_value) if bytes_value is not None else None
+        ops_per_sec = float(ops_value) if ops_value is not None else None
+    except ValueError:
+        return JSONResponse(status_code=400, content={"detail": "X-Throttle-Bytes 与 X-Throttle-Ops 必须是数字。"})
+    if any(value is not None and value <= 0 for value in (bytes_per_sec, ops_per_sec)):
+        return JSONResponse(status_code=400, content={"detail": "X-Throttle-Bytes 与 X-Throttle-Ops 必须大于 0。"})
+
+    throttle = Throttle(request.headers.get("X-Throttle-Id") or uuid.uuid4().hex, bytes_per_sec, ops_per_sec)
+    try:
+        register_throttle(throttle)
+    except ValueError as e:
+        return JSONResponse(status_code=409, content={"detail": str(e)})
+    token = current_throttle.set(throttle)
+    try:
+        response = await call_next(request)
+    finally:
+        current_throttle.reset(token)
+        unregister_throttle(throttle)
+    response.headers["X-Throttle-Id"] = throttle.name
+    return response
+
+
+@router.get("", response_model=StatusResponse)
+def throttle_status():
+    """查看全局限速与正在执行的请求各自的限速。"""
+    active = active_throttles()
+    return StatusResponse(message=f"{len(active)} 个请求带有自己的限速。",
+                          details={"global": GLOBAL_THROTTLE.status(), "requests": active})
+
+
+@router.put("", response_model=StatusResponse)
+def set_global_throttle(limits: ThrottleLimits):
+    """调整全局限速，立即对正在执行的任务生效；字段为空表示不限速。"""
+    GLOBAL_THROTTLE.set_limits(limits.bytes_per_sec, limits.ops_per_sec)
+    return StatusResponse(message="全局限速已更新。", details=GLOBAL_THROTTLE.status())
+
+
+@router.put("/{throttle_id}", response_model=StatusResponse)
+def set_request_throttle(throttle_id: str, limits: ThrottleLimits):
+    """调整某个正在执行的请求的限速。"""
+    throttle = active_throttle(throttle_id)
+    if throttle is None:
+        return StatusResponse(status="error", message=f"没有 id 为 '{throttle_id}' 的正在执行的请求。")
+    throttle.set_limits(limits.bytes_per_sec, limits.ops_per_sec)
+    return StatusResponse(message=f"请求 '{throttle_id}' 的限速已更新。", details=throttle.status())
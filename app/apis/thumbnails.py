@@ -0,0 +1,126 @@
+import bisect
+import pathlib
+from collections import Counter
+from typing import Optional
+from urllib.parse import urlencode
+
+from fastapi import APIRouter, Header, HTTPException, Query, Response
+from fastapi.responses import FileResponse
+
+from app.apis.schemas import PregenerateThumbnailsRequest, StatusResponse
+from app.core.thumbnails import (DEFAULT_SIZE, IMAGE_EXTENSIONS, MAX_SIZE, MIN_SIZE, get_cache, list_images,
+                                 parse_group, pregenerate)
+from app.workers.scheduler import CPU, cpu_fanout, run_scheduled
+
+MAX_PAGE_SIZE = 500
+
+router = APIRouter(
+    prefix="/thumbnails",
+)
+
+
+def _sort_key(name: str):
+    # 同一银行、样式的图片排在一起，文件名不符合命名规则的排在最后
+    bank, style = parse_group(name)
+    return bank is None, bank or "", style or "", name
+
+
+def _grouped_images(folder: str, bank: Optional[str], style: Optional[str]):
+    """文件夹中符合筛选条件的图片，返回按 _sort_key 排好序的 [(排序键, (银行, 样式), 路径)]。"""
+    path = pathlib.Path(folder)
+    if not path.is_dir():
+        raise HTTPException(status_code=404, detail=f"文件夹 '{folder}' 不存在或不是一个有效的文件夹。")
+    images = []
+    for image in list_images(path):
+        image_bank, image_style = parse_group(image.name)
+        if (bank is None or image_bank == bank) and (style is None or image_style == style):
+            images.append((_sort_key(image.name), (image_bank, image_style), image))
+    images.sort(key=lambda item: item[0])
+    return images
+
+
+@router.get("", response_model=StatusResponse)
+def browse(folder: str,
+           bank: Optional[str] = None,
+           style: Optional[str] = None,
+           cursor: Optional[str] = None,
+           limit: int = Query(100, gt=0, le=MAX_PAGE_SIZE),
+           size: int = Query(DEFAULT_SIZE, ge=MIN_SIZE, le=MAX_SIZE)):
+    """
+    按“银行/样式”分组分页浏览文件夹中的图片，每张图片带缩略图地址。
+    图片按 (银行, 样式, 文件名) 排序，同一组的图片连续出现；游标是上一页最后一张图片的文件名，
+    翻页期间文件夹有增删也不会重复或漏掉。bank、style 用于只看某一组，
+    文件名不符合“银行名称_xxx_样式”规则的图片归入 bank、style 为 null 的组。
+    """
+    images = _grouped_images(folder, bank, style)
+    group_sizes = Counter(group for _, group, _ in images)
+    start = bisect.bisect_right([key for key, _, _ in images], _sort_key(cursor)) if cursor else 0
+    page = images[start:start + limit]
+
+    groups = []
+    for _, group, image in page:
+        if not groups or (groups[-1]["bank"], groups[-1]["style"]) != group:
+            groups.append({"bank": group[0], "style": group[1], "count": group_sizes[group], "images": []})
+        groups[-1]["images"].append({
+            "name": image.name,
+            "path": str(image),
+            "thumbnail": f"/thumbnails/image?{urlencode({'path': str(image), 'size': size})}",
+        })
+    next_cursor = page[-1][2].name if start + limit < len(images) else None
+    return StatusResponse(message=f"共 {len(images)} 张图片，{len(group_sizes)} 个银行/样式组，本页 {len(page)} 张。",
+                          details={"folder": folder, "total": len(images), "groups": groups,
+                                   "next_cursor": next_cursor})
+
+
+@router.get("/groups", response_model=StatusResponse)
+def list_groups(folder: str):
+    """文件夹中各银行/样式组的图片数，按银行、样式排序。"""
+    images = _grouped_images(folder, None, None)
+    group_sizes = Counter(group for _, group, _ in images)
+    groups = [{"bank": bank, "style": style, "count": count} for (bank, style), count in group_sizes.items()]
+    return StatusResponse(message=f"共 {len(images)} 张图片，{len(groups)} 个银行/样式组。",
+                          details={"folder": folder, "total": len(images), "groups": groups})
+
+
+@router.get("/image")
+def thumbnail_image(path: str,
+                    size: int = Query(DEFAULT_SIZE, ge=MIN_SIZE, le=MAX_SIZE),
+                    if_none_match: Optional[str] = Header(None)):
+    """
+    返回单张图片的 JPEG 缩略图：命中缓存直接读文件，未命中时当场生成并写入缓存。
+    ETag 由源文件路径、修改时间和大小决定，源文件不变时浏览器可以凭 If-None-Match 得到 304。
+    """
+    source = pathlib.Path(path)
+    if not source.is_file() or source.suffix.lower() not in IMAGE_EXTENSIONS:
+        raise HTTPException(status_code=404, detail=f"图片 '{path}' 不存在。")
+    cache = get_cache()
+    etag = f'"{cache.key(source, size)}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=86400"}
+    if if_none_match == etag:
+        return Response(status_code=304, headers=headers)
+    try:
+        _, thumbnail = cache.get(source, size)
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=422, detail=f"无法为 '{path}' 生成缩略图: {e}")
+    return FileResponse(thumbnail, media_type="image/jpeg", headers=headers)
+
+
+@router.post("/pregenerate", response_model=StatusResponse)
+def pregenerate_thumbnails_endpoint(request: PregenerateThumbnailsRequest):
+    """立即为文件夹中的图片生成缩略图并等待完成（流水线阶段结束后会自动在后台预生成）。"""
+    try:
+        stats = run_scheduled("pregenerate_thumbnails",
+                              lambda: pregenerate(pathlib.Path(request.source_path), request.size,
+                                                  cpu_fanout(request.workers)),
+                              paths=[request.source_path], exclusive=False, resource=CPU)
+    except NotADirectoryError as e:
+        return StatusResponse(status="error", message=str(e))
+    return StatusResponse(message=f"共 {stats['images']} 张图片，新生成 {stats['generated']} 张缩略图，"
+                                  f"{stats['cached']} 张已缓存，{len(stats['failed'])} 张失败。",
+                          details=stats)
+
+
+@router.get("/cache", response_model=StatusResponse)
+def cache_status():
+    stats = get_cache().stats()
+    return StatusResponse(message=f"缓存了 {stats['entries']} 张缩略图，共 {stats['bytes']} 字节。", details=stats)
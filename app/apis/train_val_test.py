@@ -0,0 +1,123 @@
+import pathlib
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Response
+
+from app.apis.ndjson import report_response, wants_ndjson
+from app.apis.ranges import parse_byte_range
+from app.apis.schemas import StatusResponse
+from app.core.reports import iter_report
+from app.workers.TrainValTest.schemas import PackShardsRequest, NearDuplicateRequest, SplitTrainValRequest
+from app.workers.registry import lazy_worker
+from app.workers.scheduler import run_worker
+
+get_reader = lazy_worker("get_reader")
+
+router = APIRouter(
+    prefix="/train_val_test",
+)
+
+
+@router.post("/split_train_val", response_model=StatusResponse)
+def split_train_val(request: SplitTrainValRequest):
+    # worker 在源文件夹无效时会直接 sys.exit，必须先在这里校验
+    if not pathlib.Path(request.source_path).is_dir():
+        return StatusResponse(status="error", message=f"源文件夹 '{request.source_path}' 不存在或不是一个有效的文件夹。")
+
+    plan = run_worker(
+        "split_train_val_sets",
+        source_dir=request.source_path,
+        train_dir=request.train_path,
+        valid_dir=request.valid_path,
+        dry_run=request.dry_run
+    )
+    if request.dry_run:
+        return StatusResponse(message=f"[演练] 计划按 4:1 移动 {plan['operations']} 个文件。执行计划: {plan['plan_id']}",
+                              details=plan)
+    return StatusResponse(message=f"已按 4:1 把{request.source_path}划分到{request.train_path}和{request.valid_path}.")
+
+
+@router.post("/pack_shards", response_model=StatusResponse)
+def pack_shards(request: PackShardsRequest):
+    try:
+        index = run_worker(
+            "pack_dataset_shards",
+            split_dirs=request.split_dirs,
+            output_dir=request.destination_path,
+            max_shard_bytes=request.max_shard_mb * 1024 * 1024,
+            max_shard_records=request.max_shard_records,
+            workers=request.workers,
+            dry_run=request.dry_run
+        )
+    except (NotADirectoryError, ValueError) as e:
+        return StatusResponse(status="error", message=str(e))
+
+    shard_count = sum(len(split["shards"]) for split in index["splits"].values())
+    note = f"{len(index['collisions'])} 个文件与其他样本 key 重复，未打包。" if index["collisions"] else ""
+    if request.dry_run:
+        return StatusResponse(message=f"[演练] 计划写出 {shard_count} 个分片。{note}", details=index)
+    return StatusResponse(message=f"已写出 {shard_count} 个分片到{request.destination_path}.{note}", details=index)
+
+
+@router.post("/near_duplicates", response_model=StatusResponse)
+def near_duplicates(request: NearDuplicateRequest, accept: Optional[str] = Header(None)):
+    """请求头 Accept: application/x-ndjson 时逐行流式返回近重复组，否则在 JSON 的 groups/leaks 中一次返回。"""
+    try:
+        report = run_worker(
+            "detect_near_duplicates",
+            split_dirs=request.split_dirs,
+            max_distance=request.max_distance,
+            hash_file=request.hash_file,
+            workers=request.workers,
+            regroup=request.regroup,
+            dry_run=request.dry_run
+        )
+    except (NotADirectoryError, ValueError) as e:
+        return StatusResponse(status="error", message=str(e))
+
+    if wants_ndjson(accept):
+        return report_response(report)
+    report["groups"] = list(iter_report(report["report"]["report_id"]))
+    report["leaks"] = [group for group in report["groups"] if "home" in group]
+    return StatusResponse(message=f"发现 {report['group_count']} 个近重复组，其中 {report['leak_count']} 个跨越多个划分。",
+                          details=report)
+
+
+@router.get("/shards/info", response_model=StatusResponse)
+def shard_info(shards_dir: str):
+    try:
+        reader = get_reader(shards_dir)
+    except FileNotFoundError as e:
+        return StatusResponse(status="error", message=str(e))
+    return StatusResponse(message=f"共 {len(reader)} 条记录。",
+                          details={"records": len(reader), "splits": reader.splits, "labels": reader.labels})
+
+
+@router.get("/shards/record")
+def read_shard_record(shards_dir: str,
+                      key: Optional[str] = None,
+                      index: Optional[int] = None,
+                      range_header: Optional[str] = Header(None, alias="Range")):
+    """按 key 或全局编号读取单条记录的图片字节，支持 HTTP Range 分段读取。"""
+    if (key is None) == (index is None):
+        raise HTTPException(status_code=400, detail="key 与 index 必须且只能提供一个。")
+    try:
+        reader = get_reader(shards_dir)
+        view = reader.get_by_key(key) if key is not None else reader.get(index)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except (KeyError, IndexError):
+        raise HTTPException(status_code=404, detail=f"记录 {key if key is not None else index} 不存在。")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    total_size = len(view)
+    byte_range = parse_byte_range(range_header, total_size)
+    if byte_range is None:
+        return Response(content=bytes(view), media_type="image/jpeg", headers={"Accept-Ranges": "bytes"})
+
+    start, end = byte_range
+    return Response(content=bytes(view[start:end + 1]),
+                    status_code=206,
+                    media_type="image/jpeg",
+                    headers={"Accept-Ranges": "bytes", "Content-Range": f"bytes {start}-{end}/{total_size}"})
@@ -0,0 +1,191 @@
+# app/core/cluster.py
+
+import os
+import pathlib
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional
+
+from app.core.metrics import CLUSTER_SHARD_ATTEMPTS
+from app.core.ndjson import loads
+from app.core.plans import create_plan, summarize_plan
+from app.core.sharding import HASH
+
+if TYPE_CHECKING:
+    import httpx
+
+NODES_ENV_VAR = "CLUSTER_NODES"
+OPERATIONS_PAGE_ROWS = 10000
+# 可以分片执行的 worker 及其路径参数；各节点需要能以相同路径访问源/目标文件夹（本机或共享存储）
+SHARDABLE_WORKERS = {
+    "split_all_pdfs_in_folder": ("source_dir", "destination_dir"),
+    "dedupe_files": ("source_dir", "destination_dir"),
+    "normalize_images": ("source_dir", "destination_dir"),
+}
+
+
+def configured_nodes() -> List[str]:
+    """环境变量 CLUSTER_NODES 中逗号分隔的工作节点地址，例如 http://127.0.0.1:8001,http://127.0.0.1:8002。"""
+    return [node.strip().rstrip("/") for node in os.environ.get(NODES_ENV_VAR, "").split(",") if node.strip()]
+
+
+def shard_kwargs(worker: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """校验要分片执行的 worker 及其参数，并把路径参数转换成 pathlib.Path。"""
+    if worker not in SHARDABLE_WORKERS:
+        raise ValueError(f"worker '{worker}' 不支持分片执行，可选: {', '.join(SHARDABLE_WORKERS)}。")
+    if "shard" in params:
+        raise ValueError("参数中不能包含 shard，分片由协调节点分配。")
+    missing = [key for key in SHARDABLE_WORKERS[worker] if not params.get(key)]
+    if missing:
+        raise ValueError(f"缺少路径参数: {', '.join(missing)}。")
+    return {key: pathlib.Path(value) if key in SHARDABLE_WORKERS[worker] else value
+            for key, value in params.items()}
+
+
+class ShardError(Exception):
+    """工作节点返回了非 success 的结果。"""
+
+
+def _may_still_run(error: Exception) -> bool:
+    """
+    请求已经发出、却没有拿到节点的答复（读超时、连接中途断开）：节点上的分片可能仍在执行。
+    连接失败、节点返回了错误状态码或非 success 结果时，节点已不再执行该分片。
+    """
+    import httpx
+
+    if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.HTTPStatusError, ShardError)):
+        return False
+    return isinstance(error, httpx.TransportError)
+
+
+def _merge(a: Any, b: Any) -> Any:
+    if isinstance(a, dict) and isinstance(b, dict):
+        return {**a, **{key: _merge(a[key], value) if key in a else value for key, value in b.items()}}
+    if isinstance(a, list) and isinstance(b, list):
+        return a + b
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)) and not isinstance(a, bool):
+        return a + b
+    return b
+
+
+def merge_results(results: List[Dict]) -> Dict:
+    """
+    合并各分片的统计：数值相加、列表拼接、字典按键合并。
+    各分片的执行计划另行合并，明细报告留在各节点上，按节点列出。
+    """
+    merged: Dict = {}
+    for result in results:
+        merged = _merge(merged, {key: value for key, value in (result or {}).items() if key not in ("plan", "report")})
+    return merged
+
+
+def _post_shard(client: "httpx.Client", node: str, payload: Dict, headers: Dict[str, str]) -> Dict:
+    response = client.post(f"{node}/cluster/shard", json=payload, headers=headers)
+    response.raise_for_status()
+    body = response.json()
+    if body["status"] != "success":
+        raise ShardError(body["message"])
+    return body["details"]
+
+
+def _fetch_operations(client: "httpx.Client", node: str, plan_id: str) -> Iterator[Dict]:
+    """按游标分页拉取工作节点上计划的逐条操作（NDJSON），不把整个计划读进内存。"""
+    params = {"limit": OPERATIONS_PAGE_ROWS}
+    while True:
+        response = client.get(f"{node}/plans/{plan_id}/operations", params=params)
+        response.raise_for_status()
+        for line in response.content.splitlines():
+            yield loads(line)
+        if "X-Next-Cursor" not in response.headers:
+            return
+        params["cursor"] = response.headers["X-Next-Cursor"]
+
+
+def run_sharded(worker: str,
+                params: Dict[str, Any],
+                nodes: List[str],
+                shards: Optional[int] = None,
+                strategy: str = HASH,
+                retries: int = 2,
+                timeout: Optional[float] = None,
+                headers: Optional[Dict[str, str]] = None) -> Dict:
+    """
+    协调节点：把 worker 的输入按分片发给各工作节点并等待结果。
+    第 i 个分片先发给第 i % len(nodes) 个节点，失败（连接错误、超时、非 success）后依次换下一个节点重试，
+    最多重试 retries 次。全部完成后合并统计；演练生成的各节点执行计划拉取到本机合并成一个计划。
+
+    非演练时，读超时或连接中途断开的分片不自动重试：原节点可能仍在移动或改写这些文件，
+    换节点重跑会让两个节点同时处理同一批文件（路径锁只在单个节点内有效）。这类分片记为失败，
+    并在 runs[i]["may_still_run"] 中标出，确认原节点结束后再重新发起。
+
+    只有协调节点需要 httpx，在这里才导入：工作节点和单机部署不必安装；未安装时抛出 RuntimeError。
+    """
+    try:
+        import httpx
+    except ImportError:
+        raise RuntimeError("协调节点需要安装 httpx（pip install httpx）。") from None
+
+    dry_run = params.get("dry_run") is True
+    shards = shards or len(nodes)
+    runs = [{"index": index, "node": None, "attempts": 0, "seconds": None, "errors": [], "may_still_run": False}
+            for index in range(shards)]
+    results: Dict[int, Dict] = {}
+    started = time.perf_counter()
+
+    with httpx.Client(timeout=httpx.Timeout(timeout, connect=10.0)) as client, \
+            ThreadPoolExecutor(max_workers=shards, thread_name_prefix="cluster") as pool:
+
+        def submit(index: int):
+            run = runs[index]
+            run["node"] = nodes[(index + run["attempts"]) % len(nodes)]
+            run["attempts"] += 1
+            payload = {"worker": worker, "params": params, "index": index, "count": shards, "strategy": strategy}
+            return pool.submit(_post_shard, client, run["node"], payload, headers or {})
+
+        pending = {submit(index): index for index in range(shards)}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                run = runs[index]
+                try:
+                    results[index] = future.result()
+                except (httpx.HTTPError, ShardError, ValueError) as e:
+                    CLUSTER_SHARD_ATTEMPTS.inc(node=run["node"], outcome="error")
+                    run["errors"].append(f"{run['node']}: {e}")
+                    print(f"[!] 分片 {index + 1}/{shards} 在 {run['node']} 上失败: {e}")
+                    if not dry_run and _may_still_run(e):
+                        run["may_still_run"] = True
+                        print(f"[!] 分片 {index + 1}/{shards} 可能仍在 {run['node']} 上执行，不自动重试")
+                        continue
+                    if run["attempts"] <= retries:
+                        pending[submit(index)] = index
+                    continue
+                CLUSTER_SHARD_ATTEMPTS.inc(node=run["node"], outcome="success")
+                run["seconds"] = round(time.perf_counter() - started, 3)
+
+        ordered = [results[index] for index in sorted(results)]
+        shard_reports = [{"node": runs[index]["node"], **result["report"]}
+                         for index, result in sorted(results.items()) if result and "report" in result]
+        report = {
+            "worker": worker,
+            "shards": shards,
+            "strategy": strategy,
+            "nodes": nodes,
+            "runs": runs,
+            "failed_shards": [run["index"] for run in runs if run["index"] not in results],
+            "results": merge_results(ordered),
+        }
+        if shard_reports:
+            report["shard_reports"] = shard_reports
+
+        # 只有全部分片成功时才合并执行计划，避免执行一个缺了部分文件的计划
+        shard_plans = [(runs[index]["node"], result["plan"]["plan_id"])
+                       for index, result in sorted(results.items()) if result and "plan" in result]
+        if shard_plans and not report["failed_shards"]:
+            operations = (operation for node, plan_id in shard_plans
+                          for operation in _fetch_operations(client, node, plan_id))
+            plan = create_plan(worker, {**params, "shards": shards, "strategy": strategy}, operations)
+            report["shard_plans"] = [{"node": node, "plan_id": plan_id} for node, plan_id in shard_plans]
+            report["plan"] = summarize_plan(plan)
+    return report
@@ -0,0 +1,361 @@
+# app/core/fingerprints.py
+
+import contextvars
+import hashlib
+import json
+import os
+import pathlib
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from app.core import throttle
+from app.core.metrics import worker_metrics
+from app.core.ndjson import WRITE_BUFFER, dumps, loads
+from app.core.reports import ReportWriter
+
+FINGERPRINT_DIR_ENV_VAR = "FINGERPRINT_DIR"
+FINGERPRINT_TTL_ENV_VAR = "FINGERPRINT_TTL_HOURS"
+FINGERPRINT_MAX_COUNT_ENV_VAR = "FINGERPRINT_MAX_COUNT"
+DEFAULT_FINGERPRINT_TTL_HOURS = 7 * 24
+DEFAULT_FINGERPRINT_MAX_COUNT = 1000
+PRUNE_INTERVAL = 60
+_FINGERPRINT_ID = re.compile(r"[0-9a-f]{32}")
+READ_BUFFER = 1024 * 1024
+_prune_lock = threading.Lock()
+_last_prune = 0.0
+
+
+def fingerprint_dir() -> pathlib.Path:
+    path = pathlib.Path(os.environ.get(FINGERPRINT_DIR_ENV_VAR)
+                        or pathlib.Path(tempfile.gettempdir()) / "workflow_fingerprints")
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def is_fingerprint_id(value: str) -> bool:
+    return bool(_FINGERPRINT_ID.fullmatch(value))
+
+
+def content_hash(path: str) -> str:
+    """文件内容的 blake2b 哈希，读取受限速约束。"""
+    digest = hashlib.blake2b(digest_size=32)
+    buffer = bytearray(READ_BUFFER)
+    view = memoryview(buffer)
+    throttle.consume_ops()
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            throttle.consume_bytes(n)
+            digest.update(view[:n])
+    return digest.hexdigest()
+
+
+def _latest_path(root: str, content: bool, mtime: bool) -> pathlib.Path:
+    key = hashlib.blake2b(f"{root}\0{content}\0{mtime}".encode("utf-8"), digest_size=16).hexdigest()
+    return fingerprint_dir() / f"latest-{key}.txt"
+
+
+def prune_fingerprints(max_age_hours: Optional[float] = None, max_count: Optional[int] = None) -> int:
+    """
+    删除过期的指纹：超过 max_age_hours 的，以及按时间从新到旧排在 max_count 之后的。
+    默认值取环境变量 FINGERPRINT_TTL_HOURS / FINGERPRINT_MAX_COUNT。
+    latest-*.txt 指向的指纹（各根目录最近一次的，内容模式下一次构建要复用其中的哈希）不删除；
+    指向的指纹已不存在的 latest-*.txt 一并删除。返回删除的指纹数。
+    """
+    if max_age_hours is None:
+        max_age_hours = float(os.environ.get(FINGERPRINT_TTL_ENV_VAR) or DEFAULT_FINGERPRINT_TTL_HOURS)
+    if max_count is None:
+        max_count = int(os.environ.get(FINGERPRINT_MAX_COUNT_ENV_VAR) or DEFAULT_FINGERPRINT_MAX_COUNT)
+
+    root = fingerprint_dir()
+    newest: Dict[str, float] = {}
+    latest: Dict[pathlib.Path, str] = {}
+    for path in root.iterdir():
+        try:
+            if path.name.startswith("latest-") and path.suffix == ".txt":
+                latest[path] = path.read_text(encoding="utf-8").strip()
+            elif path.suffix in (".json", ".ndjson") and _FINGERPRINT_ID.fullmatch(path.stem):
+                newest[path.stem] = max(newest.get(path.stem, 0.0), path.stat().st_mtime)
+        except FileNotFoundError:
+            continue
+
+    keep = set(latest.values())
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
+    for rank, fingerprint_id in enumerate(sorted(newest, key=newest.get, reverse=True)):
+        if fingerprint_id in keep or (rank < max_count and newest[fingerprint_id] >= cutoff):
+            continue
+        (root / f"{fingerprint_id}.json").unlink(missing_ok=True)
+        (root / f"{fingerprint_id}.ndjson").unlink(missing_ok=True)
+        removed += 1
+    for path, fingerprint_id in latest.items():
+        if fingerprint_id not in newest:
+            path.unlink(missing_ok=True)
+    return removed
+
+
+def _maybe_prune():
+    """构建指纹时顺带清理，同一进程内至多每 PRUNE_INTERVAL 秒扫描一次目录。"""
+    global _last_prune
+    with _prune_lock:
+        if time.monotonic() - _last_prune < PRUNE_INTERVAL and _last_prune:
+            return
+        _last_prune = time.monotonic()
+    prune_fingerprints()
+
+
+class Fingerprint:
+    """
+    已保存的目录指纹。
+        <id>.json     头信息：根目录、选项、根哈希、统计，以及每个目录行在数据文件中的字节偏移
+        <id>.ndjson   每个目录一行: {"path", "hash", "file_count", "bytes", "files": {名称: [字节数, mtime_ns, 内容哈希]}, "dirs": {名称: 哈希}}
+    比较时只按偏移读取需要的目录行，不把整棵树读进内存。
+    """
+
+    def __init__(self, header: Dict):
+        self.header = header
+        self.index: Dict[str, int] = header["index"]
+        self._file = None
+
+    @classmethod
+    def load(cls, fingerprint_id: str) -> "Fingerprint":
+        if not is_fingerprint_id(fingerprint_id):
+            raise ValueError(f"无效的指纹 id: '{fingerprint_id}'。")
+        path = fingerprint_dir() / f"{fingerprint_id}.json"
+        if not path.is_file():
+            raise FileNotFoundError(f"指纹 '{fingerprint_id}' 不存在。")
+        return cls(json.loads(path.read_text(encoding="utf-8")))
+
+    @property
+    def fingerprint_id(self) -> str:
+        return self.header["fingerprint_id"]
+
+    def has(self, relative: str) -> bool:
+        return relative in self.index
+
+    def row(self, relative: str) -> Dict:
+        if self._file is None:
+            self._file = open(fingerprint_dir() / f"{self.fingerprint_id}.ndjson", "rb")
+        self._file.seek(self.index[relative])
+        return loads(self._file.readline())
+
+    def summary(self) -> Dict:
+        return {key: value for key, value in self.header.items() if key != "index"}
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self) -> "Fingerprint":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _Builder:
+    """后序遍历目录树，逐目录写出目录行并记录偏移，内存中只保留当前路径上各层的子项。"""
+
+    def __init__(self, data_path: pathlib.Path, content: bool, mtime: bool, workers: int,
+                 previous: Optional[Fingerprint]):
+        self.content = content
+        self.mtime = mtime
+        self.previous = previous
+        self.metrics = worker_metrics("build_fingerprint")
+        self.index: Dict[str, int] = {}
+        self.offset = 0
+        self.stats = {"files": 0, "dirs": 0, "hashed": 0, "reused": 0}
+        self.errors: Dict[str, str] = {}
+        self._out = open(data_path, "wb", buffering=WRITE_BUFFER)
+        self._pool = ThreadPoolExecutor(max_workers=workers) if content else None
+
+    def close(self):
+        self._out.close()
+        if self._pool is not None:
+            self._pool.shutdown()
+
+    def _hash_files(self, path: str, relative: str, files: Dict[str, List]):
+        """内容模式：字节数与 mtime 都没变的文件沿用上一次同一根目录指纹里的内容哈希，其余在线程池中计算。"""
+        previous = {}
+        if self.previous is not None and self.previous.has(relative):
+            previous = self.previous.row(relative)["files"]
+        pending = []
+        for name, entry in files.items():
+            old = previous.get(name)
+            if old and old[0] == entry[0] and old[1] == entry[1] and old[2]:
+                entry[2] = old[2]
+                self.stats["reused"] += 1
+            else:
+                pending.append(name)
+        # 每个任务各带一份当前上下文，请求级的限速在线程池中同样生效
+        futures = [self._pool.submit(contextvars.copy_context().run, content_hash, os.path.join(path, name))
+                   for name in pending]
+        for name, future in zip(pending, futures):
+            try:
+                files[name][2] = future.result()
+            except OSError as e:
+                self.errors[f"{relative}/{name}" if relative else name] = str(e)
+            self.metrics.bytes_read(files[name][0])
+        self.stats["hashed"] += len(pending)
+
+    def walk(self, path: str, relative: str) -> Tuple[str, int, int]:
+        """先算子目录再算本目录：按名称排序的 (名称, 字节数, mtime, 内容哈希) 与子目录哈希共同决定本目录的哈希。"""
+        files: Dict[str, List] = {}
+        subdirs = []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                    elif entry.is_file(follow_symlinks=False):
+                        stat = entry.stat(follow_symlinks=False)
+                        files[entry.name] = [stat.st_size, stat.st_mtime_ns, None]
+        except OSError as e:
+            self.errors[relative or "."] = str(e)
+            print(f"  [警告] 无法读取文件夹 '{path}': {e}", file=sys.stderr)
+        if self.content and files:
+            self._hash_files(path, relative, files)
+
+        file_count = len(files)
+        total_bytes = sum(entry[0] for entry in files.values())
+        dirs: Dict[str, str] = {}
+        for name in sorted(subdirs):
+            child_hash, child_files, child_bytes = self.walk(os.path.join(path, name),
+                                                             f"{relative}/{name}" if relative else name)
+            dirs[name] = child_hash
+            file_count += child_files
+            total_bytes += child_bytes
+
+        digest = hashlib.blake2b(digest_size=16)
+        for name in sorted(files):
+            size, mtime_ns, content = files[name]
+            digest.update(f"f\0{name}\0{size}\0{mtime_ns if self.mtime else ''}\0{content or ''}\n"
+                          .encode("utf-8", "surrogateescape"))
+        for name, child_hash in dirs.items():
+            digest.update(f"d\0{name}\0{child_hash}\n".encode("utf-8", "surrogateescape"))
+        dir_hash = digest.hexdigest()
+
+        line = dumps({"path": relative, "hash": dir_hash, "file_count": file_count, "bytes": total_bytes,
+                      "files": files, "dirs": dirs})
+        self.index[relative] = self.offset
+        self.offset += len(line)
+        self._out.write(line)
+        self.stats["files"] += len(files)
+        self.stats["dirs"] += 1
+        self.metrics.files(len(files))
+        return dir_hash, file_count, total_bytes
+
+
+def build_fingerprint(root_dir: pathlib.Path, content: bool = False, mtime: bool = True, workers: int = 8) -> Dict:
+    """
+    为目录树生成 Merkle 指纹并保存，返回指纹头信息（不含目录偏移）。
+    每个目录的哈希由其文件的 (名称, 字节数, mtime, 可选的内容哈希) 和子目录的 (名称, 哈希) 决定，
+    任何一个文件变化都会沿路径一直传到根哈希，两棵树根哈希相同即内容一致。
+
+    Args:
+        root_dir: 要生成指纹的目录。
+        content: 是否计算文件内容哈希；同一根目录上一次内容指纹中字节数与 mtime 未变的文件直接复用哈希。
+        mtime: 是否把修改时间计入哈希；比较两个不同位置的副本（复制时未保留 mtime）时应关闭。
+        workers: 计算内容哈希的线程数。
+    """
+    if not root_dir.is_dir():
+        raise NotADirectoryError(f"文件夹 '{root_dir}' 不存在或不是一个有效的目录。")
+    _maybe_prune()
+    root = os.path.normcase(os.path.abspath(root_dir))
+    latest = _latest_path(root, content, mtime)
+    previous = None
+    if content and latest.is_file():
+        try:
+            previous = Fingerprint.load(latest.read_text(encoding="utf-8").strip())
+        except (ValueError, FileNotFoundError):
+            previous = None
+
+    fingerprint_id = uuid.uuid4().hex
+    data_path = fingerprint_dir() / f"{fingerprint_id}.ndjson"
+    started = time.perf_counter()
+    builder = _Builder(data_path, content, mtime, workers, previous)
+    try:
+        root_hash, _, total_bytes = builder.walk(root, "")
+    except BaseException:
+        builder.close()
+        data_path.unlink(missing_ok=True)
+        raise
+    finally:
+        if previous is not None:
+            previous.close()
+    builder.close()
+
+    header = {"fingerprint_id": fingerprint_id, "root": root, "created": time.time(), "content": content,
+              "mtime": mtime, "root_hash": root_hash, "bytes": total_bytes, **builder.stats,
+              "errors": builder.errors, "seconds": round(time.perf_counter() - started, 3), "index": builder.index}
+    tmp = fingerprint_dir() / f"{fingerprint_id}.json.tmp"
+    tmp.write_text(json.dumps(header, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, fingerprint_dir() / f"{fingerprint_id}.json")
+    latest.write_text(fingerprint_id, encoding="utf-8")
+    return {key: value for key, value in header.items() if key != "index"}
+
+
+def _file_changed(old: List, new: List, mtime: bool, content: bool) -> bool:
+    return old[0] != new[0] or (mtime and old[1] != new[1]) or (content and old[2] != new[2])
+
+
+def diff_fingerprints(left_id: str, right_id: str) -> Dict:
+    """
+    比较两个指纹，只进入哈希不同的子目录；差异逐条写入 NDJSON 报告:
+        {"path", "kind": "file", "change": "added"|"removed"|"modified", "left": [...], "right": [...]}
+        {"path", "kind": "dir", "change": "added"|"removed", "files": 子树文件数, "bytes": 子树字节数}
+    整个目录新增或删除时只报告这个目录，不展开其中的文件。
+    """
+    with Fingerprint.load(left_id) as left, Fingerprint.load(right_id) as right:
+        mtime, content = left.header["mtime"], left.header["content"]
+        if (mtime, content) != (right.header["mtime"], right.header["content"]):
+            raise ValueError("两个指纹的 content/mtime 选项不同，无法比较。")
+        counts = {"added": 0, "removed": 0, "modified": 0}
+        dirs_compared = 0
+        with ReportWriter() as changes:
+            stack = [""]
+            while stack:
+                relative = stack.pop()
+                old_row, new_row = left.row(relative), right.row(relative)
+                if old_row["hash"] == new_row["hash"]:
+                    continue
+                dirs_compared += 1
+                prefix = f"{relative}/" if relative else ""
+                for name in sorted(old_row["files"].keys() | new_row["files"].keys()):
+                    old, new = old_row["files"].get(name), new_row["files"].get(name)
+                    if old is None:
+                        change = "added"
+                    elif new is None:
+                        change = "removed"
+                    elif _file_changed(old, new, mtime, content):
+                        change = "modified"
+                    else:
+                        continue
+                    changes.write({"path": prefix + name, "kind": "file", "change": change, "left": old, "right": new})
+                    counts[change] += 1
+                descend = []
+                for name in sorted(old_row["dirs"].keys() | new_row["dirs"].keys()):
+                    old, new = old_row["dirs"].get(name), new_row["dirs"].get(name)
+                    if old == new:
+                        continue
+                    if old is not None and new is not None:
+                        descend.append(prefix + name)
+                        continue
+                    change = "added" if old is None else "removed"
+                    subtree = (right if old is None else left).row(prefix + name)
+                    changes.write({"path": prefix + name, "kind": "dir", "change": change,
+                                   "files": subtree["file_count"], "bytes": subtree["bytes"]})
+                    counts[change] += 1
+                # 倒序入栈，报告按路径顺序输出
+                stack.extend(reversed(descend))
+        return {"left": left.summary(), "right": right.summary(),
+                "identical": left.header["root_hash"] == right.header["root_hash"],
+                "counts": counts, "dirs_compared": dirs_compared, "report": changes.summary()}
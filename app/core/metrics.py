@@ -0,0 +1,250 @@
+# app/core/metrics.py
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from app.core.profiling import span
+
+# 覆盖单个文件（毫秒级）到整个数据集（半小时级）的耗时范围
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 1800)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        # 先在锁内取快照：抓取期间有新的标签组合第一次出现时，直接遍历字典会抛出 RuntimeError
+        for key, value in sorted(self.state().items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+    def state(self):
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, state):
+        with self._lock:
+            for key, value in state.items():
+                self._values[key] = self._values.get(key, 0) + value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels: str):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> Iterator[str]:
+        # 快照里的桶计数是副本，输出过程中 observe() 不会让同一组样本前后不一致
+        for key, (counts, total, count) in sorted(self.state().items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                labels = _format_labels(self.labelnames, key, 'le="%s"' % bound)
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            yield f"{self.name}_bucket{labels} {count}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {count}"
+
+    def state(self):
+        with self._lock:
+            return {key: [list(counts), total, count] for key, (counts, total, count) in self._values.items()}
+
+    def merge(self, state):
+        with self._lock:
+            for key, (counts, total, count) in state.items():
+                current = self._values.get(key)
+                if current is None:
+                    self._values[key] = [list(counts), total, count]
+                else:
+                    current[0] = [a + b for a, b in zip(current[0], counts)]
+                    current[1] += total
+                    current[2] += count
+
+
+class MetricsRegistry:
+    """进程内的指标注册表，按 Prometheus 文本格式输出。"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+    def export_state(self) -> Dict[str, object]:
+        """导出全部指标的原始状态，供子进程把本次任务的增量带回主进程。"""
+        return {name: metric.state() for name, metric in self._metrics.items() if not isinstance(metric, Gauge)}
+
+    def merge_state(self, state: Dict[str, object]):
+        for name, metric_state in state.items():
+            metric = self._metrics.get(name)
+            if metric is not None:
+                metric.merge(metric_state)
+
+    def reset(self):
+        for metric in self._metrics.values():
+            metric.reset()
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "http_requests_total", "HTTP 请求数", ("method", "path", "status")))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "HTTP 请求耗时（秒）", ("method", "path")))
+WORKER_RUNS = REGISTRY.register(Counter(
+    "worker_runs_total", "worker 调用次数", ("worker", "outcome")))
+WORKER_LATENCY = REGISTRY.register(Histogram(
+    "worker_duration_seconds", "worker 单次调用耗时（秒）", ("worker",)))
+WORKER_STAGE_LATENCY = REGISTRY.register(Histogram(
+    "worker_stage_duration_seconds", "worker 内部各阶段耗时（秒）", ("worker", "stage")))
+WORKER_FILES = REGISTRY.register(Counter(
+    "worker_files_processed_total", "worker 处理的文件数", ("worker",)))
+WORKER_BYTES_READ = REGISTRY.register(Counter(
+    "worker_bytes_read_total", "worker 读取的字节数", ("worker",)))
+WORKER_BYTES_WRITTEN = REGISTRY.register(Counter(
+    "worker_bytes_written_total", "worker 写入的字节数", ("worker",)))
+WORKER_ERRORS = REGISTRY.register(Counter(
+    "worker_errors_total", "worker 处理单个文件时的错误数", ("worker",)))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "worker_queue_depth", "等待或正在执行的任务数", ("pool",)))
+SCHEDULER_WAIT = REGISTRY.register(Histogram(
+    "scheduler_wait_seconds", "任务在调度队列中等待资源与路径锁的时间（秒）", ("resource",)))
+CLUSTER_SHARD_ATTEMPTS = REGISTRY.register(Counter(
+    "cluster_shard_attempts_total", "协调节点发往各工作节点的分片请求数", ("node", "outcome")))
+THROTTLE_WAIT = REGISTRY.register(Counter(
+    "throttle_wait_seconds_total", "文件操作因限速而等待的总时间（秒）", ("limit",)))
+THUMBNAIL_CACHE = REGISTRY.register(Counter(
+    "thumbnail_cache_total", "缩略图缓存命中、按需生成、后台预生成与失败的次数", ("result",)))
+
+
+class WorkerMetrics:
+    """worker 内部上报指标的句柄，所有方法都只是一次加锁累加。"""
+
+    def __init__(self, worker: str):
+        self.worker = worker
+
+    def files(self, count: int = 1):
+        WORKER_FILES.inc(count, worker=self.worker)
+
+    def bytes_read(self, count: int):
+        WORKER_BYTES_READ.inc(count, worker=self.worker)
+
+    def bytes_written(self, count: int):
+        WORKER_BYTES_WRITTEN.inc(count, worker=self.worker)
+
+    def error(self, count: int = 1):
+        WORKER_ERRORS.inc(count, worker=self.worker)
+
+    @contextmanager
+    def stage(self, stage: str):
+        """记录一个阶段的耗时；请求开启了分析时，同时在时间线上留下同名的 span。"""
+        with WORKER_STAGE_LATENCY.time(worker=self.worker, stage=stage), span(stage):
+            yield
+
+
+def worker_metrics(worker: str) -> WorkerMetrics:
+    return WorkerMetrics(worker)
+
+
+@contextmanager
+def track_worker_run(worker: str):
+    """记录一次 worker 调用的耗时与结果（ok/error）。"""
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        WORKER_LATENCY.observe(time.perf_counter() - start, worker=worker)
+        WORKER_RUNS.inc(worker=worker, outcome=outcome)
+
+
+def observe_request(method: str, path: str, status: int, seconds: float):
+    HTTP_REQUESTS.inc(method=method, path=path, status=str(status))
+    HTTP_LATENCY.observe(seconds, method=method, path=path)
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
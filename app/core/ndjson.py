@@ -0,0 +1,83 @@
+# app/core/ndjson.py
+
+import json
+import os
+import pathlib
+from typing import Any, Iterator, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # orjson 是可选依赖，未安装时退回标准库 json
+    orjson = None
+
+WRITE_BUFFER = 1024 * 1024
+
+
+def dumps(row: Any) -> bytes:
+    """序列化成一行 NDJSON（带换行符）。"""
+    if orjson is not None:
+        return orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS)
+    return (json.dumps(row, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def loads(line: bytes) -> Any:
+    return orjson.loads(line) if orjson is not None else json.loads(line)
+
+
+class NdjsonWriter:
+    """逐行追加写入 NDJSON 文件，内存中只有写缓冲，与行数无关。"""
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.rows = 0
+        self._file = open(path, "wb", buffering=WRITE_BUFFER)
+
+    def write(self, row: Any):
+        self._file.write(dumps(row))
+        self.rows += 1
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self) -> "NdjsonWriter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _open_at(path: pathlib.Path, cursor: int):
+    """游标是某一行开头的字节偏移；不在行首或超出文件长度的游标视为无效。"""
+    f = open(path, "rb")
+    if cursor:
+        if cursor < 0 or cursor > os.fstat(f.fileno()).st_size:
+            f.close()
+            raise ValueError(f"无效的游标: {cursor}")
+        f.seek(cursor - 1)
+        if f.read(1) != b"\n":
+            f.close()
+            raise ValueError(f"无效的游标: {cursor}")
+    return f
+
+
+def read_lines(path: pathlib.Path, cursor: int = 0) -> Iterator[bytes]:
+    """从游标处逐行产出原始 NDJSON 行（不解析）。"""
+    with _open_at(path, cursor) as f:
+        yield from f
+
+
+def read_page(path: pathlib.Path, cursor: int = 0, limit: int = 1000) -> Tuple[List[bytes], Optional[int]]:
+    """读取从游标开始的至多 limit 行，返回 (行, 下一页游标)；已到末尾时下一页游标为 None。"""
+    lines: List[bytes] = []
+    with _open_at(path, cursor) as f:
+        for line in f:
+            lines.append(line)
+            cursor += len(line)
+            if len(lines) >= limit:
+                return lines, cursor if f.read(1) else None
+    return lines, None
+
+
+def iter_rows(path: pathlib.Path) -> Iterator[Any]:
+    for line in read_lines(path):
+        yield loads(line)
@@ -0,0 +1,269 @@
+# app/core/plans.py
+
+import hashlib
+import json
+import os
+import pathlib
+import re
+import tempfile
+import threading
+import time
+import uuid
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional
+
+from app.core import throttle
+from app.core.metrics import track_worker_run, worker_metrics
+from app.core.ndjson import NdjsonWriter, dumps, iter_rows
+
+PLAN_DIR_ENV_VAR = "PLAN_DIR"
+PLAN_TTL_ENV_VAR = "PLAN_TTL_HOURS"
+PLAN_MAX_COUNT_ENV_VAR = "PLAN_MAX_COUNT"
+DEFAULT_PLAN_TTL_HOURS = 7 * 24
+DEFAULT_PLAN_MAX_COUNT = 1000
+PRUNE_INTERVAL = 60
+_PLAN_ID = re.compile(r"[0-9a-f]{32}")
+_execute_lock = threading.Lock()
+_prune_lock = threading.Lock()
+_last_prune = 0.0
+
+
+def plan_dir() -> pathlib.Path:
+    path = pathlib.Path(os.environ.get(PLAN_DIR_ENV_VAR) or pathlib.Path(tempfile.gettempdir()) / "workflow_plans")
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def prune_plans(max_age_hours: Optional[float] = None, max_count: Optional[int] = None) -> int:
+    """
+    删除过期的计划：超过 max_age_hours 的，以及按时间从新到旧排在 max_count 之后的。
+    默认值取环境变量 PLAN_TTL_HOURS / PLAN_MAX_COUNT；正在执行的计划不会被删除。返回删除的计划数。
+    """
+    if max_age_hours is None:
+        max_age_hours = float(os.environ.get(PLAN_TTL_ENV_VAR) or DEFAULT_PLAN_TTL_HOURS)
+    if max_count is None:
+        max_count = int(os.environ.get(PLAN_MAX_COUNT_ENV_VAR) or DEFAULT_PLAN_MAX_COUNT)
+
+    newest: Dict[str, float] = {}
+    for path in plan_dir().iterdir():
+        if path.suffix not in (".json", ".ndjson") or not _PLAN_ID.fullmatch(path.stem):
+            continue
+        try:
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            continue
+        newest[path.stem] = max(newest.get(path.stem, 0.0), mtime)
+
+    cutoff = time.time() - max_age_hours * 3600
+    by_age = sorted(newest, key=newest.get, reverse=True)
+    removed = 0
+    for rank, plan_id in enumerate(by_age):
+        if rank < max_count and newest[plan_id] >= cutoff:
+            continue
+        with _execute_lock:
+            try:
+                if load_plan(plan_id)["status"] == "executing":
+                    continue
+            except (FileNotFoundError, ValueError):
+                pass  # 没有计划头：演练中途失败留下的操作文件
+            _plan_path(plan_id).unlink(missing_ok=True)
+            _operations_path(plan_id).unlink(missing_ok=True)
+        removed += 1
+    return removed
+
+
+def _maybe_prune():
+    """新建计划时顺带清理，同一进程内至多每 PRUNE_INTERVAL 秒扫描一次目录。"""
+    global _last_prune
+    with _prune_lock:
+        if time.monotonic() - _last_prune < PRUNE_INTERVAL and _last_prune:
+            return
+        _last_prune = time.monotonic()
+    prune_plans()
+
+
+def planned_operation(op: str, src: pathlib.Path, dst: pathlib.Path,
+                      record: Optional[pathlib.Path] = None, row: Optional[Dict] = None) -> Dict:
+    """
+    记录一步文件操作（move/copy）以及扫描时源文件的大小和修改时间，执行前据此判断文件是否变过。
+    给出 record 时，执行成功后把 row 追加到 NDJSON 文件 record 中，
+    用于 worker 自己维护的记录（例如 batch_rename_files 的编号映射）与实际执行的操作保持一致。
+    """
+    stat = os.stat(src)
+    operation = {"op": op, "src": str(src), "dst": str(dst), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if record is not None:
+        operation["record"] = {"path": str(record), "row": row}
+    return operation
+
+
+def _operation_digest(operation: Dict) -> int:
+    text = f"{operation['op']}\0{operation['src']}\0{operation['dst']}\0{operation['size']}\0{operation['mtime_ns']}"
+    record = operation.get("record")
+    if record is not None:
+        # 执行时会把 row 追加到 record 文件，改动它们同样要让指纹失配；不带 record 的操作摘要与之前相同
+        text += "\0" + json.dumps(record, ensure_ascii=False, sort_keys=True)
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16)
+    return int.from_bytes(digest.digest(), "big")
+
+
+def fingerprint_operations(operations: Iterable[Dict]) -> str:
+    """各操作摘要按模 2^128 求和：与顺序无关，可以边生成边累加，不必先把操作收集起来排序。"""
+    total = 0
+    for operation in operations:
+        total = (total + _operation_digest(operation)) & ((1 << 128) - 1)
+    return f"{total:032x}"
+
+
+def _plan_path(plan_id: str) -> pathlib.Path:
+    if not _PLAN_ID.fullmatch(plan_id):
+        raise ValueError(f"无效的计划 id: '{plan_id}'。")
+    return plan_dir() / f"{plan_id}.json"
+
+
+def _operations_path(plan_id: str) -> pathlib.Path:
+    return _plan_path(plan_id).with_suffix(".ndjson")
+
+
+def _save(plan: Dict):
+    path = _plan_path(plan["plan_id"])
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(plan, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+class PlanWriter:
+    """
+    边演练边把操作逐条写入计划的 NDJSON 文件（<plan_id>.ndjson），内存占用与操作数无关。
+    with 块正常结束时写入计划头（含操作数与指纹），异常退出时丢弃已写的操作。
+    params 只用于记录计划是由哪些参数生成的，执行时不会再用到。
+    """
+
+    def __init__(self, worker: str, params: Dict):
+        _maybe_prune()
+        self.plan = {
+            "plan_id": uuid.uuid4().hex,
+            "worker": worker,
+            "created": time.time(),
+            "params": {key: str(value) if isinstance(value, pathlib.PurePath) else value
+                       for key, value in params.items()},
+            "status": "planned",
+        }
+        self._writer = NdjsonWriter(_operations_path(self.plan["plan_id"]))
+        self._fingerprint = 0
+
+    def add(self, operation: Dict):
+        self._writer.write(operation)
+        self._fingerprint = (self._fingerprint + _operation_digest(operation)) & ((1 << 128) - 1)
+
+    def __enter__(self) -> "PlanWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._writer.close()
+        if exc_type is not None:
+            self._writer.path.unlink(missing_ok=True)
+            return
+        self.plan["fingerprint"] = f"{self._fingerprint:032x}"
+        self.plan["operations"] = self._writer.rows
+        _save(self.plan)
+
+
+def create_plan(worker: str, params: Dict, operations: Iterable[Dict]) -> Dict:
+    """保存 worker 演练得到的执行计划，返回计划头（含 plan_id、操作数与扫描状态指纹）。"""
+    with PlanWriter(worker, params) as writer:
+        for operation in operations:
+            writer.add(operation)
+    return writer.plan
+
+
+def load_plan(plan_id: str) -> Dict:
+    """读取计划头；plan["operations"] 是操作数，逐条操作用 iter_operations 读取。"""
+    path = _plan_path(plan_id)
+    if not path.is_file():
+        raise FileNotFoundError(f"计划 '{plan_id}' 不存在。")
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def operations_path(plan_id: str) -> pathlib.Path:
+    load_plan(plan_id)
+    return _operations_path(plan_id)
+
+
+def iter_operations(plan_id: str) -> Iterator[Dict]:
+    return iter_rows(operations_path(plan_id))
+
+
+def summarize_plan(plan: Dict) -> Dict:
+    """计划概要（即计划头，不含逐条操作），用于接口返回。"""
+    return dict(plan)
+
+
+def execute_plan(plan_id: str) -> Dict:
+    """
+    按计划逐条执行，不再重新扫描和决策。执行前先核对操作文件的指纹与计划头一致（操作文件被截断或改动过时拒绝执行）；
+    每条操作只重新 stat 一次源文件：大小或修改时间与计划时不同（或已不存在）的操作视为过期并跳过，
+    目标已被占用的视为冲突并跳过，其余直接执行。跳过的操作需要重新演练，调用方应把结果视为不完整。
+    每个计划只能执行一次。
+    """
+    with _execute_lock:
+        plan = load_plan(plan_id)
+        if plan["status"] != "planned":
+            raise ValueError(f"计划 '{plan_id}' 的状态为 {plan['status']}，不能再次执行。")
+        if fingerprint_operations(iter_operations(plan_id)) != plan["fingerprint"]:
+            raise ValueError(f"计划 '{plan_id}' 的操作文件与计划头的指纹不一致，拒绝执行。")
+        plan["status"] = "executing"
+        _save(plan)
+
+    metrics = worker_metrics(plan["worker"])
+    applied = 0
+    stale: List[Dict] = []
+    conflicts: List[Dict] = []
+    errors: List[Dict] = []
+    records: Dict[str, BinaryIO] = {}
+    try:
+        with track_worker_run(f"{plan['worker']}:execute_plan"):
+            for operation in iter_operations(plan_id):
+                src, dst = pathlib.Path(operation["src"]), pathlib.Path(operation["dst"])
+                try:
+                    stat = os.stat(src)
+                except FileNotFoundError:
+                    stale.append({"src": operation["src"], "reason": "missing"})
+                    continue
+                if stat.st_size != operation["size"] or stat.st_mtime_ns != operation["mtime_ns"]:
+                    stale.append({"src": operation["src"], "reason": "changed"})
+                    continue
+                if dst.exists():
+                    conflicts.append({"src": operation["src"], "dst": operation["dst"]})
+                    continue
+                try:
+                    dst.parent.mkdir(parents=True, exist_ok=True)
+                    if operation["op"] == "copy":
+                        throttle.copy(src, dst)
+                        metrics.bytes_written(stat.st_size)
+                    else:
+                        throttle.move(src, dst)
+                    metrics.files()
+                    applied += 1
+                except OSError as e:
+                    metrics.error()
+                    errors.append({"src": operation["src"], "error": str(e)})
+                    continue
+                record = operation.get("record")
+                if record is not None:
+                    if record["path"] not in records:
+                        records[record["path"]] = open(record["path"], "ab")
+                    records[record["path"]].write(dumps(record["row"]))
+    except BaseException:
+        # 中途异常时已执行的操作无法自动撤销，标记为 failed 防止被再次执行
+        plan["status"] = "failed"
+        _save(plan)
+        raise
+    finally:
+        for f in records.values():
+            f.close()
+
+    plan["status"] = "executed"
+    plan["executed"] = time.time()
+    plan["result"] = {"applied": applied, "stale": len(stale), "conflicts": len(conflicts), "errors": len(errors)}
+    _save(plan)
+    return {"plan_id": plan_id, "worker": plan["worker"], "applied": applied, "stale": stale,
+            "conflicts": conflicts, "errors": errors}
@@ -0,0 +1,226 @@
+# app/core/profiling.py
+
+import contextvars
+import cProfile
+import json
+import os
+import pathlib
+import pstats
+import re
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional
+
+PROFILE_DIR_ENV_VAR = "PROFILE_DIR"
+PROFILE_TTL_ENV_VAR = "PROFILE_TTL_HOURS"
+PROFILE_MAX_COUNT_ENV_VAR = "PROFILE_MAX_COUNT"
+DEFAULT_PROFILE_TTL_HOURS = 7 * 24
+DEFAULT_PROFILE_MAX_COUNT = 200
+PRUNE_INTERVAL = 60
+_PROFILE_FILE = re.compile(r"([0-9a-f]{32})\.(?:pstats|speedscope\.json)")
+_NULL_SPAN = nullcontext()
+
+_prune_lock = threading.Lock()
+_last_prune = 0.0
+
+
+def profile_dir() -> pathlib.Path:
+    path = pathlib.Path(os.environ.get(PROFILE_DIR_ENV_VAR) or pathlib.Path(tempfile.gettempdir()) / "workflow_profiles")
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def prune_profiles(max_age_hours: Optional[float] = None, max_count: Optional[int] = None) -> int:
+    """
+    删除过期的分析结果：超过 max_age_hours 的，以及按时间从新到旧排在 max_count 之后的。
+    默认值取环境变量 PROFILE_TTL_HOURS / PROFILE_MAX_COUNT。返回删除的分析结果数。
+    """
+    if max_age_hours is None:
+        max_age_hours = float(os.environ.get(PROFILE_TTL_ENV_VAR) or DEFAULT_PROFILE_TTL_HOURS)
+    if max_count is None:
+        max_count = int(os.environ.get(PROFILE_MAX_COUNT_ENV_VAR) or DEFAULT_PROFILE_MAX_COUNT)
+
+    newest: Dict[str, float] = {}
+    files: Dict[str, List[pathlib.Path]] = {}
+    for path in profile_dir().iterdir():
+        match = _PROFILE_FILE.fullmatch(path.name)
+        if not match:
+            continue
+        try:
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            continue
+        job_id = match.group(1)
+        newest[job_id] = max(newest.get(job_id, 0.0), mtime)
+        files.setdefault(job_id, []).append(path)
+
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
+    for rank, job_id in enumerate(sorted(newest, key=newest.get, reverse=True)):
+        if rank < max_count and newest[job_id] >= cutoff:
+            continue
+        for path in files[job_id]:
+            path.unlink(missing_ok=True)
+        removed += 1
+    return removed
+
+
+def _maybe_prune():
+    """保存分析结果时顺带清理，同一进程内至多每 PRUNE_INTERVAL 秒扫描一次目录。"""
+    global _last_prune
+    with _prune_lock:
+        if time.monotonic() - _last_prune < PRUNE_INTERVAL and _last_prune:
+            return
+        _last_prune = time.monotonic()
+    prune_profiles()
+
+
+class _RawStats:
+    """让 pstats.Stats 能直接加载从子进程传回的原始统计字典。"""
+
+    def __init__(self, stats: Dict):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class ProfileSession:
+    """一次被分析请求的全部数据：cProfile 统计与 worker 内部的计时片段（span）。"""
+
+    def __init__(self, job_id: Optional[str] = None):
+        self.job_id = job_id or uuid.uuid4().hex
+        self.started = time.perf_counter()
+        self.spans: List[Dict] = []
+        self.stats: Optional[pstats.Stats] = None
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, start: float, duration: float, thread: str):
+        with self._lock:
+            self.spans.append({"name": name, "start": start - self.started,
+                               "duration": duration, "thread": thread})
+
+    def add_stats(self, raw_stats: Dict):
+        with self._lock:
+            if self.stats is None:
+                self.stats = pstats.Stats(_RawStats(raw_stats))
+            else:
+                self.stats.add(pstats.Stats(_RawStats(raw_stats)))
+
+    def merge_child(self, payload: Dict, offset: float):
+        """并入子进程中同一任务的分析结果，offset 为任务提交时刻相对本会话起点的秒数。"""
+        if payload.get("stats"):
+            self.add_stats(payload["stats"])
+        with self._lock:
+            for child_span in payload.get("spans", []):
+                self.spans.append(dict(child_span, start=child_span["start"] + offset))
+
+    def export(self) -> Dict:
+        """导出可 pickle 的原始数据，供子进程传回主进程。"""
+        return {"stats": self.stats.stats if self.stats is not None else None, "spans": list(self.spans)}
+
+    @contextmanager
+    def profile(self):
+        """在当前线程内用 cProfile 运行一段代码，结果并入本次会话。"""
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ 同一时刻只允许一个 cProfile 生效，并发的分析请求退化为只记录 span
+            yield
+            return
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.create_stats()
+            self.add_stats(profiler.stats)
+
+    def to_speedscope(self) -> Dict:
+        """把 span 转成 speedscope 的 evented 格式，每个线程一条时间线。"""
+        frames: List[Dict] = []
+        frame_index: Dict[str, int] = {}
+        by_thread: Dict[str, List[Dict]] = {}
+        for span in self.spans:
+            if span["name"] not in frame_index:
+                frame_index[span["name"]] = len(frames)
+                frames.append({"name": span["name"]})
+            by_thread.setdefault(span["thread"], []).append(span)
+
+        profiles = []
+        for thread, spans in by_thread.items():
+            events = []
+            for span in spans:
+                frame = frame_index[span["name"]]
+                end = span["start"] + span["duration"]
+                events.append((span["start"], 1, -span["duration"], {"type": "O", "frame": frame, "at": span["start"]}))
+                events.append((end, 0, span["duration"], {"type": "C", "frame": frame, "at": end}))
+            # 同一时刻先关闭再打开；同时打开的先开外层，同时关闭的先关内层，保证嵌套关系合法
+            events.sort(key=lambda e: e[:3])
+            end_value = max(e[0] for e in events)
+            profiles.append({"type": "evented", "name": thread, "unit": "seconds",
+                             "startValue": 0, "endValue": end_value, "events": [e[3] for e in events]})
+
+        return {"$schema": "https://www.speedscope.app/file-format-schema.json",
+                "shared": {"frames": frames}, "profiles": profiles, "name": self.job_id}
+
+    def save(self, directory: Optional[pathlib.Path] = None) -> Dict[str, str]:
+        directory = directory or profile_dir()
+        files = {}
+        if self.stats is not None:
+            path = directory / f"{self.job_id}.pstats"
+            self.stats.dump_stats(path)
+            files["pstats"] = str(path)
+        path = directory / f"{self.job_id}.speedscope.json"
+        path.write_text(json.dumps(self.to_speedscope(), ensure_ascii=False), encoding="utf-8")
+        files["speedscope"] = str(path)
+        _maybe_prune()
+        return files
+
+
+_active_session: contextvars.ContextVar[Optional[ProfileSession]] = contextvars.ContextVar(
+    "active_profile_session", default=None)
+
+
+def current_session() -> Optional[ProfileSession]:
+    return _active_session.get()
+
+
+@contextmanager
+def profiling_session(session: ProfileSession):
+    token = _active_session.set(session)
+    try:
+        yield session
+    finally:
+        _active_session.reset(token)
+
+
+class _Span:
+    __slots__ = ("session", "name", "start")
+
+    def __init__(self, session: ProfileSession, name: str):
+        self.session = session
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.session.add_span(self.name, self.start, time.perf_counter() - self.start,
+                              threading.current_thread().name)
+        return False
+
+
+def span(name: str):
+    """
+    标记 worker 内部的一个阶段（scan/decode/encode/move 等）。
+    没有开启分析时只做一次 ContextVar 读取，返回共享的空上下文。
+    """
+    session = _active_session.get()
+    if session is None:
+        return _NULL_SPAN
+    return _Span(session, name)
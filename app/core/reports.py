@@ -0,0 +1,95 @@
+# app/core/reports.py
+
+import os
+import pathlib
+import re
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterator, Optional
+
+from app.core.ndjson import NdjsonWriter, iter_rows
+
+REPORT_DIR_ENV_VAR = "REPORT_DIR"
+REPORT_TTL_ENV_VAR = "REPORT_TTL_HOURS"
+REPORT_MAX_COUNT_ENV_VAR = "REPORT_MAX_COUNT"
+DEFAULT_REPORT_TTL_HOURS = 7 * 24
+DEFAULT_REPORT_MAX_COUNT = 1000
+PRUNE_INTERVAL = 60
+_REPORT_ID = re.compile(r"[0-9a-f]{32}")
+_prune_lock = threading.Lock()
+_last_prune = 0.0
+
+
+def report_dir() -> pathlib.Path:
+    path = pathlib.Path(os.environ.get(REPORT_DIR_ENV_VAR) or pathlib.Path(tempfile.gettempdir()) / "workflow_reports")
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def report_path(report_id: str) -> pathlib.Path:
+    if not _REPORT_ID.fullmatch(report_id):
+        raise ValueError(f"无效的报告 id: '{report_id}'。")
+    path = report_dir() / f"{report_id}.ndjson"
+    if not path.is_file():
+        raise FileNotFoundError(f"报告 '{report_id}' 不存在。")
+    return path
+
+
+def prune_reports(max_age_hours: Optional[float] = None, max_count: Optional[int] = None) -> int:
+    """
+    删除超过 max_age_hours 的报告，以及按时间从新到旧排在 max_count 之后的报告。
+    默认值取环境变量 REPORT_TTL_HOURS / REPORT_MAX_COUNT。返回删除的报告数。
+    """
+    if max_age_hours is None:
+        max_age_hours = float(os.environ.get(REPORT_TTL_ENV_VAR) or DEFAULT_REPORT_TTL_HOURS)
+    if max_count is None:
+        max_count = int(os.environ.get(REPORT_MAX_COUNT_ENV_VAR) or DEFAULT_REPORT_MAX_COUNT)
+
+    reports = []
+    for path in report_dir().glob("*.ndjson"):
+        if not _REPORT_ID.fullmatch(path.stem):
+            continue
+        try:
+            reports.append((path.stat().st_mtime, path))
+        except FileNotFoundError:
+            continue
+    reports.sort(reverse=True)
+
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
+    for rank, (mtime, path) in enumerate(reports):
+        if rank >= max_count or mtime < cutoff:
+            path.unlink(missing_ok=True)
+            removed += 1
+    return removed
+
+
+def _maybe_prune():
+    """新建报告时顺带清理，同一进程内至多每 PRUNE_INTERVAL 秒扫描一次目录。"""
+    global _last_prune
+    with _prune_lock:
+        if time.monotonic() - _last_prune < PRUNE_INTERVAL and _last_prune:
+            return
+        _last_prune = time.monotonic()
+    prune_reports()
+
+
+class ReportWriter(NdjsonWriter):
+    """
+    worker 的逐文件明细（重复文件组、不合格图片等）边产生边写入 NDJSON 报告，
+    worker 只返回统计和报告 id，明细由接口按需流式输出或分页读取。
+    """
+
+    def __init__(self):
+        _maybe_prune()
+        self.report_id = uuid.uuid4().hex
+        super().__init__(report_dir() / f"{self.report_id}.ndjson")
+
+    def summary(self) -> Dict:
+        return {"report_id": self.report_id, "rows": self.rows}
+
+
+def iter_report(report_id: str) -> Iterator[Any]:
+    return iter_rows(report_path(report_id))
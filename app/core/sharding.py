@@ -0,0 +1,29 @@
+# app/core/sharding.py
+
+import hashlib
+import pathlib
+from typing import NamedTuple, Union
+
+HASH = "hash"
+SUBTREE = "subtree"
+STRATEGIES = (HASH, SUBTREE)
+
+
+class Shard(NamedTuple):
+    """
+    集群模式下一个分片：把 64 位哈希空间等分成 count 段，落在第 index 段的文件属于本分片。
+    strategy=hash 时按文件相对路径取哈希，文件均匀打散；strategy=subtree 时按第一级子文件夹取哈希，
+    同一棵子树整体落在同一分片（源文件夹根下的文件各自成一棵子树）。
+    """
+    index: int
+    count: int
+    strategy: str = HASH
+
+    def contains_key(self, key: str) -> bool:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big") * self.count >> 64 == self.index
+
+    def contains(self, path: Union[str, pathlib.Path], root: pathlib.Path) -> bool:
+        relative = pathlib.Path(path).relative_to(root)
+        key = relative.parts[0] if self.strategy == SUBTREE else relative.as_posix()
+        return self.contains_key(key)
@@ -0,0 +1,148 @@
+# app/core/streams.py
+
+import threading
+from collections import deque
+from typing import Any, Deque, Optional, Tuple
+
+DEFAULT_MAX_CHUNKS = 16
+
+
+class ChunkPipe:
+    """
+    把异步接收的请求体交给工作线程按文件方式 read(n) 读取。
+    队列有界：写满时写入方等待，读取慢于上传时背压一直传到客户端，内存占用固定。
+    读取方调用 close() 后写入方不再等待，剩余数据直接丢弃。
+    """
+
+    def __init__(self, max_chunks: int = DEFAULT_MAX_CHUNKS):
+        self.max_chunks = max_chunks
+        self._chunks: Deque[bytes] = deque()
+        self._condition = threading.Condition()
+        self._finished = False
+        self._closed = False
+
+    def try_feed(self, chunk: bytes) -> bool:
+        """不等待地写入一块，队列已满时返回 False。"""
+        with self._condition:
+            if self._closed:
+                return True
+            if len(self._chunks) >= self.max_chunks:
+                return False
+            self._chunks.append(chunk)
+            self._condition.notify_all()
+            return True
+
+    def feed(self, chunk: bytes) -> bool:
+        """写入一块，队列满时等待；读取方已关闭时返回 False。"""
+        with self._condition:
+            while len(self._chunks) >= self.max_chunks and not self._closed:
+                self._condition.wait()
+            if self._closed:
+                return False
+            self._chunks.append(chunk)
+            self._condition.notify_all()
+            return True
+
+    def finish(self):
+        """写入方：数据已全部写入（或上传中断），读取方读完队列后得到 EOF。"""
+        with self._condition:
+            self._finished = True
+            self._condition.notify_all()
+
+    def close(self):
+        """读取方：不再读取。"""
+        with self._condition:
+            self._closed = True
+            self._chunks.clear()
+            self._condition.notify_all()
+
+    def read(self, n: int = -1) -> bytes:
+        with self._condition:
+            while not self._chunks and not self._finished and not self._closed:
+                self._condition.wait()
+            if not self._chunks:
+                return b""
+            chunk = self._chunks.popleft()
+            if 0 <= n < len(chunk):
+                self._chunks.appendleft(chunk[n:])
+                chunk = chunk[:n]
+            self._condition.notify_all()
+            return chunk
+
+
+class BoundedQueue:
+    """
+    在线程之间传递数据项的队列，按字节预算限流：预算用满时 put 等待，消费慢于生产时背压传回生产方。
+    计入预算的有排队中的数据项、生产方用 try_reserve 临时占用的内存，以及 hold=True 时
+    消费方已取出但还没 release 的数据项（例如交给进程池、尚未处理完的数据）。
+    消费方不占用预算时总能放入一项，单项超过预算也不会卡死。
+    与 ChunkPipe 一样，生产方结束时调用 finish()，消费方不再读取时调用 close()。
+    """
+
+    def __init__(self, max_bytes: int, hold: bool = False):
+        self.max_bytes = max_bytes
+        self.hold = hold
+        self._items: Deque[Tuple[Any, int]] = deque()
+        # 排队中与消费方持有的字节；生产方占用的另记在 _reserved，生产方等待时不必等它们释放
+        self._bytes = 0
+        self._reserved = 0
+        self._condition = threading.Condition()
+        self._finished = False
+        self._closed = False
+
+    def put(self, item: Any, size: int) -> bool:
+        """放入一项，超出预算时等待；消费方已关闭时返回 False。"""
+        with self._condition:
+            while self._bytes and self._bytes + self._reserved + size > self.max_bytes and not self._closed:
+                self._condition.wait()
+            if self._closed:
+                return False
+            self._items.append((item, size))
+            self._bytes += size
+            self._condition.notify_all()
+            return True
+
+    def try_reserve(self, size: int) -> bool:
+        """生产方：不等待地占用 size 字节预算，预算不足时返回 False。"""
+        with self._condition:
+            if self._bytes + self._reserved + size > self.max_bytes:
+                return False
+            self._reserved += size
+            return True
+
+    def unreserve(self, size: int):
+        with self._condition:
+            self._reserved -= size
+            self._condition.notify_all()
+
+    def release(self, size: int):
+        """消费方（hold=True）：取出的数据项处理完毕，归还其预算。"""
+        with self._condition:
+            if not self._closed:
+                self._bytes -= size
+            self._condition.notify_all()
+
+    def finish(self):
+        with self._condition:
+            self._finished = True
+            self._condition.notify_all()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._items.clear()
+            self._bytes = 0
+            self._condition.notify_all()
+
+    def get(self) -> Optional[Any]:
+        """取出一项；生产方已结束且队列取空后返回 None。"""
+        with self._condition:
+            while not self._items and not self._finished and not self._closed:
+                self._condition.wait()
+            if not self._items:
+                return None
+            item, size = self._items.popleft()
+            if not self.hold:
+                self._bytes -= size
+                self._condition.notify_all()
+            return item
@@ -0,0 +1,368 @@
+# app/core/throttle.py
+
+import contextvars
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from app.core.metrics import THROTTLE_WAIT
+
+BYTES_ENV_VAR = "THROTTLE_BYTES_PER_SEC"
+OPS_ENV_VAR = "THROTTLE_OPS_PER_SEC"
+# 限速复制时每次读写的块大小，越小速率越平滑
+COPY_CHUNK = 256 * 1024
+# 共享令牌桶无法跨进程唤醒，等待时最长隔这么久重新读取一次速率
+POLL_INTERVAL = 0.1
+# 共享表的槽位数：全局限速占 2 个，每个带限速头的请求再占 2 个
+SHARED_SLOTS = 130
+
+
+class TokenBucket:
+    """
+    令牌桶：每秒补充 rate 个令牌，最多积攒 burst 个（默认一秒的量）。
+    取令牌时只要桶里有 min(数量, burst) 个就立即放行并允许欠账，所以单次请求大于 burst 也不会卡死，
+    欠下的令牌由后续调用方等待补齐。rate 为 None 表示不限速。修改速率会唤醒正在等待的线程按新速率重新计算。
+    """
+
+    def __init__(self, rate: Optional[float] = None, burst: Optional[float] = None):
+        self._condition = threading.Condition()
+        self.rate: Optional[float] = None
+        self.burst = 0.0
+        self._tokens = 0.0
+        self._stamp = time.monotonic()
+        self.set_rate(rate, burst)
+
+    def set_rate(self, rate: Optional[float], burst: Optional[float] = None):
+        with self._condition:
+            self._refill()
+            was_limited = self.rate is not None
+            self.rate = rate or None
+            self.burst = burst or rate or 0.0
+            # 从不限速切换过来时桶是满的；调整速率时保留已有令牌（或欠账）
+            self._tokens = min(self._tokens, self.burst) if was_limited else self.burst
+            self._condition.notify_all()
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def consume(self, amount: float) -> float:
+        """取 amount 个令牌，不够时等待，返回等待的秒数。"""
+        if self.rate is None:
+            return 0.0
+        started = time.monotonic()
+        with self._condition:
+            while self.rate is not None:
+                self._refill()
+                needed = min(amount, self.burst)
+                if self._tokens >= needed:
+                    self._tokens -= amount
+                    break
+                self._condition.wait((needed - self._tokens) / self.rate)
+        return time.monotonic() - started
+
+
+class _PollingCondition:
+    """共享令牌桶用的条件变量：锁是跨进程的，但无法跨进程唤醒，等待改为按 POLL_INTERVAL 轮询。"""
+
+    def __init__(self, lock):
+        self._lock = lock
+
+    def __enter__(self):
+        self._lock.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._lock.release()
+
+    def wait(self, timeout: float):
+        self._lock.release()
+        try:
+            time.sleep(min(timeout, POLL_INTERVAL))
+        finally:
+            self._lock.acquire()
+
+    def notify_all(self):
+        pass
+
+
+class SharedLimits:
+    """
+    放在共享内存里的一组令牌桶槽位，每个槽位 4 个 double：速率（0 为不限速）、容量、令牌数、时间戳。
+    由服务进程创建，经进程池的 initializer 交给预热子进程，双方按同一组令牌限速，
+    /throttle 修改的速率子进程在下一次轮询时就能读到。槽位的分配只在服务进程里进行。
+    """
+
+    FIELDS = 4
+
+    def __init__(self, slots: int = SHARED_SLOTS, context=None):
+        context = context or multiprocessing.get_context("spawn")
+        self.values = context.Array("d", slots * self.FIELDS)
+        self._free: List[int] = list(range(slots - 1, -1, -1))
+        self._free_lock = threading.Lock()
+
+    def __getstate__(self):
+        # 子进程只需要共享内存本身；槽位分配状态留在服务进程
+        return {"values": self.values}
+
+    def __setstate__(self, state):
+        self.values = state["values"]
+        self._free = []
+        self._free_lock = threading.Lock()
+
+    def claim(self) -> int:
+        with self._free_lock:
+            if not self._free:
+                raise ValueError("带限速的请求过多，共享限速槽位已用完，请稍后重试。")
+            index = self._free.pop()
+        with self.values.get_lock():
+            base = index * self.FIELDS
+            self.values.get_obj()[base:base + self.FIELDS] = [0.0] * self.FIELDS
+        return index
+
+    def release(self, index: int):
+        with self._free_lock:
+            self._free.append(index)
+
+
+def _slot_field(offset: int) -> property:
+    def getter(bucket):
+        return bucket._raw[bucket._base + offset]
+
+    def setter(bucket, value):
+        bucket._raw[bucket._base + offset] = value
+    return property(getter, setter)
+
+
+class SharedTokenBucket(TokenBucket):
+    """状态放在 SharedLimits 某个槽位里的令牌桶，逻辑与 TokenBucket 相同，可被多个进程同时使用。"""
+
+    burst = _slot_field(1)
+    _tokens = _slot_field(2)
+    _stamp = _slot_field(3)
+
+    def __init__(self, limits: SharedLimits, index: int):
+        self.index = index
+        self._raw = limits.values.get_obj()
+        self._base = index * SharedLimits.FIELDS
+        self._condition = _PollingCondition(limits.values.get_lock())
+
+    @property
+    def rate(self) -> Optional[float]:
+        return self._raw[self._base] or None
+
+    @rate.setter
+    def rate(self, value: Optional[float]):
+        self._raw[self._base] = value or 0.0
+
+
+class Throttle:
+    """一组限速：字节/秒与操作/秒，二者都可以随时调整。"""
+
+    def __init__(self, name: str, bytes_per_sec: Optional[float] = None, ops_per_sec: Optional[float] = None):
+        self.name = name
+        self._bytes: TokenBucket = TokenBucket(bytes_per_sec)
+        self._ops: TokenBucket = TokenBucket(ops_per_sec)
+        self._limits: Optional[SharedLimits] = None
+
+    @classmethod
+    def from_slots(cls, name: str, limits: SharedLimits, slots: Tuple[int, int]) -> "Throttle":
+        throttle = cls(name)
+        throttle.bind(limits, slots)
+        return throttle
+
+    def bind(self, limits: SharedLimits, slots: Tuple[int, int]):
+        """在子进程里改用服务进程分配好的共享槽位，不改动其中的速率与令牌，也不负责归还。"""
+        self._bytes = SharedTokenBucket(limits, slots[0])
+        self._ops = SharedTokenBucket(limits, slots[1])
+
+    @property
+    def slots(self) -> Optional[Tuple[int, int]]:
+        """共享限速占用的 (字节桶, 操作桶) 槽位；仍是进程内限速时为 None。"""
+        if isinstance(self._bytes, SharedTokenBucket) and isinstance(self._ops, SharedTokenBucket):
+            return self._bytes.index, self._ops.index
+        return None
+
+    def attach(self, limits: SharedLimits):
+        """把两个令牌桶换成共享槽位并沿用当前速率，之后预热子进程也能按这组限速执行。"""
+        bytes_slot = limits.claim()
+        try:
+            ops_slot = limits.claim()
+        except ValueError:
+            limits.release(bytes_slot)
+            raise
+        old_bytes, old_ops = self._bytes, self._ops
+        self._bytes = SharedTokenBucket(limits, bytes_slot)
+        self._ops = SharedTokenBucket(limits, ops_slot)
+        self._bytes.set_rate(old_bytes.rate, old_bytes.burst or None)
+        self._ops.set_rate(old_ops.rate, old_ops.burst or None)
+        self._limits = limits
+
+    def detach(self):
+        """归还 attach 占用的共享槽位。"""
+        if self._limits is not None:
+            for bucket in (self._bytes, self._ops):
+                self._limits.release(bucket.index)
+            self._limits = None
+
+    @property
+    def bytes_limited(self) -> bool:
+        return self._bytes.rate is not None
+
+    def set_limits(self, bytes_per_sec: Optional[float], ops_per_sec: Optional[float]):
+        self._bytes.set_rate(bytes_per_sec)
+        self._ops.set_rate(ops_per_sec)
+
+    def consume_bytes(self, count: int):
+        waited = self._bytes.consume(count)
+        if waited:
+            THROTTLE_WAIT.inc(waited, limit="bytes")
+
+    def consume_ops(self, count: int = 1):
+        waited = self._ops.consume(count)
+        if waited:
+            THROTTLE_WAIT.inc(waited, limit="ops")
+
+    def status(self) -> Dict:
+        return {"name": self.name, "bytes_per_sec": self._bytes.rate, "ops_per_sec": self._ops.rate}
+
+
+def _env_rate(name: str) -> Optional[float]:
+    value = os.environ.get(name)
+    return float(value) if value else None
+
+
+# 全局限速对所有 worker 生效（启用共享限速后也包括预热子进程）；单个请求还可以在此之上再加一层自己的限速
+GLOBAL_THROTTLE = Throttle("global", _env_rate(BYTES_ENV_VAR), _env_rate(OPS_ENV_VAR))
+current_throttle: contextvars.ContextVar[Optional[Throttle]] = contextvars.ContextVar("throttle", default=None)
+
+_active: Dict[str, Throttle] = {}
+_active_lock = threading.Lock()
+# 服务进程：enable_shared_limits 创建的共享表；子进程：install_shared_limits 收到的同一张表
+_shared: Optional[SharedLimits] = None
+
+
+def enable_shared_limits() -> SharedLimits:
+    """
+    服务进程启动预热进程池前调用（只创建一次）：全局限速和此后注册的请求限速都改用共享槽位，
+    返回的表连同 GLOBAL_THROTTLE.slots 交给子进程的 install_shared_limits。
+    """
+    global _shared
+    with _active_lock:
+        if _shared is None:
+            limits = SharedLimits()
+            GLOBAL_THROTTLE.attach(limits)
+            _shared = limits
+        return _shared
+
+
+def install_shared_limits(limits: SharedLimits, global_slots: Tuple[int, int]):
+    """预热子进程的 initializer 调用：全局限速绑定到服务进程里的同一组槽位。"""
+    global _shared
+    _shared = limits
+    GLOBAL_THROTTLE.bind(limits, global_slots)
+
+
+def shared_slots(throttle: Optional[Throttle]) -> Optional[Tuple[str, Tuple[int, int]]]:
+    """把请求限速转换成可以传给子进程的 (名称, 槽位)；没有限速或未共享时为 None。"""
+    if throttle is None or throttle.slots is None:
+        return None
+    return throttle.name, throttle.slots
+
+
+@contextmanager
+def child_throttle(slots: Optional[Tuple[str, Tuple[int, int]]]):
+    """子进程执行一个任务期间，让 current_throttle 指向服务进程里那个请求的共享限速。"""
+    if _shared is None or slots is None:
+        yield
+        return
+    token = current_throttle.set(Throttle.from_slots(slots[0], _shared, slots[1]))
+    try:
+        yield
+    finally:
+        current_throttle.reset(token)
+
+
+def register_throttle(throttle: Throttle):
+    """登记请求限速；已启用共享限速时同时为它分配槽位，槽位用完时抛出 ValueError。"""
+    with _active_lock:
+        if throttle.name in _active:
+            raise ValueError(f"限速 id '{throttle.name}' 已被正在执行的请求使用。")
+        if _shared is not None:
+            throttle.attach(_shared)
+        _active[throttle.name] = throttle
+
+
+def unregister_throttle(throttle: Throttle):
+    with _active_lock:
+        if _active.get(throttle.name) is throttle:
+            del _active[throttle.name]
+        throttle.detach()
+
+
+def active_throttle(name: str) -> Optional[Throttle]:
+    with _active_lock:
+        return _active.get(name)
+
+
+def active_throttles() -> Dict[str, Dict]:
+    with _active_lock:
+        return {name: throttle.status() for name, throttle in _active.items()}
+
+
+def consume_bytes(count: int):
+    GLOBAL_THROTTLE.consume_bytes(count)
+    throttle = current_throttle.get()
+    if throttle is not None:
+        throttle.consume_bytes(count)
+
+
+def consume_ops(count: int = 1):
+    GLOBAL_THROTTLE.consume_ops(count)
+    throttle = current_throttle.get()
+    if throttle is not None:
+        throttle.consume_ops(count)
+
+
+def _bytes_limited() -> bool:
+    throttle = current_throttle.get()
+    return GLOBAL_THROTTLE.bytes_limited or (throttle is not None and throttle.bytes_limited)
+
+
+def _copy_bytes(src, dst):
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        while chunk := fsrc.read(COPY_CHUNK):
+            consume_bytes(len(chunk))
+            fdst.write(chunk)
+    shutil.copystat(src, dst)
+
+
+def copy(src, dst):
+    """限速复制单个文件（连同元数据，等同 shutil.copy2）；没有字节限速时直接调用 shutil.copy2。"""
+    consume_ops()
+    if _bytes_limited():
+        _copy_bytes(src, dst)
+    else:
+        shutil.copy2(src, dst)
+
+
+def move(src, dst):
+    """
+    限速移动单个文件：同一文件系统内只是一次重命名，只计操作数；重命名失败时（跨设备等）
+    与 shutil.move 一样限速复制后删除源文件。目标已存在时被替换，Windows 上也一样（os.replace）。
+    """
+    consume_ops()
+    try:
+        os.replace(src, dst)
+    except OSError:
+        if _bytes_limited():
+            _copy_bytes(src, dst)
+        else:
+            shutil.copy2(src, dst)
+        os.unlink(src)
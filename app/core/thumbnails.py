@@ -0,0 +1,303 @@
+# app/core/thumbnails.py
+
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import pathlib
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.core.metrics import THUMBNAIL_CACHE
+
+THUMBNAIL_DIR_ENV_VAR = "THUMBNAIL_DIR"
+THUMBNAIL_MAX_BYTES_ENV_VAR = "THUMBNAIL_CACHE_MAX_BYTES"
+PREGENERATE_ENV_VAR = "THUMBNAIL_PREGENERATE"
+INDEX_FILENAME = "index.json"
+DEFAULT_SIZE = 256
+MIN_SIZE = 32
+MAX_SIZE = 1024
+JPEG_QUALITY = 80
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp"}
+# 进程池每个任务渲染的图片数
+RENDER_CHUNK = 64
+# 命中和生成只更新内存中的索引，距上次保存超过这么多秒才顺带写回
+INDEX_SAVE_INTERVAL = 30
+# 淘汰时一次降到上限的这个比例，避免缓存满后每生成一张都要淘汰一次
+EVICT_LOW_WATERMARK = 0.9
+# 流水线中产出图片的 worker 及其输出文件夹参数；这些 worker 实际执行后在后台预生成缩略图
+PREGENERATE_OUTPUTS = {
+    "split_all_pdfs_in_folder": ("destination_dir",),
+    "fused_pre_process": ("destination_folder",),
+    "normalize_images": ("destination_dir",),
+    "batch_rename_files": ("destination_dir",),
+    "find_and_move_long_images": ("dest_dir",),
+    "split_train_val_sets": ("train_dir", "valid_dir"),
+    "extract_and_move_samples_by_dimension": ("dest_dir",),
+}
+
+
+def parse_group(name: str) -> Tuple[Optional[str], Optional[str]]:
+    """按“银行名称_xxx_样式”规则从文件名中取出 (银行, 样式)，格式不符时返回 (None, None)。"""
+    parts = pathlib.PurePath(name).stem.split('_')
+    if len(parts) < 3:
+        return None, None
+    return parts[0], parts[2]
+
+
+def list_images(folder: pathlib.Path) -> List[pathlib.Path]:
+    """文件夹（不递归）中的图片，按文件名排序。"""
+    with os.scandir(folder) as entries:
+        return sorted(pathlib.Path(entry.path) for entry in entries
+                      if entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS)
+
+
+def render_thumbnail(source: str, target: str, size: int) -> int:
+    """
+    生成一张长边不超过 size 的 JPEG 缩略图，返回其字节数。
+    JPEG 使用 draft 模式在解码阶段直接按 1/2、1/4、1/8 缩小，耗时取决于缩略图尺寸而不是原始分辨率；
+    先写临时文件再替换，读到的缩略图总是完整的。
+    """
+    from PIL import Image  # 调度器启动时就会导入本模块，PIL 到第一次渲染时才加载
+
+    tmp = f"{target}.{uuid.uuid4().hex}.tmp"
+    try:
+        with Image.open(source) as img:
+            img.draft("RGB", (size, size))
+            img.thumbnail((size, size), Image.BILINEAR)
+            (img if img.mode == "RGB" else img.convert("RGB")).save(tmp, "JPEG", quality=JPEG_QUALITY)
+        os.replace(tmp, target)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+    return os.path.getsize(target)
+
+
+def _render_chunk(jobs: List[Tuple[str, str]], size: int) -> Tuple[Dict[str, int], Dict[str, str]]:
+    """进程池任务：渲染一批缩略图，返回 ({源文件: 缩略图字节数}, {源文件: 错误})。"""
+    rendered, failed = {}, {}
+    for source, target in jobs:
+        try:
+            rendered[source] = render_thumbnail(source, target, size)
+        except Exception as e:
+            failed[source] = str(e)
+    return rendered, failed
+
+
+class ThumbnailCache:
+    """
+    以 (源文件绝对路径, 修改时间, 大小, 缩略图尺寸) 的哈希为键的磁盘缩略图缓存。
+    源文件被修改、替换或移动后键随之变化，旧缩略图不再命中，之后按最近使用时间被淘汰。
+
+    目录结构:
+        index.json          每个缩略图的源文件、字节数、最近使用时间
+        <键前2位>/<键>.jpg   缩略图
+    总大小超过 max_bytes 时按最近使用时间淘汰：内存中的索引按使用时间排序（命中或生成时移到末尾），
+    淘汰只从头部弹出，不必排序整个索引。命中和生成都只改内存中的索引，距上次保存超过
+    INDEX_SAVE_INTERVAL 秒、批量预生成结束以及 flush 时才写回，浏览时不会每张图写一次索引。
+    """
+
+    def __init__(self, cache_dir: pathlib.Path, max_bytes: int = 2 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        index_path = cache_dir / INDEX_FILENAME
+        entries: Dict[str, Dict[str, Any]] = {}
+        if index_path.is_file():
+            try:
+                entries = json.loads(index_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                entries = {}
+        # 只在加载时排序一次，之后靠 move_to_end 维持最近使用顺序
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict(
+            sorted(entries.items(), key=lambda item: item[1]["last_used"]))
+        self.total_bytes = sum(entry["bytes"] for entry in self.entries.values())
+        self._saved = time.monotonic()
+        self._dirty = False
+
+    @staticmethod
+    def key(source: pathlib.Path, size: int) -> str:
+        stat = os.stat(source)
+        raw = f"{os.path.abspath(source)}\0{stat.st_mtime_ns}\0{stat.st_size}\0{size}"
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+    def path_of(self, key: str) -> pathlib.Path:
+        return self.cache_dir / key[:2] / f"{key}.jpg"
+
+    def _save_index(self):
+        tmp = self.cache_dir / f"{INDEX_FILENAME}.tmp"
+        tmp.write_text(json.dumps(self.entries, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.cache_dir / INDEX_FILENAME)
+        self._saved = time.monotonic()
+        self._dirty = False
+
+    def _maybe_save_index(self):
+        """调用方需持有锁。距上次保存超过 INDEX_SAVE_INTERVAL 秒才写回。"""
+        if self._dirty and time.monotonic() - self._saved > INDEX_SAVE_INTERVAL:
+            self._save_index()
+
+    def flush(self):
+        """把内存中尚未写回的索引改动写回磁盘，服务停止时调用。"""
+        with self._lock:
+            if self._dirty:
+                self._save_index()
+
+    def _hit(self, key: str) -> bool:
+        """调用方需持有锁。缩略图文件被外部删除时同时清掉索引项。"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+        self._dirty = True
+        if not self.path_of(key).is_file():
+            self.total_bytes -= self.entries.pop(key)["bytes"]
+            return False
+        entry["last_used"] = time.time()
+        self.entries.move_to_end(key)
+        return True
+
+    def _add(self, key: str, source: str, nbytes: int):
+        old = self.entries.get(key)
+        if old is not None:
+            self.total_bytes -= old["bytes"]
+        self.entries[key] = {"source": source, "bytes": nbytes, "last_used": time.time()}
+        self.entries.move_to_end(key)
+        self.total_bytes += nbytes
+        self._dirty = True
+
+    def _evict(self, keep: Optional[str] = None):
+        """按最近使用时间淘汰缩略图，直到总大小降到上限的 EVICT_LOW_WATERMARK；keep 是刚生成、马上要返回的那张。"""
+        if self.total_bytes <= self.max_bytes:
+            return
+        target = self.max_bytes * EVICT_LOW_WATERMARK
+        while self.total_bytes > target and self.entries:
+            key, entry = self.entries.popitem(last=False)
+            if key == keep:
+                self.entries[key] = entry
+                if len(self.entries) == 1:
+                    break
+                continue
+            self.total_bytes -= entry["bytes"]
+            self.path_of(key).unlink(missing_ok=True)
+        self._dirty = True
+
+    def get(self, source: pathlib.Path, size: int = DEFAULT_SIZE) -> Tuple[str, pathlib.Path]:
+        """返回 (键, 缩略图路径)；未命中时在当前线程生成。"""
+        key = self.key(source, size)
+        target = self.path_of(key)
+        with self._lock:
+            if self._hit(key):
+                self.hits += 1
+                self._maybe_save_index()
+                THUMBNAIL_CACHE.inc(result="hit")
+                return key, target
+            self.misses += 1
+        THUMBNAIL_CACHE.inc(result="miss")
+
+        target.parent.mkdir(exist_ok=True)
+        nbytes = render_thumbnail(str(source), str(target), size)
+        with self._lock:
+            self._add(key, str(source), nbytes)
+            self._evict(keep=key)
+            self._maybe_save_index()
+        return key, target
+
+    def ensure(self, sources: Iterable[pathlib.Path], size: int = DEFAULT_SIZE,
+               workers: Optional[int] = None) -> Dict:
+        """
+        为一批图片预生成缩略图：已缓存的跳过，其余每 RENDER_CHUNK 张一块交给进程池渲染，
+        渲染完一块就登记一块。返回图片数、新生成数、已缓存数和失败的图片。
+        """
+        keys: Dict[str, str] = {}
+        failed: Dict[str, str] = {}
+        for source in sources:
+            try:
+                keys[str(source)] = self.key(source, size)
+            except OSError as e:
+                failed[str(source)] = str(e)
+        unreadable = len(failed)
+
+        jobs = []
+        with self._lock:
+            for source, key in keys.items():
+                if not self._hit(key):
+                    jobs.append((source, str(self.path_of(key))))
+        for _, target in jobs:
+            pathlib.Path(target).parent.mkdir(exist_ok=True)
+
+        generated = 0
+        if jobs:
+            chunks = [jobs[i:i + RENDER_CHUNK] for i in range(0, len(jobs), RENDER_CHUNK)]
+            # 预生成在服务进程的调度器线程里执行，不能 fork 已有线程的进程；与预热进程池一样用 spawn
+            with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count(), len(chunks)),
+                                     mp_context=multiprocessing.get_context("spawn")) as pool:
+                for rendered, chunk_failed in pool.map(_render_chunk, chunks, itertools.repeat(size)):
+                    failed.update(chunk_failed)
+                    with self._lock:
+                        for source, nbytes in rendered.items():
+                            self._add(keys[source], source, nbytes)
+                    generated += len(rendered)
+            THUMBNAIL_CACHE.inc(generated, result="pregenerated")
+        if failed:
+            THUMBNAIL_CACHE.inc(len(failed), result="failed")
+        with self._lock:
+            self._evict()
+            self._save_index()
+        return {"images": len(keys) + unreadable, "generated": generated,
+                "cached": len(keys) - len(jobs), "failed": failed}
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"cache_dir": str(self.cache_dir), "entries": len(self.entries), "bytes": self.total_bytes,
+                    "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses}
+
+
+_cache: Optional[ThumbnailCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> ThumbnailCache:
+    """进程内共享的缩略图缓存，目录与上限分别取环境变量 THUMBNAIL_DIR、THUMBNAIL_CACHE_MAX_BYTES。"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                cache_dir = pathlib.Path(os.environ.get(THUMBNAIL_DIR_ENV_VAR)
+                                         or pathlib.Path(tempfile.gettempdir()) / "workflow_thumbnails")
+                max_bytes = int(os.environ.get(THUMBNAIL_MAX_BYTES_ENV_VAR) or 2 * 1024 ** 3)
+                _cache = ThumbnailCache(cache_dir, max_bytes)
+    return _cache
+
+
+def flush_cache():
+    """服务停止时写回缩略图索引；本进程没有用过缓存时什么也不做。"""
+    if _cache is not None:
+        _cache.flush()
+
+
+def pregenerate_enabled() -> bool:
+    return os.environ.get(PREGENERATE_ENV_VAR, "1") != "0"
+
+
+def output_folders(worker: str, params: Dict[str, Any]) -> List[pathlib.Path]:
+    """worker 实际执行后产出图片的文件夹；不在 PREGENERATE_OUTPUTS 中的 worker 返回空列表。"""
+    names = PREGENERATE_OUTPUTS.get(worker.rsplit(":", 1)[-1], ())
+    return [pathlib.Path(params[name]) for name in names if params.get(name)]
+
+
+def pregenerate(folder: pathlib.Path, size: int = DEFAULT_SIZE, workers: Optional[int] = None) -> Dict:
+    """为文件夹中的全部图片预生成缩略图。"""
+    if not folder.is_dir():
+        raise NotADirectoryError(f"文件夹 '{folder}' 不存在或不是一个有效的目录。")
+    stats = get_cache().ensure(list_images(folder), size, workers)
+    stats["folder"] = str(folder)
+    return stats
@@ -0,0 +1,312 @@
+# app/core/zipstream.py
+
+import hashlib
+import os
+import pathlib
+import struct
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from array import array
+from collections import OrderedDict
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+CHUNK_SIZE = 1024 * 1024
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+# 第 3 位：CRC 和大小写在数据之后的数据描述符里；第 11 位：文件名为 UTF-8
+_FLAGS = 0x0008 | 0x0800
+_CRC_CACHE_SIZE = 100_000
+CRC_DIR_ENV_VAR = "ZIP_CRC_DIR"
+CRC_MAX_FILES = 1000
+
+
+class ZipEntry(NamedTuple):
+    path: str
+    arcname: str
+    size: int
+    mtime_ns: int
+
+
+def iter_folder(root: pathlib.Path, prefix: str = "") -> Iterator[ZipEntry]:
+    """按名称排序递归遍历文件夹；顺序固定，续传时前后两次请求生成的字节完全一致。"""
+    try:
+        with os.scandir(root) as it:
+            entries = sorted(it, key=lambda e: e.name)
+    except OSError as e:
+        print(f"  [警告] 无法读取文件夹 '{root}': {e}", file=sys.stderr)
+        return
+    for entry in entries:
+        arcname = f"{prefix}{entry.name}"
+        if entry.is_dir(follow_symlinks=False):
+            yield from iter_folder(pathlib.Path(entry.path), f"{arcname}/")
+        elif entry.is_file(follow_symlinks=False):
+            stat = entry.stat(follow_symlinks=False)
+            yield ZipEntry(entry.path, arcname, stat.st_size, stat.st_mtime_ns)
+
+
+def iter_files(paths: Iterable[str], root: pathlib.Path) -> Iterator[ZipEntry]:
+    """按给定顺序打包一组文件，压缩包内的路径相对于 root；已不存在的文件跳过。"""
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        yield ZipEntry(path, pathlib.Path(path).relative_to(root).as_posix(), stat.st_size, stat.st_mtime_ns)
+
+
+def _digest_entry(digest, entry: ZipEntry):
+    digest.update(f"{entry.arcname}\0{entry.size}\0{entry.mtime_ns}\n".encode("utf-8"))
+
+
+def entries_etag(entries: Iterable[ZipEntry]) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for entry in entries:
+        _digest_entry(digest, entry)
+    return digest.hexdigest()
+
+
+def measure(entries: Iterable[ZipEntry]) -> Tuple[int, str]:
+    """一次遍历算出打包后的总长度与 ETag，不保留条目，内存占用与文件数无关。"""
+    digest = hashlib.blake2b(digest_size=16)
+    offset = cd_size = count = 0
+    for entry in entries:
+        _digest_entry(digest, entry)
+        name_size = len(entry.arcname.encode("utf-8"))
+        big = entry.size >= ZIP64_LIMIT
+        cd_size += 46 + name_size + _central_extra_size(big, offset)
+        offset += 30 + name_size + 20 * big + entry.size + (24 if big else 16)
+        count += 1
+    return offset + cd_size + len(ZipStream._end_records(count, offset, cd_size)), digest.hexdigest()
+
+
+def crc_dir() -> pathlib.Path:
+    path = pathlib.Path(os.environ.get(CRC_DIR_ENV_VAR) or pathlib.Path(tempfile.gettempdir()) / "workflow_zip_crcs")
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _load_crcs(etag: str) -> Optional[array]:
+    """读取某个 ETag 保存过的 CRC（按条目顺序，每个 4 字节）；没有时返回 None。"""
+    crcs = array("I")
+    try:
+        crcs.frombytes((crc_dir() / f"{etag}.crc").read_bytes())
+    except (OSError, ValueError):
+        return None
+    return crcs
+
+
+def _save_crcs(etag: str, crcs: array):
+    directory = crc_dir()
+    tmp = directory / f"{etag}.{uuid.uuid4().hex}.tmp"
+    tmp.write_bytes(crcs.tobytes())
+    os.replace(tmp, directory / f"{etag}.crc")
+    saved = sorted(directory.glob("*.crc"), key=lambda path: path.stat().st_mtime)
+    for path in saved[:max(len(saved) - CRC_MAX_FILES, 0)]:
+        path.unlink(missing_ok=True)
+
+
+# 本进程内已算过的 CRC，按 (路径, 大小, mtime) 缓存：断点续传时跳过的文件不必再读一遍
+_crc_cache: "OrderedDict[Tuple[str, int, int], int]" = OrderedDict()
+_crc_lock = threading.Lock()
+
+
+def _remember_crc(entry: ZipEntry, crc: int):
+    with _crc_lock:
+        _crc_cache[(entry.path, entry.size, entry.mtime_ns)] = crc
+        _crc_cache.move_to_end((entry.path, entry.size, entry.mtime_ns))
+        while len(_crc_cache) > _CRC_CACHE_SIZE:
+            _crc_cache.popitem(last=False)
+
+
+def file_crc(entry: ZipEntry) -> int:
+    with _crc_lock:
+        crc = _crc_cache.get((entry.path, entry.size, entry.mtime_ns))
+    if crc is not None:
+        return crc
+    crc = 0
+    with open(entry.path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            crc = zlib.crc32(chunk, crc)
+    _remember_crc(entry, crc)
+    return crc
+
+
+def _dos_datetime(mtime_ns: int) -> Tuple[int, int]:
+    t = time.localtime(max(mtime_ns / 1e9, 315532800))  # ZIP 时间最早为 1980 年
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+
+def _central_extra_size(big: bool, offset: int) -> int:
+    fields = 2 * big + (offset >= ZIP64_LIMIT)
+    return 4 + 8 * fields if fields else 0
+
+
+class _Record:
+    __slots__ = ("entry", "name", "offset", "big", "crc", "index", "saved")
+
+    def __init__(self, entry: ZipEntry, offset: int, index: int, saved: Optional[array]):
+        self.entry = entry
+        self.name = entry.arcname.encode("utf-8")
+        self.offset = offset
+        # 文件本身超过 4 GB：本地头带 ZIP64 扩展，数据描述符用 8 字节大小
+        self.big = entry.size >= ZIP64_LIMIT
+        self.crc: Optional[int] = None
+        self.index = index
+        self.saved = saved
+
+    def get_crc(self) -> int:
+        if self.crc is None:
+            if self.saved is not None and self.index < len(self.saved):
+                self.crc = self.saved[self.index]
+            else:
+                self.crc = file_crc(self.entry)
+        return self.crc
+
+
+# 一段输出：(长度, 生成字节的函数, 需要从磁盘读的文件)
+_Segment = Tuple[int, Optional[Callable[[], bytes]], Optional[_Record]]
+
+
+class ZipStream:
+    """
+    不落盘、不压缩（store）的流式 ZIP 生成器。
+    CRC 写在每个文件数据之后的数据描述符里，所以每一段的长度只取决于文件名和大小，
+    无需先读文件就能算出总长度和任意字节的位置，从而支持 HTTP Range 续传；
+    文件或偏移超过 4 GB、条目超过 65535 个时自动使用 ZIP64。
+    内存占用只与文件数（中央目录）有关，与数据量无关。
+
+    中央目录需要每个文件的 CRC。一次输出了完整中央目录后，这些 CRC 按 ETag（见 measure）保存到
+    ZIP_CRC_DIR，之后同一 ETag 的续传直接取用，不必为区间之前的文件再把数据读一遍。
+    给出 etag 时还会核对打包时的文件列表与算 ETag 时一致，不一致则中断输出。
+    """
+
+    def __init__(self, entries: Iterable[ZipEntry], chunk_size: int = CHUNK_SIZE,
+                 on_read: Optional[Callable[[int], None]] = None, etag: Optional[str] = None):
+        self.entries = entries
+        self.chunk_size = chunk_size
+        self.on_read = on_read
+        self.etag = etag
+
+    def _segments(self) -> Iterator[_Segment]:
+        records: List[_Record] = []
+        saved = _load_crcs(self.etag) if self.etag is not None else None
+        digest = hashlib.blake2b(digest_size=16)
+        offset = 0
+        for entry in self.entries:
+            _digest_entry(digest, entry)
+            record = _Record(entry, offset, len(records), saved)
+            records.append(record)
+            header = self._local_header(record)
+            descriptor_size = 24 if record.big else 16
+            yield len(header), (lambda header=header: header), None
+            yield entry.size, None, record
+            yield descriptor_size, (lambda record=record: self._descriptor(record)), None
+            offset += len(header) + entry.size + descriptor_size
+
+        etag = digest.hexdigest()
+        if self.etag is not None and etag != self.etag:
+            raise RuntimeError("文件在打包过程中发生了增删或修改，与 ETag 不一致。")
+        cd_offset = offset
+        for record in records:
+            size = 46 + len(record.name) + _central_extra_size(record.big, record.offset)
+            yield size, (lambda record=record: self._central_header(record)), None
+            offset += size
+        end = self._end_records(len(records), cd_offset, offset - cd_offset)
+        yield len(end), (lambda: self._finish(etag, records, saved, end)), None
+
+    @staticmethod
+    def _finish(etag: str, records: List[_Record], saved: Optional[array], end: bytes) -> bytes:
+        """输出结尾记录时，如果所有 CRC 都已算出而且还没保存过，就按 ETag 保存下来。"""
+        if (saved is None or len(saved) != len(records)) and all(record.crc is not None for record in records):
+            _save_crcs(etag, array("I", (record.crc for record in records)))
+        return end
+
+    def total_size(self) -> int:
+        return sum(length for length, _, _ in self._segments())
+
+    def iter_bytes(self, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """
+        产出闭区间 [start, end] 内的字节。区间之前的文件数据不会输出，但中央目录要用到它们的 CRC：
+        依次取自该 ETag 保存过的 CRC、本进程的缓存，都没有时才把文件完整读一遍。
+        """
+        position = 0
+        for length, render, record in self._segments():
+            segment_start, position = position, position + length
+            if position <= start or length == 0:
+                continue
+            if end is not None and segment_start > end:
+                break
+            skip = max(start - segment_start, 0)
+            stop = length if end is None else min(length, end + 1 - segment_start)
+            if record is None:
+                yield render()[skip:stop]
+            else:
+                yield from self._file_bytes(record, skip, stop)
+
+    def _file_bytes(self, record: _Record, skip: int, stop: int) -> Iterator[bytes]:
+        entry = record.entry
+        crc = 0
+        with open(entry.path, "rb") as f:
+            f.seek(skip)
+            remaining = stop - skip
+            while remaining:
+                chunk = f.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    raise RuntimeError(f"文件 '{entry.path}' 在打包过程中被修改（比扫描时短）。")
+                if skip == 0:
+                    crc = zlib.crc32(chunk, crc)
+                remaining -= len(chunk)
+                if self.on_read:
+                    self.on_read(len(chunk))
+                yield chunk
+        if skip == 0 and stop == entry.size:
+            record.crc = crc
+            _remember_crc(entry, crc)
+
+    @staticmethod
+    def _local_header(record: _Record) -> bytes:
+        entry = record.entry
+        time_, date = _dos_datetime(entry.mtime_ns)
+        extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0) if record.big else b""
+        size_field = 0xFFFFFFFF if record.big else 0
+        return struct.pack("<IHHHHHIIIHH", 0x04034B50, 45 if record.big else 20, _FLAGS, 0, time_, date,
+                           0, size_field, size_field, len(record.name), len(extra)) + record.name + extra
+
+    @staticmethod
+    def _descriptor(record: _Record) -> bytes:
+        crc = record.get_crc()
+        if record.big:
+            return struct.pack("<IIQQ", 0x08074B50, crc, record.entry.size, record.entry.size)
+        return struct.pack("<IIII", 0x08074B50, crc, record.entry.size, record.entry.size)
+
+    @staticmethod
+    def _central_header(record: _Record) -> bytes:
+        entry = record.entry
+        time_, date = _dos_datetime(entry.mtime_ns)
+        far = record.offset >= ZIP64_LIMIT
+        values = ([entry.size, entry.size] if record.big else []) + ([record.offset] if far else [])
+        extra = struct.pack(f"<HH{len(values)}Q", 0x0001, 8 * len(values), *values) if values else b""
+        size_field = 0xFFFFFFFF if record.big else entry.size
+        version = 45 if record.big or far else 20
+        return struct.pack("<IHHHHHHIIIHHHHHII", 0x02014B50, version, version, _FLAGS, 0, time_, date,
+                           record.get_crc(), size_field, size_field, len(record.name), len(extra), 0, 0, 0,
+                           0o100644 << 16, 0xFFFFFFFF if far else record.offset) + record.name + extra
+
+    @staticmethod
+    def _end_records(count: int, cd_offset: int, cd_size: int) -> bytes:
+        end = b""
+        zip64 = count >= ZIP64_COUNT_LIMIT or cd_offset >= ZIP64_LIMIT or cd_size >= ZIP64_LIMIT
+        if zip64:
+            zip64_offset = cd_offset + cd_size
+            end += struct.pack("<IQHHIIQQQQ", 0x06064B50, 44, 45, 45, 0, 0, count, count, cd_size, cd_offset)
+            end += struct.pack("<IIQI", 0x07064B50, 0, zip64_offset, 1)
+        # 超出范围的字段写 0xFFFF/0xFFFFFFFF，解压工具据此去读 ZIP64 结尾记录
+        count_field = 0xFFFF if count >= ZIP64_COUNT_LIMIT else count
+        end += struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, count_field, count_field,
+                           0xFFFFFFFF if cd_size >= ZIP64_LIMIT else cd_size,
+                           0xFFFFFFFF if cd_offset >= ZIP64_LIMIT else cd_offset, 0)
+        return end
@@ -1,11 +1,63 @@
+import threading
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 import uvicorn
 
 from app.apis.pre_process import router as pre_process
+from app.apis.train_val_test import router as train_val_test
+from app.apis.classify_jpg import router as classify_jpg
+from app.apis.metrics import router as metrics, metrics_middleware
+from app.apis.profiling import router as profiling, profiling_middleware
+from app.apis.plans import router as plans
+from app.apis.scheduler import router as scheduler, priority_middleware, scheduler_busy_handler
+from app.apis.throttle import router as throttle, throttle_middleware
+from app.apis.cluster import router as cluster
+from app.apis.download import router as download
+from app.apis.reports import router as reports
+from app.apis.thumbnails import router as thumbnails
+from app.apis.fingerprints import router as fingerprints
+from app.core.thumbnails import flush_cache
+from app.workers.prewarm import warm_up_in_background, start_worker_pool, stop_worker_pool
+from app.workers.scheduler import SchedulerBusy
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 预热放在后台线程：服务立即可用，重量级库和预热进程池在第一个请求到来前就绪
+    warm_up_in_background()
+    cancelled = threading.Event()
+    pool_starter = threading.Thread(target=start_worker_pool, kwargs={"cancelled": cancelled},
+                                    name="worker-pool-start", daemon=True)
+    pool_starter.start()
+    yield
+    # 先置位再关闭：仍在启动中的进程池启动完成后会自行关闭，等它结束后才算停止
+    cancelled.set()
+    stop_worker_pool()
+    pool_starter.join()
+    flush_cache()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+app.middleware("http")(priority_middleware)
+app.middleware("http")(throttle_middleware)
+app.middleware("http")(profiling_middleware)
+app.middleware("http")(metrics_middleware)
+app.add_exception_handler(SchedulerBusy, scheduler_busy_handler)
 
 app.include_router(pre_process)
+app.include_router(train_val_test)
+app.include_router(classify_jpg)
+app.include_router(metrics)
+app.include_router(profiling)
+app.include_router(plans)
+app.include_router(scheduler)
+app.include_router(cluster)
+app.include_router(download)
+app.include_router(reports)
+app.include_router(throttle)
+app.include_router(thumbnails)
+app.include_router(fingerprints)
 
 if __name__ == '__main__':
     uvicorn.run(
@@ -0,0 +1,40 @@
+import re
+
+from pydantic import BaseModel, Field, field_validator
+from typing import Dict, Optional
+
+# 与 打包成分片.SPLIT_NAME_PATTERN 一致：划分名称会成为分片文件名的一部分
+SPLIT_NAME_PATTERN = re.compile(r"[A-Za-z0-9_-]+")
+
+
+class PackShardsRequest(BaseModel):
+    split_dirs: Dict[str, str] = Field(..., description="划分名称到文件夹路径的映射，例如 {\"train\": ..., \"eval\": ...}")
+    destination_path: str = Field(..., description="分片输出文件夹的完整路径。")
+    max_shard_mb: int = Field(256, gt=0, description="单个分片的大小上限（MB）")
+    max_shard_records: int = Field(10000, gt=0, description="单个分片的样本数上限")
+    workers: int = Field(4, gt=0, description="并行写分片的线程数")
+    dry_run: bool = Field(True, description="演练模式，只返回分片计划")
+
+    @field_validator("split_dirs")
+    @classmethod
+    def _check_split_names(cls, split_dirs):
+        for split in split_dirs:
+            if not SPLIT_NAME_PATTERN.fullmatch(split):
+                raise ValueError(f"划分名称 '{split}' 只能包含字母、数字、下划线和连字符")
+        return split_dirs
+
+
+class NearDuplicateRequest(BaseModel):
+    split_dirs: Dict[str, str] = Field(..., description="划分名称到文件夹路径的映射，顺序决定并组时的优先级")
+    max_distance: int = Field(4, ge=0, le=7, description="判定为近重复的最大汉明距离（64 位 dHash），最大 7")
+    hash_file: Optional[str] = Field(None, description="保存感知哈希数组的 .npy 路径")
+    workers: Optional[int] = Field(None, description="计算哈希的进程数")
+    regroup: bool = Field(False, description="是否把泄漏组的成员移动到同一个划分")
+    dry_run: bool = Field(True, description="演练模式，只报告不移动")
+
+
+class SplitTrainValRequest(BaseModel):
+    source_path: str = Field(..., description="包含原始图片的源文件夹路径。")
+    train_path: str = Field(..., description="训练集输出文件夹路径。")
+    valid_path: str = Field(..., description="验证集输出文件夹路径。")
+    dry_run: bool = Field(True, description="演练模式，只打印操作，不移动文件")
@@ -1,10 +1,12 @@
 import pathlib
 import sys
-import shutil
-from typing import Set, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 
+from app.core import throttle
+from app.core.plans import create_plan, planned_operation, summarize_plan
 
-def extract_and_move_samples_by_dimension(source_dir: str, dest_dir: str, dry_run: bool = True) -> None:
+
+def extract_and_move_samples_by_dimension(source_dir: str, dest_dir: str, dry_run: bool = True) -> Optional[Dict]:
     """
     根据“银行名称-样式”维度，从源文件夹中为每个组合抽取一个.jpg样本文件，
     并将其移动（剪切）到目标文件夹。
@@ -12,7 +14,10 @@ def extract_and_move_samples_by_dimension(source_dir: str, dest_dir: str, dry_ru
     Args:
         source_dir (str): 包含原始图片的源文件夹路径。
         dest_dir (str): 用于存放抽取样本的目标文件夹路径。
-        dry_run (bool, optional): 是否为演练模式。True则只打印操作，不实际移动文件。
+        dry_run (bool, optional): 是否为演练模式。True则只打印操作，不实际移动文件，并把这些操作保存为执行计划。
+
+    Returns:
+        演练模式下返回已保存的执行计划（见 app.core.plans.execute_plan），否则返回 None。
     """
     source_path = pathlib.Path(source_dir)
     dest_path = pathlib.Path(dest_dir)
@@ -44,6 +49,7 @@ def extract_and_move_samples_by_dimension(source_dir: str, dest_dir: str, dry_ru
     total_files_scanned = 0
     samples_moved = 0
     malformed_count = 0
+    operations: List[Dict] = []
 
     for file_path in source_path.rglob('*.jpg'):
         if not file_path.is_file():
@@ -70,13 +76,14 @@ def extract_and_move_samples_by_dimension(source_dir: str, dest_dir: str, dry_ru
 
             if not dry_run:
                 try:
-                    # 将 shutil.copy2 更改为 shutil.move
-                    shutil.move(file_path, destination_file_path)
+                    # 移动（而非复制）样本文件，受全局/请求级限速控制
+                    throttle.move(file_path, destination_file_path)
                     print(f"    └── ✅ 移动成功")
                 except OSError as e:
                     print(f"    └── ❌ 移动失败: {e}")
             else:
-                # 在演练模式下，只打印信息
+                # 在演练模式下，只记录到执行计划
+                operations.append(planned_operation("move", file_path, destination_file_path))
                 print(f"    └── (演练) 将移动到: {destination_file_path}")
 
             print()
@@ -99,6 +106,13 @@ def extract_and_move_samples_by_dimension(source_dir: str, dest_dir: str, dry_ru
         print(f"[*] 成功移动 {samples_moved} 个样本文件到目标文件夹。")
     print(f"[*] 目标文件夹路径: {dest_path.resolve()}")
 
+    if dry_run:
+        plan = create_plan("extract_and_move_samples_by_dimension",
+                           {"source_dir": source_dir, "dest_dir": dest_dir}, operations)
+        print(f"[*] 执行计划已保存: {plan['plan_id']}")
+        return summarize_plan(plan)
+    return None
+
 
 # ==============================================================================
 # --- MAIN SCRIPT CONTROLLER ---
@@ -1,9 +1,12 @@
 import pathlib
 import sys
-import shutil
 from collections import defaultdict
 import math
-from typing import Dict, List
+from typing import Dict, List, Optional
+
+from app.core import throttle
+from app.core.plans import create_plan, planned_operation, summarize_plan
+from app.core.profiling import span
 
 
 def split_train_val_sets(
@@ -11,7 +14,7 @@ def split_train_val_sets(
         train_dir: str,
         valid_dir: str,
         dry_run: bool = True
-) -> None:
+) -> Optional[Dict]:
     """
     根据“银行名称-样式”维度，将源文件夹中的.jpg文件按约4:1的比例
     移动（剪切）到训练集和验证集文件夹。
@@ -22,7 +25,10 @@ def split_train_val_sets(
         source_dir (str): 包含原始图片的源文件夹路径。
         train_dir (str): 用于存放训练集样本的目标文件夹路径。
         valid_dir (str): 用于存放验证集样本的目标文件夹路径。
-        dry_run (bool, optional): 是否为演练模式。True则只打印操作，不实际移动文件。
+        dry_run (bool, optional): 是否为演练模式。True则只打印操作，不实际移动文件，并把这些移动保存为执行计划。
+
+    Returns:
+        Optional[Dict]: 演练模式下返回已保存的执行计划概要（见 app.core.plans.execute_plan），否则为 None。
     """
     source_path = pathlib.Path(source_dir)
     train_path = pathlib.Path(train_dir)
@@ -58,21 +64,22 @@ def split_train_val_sets(
     total_files_scanned = 0
     malformed_count = 0
 
-    for file_path in sorted(source_path.rglob('*.jpg')):  # 排序以保证每次运行结果一致
-        if not file_path.is_file():
-            continue
+    with span("scan"):
+        for file_path in sorted(source_path.rglob('*.jpg')):  # 排序以保证每次运行结果一致
+            if not file_path.is_file():
+                continue
 
-        total_files_scanned += 1
-        parts = file_path.stem.split('_')
+            total_files_scanned += 1
+            parts = file_path.stem.split('_')
 
-        if len(parts) < 3:
-            malformed_count += 1
-            continue
+            if len(parts) < 3:
+                malformed_count += 1
+                continue
 
-        bank_name = parts[0]
-        style = parts[2]
-        category = (bank_name, style)
-        grouped_files[category].append(file_path)
+            bank_name = parts[0]
+            style = parts[2]
+            category = (bank_name, style)
+            grouped_files[category].append(file_path)
 
     print(f"[*] 分组完成。发现 {len(grouped_files)} 个独特的类别。")
     print("-" * 60)
@@ -82,6 +89,7 @@ def split_train_val_sets(
     total_moved_train = 0
     total_moved_valid = 0
     skipped_categories_count = 0
+    operations = []
 
     for category, files in grouped_files.items():
         bank_name, style = category
@@ -107,27 +115,32 @@ def split_train_val_sets(
         files_for_valid = files[:num_valid]
         files_for_train = files[num_valid:]
 
-        # 移动到验证集
-        for file_path in files_for_valid:
-            if not dry_run:
-                try:
-                    shutil.move(str(file_path), str(valid_path / file_path.name))
-                except OSError as e:
-                    print(f"      └── ❌ 移动失败: {file_path.name} -> {e}")
-                    continue
-            print(f"      └── [验证集] 移动: {file_path.name}")
-            total_moved_valid += 1
-
-        # 移动到训练集
-        for file_path in files_for_train:
-            if not dry_run:
-                try:
-                    shutil.move(str(file_path), str(train_path / file_path.name))
-                except OSError as e:
-                    print(f"      └── ❌ 移动失败: {file_path.name} -> {e}")
-                    continue
-            print(f"      └── [训练集] 移动: {file_path.name}")
-            total_moved_train += 1
+        with span("move"):
+            # 移动到验证集
+            for file_path in files_for_valid:
+                if dry_run:
+                    operations.append(planned_operation("move", file_path, valid_path / file_path.name))
+                else:
+                    try:
+                        throttle.move(file_path, valid_path / file_path.name)
+                    except OSError as e:
+                        print(f"      └── ❌ 移动失败: {file_path.name} -> {e}")
+                        continue
+                print(f"      └── [验证集] 移动: {file_path.name}")
+                total_moved_valid += 1
+
+            # 移动到训练集
+            for file_path in files_for_train:
+                if dry_run:
+                    operations.append(planned_operation("move", file_path, train_path / file_path.name))
+                else:
+                    try:
+                        throttle.move(file_path, train_path / file_path.name)
+                    except OSError as e:
+                        print(f"      └── ❌ 移动失败: {file_path.name} -> {e}")
+                        continue
+                print(f"      └── [训练集] 移动: {file_path.name}")
+                total_moved_train += 1
 
     # --- 4. 总结报告 ---
     print("-" * 60)
@@ -146,6 +159,14 @@ def split_train_val_sets(
         print(f"[*] 成功移动 {total_moved_train} 个文件到训练集: {train_path.resolve()}")
         print(f"[*] 成功移动 {total_moved_valid} 个文件到验证集: {valid_path.resolve()}")
 
+    if dry_run:
+        plan = create_plan("split_train_val_sets",
+                           {"source_dir": source_dir, "train_dir": train_dir, "valid_dir": valid_dir},
+                           operations)
+        print(f"[*] 执行计划已保存: {plan['plan_id']}")
+        return summarize_plan(plan)
+    return None
+
 
 # ==============================================================================
 # --- MAIN SCRIPT CONTROLLER ---
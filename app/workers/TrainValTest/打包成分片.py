@@ -0,0 +1,289 @@
+import io
+import json
+import os
+import pathlib
+import re
+import struct
+import sys
+import tarfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+# 分片格式（WebDataset 风格）：
+#   {split}-g{代}-{序号}.tar   不压缩的 tar，每个样本两个成员: {key}.jpg 与 {key}.json（银行、样式标签）
+#                        key 由样本在划分文件夹中的相对路径去掉扩展名得到（见 sample_key），在同一划分内唯一
+#   {split}-g{代}-{序号}.idx   紧凑偏移索引，每个样本一条 INDEX_RECORD: (jpg 数据偏移, jpg 字节数, 标签编号)
+#   {split}-g{代}-{序号}.keys  样本 key 列表，每行一个，与 .idx 记录一一对应
+#   shards_index.json    全局索引: 代号、各划分的分片列表、样本数、字节数与标签表
+# 每次打包都写出新一代文件名的分片，从不覆盖当前索引引用的文件；最后替换 shards_index.json 才切换到新一代，
+# 读取端按索引打开的 .tar 与 .idx 总是同一次打包写出的
+INDEX_FILENAME = "shards_index.json"
+INDEX_RECORD = struct.Struct("<QII")
+SHARD_NAME_TEMPLATE = "{split}-g{generation:06d}-{index:06d}"
+# 划分名称会成为分片文件名的一部分，只允许这些字符，不能借 ../ 或 / 写到输出文件夹之外
+SPLIT_NAME_PATTERN = re.compile(r"[A-Za-z0-9_-]+")
+IMAGE_EXTENSIONS = {".jpg", ".jpeg"}
+
+
+def parse_label(file_path: pathlib.Path) -> Optional[Tuple[str, str]]:
+    """按“银行名称_xxx_样式”规则从文件名中取出 (银行, 样式)，格式不符时返回 None。"""
+    parts = file_path.stem.split('_')
+    if len(parts) < 3:
+        return None
+    return parts[0], parts[2]
+
+
+def sample_key(relative: pathlib.PurePath) -> str:
+    """
+    样本 key：相对路径去掉扩展名，其中 %、/、. 按百分号编码转义。
+    WebDataset 按成员名第一个 . 之前的部分归组样本，key 里不能出现 . 和 /；
+    不同子文件夹里的同名文件因此得到不同的 key，直接位于划分文件夹下、文件名不含 . 的 key 与原文件名相同。
+    """
+    stem = relative.with_suffix("").as_posix()
+    return stem.replace("%", "%25").replace(".", "%2E").replace("/", "%2F")
+
+
+def _plan_shards(files: List[Tuple[pathlib.Path, int, Tuple[str, str], str]],
+                 max_shard_bytes: int,
+                 max_shard_records: int) -> List[List[Tuple[pathlib.Path, int, Tuple[str, str], str]]]:
+    """按顺序把样本切分成大小和数量都有上限的分片，计划只依赖文件列表，保证结果可复现。"""
+    shards = []
+    current = []
+    current_bytes = 0
+    for item in files:
+        size = item[1]
+        if current and (current_bytes + size > max_shard_bytes or len(current) >= max_shard_records):
+            shards.append(current)
+            current = []
+            current_bytes = 0
+        current.append(item)
+        current_bytes += size
+    if current:
+        shards.append(current)
+    return shards
+
+
+def _write_shard(shard_path: pathlib.Path,
+                 samples: List[Tuple[pathlib.Path, int, Tuple[str, str], str]],
+                 label_ids: Dict[Tuple[str, str], int]) -> Dict:
+    """
+    顺序写出一个分片及其 .idx/.keys 索引。文件名属于尚未发布的新一代，不会有读取端在用；
+    仍先写临时文件再改名，中断时不会留下看似完整的分片。
+    """
+    tmp_tar = shard_path.with_suffix(".tar.tmp")
+    records = bytearray()
+    keys = []
+
+    with tarfile.open(tmp_tar, "w", format=tarfile.PAX_FORMAT) as tar:
+        for file_path, size, label, key in samples:
+            data = file_path.read_bytes()
+
+            info = tarfile.TarInfo(f"{key}{file_path.suffix.lower()}")
+            info.size = len(data)
+            info.mtime = int(file_path.stat().st_mtime)
+            # 数据偏移 = 当前写入位置 + 该成员头部长度，供读取端直接定位图片字节
+            data_offset = tar.offset + len(info.tobuf(tar.format, tar.encoding, tar.errors))
+            tar.addfile(info, io.BytesIO(data))
+
+            meta = json.dumps({"bank": label[0], "style": label[1], "source": file_path.name, "key": key},
+                              ensure_ascii=False).encode("utf-8")
+            meta_info = tarfile.TarInfo(f"{key}.json")
+            meta_info.size = len(meta)
+            meta_info.mtime = info.mtime
+            tar.addfile(meta_info, io.BytesIO(meta))
+
+            records += INDEX_RECORD.pack(data_offset, len(data), label_ids[label])
+            keys.append(key)
+
+    tmp_idx = shard_path.with_suffix(".idx.tmp")
+    tmp_keys = shard_path.with_suffix(".keys.tmp")
+    tmp_idx.write_bytes(bytes(records))
+    tmp_keys.write_text("\n".join(keys) + "\n", encoding="utf-8")
+    os.replace(tmp_idx, shard_path.with_suffix(".idx"))
+    os.replace(tmp_keys, shard_path.with_suffix(".keys"))
+    os.replace(tmp_tar, shard_path)
+    return {"name": shard_path.name, "records": len(samples), "bytes": shard_path.stat().st_size}
+
+
+def _load_index(output_path: pathlib.Path) -> Optional[Dict]:
+    """输出文件夹中当前的全局索引，没有或无法解析时返回 None。"""
+    try:
+        return json.loads((output_path / INDEX_FILENAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _index_shard_names(index: Optional[Dict]) -> set:
+    if index is None:
+        return set()
+    return {shard["name"] for info in index["splits"].values() for shard in info["shards"]}
+
+
+def _stale_shard_files(output_path: pathlib.Path, splits, keep: set) -> List[pathlib.Path]:
+    """
+    这些划分的 .tar/.idx/.keys 中不属于 keep 的（更早的代、中断的打包、旧版本不带代号的文件名）。
+    keep 为新索引和上一份索引引用的分片：按上一份索引打开的读取端还能读完。
+    """
+    pattern = re.compile(rf"({'|'.join(re.escape(split) for split in splits)})-(g\d+-)?\d{{6}}\.(tar|idx|keys)")
+    return [path for path in output_path.iterdir()
+            if pattern.fullmatch(path.name) and path.with_suffix(".tar").name not in keep]
+
+
+def pack_dataset_shards(
+        split_dirs: Dict[str, str],
+        output_dir: str,
+        max_shard_bytes: int = 256 * 1024 * 1024,
+        max_shard_records: int = 10000,
+        workers: int = 4,
+        dry_run: bool = True
+) -> Dict:
+    """
+    把 split_train_val_sets 划分好的各个文件夹（train/eval/test）打包成大小受限的 tar 分片，
+    并生成全局分片索引。训练时只需顺序读取少量大文件，而不是数十万个小 jpg。
+
+    Args:
+        split_dirs (Dict[str, str]): 划分名称到文件夹路径的映射，例如 {"train": ..., "eval": ...}。
+        output_dir (str): 分片输出文件夹。
+        max_shard_bytes (int): 单个分片的字节数上限（单个超大样本会独占一个分片）。
+        max_shard_records (int): 单个分片的样本数上限。
+        workers (int): 并行写分片的线程数。
+        dry_run (bool): 是否为演练模式，True 则只返回分片计划，不写任何文件。
+
+    Returns:
+        Dict: 全局分片索引（演练模式下为计划）；collisions 列出因 key 与先出现的样本相同而未打包的文件。
+    """
+    output_path = pathlib.Path(output_dir)
+    for split in split_dirs:
+        if not SPLIT_NAME_PATTERN.fullmatch(split):
+            raise ValueError(f"划分名称 '{split}' 只能包含字母、数字、下划线和连字符。")
+    previous = _load_index(output_path)
+    generation = previous.get("generation", 0) + 1 if previous else 1
+
+    # --- 1. 扫描各划分并解析标签 ---
+    split_samples: Dict[str, List[Tuple[pathlib.Path, int, Tuple[str, str], str]]] = {}
+    malformed_count = 0
+    # 同一划分内 key 重复的（例如 x.jpg 与 x.jpeg）只保留先出现的一个，其余记入 collisions
+    collisions: List[Dict] = []
+    for split, directory in split_dirs.items():
+        split_path = pathlib.Path(directory)
+        if not split_path.is_dir():
+            raise NotADirectoryError(f"划分 '{split}' 的文件夹 '{directory}' 不存在或不是一个有效的文件夹。")
+
+        samples = []
+        seen_keys: Dict[str, str] = {}
+        for file_path in sorted(split_path.rglob('*')):  # 排序以保证每次打包结果一致
+            if not file_path.is_file() or file_path.suffix.lower() not in IMAGE_EXTENSIONS:
+                continue
+            label = parse_label(file_path)
+            if label is None:
+                malformed_count += 1
+                continue
+            key = sample_key(file_path.relative_to(split_path))
+            if key in seen_keys:
+                collisions.append({"key": key, "split": split, "source": str(file_path),
+                                   "conflicts_with": seen_keys[key]})
+                continue
+            seen_keys[key] = str(file_path)
+            samples.append((file_path, file_path.stat().st_size, label, key))
+        split_samples[split] = samples
+        print(f"[*] 划分 '{split}': 共 {len(samples)} 个样本。")
+
+    labels = sorted({label for samples in split_samples.values() for _, _, label, _ in samples})
+    label_ids = {label: i for i, label in enumerate(labels)}
+
+    # --- 2. 规划分片 ---
+    jobs: List[Tuple[str, pathlib.Path, list]] = []
+    for split, samples in split_samples.items():
+        for i, shard in enumerate(_plan_shards(samples, max_shard_bytes, max_shard_records)):
+            shard_path = output_path / f"{SHARD_NAME_TEMPLATE.format(split=split, generation=generation, index=i)}.tar"
+            jobs.append((split, shard_path, shard))
+
+    index = {
+        "format": "tar",
+        "generation": generation,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "labels": [list(label) for label in labels],
+        "malformed": malformed_count,
+        "collisions": collisions,
+        "splits": {split: {"source_dir": split_dirs[split], "records": len(samples), "shards": []}
+                   for split, samples in split_samples.items()},
+    }
+
+    if dry_run:
+        for split, shard_path, shard in jobs:
+            index["splits"][split]["shards"].append({
+                "name": shard_path.name, "records": len(shard), "bytes": sum(item[1] for item in shard)})
+        print(f"[*] [演练模式] 计划写出 {len(jobs)} 个分片，跳过 {malformed_count} 个文件名格式不正确的文件，"
+              f"{len(collisions)} 个 key 重复的文件。")
+        return index
+
+    # --- 3. 并行写出分片 ---
+    output_path.mkdir(parents=True, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [(split, pool.submit(_write_shard, shard_path, shard, label_ids))
+                   for split, shard_path, shard in jobs]
+        for split, future in futures:
+            index["splits"][split]["shards"].append(future.result())
+
+    tmp_index = output_path / f"{INDEX_FILENAME}.tmp"
+    tmp_index.write_text(json.dumps(index, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp_index, output_path / INDEX_FILENAME)
+
+    # 新索引生效后再清理，保留上一代供仍在读取它的读取端使用
+    splits = set(split_samples) | set(previous["splits"] if previous else ())
+    keep = _index_shard_names(index) | _index_shard_names(previous)
+    removed = 0
+    for path in _stale_shard_files(output_path, splits, keep):
+        path.unlink(missing_ok=True)
+        removed += 1
+    if removed:
+        print(f"[*] 删除了 {removed} 个之前打包留下的多余分片文件。")
+
+    total_records = sum(len(samples) for samples in split_samples.values())
+    print(f"[*] 打包完成: {total_records} 个样本写入 {len(jobs)} 个分片: {output_path.resolve()}")
+    if malformed_count > 0:
+        print(f"[*] 跳过了 {malformed_count} 个文件名格式不正确的文件。")
+    for collision in collisions:
+        print(f"[!] 跳过 '{collision['source']}': key '{collision['key']}' 与 '{collision['conflicts_with']}' 相同",
+              file=sys.stderr)
+    return index
+
+
+# ==============================================================================
+# --- MAIN SCRIPT CONTROLLER ---
+# ==============================================================================
+def main():
+    """
+    配置并运行分片打包任务，通常在 split_train_val_sets 之后执行。
+    """
+    # ==================== 1. 基本配置 ====================
+    #
+    # 各划分的文件夹：与 split_train_val_sets 的 train/eval 输出保持一致
+    SPLIT_DIRECTORIES = {
+        "train": r'C:\Users\EDY\Desktop\testProject\申元按银行顺序标注回单\post处理\train',
+        "eval": r'C:\Users\EDY\Desktop\testProject\申元按银行顺序标注回单\post处理\eval',
+    }
+
+    # 分片输出文件夹
+    OUTPUT_DIRECTORY = r'C:\Users\EDY\Desktop\testProject\申元按银行顺序标注回单\post处理\shards'
+
+    # 单个分片上限：256MB 或 10000 个样本
+    MAX_SHARD_BYTES = 256 * 1024 * 1024
+    MAX_SHARD_RECORDS = 10000
+
+    # 演练模式：True 只打印分片计划，False 实际写出分片
+    DRY_RUN_MODE = True
+
+    # =====================================================
+
+    try:
+        pack_dataset_shards(SPLIT_DIRECTORIES, OUTPUT_DIRECTORY,
+                            MAX_SHARD_BYTES, MAX_SHARD_RECORDS, dry_run=DRY_RUN_MODE)
+    except Exception as e:
+        print(f"\n程序执行时发生意外错误: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,9 +2,14 @@ import pathlib
 import random
 import os
 import shutil
+from typing import Dict, List, Optional, Set
 
+from app.core import throttle
+from app.core.plans import create_plan, planned_operation, summarize_plan
 
-def process_end_folders(target_dir: pathlib.Path, move_to_dir: pathlib.Path, threshold: int, dry_run: bool = True):
+
+def process_end_folders(target_dir: pathlib.Path, move_to_dir: pathlib.Path, threshold: int,
+                        dry_run: bool = True) -> Optional[Dict]:
     """
     处理目标文件夹下的末端文件夹，将超出阈值的文件移动到指定目录。
 
@@ -12,7 +17,11 @@ def process_end_folders(target_dir: pathlib.Path, move_to_dir: pathlib.Path, thr
         target_dir: 目标文件夹的路径。
         move_to_dir: 用于存放超出阈值文件的目标文件夹。
         threshold: 每个末端文件夹中文件的数量上限。
-        dry_run: 是否为演练模式。如果为True，则只打印信息而不实际移动文件。
+        dry_run: 是否为演练模式。如果为True，则只打印信息而不实际移动文件，并把随机抽中的文件保存为执行计划，
+                 执行计划时移动的正是演练时看到的这些文件。
+
+    Returns:
+        演练模式下返回已保存的执行计划（见 app.core.plans.execute_plan），否则返回 None。
     """
     if not target_dir.is_dir():
         print(f"错误：提供的路径 '{target_dir}' 不是一个有效的文件夹。")
@@ -31,6 +40,8 @@ def process_end_folders(target_dir: pathlib.Path, move_to_dir: pathlib.Path, thr
         print("警告：当前为实战模式，将实际移动文件！")
     print("=" * 50)
 
+    operations: List[Dict] = []
+    planned_targets: Set[pathlib.Path] = set()
     # 使用 rglob 遍历所有子目录
     for p in target_dir.rglob('*'):
         if p.is_dir():
@@ -56,7 +67,15 @@ def process_end_folders(target_dir: pathlib.Path, move_to_dir: pathlib.Path, thr
                         destination_path = move_to_dir / file_to_move.name
 
                         if dry_run:
-                            print(f"  [演练] 计划移动: {file_to_move} -> {destination_path}")
+                            # 与实际执行相同的重名处理，本次计划里已占用的名称也要避开
+                            counter = 1
+                            new_destination_path = destination_path
+                            while new_destination_path.exists() or new_destination_path in planned_targets:
+                                new_destination_path = move_to_dir / f"{destination_path.stem}_{counter}{destination_path.suffix}"
+                                counter += 1
+                            planned_targets.add(new_destination_path)
+                            operations.append(planned_operation("move", file_to_move, new_destination_path))
+                            print(f"  [演练] 计划移动: {file_to_move} -> {new_destination_path}")
                         else:
                             try:
                                 # 处理潜在的文件名冲突
@@ -67,8 +86,8 @@ def process_end_folders(target_dir: pathlib.Path, move_to_dir: pathlib.Path, thr
                                     new_destination_path = move_to_dir / new_name
                                     counter += 1
 
-                                # 使用 shutil.move，因为它更健壮，可以跨盘符移动
-                                shutil.move(str(file_to_move), str(new_destination_path))
+                                # 可以跨盘符移动，受全局/请求级限速控制
+                                throttle.move(file_to_move, new_destination_path)
                                 if new_destination_path != destination_path:
                                     print(f"  [已移动] {file_to_move} -> {new_destination_path} (因重名而重命名)")
                                 else:
@@ -82,6 +101,14 @@ def process_end_folders(target_dir: pathlib.Path, move_to_dir: pathlib.Path, thr
     print("\n" + "=" * 50)
     print("扫描完成。")
 
+    if dry_run:
+        plan = create_plan("process_end_folders",
+                           {"target_dir": target_dir, "move_to_dir": move_to_dir, "threshold": threshold},
+                           operations)
+        print(f"执行计划已保存: {plan['plan_id']}")
+        return summarize_plan(plan)
+    return None
+
 
 def main():
     """
@@ -0,0 +1,278 @@
+import bisect
+import json
+import mmap
+import pathlib
+import sys
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple, TypeVar
+
+from app.workers.TrainValTest.打包成分片 import INDEX_FILENAME, INDEX_RECORD
+
+T = TypeVar("T")
+
+
+class _StaleIndex(Exception):
+    """分片文件与读取器加载的索引对不上（已被重新打包或清理），需要重新加载索引。"""
+
+
+class _MappedShard:
+    """单个分片的只读内存映射，.tar 与 .idx 都按需映射，从不整体读入内存。"""
+
+    def __init__(self, tar_path: pathlib.Path, records: int):
+        self.tar_path = tar_path
+        self.records = records
+        self._tar_file = None
+        self._tar_map: Optional[mmap.mmap] = None
+        self._idx_map: Optional[mmap.mmap] = None
+        self._idx_records = 0
+        self._keys: Optional[List[str]] = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        with self._lock:
+            if self._idx_map is not None:
+                return
+            try:
+                # ACCESS_READ 映射直接共享操作系统的页缓存，多个进程读同一分片时数据只在内存中存在一份
+                self._tar_file = open(self.tar_path, "rb")
+                self._tar_map = mmap.mmap(self._tar_file.fileno(), 0, access=mmap.ACCESS_READ)
+                with open(self.tar_path.with_suffix(".idx"), "rb") as idx_file:
+                    idx_map = mmap.mmap(idx_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (FileNotFoundError, ValueError) as e:
+                # 分片已被清理，或文件为空（正在写入）无法映射
+                self._close_handles()
+                raise _StaleIndex(f"无法打开分片 '{self.tar_path.name}': {e}")
+            # .idx 的实际记录数要与索引中登记的一致，否则是按旧索引打开了改写过的分片
+            self._idx_records = len(idx_map) // INDEX_RECORD.size
+            if self._idx_records != self.records:
+                idx_map.close()
+                self._close_handles()
+                raise _StaleIndex(f"分片 '{self.tar_path.name}' 有 {self._idx_records} 条记录，索引中登记的是 {self.records} 条。")
+            # 最后赋值 _idx_map，其它线程看到它不为 None 时 _tar_map 一定已就绪
+            self._idx_map = idx_map
+
+    def record(self, i: int) -> Tuple[int, int, int]:
+        if self._idx_map is None:
+            self._open()
+        if not 0 <= i < self._idx_records:
+            raise _StaleIndex(f"分片 '{self.tar_path.name}' 中没有第 {i} 条记录。")
+        return INDEX_RECORD.unpack_from(self._idx_map, i * INDEX_RECORD.size)
+
+    def view(self, i: int) -> memoryview:
+        offset, size, _ = self.record(i)
+        if offset + size > len(self._tar_map):
+            raise _StaleIndex(f"分片 '{self.tar_path.name}' 第 {i} 条记录超出 .tar 文件末尾。")
+        return memoryview(self._tar_map)[offset:offset + size]
+
+    def keys(self) -> List[str]:
+        if self._keys is None:
+            try:
+                keys = self.tar_path.with_suffix(".keys").read_text(encoding="utf-8").splitlines()
+            except FileNotFoundError as e:
+                raise _StaleIndex(f"无法读取分片 '{self.tar_path.name}' 的 key 列表: {e}")
+            if len(keys) != self.records:
+                raise _StaleIndex(f"分片 '{self.tar_path.name}' 的 key 列表与索引中登记的记录数不一致。")
+            self._keys = keys
+        return self._keys
+
+    def close(self):
+        self._close_handles(self._idx_map)
+        self._idx_map = None
+
+    def _close_handles(self, *extra):
+        for handle in (*extra, self._tar_map, self._tar_file):
+            if handle is not None:
+                try:
+                    handle.close()
+                except BufferError:
+                    # 仍有 memoryview 引用该映射时无法关闭，交给垃圾回收
+                    pass
+        self._tar_map = self._tar_file = None
+
+
+class _Layout(NamedTuple):
+    """一次加载的索引对应的分片与标签；重新加载时整体替换，并发的读取看到的总是同一份索引。"""
+    shards: List[_MappedShard]
+    starts: List[int]
+    total: int
+    labels: List[Tuple[str, str]]
+
+
+class ShardDatasetReader:
+    """
+    打包分片（见 打包成分片.py）的随机访问读取器。
+
+    记录按 shards_index.json 中的划分与分片顺序编号，get() 返回图片字节的零拷贝 memoryview。
+    分片文件与已加载的索引对不上（目录被重新打包）时，自动重新加载索引后再读一次。
+    对象被 pickle 到子进程时只传递路径，子进程各自重新建立映射。
+    """
+
+    def __init__(self, shards_dir: str):
+        self.shards_dir = pathlib.Path(shards_dir)
+        self._key_lookup: Optional[Tuple[_Layout, Dict[str, Tuple[int, int]], Set[str]]] = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        index_path = self.shards_dir / INDEX_FILENAME
+        if not index_path.is_file():
+            raise FileNotFoundError(f"'{self.shards_dir}' 中找不到分片索引 {INDEX_FILENAME}。")
+
+        index = json.loads(index_path.read_text(encoding="utf-8"))
+        splits: Dict[str, Tuple[int, int]] = {}
+        shards: List[_MappedShard] = []
+        starts: List[int] = []
+        total = 0
+        for split, info in index["splits"].items():
+            split_start = total
+            for shard in info["shards"]:
+                starts.append(total)
+                shards.append(_MappedShard(self.shards_dir / shard["name"], shard["records"]))
+                total += shard["records"]
+            splits[split] = (split_start, total)
+
+        self.index = index
+        self.labels: List[Tuple[str, str]] = [tuple(label) for label in index["labels"]]
+        self.splits = splits
+        self._layout = _Layout(shards, starts, total, self.labels)
+
+    def _reload(self, stale: _Layout):
+        """只有第一个发现 stale 过期的线程重新加载；旧分片不主动关闭（可能仍有请求在用），由垃圾回收释放映射。"""
+        with self._lock:
+            if self._layout is stale:
+                self._load()
+
+    def _read(self, read: Callable[[_Layout], T]) -> T:
+        layout = self._layout
+        try:
+            return read(layout)
+        except _StaleIndex:
+            self._reload(layout)
+        try:
+            return read(self._layout)
+        except _StaleIndex as e:
+            raise ValueError(f"'{self.shards_dir}' 的分片与索引不一致，可能正在重新打包，请稍后重试。({e})")
+
+    def __len__(self) -> int:
+        return self._layout.total
+
+    def __getstate__(self):
+        return {"shards_dir": str(self.shards_dir)}
+
+    def __setstate__(self, state):
+        self.__init__(state["shards_dir"])
+
+    @staticmethod
+    def _locate(layout: _Layout, i: int) -> Tuple[_MappedShard, int]:
+        if not 0 <= i < layout.total:
+            raise IndexError(f"记录编号 {i} 超出范围 [0, {layout.total})")
+        shard_no = bisect.bisect_right(layout.starts, i) - 1
+        return layout.shards[shard_no], i - layout.starts[shard_no]
+
+    def _locate_key(self, layout: _Layout, key: str) -> Tuple[_MappedShard, int]:
+        cached = self._key_lookup
+        if cached is None or cached[0] is not layout:
+            with self._lock:
+                cached = self._key_lookup
+                if cached is None or cached[0] is not layout:
+                    lookup = {}
+                    duplicate_keys = set()
+                    for shard_no, shard in enumerate(layout.shards):
+                        for local, shard_key in enumerate(shard.keys()):
+                            if shard_key in lookup:
+                                duplicate_keys.add(shard_key)
+                            lookup[shard_key] = (shard_no, local)
+                    cached = self._key_lookup = (layout, lookup, duplicate_keys)
+        _, lookup, duplicate_keys = cached
+        if key in duplicate_keys:
+            # key 只在同一划分内唯一，不同划分中可能各有一个同名样本，此时只能按编号读取
+            raise ValueError(f"key '{key}' 在多个划分中都存在，请按记录编号读取。")
+        if key not in lookup:
+            raise KeyError(key)
+        shard_no, local = lookup[key]
+        return layout.shards[shard_no], local
+
+    def get(self, i: int) -> memoryview:
+        """按全局编号返回图片字节（零拷贝）。"""
+        def read(layout: _Layout) -> memoryview:
+            shard, local = self._locate(layout, i)
+            return shard.view(local)
+        return self._read(read)
+
+    def get_by_key(self, key: str) -> memoryview:
+        """按样本 key（见 打包成分片.sample_key）返回图片字节（零拷贝）；key 在多个划分中重复时抛出 ValueError。"""
+        def read(layout: _Layout) -> memoryview:
+            shard, local = self._locate_key(layout, key)
+            return shard.view(local)
+        return self._read(read)
+
+    def label(self, i: int) -> Tuple[str, str]:
+        def read(layout: _Layout) -> Tuple[str, str]:
+            shard, local = self._locate(layout, i)
+            return layout.labels[shard.record(local)[2]]
+        return self._read(read)
+
+    def key(self, i: int) -> str:
+        def read(layout: _Layout) -> str:
+            shard, local = self._locate(layout, i)
+            return shard.keys()[local]
+        return self._read(read)
+
+    def close(self):
+        for shard in self._layout.shards:
+            shard.close()
+
+
+MAX_CACHED_READERS = 8
+_readers: "OrderedDict[str, Tuple[Tuple[int, int], ShardDatasetReader]]" = OrderedDict()
+_readers_lock = threading.Lock()
+
+
+def get_reader(shards_dir: str) -> ShardDatasetReader:
+    """
+    每个进程每个分片目录只建立一次映射，供 API 复用。
+    每次调用都 stat 一次 shards_index.json：重新打包后索引的修改时间或大小变化，随即换用新的读取器，
+    不会继续用旧索引和旧文件的映射返回过期数据。旧读取器不主动关闭（可能仍有请求在用），由垃圾回收释放映射。
+    """
+    index_path = pathlib.Path(shards_dir) / INDEX_FILENAME
+    try:
+        stat = index_path.stat()
+    except FileNotFoundError:
+        raise FileNotFoundError(f"'{shards_dir}' 中找不到分片索引 {INDEX_FILENAME}。")
+    version = (stat.st_mtime_ns, stat.st_size)
+    with _readers_lock:
+        cached = _readers.get(shards_dir)
+        if cached is not None and cached[0] == version:
+            _readers.move_to_end(shards_dir)
+            return cached[1]
+        reader = ShardDatasetReader(shards_dir)
+        _readers[shards_dir] = (version, reader)
+        _readers.move_to_end(shards_dir)
+        while len(_readers) > MAX_CACHED_READERS:
+            _readers.popitem(last=False)
+        return reader
+
+
+def main():
+    """
+    随机读取几个样本，检查分片是否可用。
+    """
+    # ==================== 配置区 ====================
+    SHARDS_DIRECTORY = r'C:\Users\EDY\Desktop\testProject\申元按银行顺序标注回单\post处理\shards'
+    # ==============================================
+
+    try:
+        reader = ShardDatasetReader(SHARDS_DIRECTORY)
+    except Exception as e:
+        print(f"\n程序执行时发生意外错误: {e}")
+        sys.exit(1)
+
+    print(f"[*] 共 {len(reader)} 条记录，划分: {reader.splits}")
+    for i in range(min(5, len(reader))):
+        print(f"    └── #{i} {reader.key(i)} {reader.label(i)} {len(reader.get(i))} 字节")
+    reader.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+import functools
+import itertools
+import os
+import pathlib
+import sys
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from PIL import Image
+
+from app.core import throttle
+from app.core.plans import PlanWriter, planned_operation, summarize_plan
+from app.core.reports import ReportWriter
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg"}
+HASH_BITS = 64
+CHUNK_COUNT = 4  # 多索引哈希：64 位拆成 4 段，每段 16 位
+CHUNK_BITS = HASH_BITS // CHUNK_COUNT
+# 每段的查找半径为 max_distance // CHUNK_COUNT；限制在 1 以内，每个样本每段最多查 1 + 16 个桶
+MAX_DISTANCE = 2 * CHUNK_COUNT - 1
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _dhash_batch(paths: List[str]) -> Tuple[List[str], np.ndarray]:
+    """
+    以 draft 模式缩小解码并计算 64 位 dHash（9x8 灰度图中相邻像素的明暗关系）。
+    返回成功的路径与对应的 uint64 数组。
+    """
+    rows = []
+    ok_paths = []
+    for path in paths:
+        try:
+            with Image.open(path) as img:
+                img.draft("L", (64, 64))
+                rows.append(np.asarray(img.convert("L").resize((9, 8), Image.BILINEAR), dtype=np.int16))
+                ok_paths.append(path)
+        except Exception as e:
+            print(f"    └── ❌ 无法解码: {path} -> {e}", file=sys.stderr)
+    if not rows:
+        return ok_paths, np.empty(0, dtype=np.uint64)
+
+    pixels = np.stack(rows)
+    bits = (pixels[:, :, 1:] > pixels[:, :, :-1]).reshape(len(rows), HASH_BITS)
+    packed = np.packbits(bits, axis=1)  # (N, 8) 大端字节序
+    return ok_paths, packed.view(">u8").reshape(-1).astype(np.uint64)
+
+
+def hamming_distance(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """按元素计算两个 uint64 数组之间的汉明距离。"""
+    xor = np.bitwise_xor(a, b).astype(np.uint64)
+    return _POPCOUNT_TABLE[xor.view(np.uint8).reshape(-1, 8)].sum(axis=1)
+
+
+def compute_hashes(paths: List[str], workers: Optional[int] = None, chunk_size: int = 256) -> Tuple[List[str], np.ndarray]:
+    """在进程池中批量计算 dHash，结果保存在紧凑的 uint64 数组中。"""
+    chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+    ok_paths: List[str] = []
+    arrays = []
+    if chunks:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            for chunk_paths, chunk_hashes in pool.map(_dhash_batch, chunks):
+                ok_paths.extend(chunk_paths)
+                arrays.append(chunk_hashes)
+    hashes = np.concatenate(arrays) if arrays else np.empty(0, dtype=np.uint64)
+    return ok_paths, hashes
+
+
+@functools.lru_cache(maxsize=None)
+def _flip_masks(radius: int) -> Tuple[int, ...]:
+    """CHUNK_BITS 位内翻转不超过 radius 位的所有掩码（含 0），每个半径只枚举一次。"""
+    masks = [0]
+    for r in range(1, radius + 1):
+        for bits in itertools.combinations(range(CHUNK_BITS), r):
+            masks.append(sum(1 << bit for bit in bits))
+    return tuple(masks)
+
+
+def _neighbors(value: int, radius: int) -> List[int]:
+    """枚举与 value 在 CHUNK_BITS 位内汉明距离不超过 radius 的所有取值。"""
+    return [value ^ mask for mask in _flip_masks(radius)]
+
+
+def find_near_duplicate_pairs(hashes: np.ndarray, max_distance: int) -> List[Tuple[int, int]]:
+    """
+    多索引哈希查找汉明距离不超过 max_distance 的所有样本对，避免两两比较。
+    鸽巢原理：总距离不超过 k 时，4 段中至少有一段的距离不超过 k // 4，
+    因此只需在每段的桶里查找该半径内的邻居，再用完整哈希验证。
+    max_distance 不能超过 MAX_DISTANCE：半径再大时每段要查的桶数按组合数增长，不比两两比较快。
+    """
+    if not 0 <= max_distance <= MAX_DISTANCE:
+        raise ValueError(f"max_distance 必须在 0 到 {MAX_DISTANCE} 之间。")
+    radius = max_distance // CHUNK_COUNT
+    mask = np.uint64((1 << CHUNK_BITS) - 1)
+    chunks = [((hashes >> np.uint64(CHUNK_BITS * j)) & mask).astype(np.int64) for j in range(CHUNK_COUNT)]
+
+    tables = []
+    for values in chunks:
+        table: Dict[int, List[int]] = defaultdict(list)
+        for i, v in enumerate(values.tolist()):
+            table[v].append(i)
+        tables.append(table)
+
+    pairs = set()
+    for i in range(len(hashes)):
+        candidates = set()
+        for j in range(CHUNK_COUNT):
+            for v in _neighbors(int(chunks[j][i]), radius):
+                for c in tables[j].get(v, ()):
+                    if c > i:
+                        candidates.add(c)
+        if not candidates:
+            continue
+        candidate_array = np.fromiter(candidates, dtype=np.int64)
+        distances = hamming_distance(np.full(len(candidate_array), hashes[i], dtype=np.uint64), hashes[candidate_array])
+        for c in candidate_array[distances <= max_distance].tolist():
+            pairs.add((i, c))
+    return sorted(pairs)
+
+
+def _group_pairs(count: int, pairs: List[Tuple[int, int]]) -> List[List[int]]:
+    """并查集把成对的近重复合并成组。"""
+    parent = list(range(count))
+
+    def find(x: int) -> int:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in pairs:
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[rb] = ra
+
+    groups: Dict[int, List[int]] = defaultdict(list)
+    for i in range(count):
+        groups[find(i)].append(i)
+    return [members for members in groups.values() if len(members) > 1]
+
+
+def _regroup(group: Dict, split_dirs: Dict[str, str], split_of: Dict[str, str],
+             plan: Optional[PlanWriter], planned_targets: Set[pathlib.Path]) -> int:
+    """
+    把一个泄漏组中不在归属划分的文件移到归属划分，返回移动（演练时为计划移动）的文件数。
+    演练时（plan 不为 None）只把移动写入执行计划。
+    """
+    moved = 0
+    home_dir = pathlib.Path(split_dirs[group["home"]])
+    for file_path in group["files"]:
+        if split_of[file_path] == group["home"]:
+            continue
+        destination = home_dir / pathlib.Path(file_path).name
+        if plan is not None:
+            if destination.exists() or destination in planned_targets:
+                print(f"    └── (演练) 目标已存在，跳过: {destination}")
+                continue
+            planned_targets.add(destination)
+            plan.add(planned_operation("move", pathlib.Path(file_path), destination))
+            print(f"    └── (演练) [{split_of[file_path]} -> {group['home']}] {pathlib.Path(file_path).name}")
+            moved += 1
+            continue
+        if destination.exists():
+            print(f"    └── ❌ 目标已存在，跳过: {destination}")
+            continue
+        try:
+            throttle.move(file_path, destination)
+            moved += 1
+        except OSError as e:
+            print(f"    └── ❌ 移动失败: {file_path} -> {e}")
+    return moved
+
+
+def detect_near_duplicates(
+        split_dirs: Dict[str, str],
+        max_distance: int = 4,
+        hash_file: Optional[str] = None,
+        workers: Optional[int] = None,
+        regroup: bool = False,
+        dry_run: bool = True
+) -> Dict:
+    """
+    计算 train/val/test 各文件夹中所有 .jpg 的感知哈希，找出近重复组，并报告跨划分泄漏。
+
+    Args:
+        split_dirs (Dict[str, str]): 划分名称到文件夹路径的映射，顺序决定并组时的优先级（通常 train 在前）。
+        max_distance (int): 判定为近重复的最大汉明距离（64 位 dHash），不超过 MAX_DISTANCE。
+        hash_file (str, optional): 保存哈希数组的 .npy 路径（后缀统一改为 .npy），同名 .txt 保存对应的文件路径列表。
+        workers (int, optional): 计算哈希的进程数。
+        regroup (bool): 是否把每个泄漏组的成员移动到同一个划分（组内样本最多的划分，平局按 split_dirs 顺序）。
+        dry_run (bool): 是否为演练模式。True则只打印操作，不实际移动文件；regroup 时把这些移动保存为执行计划。
+
+    Returns:
+        统计信息与 NDJSON 报告 id；报告每行一个近重复组，跨划分的组带有归属划分 home。
+        演练且 regroup 时还包含已保存的执行计划（见 app.core.plans.execute_plan）。
+    """
+    if not 0 <= max_distance <= MAX_DISTANCE:
+        raise ValueError(f"max_distance 必须在 0 到 {MAX_DISTANCE} 之间。")
+
+    # --- 1. 扫描各划分 ---
+    paths: List[str] = []
+    split_of: Dict[str, str] = {}
+    for split, directory in split_dirs.items():
+        split_path = pathlib.Path(directory)
+        if not split_path.is_dir():
+            raise NotADirectoryError(f"划分 '{split}' 的文件夹 '{directory}' 不存在或不是一个有效的文件夹。")
+        for file_path in sorted(split_path.rglob('*')):
+            if file_path.is_file() and file_path.suffix.lower() in IMAGE_EXTENSIONS:
+                paths.append(str(file_path))
+                split_of[str(file_path)] = split
+    print(f"[*] 共扫描 {len(paths)} 个图片文件，开始计算感知哈希...")
+
+    # --- 2. 计算并保存哈希 ---
+    paths, hashes = compute_hashes(paths, workers)
+    if hash_file:
+        # np.save 会给没有 .npy 后缀的路径补上后缀，先统一好，打印的路径与 .txt 才对得上
+        hash_path = pathlib.Path(hash_file).with_suffix(".npy")
+        hash_path.parent.mkdir(parents=True, exist_ok=True)
+        np.save(hash_path, hashes)
+        hash_path.with_suffix(".txt").write_text("\n".join(paths) + "\n", encoding="utf-8")
+        print(f"[*] 哈希数组已保存: {hash_path.resolve()}")
+
+    # --- 3. 查找近重复组并统计泄漏，逐组写入报告；可选把泄漏组并到同一划分 ---
+    pairs = find_near_duplicate_pairs(hashes, max_distance)
+    leak_count = 0
+    moved = 0
+    split_order = list(split_dirs)
+    planned_targets: Set[pathlib.Path] = set()
+    params = {"split_dirs": split_dirs, "max_distance": max_distance}
+    with ReportWriter() as groups, \
+            (PlanWriter("detect_near_duplicates", params) if regroup and dry_run else nullcontext()) as plan:
+        for members in _group_pairs(len(paths), pairs):
+            member_paths = [paths[i] for i in members]
+            splits = Counter(split_of[p] for p in member_paths)
+            group = {"files": member_paths, "splits": dict(splits)}
+            if len(splits) > 1:
+                # 组内样本最多的划分作为归属，平局时按 split_dirs 的顺序
+                group["home"] = max(splits, key=lambda s: (splits[s], -split_order.index(s)))
+                leak_count += 1
+                if regroup:
+                    moved += _regroup(group, split_dirs, split_of, plan, planned_targets)
+            groups.write(group)
+
+    print(f"[*] 发现 {groups.rows} 个近重复组，其中 {leak_count} 个跨越多个划分（数据泄漏）。")
+    result = {"scanned": len(paths), "group_count": groups.rows, "leak_count": leak_count, "moved": moved,
+              "report": groups.summary()}
+    if plan is not None:
+        print(f"[*] 执行计划已保存: {plan.plan['plan_id']}")
+        result["plan"] = summarize_plan(plan.plan)
+    return result
+
+
+# ==============================================================================
+# --- MAIN SCRIPT CONTROLLER ---
+# ==============================================================================
+def main():
+    """
+    配置并运行近重复与泄漏检测任务。
+    """
+    # ==================== 1. 基本配置 ====================
+    SPLIT_DIRECTORIES = {
+        "train": r'C:\Users\EDY\Desktop\testProject\申元按银行顺序标注回单\post处理\train',
+        "eval": r'C:\Users\EDY\Desktop\testProject\申元按银行顺序标注回单\post处理\eval',
+    }
+
+    # 最大汉明距离：0 只找完全一致的感知哈希，4~6 可覆盖重新扫描、重新导出的同一张回单
+    MAX_DISTANCE = 4
+
+    # 是否把泄漏组并到同一个划分，以及是否为演练模式
+    REGROUP = True
+    DRY_RUN_MODE = True
+
+    # =====================================================
+
+    try:
+        detect_near_duplicates(SPLIT_DIRECTORIES, MAX_DISTANCE, regroup=REGROUP, dry_run=DRY_RUN_MODE)
+    except Exception as e:
+        print(f"\n程序执行时发生意外错误: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
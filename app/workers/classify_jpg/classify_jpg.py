@@ -0,0 +1,240 @@
+# classify_jpg.py
+
+import asyncio
+import contextvars
+import importlib
+import os
+import pathlib
+import sys
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Protocol, Tuple
+
+import numpy as np
+from PIL import Image
+
+from app.core import throttle
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg"}
+# 通过环境变量指定模型工厂，例如 "my_models.receipts:build_model"；未设置时使用内置的微型模型
+MODEL_ENV_VAR = "CLASSIFY_JPG_MODEL"
+BUILTIN_MODEL = "builtin:tiny"
+
+
+class ImageClassifier(Protocol):
+    """可插拔 CPU 模型需要实现的接口。"""
+
+    input_size: Tuple[int, int]
+
+    def predict(self, batch: np.ndarray) -> List[str]:
+        """batch 形状为 (N, H, W)，float32 灰度，取值 0~1；返回 N 个标签。"""
+        ...
+
+
+class TinyCentroidModel:
+    """
+    内置的微型最近质心模型，只依赖亮度均值与对比度两个特征，用于测试和联调。
+    """
+
+    input_size = (64, 64)
+    labels = ("blank", "document", "photo")
+    centroids = np.array([
+        [0.97, 0.03],  # blank: 几乎全白、无对比度
+        [0.85, 0.25],  # document: 白底黑字
+        [0.45, 0.20],  # photo: 整体偏暗、层次丰富
+    ], dtype=np.float32)
+
+    def predict(self, batch: np.ndarray) -> List[str]:
+        flat = batch.reshape(len(batch), -1)
+        features = np.stack([flat.mean(axis=1), flat.std(axis=1)], axis=1)
+        distances = ((features[:, None, :] - self.centroids[None, :, :]) ** 2).sum(axis=2)
+        return [self.labels[i] for i in distances.argmin(axis=1)]
+
+
+_models: Dict[str, ImageClassifier] = {}
+_models_lock = threading.Lock()
+
+
+def allowed_models() -> List[str]:
+    """允许使用的模型：内置微型模型，以及服务端环境变量配置的模型。请求里不能指定任意模块。"""
+    configured = os.environ.get(MODEL_ENV_VAR)
+    return [BUILTIN_MODEL] + ([configured] if configured and configured != BUILTIN_MODEL else [])
+
+
+def load_model(spec: Optional[str] = None) -> ImageClassifier:
+    """
+    按 "模块:工厂函数" 加载模型，每个工作进程每种模型只加载一次。
+    spec 不在 allowed_models() 中或加载失败时抛出 ValueError。
+    """
+    spec = spec or os.environ.get(MODEL_ENV_VAR) or BUILTIN_MODEL
+    if spec not in allowed_models():
+        raise ValueError(f"不允许使用模型 '{spec}'，可用的模型: {', '.join(allowed_models())}。")
+    with _models_lock:
+        if spec not in _models:
+            if spec == BUILTIN_MODEL:
+                _models[spec] = TinyCentroidModel()
+            else:
+                module_name, _, factory_name = spec.partition(":")
+                try:
+                    factory = getattr(importlib.import_module(module_name), factory_name)
+                    _models[spec] = factory()
+                except Exception as e:
+                    raise ValueError(f"加载模型 '{spec}' 失败: {e}") from e
+        return _models[spec]
+
+
+def decode_image(path: pathlib.Path, size: Tuple[int, int]) -> np.ndarray:
+    """用 JPEG draft 模式按目标尺寸解码，再缩放为模型输入，避免全分辨率解码。"""
+    with Image.open(path) as img:
+        img.draft("L", size)
+        img = img.convert("L").resize(size, Image.BILINEAR)
+        return np.asarray(img, dtype=np.float32) / 255.0
+
+
+class MicroBatcher:
+    """
+    跨并发请求的动态微批处理：第一条样本到达后最多等待 max_wait_ms，
+    凑够 max_batch 条或超时后一次性送入模型，推理在单独的线程中执行，不阻塞事件循环。
+    """
+
+    def __init__(self, model: ImageClassifier, max_batch: int = 32, max_wait_ms: float = 5.0):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="classify-infer")
+        self.batches_run = 0
+
+    def _ensure_started(self):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, array: np.ndarray) -> str:
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((array, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(items) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            batch = np.stack([array for array, _ in items])
+            try:
+                labels = await loop.run_in_executor(self._executor, self.model.predict, batch)
+            except Exception as e:
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches_run += 1
+            for (_, future), label in zip(items, labels):
+                if not future.done():
+                    future.set_result(label)
+
+
+_batchers: Dict[str, MicroBatcher] = {}
+_decode_pool = ThreadPoolExecutor(max_workers=min(8, (os.cpu_count() or 1) * 2),
+                                  thread_name_prefix="classify-decode")
+
+
+def get_batcher(spec: Optional[str] = None) -> MicroBatcher:
+    """每个工作进程共享同一个微批处理器，使并发请求能合并成同一批推理。"""
+    spec = spec or os.environ.get(MODEL_ENV_VAR) or BUILTIN_MODEL
+    if spec not in _batchers:
+        _batchers[spec] = MicroBatcher(load_model(spec))
+    return _batchers[spec]
+
+
+async def classify_directory(source_dir: pathlib.Path,
+                             output_dir: Optional[pathlib.Path] = None,
+                             model_spec: Optional[str] = None,
+                             max_in_flight: int = 256,
+                             dry_run: bool = True) -> Dict:
+    """
+    对文件夹内所有 jpg 分类，返回每个文件的标签。
+    解码在线程池中并行完成，推理经由 MicroBatcher 与其它并发请求合并成批。
+
+    Args:
+        source_dir: 要分类的源文件夹。
+        output_dir: 非演练模式下，按标签复制到 output_dir/<标签>/ 子文件夹。
+        model_spec: 模型名，只能是 allowed_models() 中的一个，默认读取环境变量或使用内置微型模型。
+        max_in_flight: 同时处于解码或推理中的最大样本数。
+        dry_run: 为 True 时只返回标签，不复制任何文件。
+    """
+    if not source_dir.is_dir():
+        raise NotADirectoryError(f"源文件夹 '{source_dir}' 不存在或不是一个有效的目录。")
+
+    batcher = get_batcher(model_spec)
+    size = batcher.model.input_size
+    loop = asyncio.get_running_loop()
+    # 扫描放到线程里执行，避免大文件夹阻塞事件循环
+    image_paths = await loop.run_in_executor(None, lambda: sorted(
+        p for p in source_dir.rglob('*') if p.is_file() and p.suffix.lower() in IMAGE_EXTENSIONS))
+
+    # 限制同时在途的样本数，避免大文件夹一次性解码全部图片占满内存
+    in_flight = asyncio.Semaphore(max_in_flight)
+
+    async def _classify_one(path: pathlib.Path) -> Tuple[pathlib.Path, Optional[str], Optional[str]]:
+        async with in_flight:
+            try:
+                array = await loop.run_in_executor(_decode_pool, decode_image, path, size)
+            except Exception as e:
+                return path, None, str(e)
+            return path, await batcher.submit(array), None
+
+    results = await asyncio.gather(*(_classify_one(p) for p in image_paths))
+
+    labels: Dict[str, str] = {}
+    failed: Dict[str, str] = {}
+    for path, label, error in results:
+        relative = str(path.relative_to(source_dir))
+        if error is not None:
+            failed[relative] = error
+        else:
+            labels[relative] = label
+
+    if not dry_run and output_dir is not None:
+        def _copy_all():
+            for relative, label in labels.items():
+                target_path = output_dir / label / relative
+                target_path.parent.mkdir(parents=True, exist_ok=True)
+                throttle.copy(source_dir / relative, target_path)
+
+        # 线程池不会自动带上请求的上下文，显式复制一份，本次请求的限速才能作用到复制上
+        await loop.run_in_executor(None, contextvars.copy_context().run, _copy_all)
+
+    return {
+        "labels": labels,
+        "counts": dict(Counter(labels.values())),
+        "failed": failed,
+    }
+
+
+def main(source_folder: pathlib.Path, output_folder: pathlib.Path, is_dry_run: bool):
+    """
+    主函数，用于配置和运行脚本。
+    """
+    summary = asyncio.run(classify_directory(source_folder, output_folder, dry_run=is_dry_run))
+    print(f"分类完成: {summary['counts']}")
+    if summary["failed"]:
+        print(f"解码失败 {len(summary['failed'])} 个文件。", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    SOURCE = pathlib.Path(r'C:\path\to\receipts')
+    OUTPUT = pathlib.Path(r'C:\path\to\classified')
+    main(SOURCE, OUTPUT, is_dry_run=True)
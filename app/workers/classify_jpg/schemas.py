@@ -1,6 +1,6 @@
 # app/core/schemas.py
-from pydantic import BaseModel
-from typing import Dict, Any
+from pydantic import BaseModel, Field
+from typing import Dict, Any, Optional
 
 class CleanDataRequest(BaseModel):
     source_directory: str
@@ -9,4 +9,8 @@ class CleanDataRequest(BaseModel):
 class CleanDataResponse(BaseModel):
     status: str
     message: str
-    summary: Dict[str, Any]
\ No newline at end of file
+    summary: Dict[str, Any]
+
+class ClassifyRequest(CleanDataRequest):
+    model: Optional[str] = Field(None, description="模型名，只能是 \"builtin:tiny\" 或服务端环境变量 CLASSIFY_JPG_MODEL 配置的模型；为空时使用后者")
+    dry_run: bool = Field(True, description="演练模式，只返回标签，不按标签复制文件")
@@ -0,0 +1,272 @@
+# archive_cache.py
+
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+INDEX_FILENAME = "index.json"
+LOCK_FILENAME = "index.lock"
+READ_BUFFER = 1024 * 1024
+# 单文件压缩格式：解压出的文件名取自压缩包名，内容相同、名字不同的压缩包会得到不同的成员
+SINGLE_FILE_SUFFIXES = {".gz", ".bz2", ".xz", ".lzma", ".z", ".zst", ".lz", ".lzo", ".lz4"}
+
+
+def content_hash(path: pathlib.Path) -> str:
+    digest = hashlib.sha256()
+    buffer = bytearray(READ_BUFFER)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            digest.update(view[:n])
+    return digest.hexdigest()
+
+
+def cache_key(archive: pathlib.Path, digest: str) -> str:
+    """缓存键：一般只取内容哈希；单文件压缩格式（非 .tar.*）的成员名来自压缩包名，键里要带上文件名。"""
+    suffixes = [suffix.lower() for suffix in archive.suffixes]
+    if suffixes and suffixes[-1] in SINGLE_FILE_SUFFIXES and suffixes[-2:-1] != [".tar"]:
+        return f"{digest}:{archive.name}"
+    return digest
+
+
+@contextmanager
+def _file_lock(path: pathlib.Path) -> Iterator[None]:
+    """跨进程的排他锁：CPU 型 worker 跑在进程池里，同一个缓存目录可能同时被多个进程使用。"""
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class ArchiveCache:
+    """
+    以压缩包内容哈希为键的解压结果缓存。
+
+    目录结构:
+        index.json                  archives: 每个压缩包的成员清单 {成员相对路径: 成员内容哈希}、总字节数、最近使用时间；
+                                    blobs: 每个成员文件的字节数与引用它的清单数；bytes: 成员文件总字节数
+        index.lock                  读改写 index.json 与增删 blobs 时持有的文件锁
+        blobs/<前2位>/<内容哈希>     按内容寻址的成员文件，不同压缩包中相同的成员只存一份
+    同一个压缩包再次出现时，直接从 blobs 复制出成员文件，不再调用 patoolib。
+    输出文件总是独立的副本而不是硬链接，之后就地修改输出文件（规范化、重命名工具等）不会改坏缓存。
+    总大小超过 max_bytes 时按最近使用时间淘汰清单，并回收引用数降为 0 的成员文件；
+    总字节数与引用数随清单增删维护在索引里，淘汰时不必 stat 成员文件，也不必重新统计引用。
+
+    index.json 每次都在文件锁内重新读取、修改后立即写回，多个进程或多个实例共用同一个缓存目录时
+    不会互相覆盖清单，也不会删掉对方清单仍在引用的成员文件。同一进程内请通过 get_archive_cache 共享实例。
+    """
+
+    def __init__(self, cache_dir: pathlib.Path, max_bytes: int = 20 * 1024 ** 3, store_members: bool = True):
+        self.cache_dir = cache_dir
+        self.blob_dir = cache_dir / "blobs"
+        self.tmp_dir = cache_dir / "tmp"
+        self.max_bytes = max_bytes
+        self.store_members = store_members
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        self.entries: Dict[str, Dict] = {}
+        self.blobs: Dict[str, Dict] = {}
+        self.total_bytes = 0
+        with self._locked():
+            # 只是读入已有清单，让 stats() 立即反映缓存内容
+            pass
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """持有线程锁和文件锁，并从磁盘重新读取清单；调用方修改 entries 后需在锁内调用 _save_index。"""
+        with self._lock, _file_lock(self.cache_dir / LOCK_FILENAME):
+            index_path = self.cache_dir / INDEX_FILENAME
+            try:
+                index = json.loads(index_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                index = {}
+            if index and "archives" not in index:
+                self._load_legacy(index)
+            else:
+                self.entries = index.get("archives", {})
+                self.blobs = index.get("blobs", {})
+                self.total_bytes = index.get("bytes", 0)
+            yield
+
+    def _load_legacy(self, entries: Dict[str, Dict]):
+        """旧版 index.json 只有清单：按新的缓存键重新登记，并统计一次成员文件大小与引用数。"""
+        self.entries, self.blobs, self.total_bytes = {}, {}, 0
+        for key, entry in entries.items():
+            self.entries[cache_key(pathlib.Path(entry["archive"]), key)] = entry
+            if entry.get("stored"):
+                for digest in set(entry["members"].values()):
+                    if digest not in self.blobs:
+                        blob = self._blob_path(digest)
+                        self.blobs[digest] = {"bytes": blob.stat().st_size if blob.exists() else 0, "refs": 0}
+                        self.total_bytes += self.blobs[digest]["bytes"]
+                    self.blobs[digest]["refs"] += 1
+
+    def _blob_path(self, digest: str) -> pathlib.Path:
+        return self.blob_dir / digest[:2] / digest
+
+    def _save_index(self):
+        index = {"archives": self.entries, "blobs": self.blobs, "bytes": self.total_bytes}
+        tmp = self.cache_dir / f"{INDEX_FILENAME}.{uuid.uuid4().hex}.tmp"
+        tmp.write_text(json.dumps(index, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.cache_dir / INDEX_FILENAME)
+
+    def _materialize(self, entry: Dict, output_dir: pathlib.Path) -> bool:
+        """把清单中的成员复制到输出目录；任何成员缺失（例如刚被其他进程淘汰）都视为未命中。"""
+        for relative, digest in entry["members"].items():
+            target = output_dir / relative
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if target.exists() or target.is_symlink():
+                # 旧版本输出的可能是指向 blob 的硬链接，先断开再写，避免改到缓存里的文件
+                target.unlink()
+            try:
+                shutil.copy2(self._blob_path(digest), target)
+            except FileNotFoundError:
+                return False
+        return True
+
+    def extract(self, archive: pathlib.Path, output_dir: pathlib.Path,
+                extract_fn: Callable[[pathlib.Path, pathlib.Path], None]) -> bool:
+        """
+        把 archive 解压到 output_dir。命中缓存时直接物化成员文件并返回 True；
+        未命中时调用 extract_fn 解压到临时目录，再收录进缓存并物化，返回 False。
+        """
+        key = cache_key(archive, content_hash(archive))
+        with self._locked():
+            entry = self.entries.get(key)
+        # 复制成员文件不持有锁；期间成员被其他进程淘汰时 _materialize 返回 False，按未命中重新解压
+        if entry is not None and entry.get("stored") and self._materialize(entry, output_dir):
+            with self._locked():
+                if key in self.entries:
+                    self.entries[key]["last_used"] = time.time()
+                    self._save_index()
+            self.hits += 1
+            return True
+        self.misses += 1
+
+        staging = self.tmp_dir / uuid.uuid4().hex
+        staging.mkdir()
+        try:
+            extract_fn(archive, staging)
+            members: Dict[str, str] = {}
+            sizes: Dict[str, int] = {}
+            pending: List[Tuple[pathlib.Path, pathlib.Path]] = []
+            total = 0
+            for path in staging.rglob('*'):
+                if not path.is_file():
+                    continue
+                digest = content_hash(path)
+                members[path.relative_to(staging).as_posix()] = digest
+                sizes[digest] = path.stat().st_size
+                total += sizes[digest]
+                blob = self._blob_path(digest)
+                if self.store_members and not blob.exists():
+                    # 先复制到缓存目录下的临时文件，加锁后再原子地放到 blob 位置；解压结果本身留给输出目录
+                    tmp = self.tmp_dir / f"{uuid.uuid4().hex}.blob"
+                    shutil.copy2(path, tmp)
+                    pending.append((tmp, blob))
+
+            with self._locked():
+                for tmp, blob in pending:
+                    if blob.exists():
+                        tmp.unlink()
+                    else:
+                        blob.parent.mkdir(exist_ok=True)
+                        os.replace(tmp, blob)
+                if key in self.entries:
+                    # 之前的清单因成员文件缺失未能命中，先释放它的引用再登记新的
+                    self._release(self.entries.pop(key))
+                self.entries[key] = {"archive": archive.name, "members": members, "bytes": total,
+                                     "stored": self.store_members, "last_used": time.time()}
+                if self.store_members:
+                    for digest, size in sizes.items():
+                        blob = self.blobs.setdefault(digest, {"bytes": size, "refs": 0})
+                        if blob["refs"] == 0:
+                            self.total_bytes += size
+                        blob["refs"] += 1
+                self._evict()
+                self._save_index()
+
+            # 未命中时输出的就是刚解压出的文件，直接移到输出目录，不依赖 blob 是否还在
+            for relative in members:
+                target = output_dir / relative
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(staging / relative, target)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        return False
+
+    def _release(self, entry: Dict):
+        """调用方需持有锁。清单被移除时减少其成员文件的引用数，降为 0 的成员文件随即删除。"""
+        if not entry.get("stored"):
+            return
+        for digest in set(entry["members"].values()):
+            blob = self.blobs.get(digest)
+            if blob is None:
+                continue
+            blob["refs"] -= 1
+            if blob["refs"] <= 0:
+                del self.blobs[digest]
+                self.total_bytes -= blob["bytes"]
+                self._blob_path(digest).unlink(missing_ok=True)
+
+    def _evict(self):
+        """按最近使用时间淘汰清单，直到被引用成员文件的总大小不超过 max_bytes。"""
+        if self.total_bytes <= self.max_bytes:
+            return
+        for key in sorted(self.entries, key=lambda k: self.entries[k]["last_used"]):
+            if self.total_bytes <= self.max_bytes:
+                break
+            self._release(self.entries.pop(key))
+
+    def stats(self) -> Dict:
+        return {"entries": len(self.entries), "bytes": self.total_bytes, "hits": self.hits, "misses": self.misses}
+
+
+_caches: Dict[str, ArchiveCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_archive_cache(cache_dir: pathlib.Path, max_bytes: int = 20 * 1024 ** 3) -> ArchiveCache:
+    """同一个缓存目录在进程内只创建一个 ArchiveCache，以最近一次调用的 max_bytes 为准。"""
+    key = os.path.normcase(os.path.abspath(cache_dir))
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = ArchiveCache(cache_dir, max_bytes=max_bytes)
+        cache.max_bytes = max_bytes
+        return cache
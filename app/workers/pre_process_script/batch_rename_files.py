@@ -1,8 +1,115 @@
 # batch_rename_files.py
 
+import hashlib
+import os
 import pathlib
-import shutil  # <--- 修改1：导入shutil库用于文件复制
-from typing import List
+import shutil
+import tempfile
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.core import throttle
+from app.core.metrics import worker_metrics
+from app.core.ndjson import dumps, loads, read_lines
+from app.core.plans import create_plan, planned_operation, summarize_plan
+from app.workers.pre_process_script.dedupe_files import full_hash, scan_files
+
+# 持久映射放在独立的目录里，按目标文件夹区分，不写进数据集本身（否则会被 move_unwanted_files 当作多余文件移走）；
+# 每复制一个文件追加一行，执行演练计划时由 execute_plan 在复制成功后追加。
+# 映射决定了编号是否稳定，不能放在会被系统清理的临时目录里：未配置时放在用户目录下
+MAPPING_DIR_ENV_VAR = "RENAME_MAPPING_DIR"
+DEFAULT_MAPPING_DIR = pathlib.Path.home() / ".workflow" / "rename_mappings"
+# 旧版本默认放在临时目录里，读取映射时迁移出来
+LEGACY_MAPPING_DIR = pathlib.Path(tempfile.gettempdir()) / "workflow_rename_mappings"
+# 旧版本写在目标文件夹里的映射文件，读取映射时迁移出来
+LEGACY_MAPPING_FILENAME = ".batch_rename_mapping.ndjson"
+
+
+def mapping_dir() -> pathlib.Path:
+    path = pathlib.Path(os.environ.get(MAPPING_DIR_ENV_VAR) or DEFAULT_MAPPING_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def mapping_path(destination_dir: pathlib.Path) -> pathlib.Path:
+    """destination_dir 对应的映射文件；旧版本留在目标文件夹或临时目录里的映射文件会被移到这里。"""
+    key = hashlib.blake2b(str(destination_dir.resolve()).encode("utf-8"), digest_size=16).hexdigest()
+    path = mapping_dir() / f"{key}.ndjson"
+    for legacy in (destination_dir / LEGACY_MAPPING_FILENAME, LEGACY_MAPPING_DIR / f"{key}.ndjson"):
+        if legacy != path and legacy.is_file() and not path.exists():
+            # 临时目录可能与映射目录不在同一个磁盘上，os.replace 会失败
+            shutil.move(str(legacy), str(path))
+    return path
+
+
+class _RenameMapping:
+    """
+    原文件到编号的持久映射，保存在 mapping_path(目标文件夹) 中（NDJSON，只追加）:
+        {"source": 源文件相对路径, "hash": 内容哈希, "size": 字节数, "mtime_ns": 修改时间, "number": 编号, "name": 目标文件名}
+    以 (相对路径, 内容哈希) 为键：同一路径的内容变化后视为新文件，分配新的编号，旧记录保留。
+    字节数与 mtime 都没变的文件直接沿用最近一条记录的哈希，不再读取内容。
+    已用的编号和文件名都在内存中，判断重名不需要逐个文件访问磁盘。
+    """
+
+    def __init__(self, destination_dir: pathlib.Path):
+        self.path = mapping_path(destination_dir)
+        self.by_key: Dict[Tuple[str, str], Dict] = {}
+        self.latest: Dict[str, Dict] = {}
+        self.names: Set[str] = set()
+        self.max_number = 0
+        self._file = None
+        if self.path.is_file():
+            for line in read_lines(self.path):
+                # 只追加的文件最后一行可能是中断时写了一半的
+                if line.endswith(b"\n"):
+                    self._index(loads(line))
+
+    def _index(self, row: Dict):
+        self.by_key[(row["source"], row["hash"])] = row
+        self.latest[row["source"]] = row
+        self.names.add(row["name"])
+        self.max_number = max(self.max_number, row["number"])
+
+    def cached_hash(self, source: str, size: int, mtime_ns: int) -> Optional[str]:
+        row = self.latest.get(source)
+        if row and row["size"] == size and row["mtime_ns"] == mtime_ns:
+            return row["hash"]
+        return None
+
+    def get(self, source: str, digest: str) -> Optional[Dict]:
+        return self.by_key.get((source, digest))
+
+    def record(self, row: Dict, persist: bool = True):
+        """登记一条映射；演练时 persist=False，只占用编号不写文件。"""
+        self._index(row)
+        if persist:
+            if self._file is None:
+                self._file = open(self.path, "ab")
+            self._file.write(dumps(row))
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def _unmapped_by_hash(destination_dir: pathlib.Path, existing: Set[str], mapping: _RenameMapping,
+                      metrics) -> Dict[str, List[str]]:
+    """
+    目标文件夹中映射里没有记录的文件，按内容哈希分组。用于补建映射：目标文件夹由旧版本编号填充、
+    或映射文件丢失时，内容相同的源文件直接认领已有的文件名，不再以新编号重复复制。
+    """
+    unmapped: Dict[str, List[str]] = {}
+    for name in sorted(existing - mapping.names):
+        path = destination_dir / name
+        with metrics.stage("hash"):
+            digest = full_hash(str(path))
+        metrics.bytes_read(path.stat().st_size)
+        unmapped.setdefault(digest, []).append(name)
+    return unmapped
+
+
+def _number_of(name: str) -> int:
+    stem = pathlib.PurePath(name).stem
+    return int(stem) if stem.isdigit() else 0
 
 
 def batch_rename_files(
@@ -11,17 +118,26 @@ def batch_rename_files(
         prefix: str,
         start_counter: int = 1,
         dry_run: bool = True
-):
+) -> Optional[Dict]:
     """
     递归地扫描源目录中的所有文件，将它们复制并重命名到目标目录中。
     此操作为非破坏性，不会修改源目录中的任何文件。
 
+    编号是稳定的：每个文件按 (相对路径, 内容哈希) 记录在目标文件夹对应的映射文件中（见 mapping_path），
+    再次运行时已复制过且目标文件仍在的文件直接跳过，只有新增或内容变化的文件按排序顺序分配下一个空闲编号并复制，
+    新增一个文件不会让排在它后面的文件整体改号、重新复制。目标文件被删除的，按原编号补回。
+    目标文件夹里已有、但映射中没有记录的文件（旧版本的输出或映射丢失）按内容哈希认领，补进映射而不重复复制。
+    演练生成的计划里每个新文件的复制都带着它的映射记录，执行计划时复制成功一个就记录一个。
+
     Args:
         source_dir: 要扫描的源文件夹路径。
         destination_dir: 复制并重命名后文件存放的目标文件夹。
         prefix: 新文件名的前缀 (当前版本代码未使用，但保留参数)。
-        start_counter: 计数器的起始数字。
-        dry_run: 如果为 True，则只打印将要进行的操作，不实际复制或重命名文件。
+        start_counter: 映射为空时计数器的起始数字；之后从已分配的最大编号继续。
+        dry_run: 如果为 True，则只打印将要进行的操作，不实际复制或重命名文件，并把这些操作保存为执行计划。
+
+    Returns:
+        处理统计；演练模式下还包含已保存的执行计划（见 app.core.plans.execute_plan）。
     """
     # --- 1. 安全性与有效性检查 ---
     if not source_dir.is_dir():
@@ -44,12 +160,14 @@ def batch_rename_files(
             print(f"错误: 无法创建目标文件夹 '{destination_dir}': {e}")
             return
 
+    mapping = _RenameMapping(destination_dir)
     try:
-        # --- 2. 发现所有源文件 ---
-        all_files: List[pathlib.Path] = [
-            item for item in source_dir.rglob('*') if item.is_file()
-        ]
-        all_files.sort()  # 排序确保重命名顺序一致
+        # --- 2. 发现所有源文件，列出目标文件夹中已有的文件（只读一次目录） ---
+        all_files: List[Tuple[str, int, int]] = sorted(scan_files(source_dir))  # 排序确保编号顺序一致
+        existing: Set[str] = set()
+        if destination_dir.is_dir():
+            with os.scandir(destination_dir) as entries:
+                existing = {entry.name for entry in entries if entry.is_file()}
 
         if not all_files:
             print("信息: 在源目录中未找到任何文件。")
@@ -58,57 +176,153 @@ def batch_rename_files(
         print(f"总共发现 {len(all_files)} 个文件。准备开始处理...")
         print("-" * 60)
 
-        processed_count = 0
-        skipped_count = 0
+        metrics = worker_metrics("batch_rename_files")
+        unchanged = 0
+        to_copy: List[Tuple[pathlib.Path, str, Dict]] = []
+        new_files: List[Tuple[pathlib.Path, Dict]] = []
 
-        # --- 3. 遍历并执行“复制并重命名” ---
-        for i, old_path in enumerate(all_files):
-            counter = start_counter + i
-            file_extension = old_path.suffix
+        # --- 3. 对照映射：已复制过的跳过，目标被删的按原编号补回，其余为新文件 ---
+        for path, size, mtime_ns in all_files:
+            old_path = pathlib.Path(path)
+            source = old_path.relative_to(source_dir).as_posix()
+            digest = mapping.cached_hash(source, size, mtime_ns)
+            if digest is None:
+                with metrics.stage("hash"):
+                    digest = full_hash(path)
+                metrics.bytes_read(size)
+            row = mapping.get(source, digest)
+            if row is None:
+                new_files.append((old_path, {"source": source, "hash": digest, "size": size, "mtime_ns": mtime_ns}))
+            elif row["name"] in existing:
+                unchanged += 1
+            else:
+                to_copy.append((old_path, row["name"], None))
 
-            # 构建新文件名 (根据您的代码，已移除前缀)
+        # --- 4. 映射里没有的源文件先按内容认领目标文件夹中已有的同内容文件 ---
+        adopted = 0
+        if new_files and existing - mapping.names:
+            unmapped = _unmapped_by_hash(destination_dir, existing, mapping, metrics)
+            remaining = []
+            for old_path, row in new_files:
+                names = unmapped.get(row["hash"])
+                if not names:
+                    remaining.append((old_path, row))
+                    continue
+                name = names.pop(0)
+                mapping.record(dict(row, number=_number_of(name), name=name), persist=not dry_run)
+                adopted += 1
+                unchanged += 1
+            new_files = remaining
+            if adopted:
+                print(f"按内容认领了目标文件夹中已有的 {adopted} 个文件，补入映射。")
+
+        # --- 5. 新文件：按顺序分配下一个空闲编号 ---
+        counter = max(start_counter, mapping.max_number + 1)
+        for old_path, row in new_files:
+            file_extension = old_path.suffix
+            # 构建新文件名 (根据您的代码，已移除前缀)；跳过目标文件夹中已被占用的文件名
             new_name = f"{counter:04d}{file_extension}"
+            while new_name in existing or new_name in mapping.names:
+                counter += 1
+                new_name = f"{counter:04d}{file_extension}"
+            to_copy.append((old_path, new_name, dict(row, number=counter, name=new_name)))
+            # 先占用编号，后面的新文件不会再分到它；实际复制成功后才写入映射文件
+            mapping.names.add(new_name)
+            counter += 1
 
+        # --- 6. 复制（演练时生成计划） ---
+        processed_count = 0
+        skipped_count = 0
+        operations = []
+        for old_path, new_name, row in to_copy:
             # <--- 修改4：构建完整的新路径，指向目标文件夹 ---
             new_path = destination_dir / new_name
 
             # 根据模式执行操作
             if dry_run:
+                if row is None:
+                    operations.append(planned_operation("copy", old_path, new_path))
+                else:
+                    mapping.record(row, persist=False)
+                    operations.append(planned_operation("copy", old_path, new_path, record=mapping.path, row=row))
                 print(
                     f"[演练] 将复制: '{old_path.relative_to(source_dir.parent)}' -> '{new_path.relative_to(destination_dir.parent)}'")
                 processed_count += 1
                 continue
 
-            # --- 4. 实际执行操作 ---
+            # --- 实际执行操作 ---
             try:
-                # 安全性检查：如果新文件名已存在，则跳过
-                if new_path.exists():
-                    print(f"  -> 警告: 目标文件名 '{new_path.name}' 已存在，跳过此文件。")
-                    skipped_count += 1
-                    continue
-
                 # <--- 修改5：核心操作从 rename 改为 copy2 ---
                 # copy2 会同时复制文件内容和元数据（如修改时间）
-                shutil.copy2(old_path, new_path)
+                throttle.copy(old_path, new_path)
+                if row is not None:
+                    mapping.record(row)
+                metrics.files()
+                metrics.bytes_written(new_path.stat().st_size)
                 print(f"  -> 成功: 已复制并重命名 '{old_path.name}' -> '{new_path.name}'")
                 processed_count += 1
 
             except Exception as e:
+                metrics.error()
                 print(f"  -> 错误: 处理文件 '{old_path.name}' 时发生未知错误: {e}")
                 skipped_count += 1
 
         print("\n" + "=" * 60)
         print("处理完成！")
         if dry_run:
-            print(f"演练总结：总共有 {processed_count} 个文件将被复制并重命名。")
+            print(f"演练总结：总共有 {processed_count} 个文件将被复制并重命名，{unchanged} 个已复制过的文件不变。")
         else:
-            print(f"成功处理: {processed_count} 个文件")
+            print(f"成功处理: {processed_count} 个文件，{unchanged} 个已复制过的文件不变")
             if skipped_count > 0:
                 print(f"跳过或失败: {skipped_count} 个文件")
         print("=" * 60)
 
+        summary = {"processed": processed_count, "skipped": skipped_count, "unchanged": unchanged,
+                   "adopted": adopted,
+                   "next_number": max(counter, mapping.max_number + 1),
+                   "mapping": str(mapping.path)}
+        if dry_run:
+            plan = create_plan("batch_rename_files",
+                               {"source_dir": source_dir, "destination_dir": destination_dir,
+                                "start_counter": start_counter},
+                               operations)
+            print(f"执行计划已保存: {plan['plan_id']}")
+            summary["plan"] = summarize_plan(plan)
+        return summary
+
     except Exception as e:
         print(f"在处理过程中发生严重错误: {e}")
+    finally:
+        mapping.close()
+
+
+def lookup_rename_mapping(destination_dir: pathlib.Path,
+                          source: Optional[str] = None,
+                          name: Optional[str] = None,
+                          cursor: int = 0,
+                          limit: int = 1000) -> Dict:
+    """
+    查询 batch_rename_files 在目标文件夹中记录的映射。
+    source（源文件相对路径）与 name（目标文件名）用于筛选，都不给时按写入顺序分页列出全部记录；
+    同一个源文件内容变化过时会有多条记录，最后一条是最新的。
+    cursor 是映射文件中的字节偏移，返回的 next_cursor 为 None 表示已到末尾；不在行首或超出文件长度的游标
+    抛出 ValueError。
+    """
+    path = mapping_path(destination_dir)
+    if not path.is_file():
+        raise FileNotFoundError(f"目标文件夹 '{destination_dir}' 中没有重命名映射。")
+    rows = []
+    next_cursor = cursor
+    for line in read_lines(path, cursor):
+        if not line.endswith(b"\n") or len(rows) >= limit:
+            break
+        next_cursor += len(line)
+        row = loads(line)
+        if (source is None or row["source"] == source) and (name is None or row["name"] == name):
+            rows.append(row)
+    if next_cursor >= path.stat().st_size:
+        next_cursor = None
+    return {"rows": rows, "next_cursor": next_cursor}
 
 
 # <--- 修改6：将main函数参数化，以便主脚本调用 ---
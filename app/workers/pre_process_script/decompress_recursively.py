@@ -1,12 +1,26 @@
 # decompress_recursively.py
 
+import bz2
+import lzma
+import os
 import pathlib
 import shutil
+import struct
 import sys
+import tarfile
 import time
+import uuid
+import zipfile
+import zlib
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
 import patoolib
 from patoolib.util import PatoolError
 
+from app.core import throttle
+from app.core.metrics import worker_metrics
+from app.workers.pre_process_script.archive_cache import ArchiveCache, get_archive_cache
+
 # 支持的压缩文件扩展名集合
 ARCHIVE_EXTENSIONS = {
     ".zip", ".rar", ".7z", ".tar", ".gz", ".bz2", ".iso", ".jar", ".cbz",
@@ -15,8 +29,98 @@ ARCHIVE_EXTENSIONS = {
 }
 
 
+def _patool_extract(archive: pathlib.Path, outdir: pathlib.Path):
+    patoolib.extract_archive(str(archive), outdir=str(outdir), verbosity=-1)
+
+
+def _extract(archive: pathlib.Path, outdir: pathlib.Path, cache: Optional[ArchiveCache]):
+    """有缓存时先按内容哈希查找，同一个压缩包只真正解压一次。"""
+    if cache is None:
+        _patool_extract(archive, outdir)
+    elif cache.extract(archive, outdir, _patool_extract):
+        print(f"  [缓存命中] {archive.name}")
+
+
+def _wanted(name: str, keep_extensions: Optional[Set[str]]) -> bool:
+    """扩展名过滤：压缩包总是保留，留待之后解压嵌套包。"""
+    suffix = pathlib.PurePosixPath(name).suffix.lower()
+    return keep_extensions is None or suffix in keep_extensions or suffix in ARCHIVE_EXTENSIONS
+
+
+def _extract_staged(archive: pathlib.Path, outdir: pathlib.Path, cache: Optional[ArchiveCache],
+                    keep_extensions: Optional[Set[str]]) -> Tuple[List[pathlib.Path], int]:
+    """先解压到临时文件夹，只把需要的文件移到 outdir，返回 (移入的文件路径, 过滤掉的文件数)。"""
+    staging = outdir / f".{archive.name}.extracting"
+    staging.mkdir(parents=True, exist_ok=True)
+    moved: List[pathlib.Path] = []
+    skipped = 0
+    try:
+        _extract(archive, staging, cache)
+        for item in staging.rglob('*'):
+            if not item.is_file():
+                continue
+            if not _wanted(item.name, keep_extensions):
+                skipped += 1
+                continue
+            target = outdir / item.relative_to(staging)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            # patool 解压时无法限速，按解出的字节数事后记账，后续的解压与复制因此放慢
+            throttle.consume_ops()
+            throttle.consume_bytes(item.stat().st_size)
+            os.replace(item, target)
+            moved.append(target)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return moved, skipped
+
+
+def _archives_in(paths: Iterable[pathlib.Path]) -> List[pathlib.Path]:
+    return [p for p in paths if p.suffix.lower() in ARCHIVE_EXTENSIONS]
+
+
+def _extract_nested_archives(archives: Iterable[pathlib.Path], cache: Optional[ArchiveCache], metrics,
+                             keep_extensions: Optional[Set[str]] = None) -> int:
+    """
+    就地解压本次产出的嵌套压缩包，解压后删除压缩包本身，返回处理的压缩包数。
+    只处理 archives 以及从它们里面解出的压缩包，输出文件夹里原有的压缩包不受影响。
+    """
+    pending = list(archives)
+    processed = 0
+    while pending:
+        archive = pending.pop()
+        processed += 1
+        try:
+            print(f"  [正在解压嵌套包] {archive.name}")
+            metrics.bytes_read(archive.stat().st_size)
+            with metrics.stage("extract_nested"):
+                moved, _ = _extract_staged(archive, archive.parent, cache, keep_extensions)
+            # 解出的文件可能与压缩包同名并已替换了它，这时不能再删
+            pending.extend(p for p in _archives_in(moved) if p != archive)
+            if archive in moved:
+                continue
+
+            retries = 5
+            delay = 0.2
+            for i in range(retries):
+                try:
+                    archive.unlink()
+                    break
+                except PermissionError:
+                    if i < retries - 1:
+                        time.sleep(delay)
+                    else:
+                        print(f"  [删除失败] 无法删除文件 '{archive.name}'。将保留该文件并继续。", file=sys.stderr)
+
+        except PatoolError as e:
+            metrics.error()
+            print(f"  [嵌套解压失败] {archive.name}: {e}", file=sys.stderr)
+    return processed
+
+
 def decompress_recursively(source_folder: pathlib.Path,
-                           output_folder: pathlib.Path):
+                           output_folder: pathlib.Path,
+                           cache_dir: Optional[pathlib.Path] = None,
+                           cache_max_bytes: int = 20 * 1024 ** 3):
     """
     将源文件夹的所有内容（包括压缩包内的文件）提取到指定的输出文件夹。
     此操作是非破坏性的，不会修改源文件夹。
@@ -24,17 +128,23 @@ def decompress_recursively(source_folder: pathlib.Path,
     Args:
         source_folder (pathlib.Path): 要处理的源文件夹路径。
         output_folder (pathlib.Path): 所有文件将被提取到的目标文件夹路径。
+        cache_dir (pathlib.Path, optional): 解压缓存目录。提供后，内容相同的压缩包直接从缓存复制出成员文件。
+        cache_max_bytes (int): 解压缓存的总大小上限，超出后按最近使用时间淘汰。
     """
     if not source_folder.is_dir():
-        print(f"错误: 源文件夹 '{source_folder}' 不存在或不是一个文件夹。", file=sys.stderr)
-        return
+        raise NotADirectoryError(f"源文件夹 '{source_folder}' 不存在或不是一个有效的目录。")
 
     # 确保输出文件夹存在
     output_folder.mkdir(parents=True, exist_ok=True)
+    cache = get_archive_cache(cache_dir, max_bytes=cache_max_bytes) if cache_dir is not None else None
+    metrics = worker_metrics("decompress_recursively")
     print(f"处理: {source_folder.name}  ->  {output_folder.name}")
 
     # --- 阶段 1: 遍历源文件夹，复制/解压到输出文件夹 ---
-    for item in source_folder.rglob("*"):
+    produced: List[pathlib.Path] = []
+    with metrics.stage("scan"):
+        items = list(source_folder.rglob("*"))
+    for item in items:
         relative_path = item.relative_to(source_folder)
         dest_path = output_folder / relative_path
 
@@ -42,55 +152,416 @@ def decompress_recursively(source_folder: pathlib.Path,
             dest_path.mkdir(exist_ok=True)
             continue
 
+        metrics.files()
+        metrics.bytes_read(item.stat().st_size)
         if item.suffix.lower() in ARCHIVE_EXTENSIONS:
             try:
                 print(f"  [正在解压] {item.name}")
-                patoolib.extract_archive(str(item), outdir=str(dest_path.parent), verbosity=-1)
+                with metrics.stage("extract"):
+                    moved, _ = _extract_staged(item, dest_path.parent, cache, None)
+                produced.extend(_archives_in(moved))
             except PatoolError as e:
+                metrics.error()
                 print(f"  [解压失败] {item.name}: {e}", file=sys.stderr)
         else:
-            shutil.copy2(item, dest_path)
+            with metrics.stage("copy"):
+                throttle.copy(item, dest_path)
+            metrics.bytes_written(item.stat().st_size)
+
+    # --- 阶段 2: 递归处理本次解压出来的嵌套压缩包，输出文件夹里原有的压缩包不动 ---
+    with metrics.stage("nested"):
+        _extract_nested_archives(produced, cache, metrics)
+
+    if cache is not None:
+        print(f"  [缓存统计] {cache.stats()}")
+
+
+# ==================== 流式上传：边接收边解压 ====================
+
+STREAM_CHUNK = 1024 * 1024
+_ZIP_LOCAL, _ZIP_END, _ZIP_DESCRIPTOR = b"PK\x03\x04", b"PK\x05\x06", b"PK\x07\x08"
+# tar 可以带的压缩格式：魔数 -> 用于探测内容是否为 tar 的解压器
+_COMPRESSED_MAGICS = {
+    b"\x1f\x8b": lambda: zlib.decompressobj(16 + zlib.MAX_WBITS),
+    b"BZh": bz2.BZ2Decompressor,
+    b"\xfd7zXZ\x00": lzma.LZMADecompressor,
+}
+
+
+class _StreamReader:
+    """给上传流加上“读满 n 字节”、回退（unread）和已读字节计数，zip 本地头解析需要这些能力。"""
+
+    def __init__(self, raw: BinaryIO):
+        self.raw = raw
+        self.position = 0
+        self._buffer = b""
+
+    def read(self, n: int = -1) -> bytes:
+        data = bytearray(self._buffer)
+        self._buffer = b""
+        while n < 0 or len(data) < n:
+            chunk = self.raw.read(STREAM_CHUNK if n < 0 else n - len(data))
+            if not chunk:
+                break
+            data += chunk
+        if 0 <= n < len(data):
+            self._buffer = bytes(data[n:])
+            del data[n:]
+        self.position += len(data)
+        return bytes(data)
+
+    def read_some(self, n: int = STREAM_CHUNK) -> bytes:
+        """有多少读多少（至少 1 字节，EOF 时为空），不等凑满 n 字节，数据到达后立即可以处理。"""
+        if self._buffer:
+            data, self._buffer = self._buffer[:n], self._buffer[n:]
+        else:
+            data = self.raw.read(n)
+        self.position += len(data)
+        return data
+
+    def unread(self, data: bytes):
+        self._buffer = data + self._buffer
+        self.position -= len(data)
+
+    def peek(self, n: int) -> bytes:
+        data = self.read(n)
+        self.unread(data)
+        return data
+
+
+def _detect_stream_format(reader: _StreamReader) -> str:
+    """按魔数判断上传的格式：zip、tar（可带 gz/bz2/xz 压缩），其余格式需要随机访问，落盘后交给 patool。"""
+    head = reader.peek(512)
+    if head.startswith((_ZIP_LOCAL, _ZIP_END)):
+        return "zip"
+    if head[257:262] == b"ustar":
+        return "tar"
+    for magic, decompressor in _COMPRESSED_MAGICS.items():
+        if head.startswith(magic):
+            try:
+                plain = decompressor().decompress(reader.peek(STREAM_CHUNK), 512)
+            except (OSError, EOFError, ValueError, zlib.error, lzma.LZMAError):
+                return "spill"
+            return "tar" if plain[257:262] == b"ustar" else "spill"
+    return "spill"
+
+
+def _safe_target(output_folder: pathlib.Path, name: str) -> Optional[pathlib.Path]:
+    """成员名不能是绝对路径、带盘符或用 .. 跳出输出文件夹。"""
+    relative = pathlib.PurePosixPath(name.replace("\\", "/"))
+    if relative.is_absolute() or not relative.parts or ".." in relative.parts or ":" in relative.parts[0]:
+        return None
+    return output_folder.joinpath(*relative.parts)
+
+
+def _store_member(name: str, chunks: Iterator[bytes], output_folder: pathlib.Path,
+                  keep_extensions: Optional[Set[str]], mtime: Optional[float], metrics, stats: Dict) -> int:
+    """把一个成员的数据写到输出文件夹（被过滤掉的只读过不写），返回数据的 CRC32。"""
+    crc = 0
+    target = _safe_target(output_folder, name)
+    if target is None or not _wanted(name, keep_extensions):
+        if target is None:
+            metrics.error()
+            print(f"  [跳过] 不安全的成员路径: {name}", file=sys.stderr)
+        stats["skipped"] += 1
+        for chunk in chunks:
+            crc = zlib.crc32(chunk, crc)
+        return crc
 
-    # --- 阶段 2: 在输出文件夹内部，递归处理所有被解压出来的嵌套压缩包 ---
+    size = 0
+    target.parent.mkdir(parents=True, exist_ok=True)
+    throttle.consume_ops()
+    with open(target, "wb") as f:
+        for chunk in chunks:
+            crc = zlib.crc32(chunk, crc)
+            throttle.consume_bytes(len(chunk))
+            f.write(chunk)
+            size += len(chunk)
+    if mtime is not None:
+        os.utime(target, (mtime, mtime))
+    metrics.files()
+    metrics.bytes_written(size)
+    if target.suffix.lower() in ARCHIVE_EXTENSIONS:
+        stats["archives"].append(target)
+    stats["extracted"] += 1
+    stats["bytes_written"] += size
+    return crc
 
-    # ==================== 修改1：增加一个集合来“记忆”已处理过的文件 ====================
-    processed_archives = set()
-    # =================================================================================
 
+def _copy_chunks(reader: _StreamReader, size: int) -> Iterator[bytes]:
+    while size:
+        chunk = reader.read_some(min(STREAM_CHUNK, size))
+        if not chunk:
+            raise EOFError("压缩包数据不完整。")
+        size -= len(chunk)
+        yield chunk
+
+
+def _inflate_chunks(reader: _StreamReader, compressed_size: Optional[int]) -> Iterator[bytes]:
+    """解压一个 deflate 成员。长度未知（数据描述符）时靠 deflate 流自身的结束标记定界，多读的部分退回。"""
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    remaining = compressed_size
+    while not decompressor.eof:
+        chunk = reader.read_some(STREAM_CHUNK if remaining is None else min(STREAM_CHUNK, remaining))
+        if not chunk:
+            raise EOFError("压缩包数据不完整。")
+        if remaining is not None:
+            remaining -= len(chunk)
+        # 限制单次输出大小，防止高压缩比的数据一次性占满内存
+        data = decompressor.decompress(chunk, STREAM_CHUNK)
+        while data:
+            yield data
+            data = decompressor.decompress(decompressor.unconsumed_tail, STREAM_CHUNK)
+    if decompressor.unused_data:
+        reader.unread(decompressor.unused_data)
+    if remaining:
+        reader.read(remaining)
+
+
+def _stored_chunks_until_descriptor(reader: _StreamReader, zip64: bool) -> Iterator[bytes]:
+    """
+    store 成员的大小写在数据之后的描述符里（如 /download/zip 的输出）：逐块查找描述符签名，
+    只有紧跟的 CRC 和长度都与已读数据吻合时才视为结尾，描述符本身退回给调用方读取。
+    """
+    length, layout = (24, "<IQQ") if zip64 else (16, "<III")
+    crc = size = 0
+    pending = b""
+    while True:
+        chunk = reader.read_some()
+        if not chunk:
+            raise EOFError("压缩包数据不完整。")
+        pending += chunk
+        index = pending.find(_ZIP_DESCRIPTOR)
+        while index >= 0 and len(pending) - index >= length:
+            expected_crc, compressed_size, plain_size = struct.unpack_from(layout, pending, index + 4)
+            if plain_size == compressed_size == size + index and zlib.crc32(pending[:index], crc) == expected_crc:
+                if index:
+                    yield pending[:index]
+                reader.unread(pending[index:])
+                return
+            index = pending.find(_ZIP_DESCRIPTOR, index + 1)
+        # 末尾可能是一个还没读全的描述符，留到下一轮
+        keep = len(pending) - index if index >= 0 else min(len(pending), length - 1)
+        emit, pending = pending[:len(pending) - keep], pending[len(pending) - keep:]
+        if emit:
+            crc = zlib.crc32(emit, crc)
+            size += len(emit)
+            yield emit
+
+
+def _dos_mtime(mod_date: int, mod_time: int) -> Optional[float]:
+    try:
+        return time.mktime(((mod_date >> 9) + 1980, (mod_date >> 5) & 0xF, mod_date & 0x1F,
+                            mod_time >> 11, (mod_time >> 5) & 0x3F, (mod_time & 0x1F) * 2, 0, 0, -1))
+    except (ValueError, OverflowError):
+        return None
+
+
+def _stream_zip(reader: _StreamReader, output_folder: pathlib.Path, keep_extensions: Optional[Set[str]],
+                metrics, stats: Dict) -> Optional[int]:
+    """
+    按本地文件头顺序解压 zip，不需要位于末尾的中央目录。
+    遇到加密或不支持的压缩方式（只支持 store 和 deflate）的成员时，
+    返回该成员本地头在流中的偏移，剩余部分由调用方落盘后再处理。
+    """
     while True:
-        # ==================== 修改2：查找压缩包时，跳过已处理过的 ======================
-        nested_archives = [
-            p for p in output_folder.rglob('*')
-            if p.suffix.lower() in ARCHIVE_EXTENSIONS and p not in processed_archives
-        ]
-        # =================================================================================
+        header_offset = reader.position
+        signature = reader.read(4)
+        if signature != _ZIP_LOCAL:
+            # 中央目录和结尾记录，读完丢弃
+            while reader.read_some():
+                pass
+            return None
+        fields = reader.read(26)
+        if len(fields) < 26:
+            raise EOFError("压缩包数据不完整。")
+        _, flags, method, mod_time, mod_date, crc, compressed_size, size, name_length, extra_length = \
+            struct.unpack("<HHHHHIIIHH", fields)
+        raw_name = reader.read(name_length)
+        extra = reader.read(extra_length)
+
+        zip64 = False
+        position = 0
+        while position + 4 <= len(extra):
+            tag, length = struct.unpack_from("<HH", extra, position)
+            if tag == 0x0001:
+                zip64 = True
+                values = list(struct.unpack_from(f"<{length // 8}Q", extra, position + 4))
+                if size == 0xFFFFFFFF and values:
+                    size = values.pop(0)
+                if compressed_size == 0xFFFFFFFF and values:
+                    compressed_size = values.pop(0)
+            position += 4 + length
+
+        has_descriptor = bool(flags & 0x08)
+        if flags & 0x01 or method not in (0, 8):
+            reader.unread(signature + fields + raw_name + extra)
+            return header_offset
+
+        name = raw_name.decode("utf-8" if flags & 0x800 else "cp437")
+        if method == 8:
+            chunks = _inflate_chunks(reader, None if has_descriptor else compressed_size)
+        elif has_descriptor:
+            chunks = _stored_chunks_until_descriptor(reader, zip64)
+        else:
+            chunks = _copy_chunks(reader, compressed_size)
+        if name.endswith("/"):
+            actual_crc = 0
+            for chunk in chunks:
+                actual_crc = zlib.crc32(chunk, actual_crc)
+            target = _safe_target(output_folder, name)
+            if target is not None:
+                target.mkdir(parents=True, exist_ok=True)
+        else:
+            actual_crc = _store_member(name, chunks, output_folder, keep_extensions,
+                                       _dos_mtime(mod_date, mod_time), metrics, stats)
+        # 文件夹条目同样可能带数据描述符（流式写出的 zip），不读掉的话下一轮会把它当成中央目录
+        if has_descriptor:
+            head = reader.read(4)
+            crc = struct.unpack("<I", reader.read(4) if head == _ZIP_DESCRIPTOR else head)[0]
+            reader.read(16 if zip64 else 8)
+        if actual_crc != crc:
+            metrics.error()
+            print(f"  [校验失败] {name} 的 CRC 不匹配。", file=sys.stderr)
 
-        if not nested_archives:
-            break
 
-        for archive in nested_archives:
-            # ==================== 修改3：无论后续成功与否，立刻“记住”它 ==================
-            processed_archives.add(archive)
-            # =================================================================================
+def _stream_tar(reader: _StreamReader, output_folder: pathlib.Path, keep_extensions: Optional[Set[str]],
+                metrics, stats: Dict):
+    """tarfile 的流模式（r|*）顺序读取成员，压缩层由 tarfile 自动识别；只解出普通文件和文件夹。"""
+    with tarfile.open(fileobj=reader, mode="r|*") as archive:
+        for member in archive:
+            if member.isdir():
+                target = _safe_target(output_folder, member.name)
+                if target is not None:
+                    target.mkdir(parents=True, exist_ok=True)
+            elif member.isfile():
+                source = archive.extractfile(member)
+                _store_member(member.name, iter(lambda: source.read(STREAM_CHUNK), b""), output_folder,
+                              keep_extensions, member.mtime, metrics, stats)
+            else:
+                stats["skipped"] += 1
 
+
+def _spill(reader: _StreamReader, path: pathlib.Path, offset: int = 0) -> int:
+    """
+    把剩余的上传数据写到磁盘。offset > 0 时在文件开头留出空洞（稀疏文件，不占磁盘读写），
+    使 zip 成员的偏移与原始压缩包一致，zipfile 可以直接读取后半部分。
+    """
+    written = 0
+    with open(path, "wb") as f:
+        f.seek(offset)
+        while chunk := reader.read_some():
+            f.write(chunk)
+            written += len(chunk)
+    return written
+
+
+def _extract_spilled_zip(path: pathlib.Path, start: int, output_folder: pathlib.Path,
+                         keep_extensions: Optional[Set[str]], metrics, stats: Dict):
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            # 偏移在 start 之前的成员已在流式阶段解压
+            if info.header_offset < start:
+                continue
+            if info.is_dir():
+                target = _safe_target(output_folder, info.filename)
+                if target is not None:
+                    target.mkdir(parents=True, exist_ok=True)
+                continue
             try:
-                print(f"  [正在解压嵌套包] {archive.name}")
-                patoolib.extract_archive(str(archive), outdir=str(archive.parent), verbosity=-1)
-
-                retries = 5
-                delay = 0.2
-                for i in range(retries):
-                    try:
-                        archive.unlink()
-                        break
-                    except PermissionError:
-                        if i < retries - 1:
-                            time.sleep(delay)
-                        else:
-                            print(f"  [删除失败] 无法删除文件 '{archive.name}'。将保留该文件并继续。", file=sys.stderr)
+                with archive.open(info) as source:
+                    _store_member(info.filename, iter(lambda: source.read(STREAM_CHUNK), b""), output_folder,
+                                  keep_extensions, time.mktime(info.date_time + (0, 0, -1)), metrics, stats)
+            except (RuntimeError, NotImplementedError, zipfile.BadZipFile) as e:
+                metrics.error()
+                print(f"  [解压失败] {info.filename}: {e}", file=sys.stderr)
 
-            except PatoolError as e:
-                print(f"  [嵌套解压失败] {archive.name}: {e}", file=sys.stderr)
+
+# 落盘文件名只取这些后缀，其余部分一律不用客户端提供的内容
+_COMPOUND_SUFFIXES = (".tar.gz", ".tar.bz2", ".tar.xz")
+
+
+def upload_spill_name(filename: str) -> str:
+    """
+    由上传的文件名得到落盘用的文件名 upload<后缀>：patool 靠后缀识别格式，路径部分全部丢弃。
+    文件名是 "." 或 ".." 时抛出 ValueError。
+    """
+    name = filename.replace("\\", "/").rsplit("/", 1)[-1].strip()
+    if name in (".", ".."):
+        raise ValueError(f"无效的上传文件名: '{filename}'")
+    lowered = name.lower()
+    for suffix in _COMPOUND_SUFFIXES:
+        if lowered.endswith(suffix):
+            return f"upload{suffix}"
+    suffix = pathlib.PurePosixPath(lowered).suffix
+    return f"upload{suffix}" if suffix in ARCHIVE_EXTENSIONS else "upload"
+
+
+def decompress_stream(stream: BinaryIO,
+                      output_folder: pathlib.Path,
+                      filename: str = "",
+                      keep_extensions: Optional[Set[str]] = None,
+                      cache_dir: Optional[pathlib.Path] = None,
+                      cache_max_bytes: int = 20 * 1024 ** 3) -> Dict:
+    """
+    边接收边解压一个上传的压缩包流，上传结束前就开始产出文件，压缩包本身不落盘。
+    zip 按本地文件头顺序解压，tar（含 .tar.gz/.tar.bz2/.tar.xz）用 tarfile 流模式解压；
+    只有需要随机访问的情况（rar/7z 等格式、zip 中加密或压缩方式不支持的成员）才把剩余数据落盘。
+    完成后与 decompress_recursively 一样就地解压嵌套的压缩包。
+
+    Args:
+        stream: 提供 read(n) 的上传数据流。
+        output_folder: 解压目标文件夹。
+        filename: 上传的文件名，只用于日志和落盘时让 patool 按后缀识别格式；"." 和 ".." 会被拒绝。
+        keep_extensions: 只保留这些扩展名（小写，如 {'.jpg', '.pdf'}）的文件，在解压时即时过滤；压缩包总是保留。
+        cache_dir: 解压缓存目录，用于落盘的压缩包和嵌套压缩包。
+        cache_max_bytes: 解压缓存的总大小上限。
+
+    Returns:
+        Dict: 识别出的格式、解出/跳过的文件数、读取与写入的字节数、是否落盘、处理的嵌套压缩包数。
+    """
+    spill_name = upload_spill_name(filename)
+    output_folder.mkdir(parents=True, exist_ok=True)
+    cache = get_archive_cache(cache_dir, max_bytes=cache_max_bytes) if cache_dir is not None else None
+    metrics = worker_metrics("decompress_stream")
+    reader = _StreamReader(stream)
+    stats = {"format": _detect_stream_format(reader), "extracted": 0, "skipped": 0,
+             "bytes_read": 0, "bytes_written": 0, "spilled_bytes": 0, "nested": 0, "archives": []}
+    print(f"处理上传: {filename or '<stream>'} ({stats['format']})  ->  {output_folder.name}")
+
+    # 落盘时只沿用上传文件名的后缀，patool 据此识别格式
+    spill_dir = output_folder / f".upload-{uuid.uuid4().hex}"
+    spill_path = spill_dir / spill_name
+    try:
+        with metrics.stage("stream_extract"):
+            if stats["format"] == "tar":
+                _stream_tar(reader, output_folder, keep_extensions, metrics, stats)
+            elif stats["format"] == "zip":
+                start = _stream_zip(reader, output_folder, keep_extensions, metrics, stats)
+                if start is not None:
+                    print(f"  [落盘] 偏移 {start} 之后的成员需要随机访问")
+                    spill_dir.mkdir()
+                    stats["spilled_bytes"] = _spill(reader, spill_path, start)
+                    _extract_spilled_zip(spill_path, start, output_folder, keep_extensions, metrics, stats)
+            else:
+                spill_dir.mkdir()
+                stats["spilled_bytes"] = _spill(reader, spill_path)
+                moved, skipped = _extract_staged(spill_path, output_folder, cache, keep_extensions)
+                stats["archives"].extend(_archives_in(moved))
+                stats["extracted"] += len(moved)
+                stats["skipped"] += skipped
+    except (EOFError, tarfile.TarError, zipfile.BadZipFile, zlib.error, struct.error, PatoolError) as e:
+        metrics.error()
+        raise ValueError(f"压缩包数据损坏或不完整: {e}") from e
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    stats["bytes_read"] = reader.position
+    metrics.bytes_read(reader.position)
+    # 只解压本次上传产出的嵌套压缩包，目标文件夹里原有的压缩包不动
+    stats["nested"] = _extract_nested_archives(stats.pop("archives"), cache, metrics, keep_extensions)
+    print(f"  解出 {stats['extracted']} 个文件，跳过 {stats['skipped']} 个，落盘 {stats['spilled_bytes']} 字节。")
+    return stats
 
 
 def main(source_folder: pathlib.Path, output_folder: pathlib.Path):
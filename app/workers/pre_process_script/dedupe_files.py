@@ -0,0 +1,318 @@
+# dedupe_files.py
+
+import contextvars
+import hashlib
+import json
+import os
+import pathlib
+import re
+import sys
+import tempfile
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from app.core import throttle
+from app.core.metrics import worker_metrics
+from app.core.plans import PlanWriter, planned_operation, summarize_plan
+from app.core.reports import ReportWriter
+from app.core.sharding import Shard
+
+# 哈希缓存放在独立的缓存目录里，按扫描根目录区分，不往被去重的文件夹里写任何文件
+CACHE_DIR_ENV_VAR = "DEDUPE_CACHE_DIR"
+# 旧版本写在源文件夹里的缓存文件，扫描时忽略
+CACHE_PREFIX = ".dedupe_hash_cache"
+PARTIAL_BLOCK = 64 * 1024
+READ_BUFFER = 1024 * 1024
+# move_unwanted_files / 挑出长图 / batch_rename_files 等在重名时追加的后缀: name(1)、name (1)、name_1
+COPY_SUFFIX = re.compile(r"(\s?\(\d+\)|_\d+)$")
+
+
+def cache_dir() -> pathlib.Path:
+    path = pathlib.Path(os.environ.get(CACHE_DIR_ENV_VAR)
+                        or pathlib.Path(tempfile.gettempdir()) / "workflow_dedupe_cache")
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def cache_path(root_dir: pathlib.Path, shard: Optional[Shard] = None) -> pathlib.Path:
+    """root_dir 的哈希缓存文件；集群模式下每个分片各用一个，避免多个节点同时改写同一个文件。"""
+    key = hashlib.blake2b(str(root_dir.resolve()).encode("utf-8"), digest_size=16).hexdigest()
+    return cache_dir() / (f"{key}.json" if shard is None else f"{key}.{shard.index}-{shard.count}.json")
+
+
+def scan_files(root_dir: pathlib.Path) -> Iterator[Tuple[str, int, int]]:
+    """用 os.scandir 递归遍历，直接复用目录项里的 stat 信息，返回 (路径, 字节数, mtime_ns)。"""
+    stack = [str(root_dir)]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False) and not entry.name.startswith(CACHE_PREFIX):
+                        stat = entry.stat(follow_symlinks=False)
+                        yield entry.path, stat.st_size, stat.st_mtime_ns
+        except OSError as e:
+            print(f"  [警告] 无法读取文件夹 '{current}': {e}", file=sys.stderr)
+
+
+def partial_hash(path: str, size: int) -> str:
+    """只读取头尾各 PARTIAL_BLOCK 字节；文件不超过两块时等同于全量哈希。"""
+    digest = hashlib.blake2b(digest_size=16)
+    throttle.consume_ops()
+    throttle.consume_bytes(min(size, 2 * PARTIAL_BLOCK))
+    with open(path, "rb", buffering=0) as f:
+        digest.update(f.read(PARTIAL_BLOCK))
+        if size > 2 * PARTIAL_BLOCK:
+            f.seek(-PARTIAL_BLOCK, os.SEEK_END)
+        digest.update(f.read(PARTIAL_BLOCK))
+    return digest.hexdigest()
+
+
+def full_hash(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=32)
+    buffer = bytearray(READ_BUFFER)
+    view = memoryview(buffer)
+    throttle.consume_ops()
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            throttle.consume_bytes(n)
+            digest.update(view[:n])
+    return digest.hexdigest()
+
+
+class _HashCache:
+    """哈希缓存：以相对路径为键，只有字节数与 mtime 都未变化时才复用。"""
+
+    def __init__(self, root_dir: pathlib.Path, enabled: bool, path: pathlib.Path):
+        self.root_dir = root_dir
+        self.path = path
+        self.enabled = enabled
+        self.entries: Dict[str, list] = {}
+        self.dirty = False
+        if enabled and self.path.is_file():
+            try:
+                self.entries = json.loads(self.path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                self.entries = {}
+
+    def _key(self, path: str) -> str:
+        return os.path.relpath(path, self.root_dir)
+
+    def get(self, path: str, size: int, mtime_ns: int, kind: int) -> Optional[str]:
+        entry = self.entries.get(self._key(path))
+        if entry and entry[0] == size and entry[1] == mtime_ns:
+            return entry[kind]
+        return None
+
+    def put(self, path: str, size: int, mtime_ns: int, kind: int, value: str):
+        key = self._key(path)
+        entry = self.entries.get(key)
+        if not entry or entry[0] != size or entry[1] != mtime_ns:
+            entry = [size, mtime_ns, None, None]
+            self.entries[key] = entry
+        entry[kind] = value
+        self.dirty = True
+
+    def retain(self, paths: List[str]):
+        """丢弃已不存在文件的缓存条目，避免缓存无限增长。"""
+        keep = {self._key(path) for path in paths}
+        if len(keep) != len(self.entries):
+            self.entries = {k: v for k, v in self.entries.items() if k in keep}
+            self.dirty = True
+
+    def save(self):
+        if self.enabled and self.dirty:
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(self.entries, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self.path)
+
+
+_PARTIAL, _FULL = 2, 3
+
+
+def _hash_group(files: List[Tuple[str, int, int]], kind: int, cache: _HashCache,
+                pool: ThreadPoolExecutor) -> Dict[str, List[Tuple[str, int, int]]]:
+    """对一组候选文件计算（或从缓存取出）哈希，按哈希值重新分组。"""
+    results: Dict[Tuple[str, int, int], str] = {}
+    # 在提交时的上下文中计算，请求级限速（app.core.throttle.current_throttle）对哈希线程同样生效
+    pending = []
+    for item in files:
+        cached = cache.get(*item, kind)
+        if cached is not None:
+            results[item] = cached
+        elif kind == _PARTIAL:
+            pending.append((item, pool.submit(contextvars.copy_context().run, partial_hash, item[0], item[1])))
+        else:
+            pending.append((item, pool.submit(contextvars.copy_context().run, full_hash, item[0])))
+
+    metrics = worker_metrics("dedupe_files")
+    for item, future in pending:
+        try:
+            value = future.result()
+        except OSError as e:
+            metrics.error()
+            print(f"  [警告] 读取 '{item[0]}' 失败: {e}", file=sys.stderr)
+            continue
+        metrics.bytes_read(min(item[1], 2 * PARTIAL_BLOCK) if kind == _PARTIAL else item[1])
+        cache.put(*item, kind, value)
+        results[item] = value
+
+    groups: Dict[str, List[Tuple[str, int, int]]] = defaultdict(list)
+    for item, value in results.items():
+        groups[value].append(item)
+    return groups
+
+
+def _keeper_sort_key(path: str) -> Tuple[int, int, str]:
+    """优先保留不带重名后缀、路径更短的文件。"""
+    stem = pathlib.Path(path).stem
+    return (1 if COPY_SUFFIX.search(stem) else 0, len(path), path)
+
+
+def find_duplicate_groups(root_dir: pathlib.Path,
+                          workers: int = 8,
+                          use_cache: bool = True,
+                          shard: Optional[Shard] = None) -> Iterator[Dict]:
+    """
+    按“字节数 -> 头尾部分哈希 -> 全量哈希”逐级筛选重复文件，逐组产出结果。
+    字节数唯一的文件一个字节都不会读取。
+    集群模式下按字节数分片：重复文件字节数一定相同，各分片的结果互不重叠，合并后与单机一致。
+    """
+    metrics = worker_metrics("dedupe_files")
+    by_size: Dict[int, List[Tuple[str, int, int]]] = defaultdict(list)
+    with metrics.stage("scan"):
+        for item in scan_files(root_dir):
+            by_size[item[1]].append(item)
+    if shard is not None:
+        by_size = {size: items for size, items in by_size.items() if shard.contains_key(str(size))}
+    metrics.files(sum(len(items) for items in by_size.values()))
+
+    cache = _HashCache(root_dir, use_cache, cache_path(root_dir, shard))
+    cache.retain([item[0] for items in by_size.values() for item in items])
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for size in sorted(by_size):
+                candidates = by_size[size]
+                if len(candidates) < 2:
+                    continue
+                with metrics.stage("partial_hash"):
+                    partial_groups = _hash_group(candidates, _PARTIAL, cache, pool)
+                for partial_group in partial_groups.values():
+                    if len(partial_group) < 2:
+                        continue
+                    # 不超过两块的文件，部分哈希已经覆盖全部内容
+                    if size <= 2 * PARTIAL_BLOCK:
+                        full_groups = {cache.get(*partial_group[0], _PARTIAL): partial_group}
+                    else:
+                        with metrics.stage("full_hash"):
+                            full_groups = _hash_group(partial_group, _FULL, cache, pool)
+                    for digest, group in full_groups.items():
+                        if len(group) < 2:
+                            continue
+                        paths = sorted((item[0] for item in group), key=_keeper_sort_key)
+                        yield {"hash": digest, "size": size, "keep": paths[0], "duplicates": paths[1:]}
+    finally:
+        cache.save()
+
+
+def _free_target(target_path: pathlib.Path, taken: Set[pathlib.Path]) -> pathlib.Path:
+    """与 move_unwanted_files 相同：目标已存在或已被本次占用时，在文件名后追加 (n)，不覆盖上一轮移走的副本。"""
+    candidate = target_path
+    counter = 1
+    while candidate.exists() or candidate in taken:
+        candidate = target_path.with_name(f"{target_path.stem}({counter}){target_path.suffix}")
+        counter += 1
+    taken.add(candidate)
+    return candidate
+
+
+def dedupe_files(source_dir: pathlib.Path,
+                 destination_dir: pathlib.Path,
+                 workers: int = 8,
+                 use_cache: bool = True,
+                 dry_run: bool = True,
+                 shard: Optional[Shard] = None) -> Dict:
+    """
+    Finds byte-identical files under source_dir and moves every copy except one
+    to destination_dir, keeping the relative folder structure.
+
+    Args:
+        source_dir: The directory to scan for duplicates.
+        destination_dir: The directory where duplicate copies will be moved.
+        workers: Number of hashing threads.
+        use_cache: Whether to reuse and update the hash cache kept under DEDUPE_CACHE_DIR.
+        dry_run: If True, only reports duplicate groups without moving any files,
+                 and saves the moves as an execution plan.
+        shard: In cluster mode, only the size groups that belong to this shard are checked.
+
+    Returns:
+        Totals plus the id of the NDJSON report holding one row per duplicate group;
+        in dry-run mode it also carries the saved plan.
+    """
+    if not source_dir.is_dir():
+        raise NotADirectoryError(f"源文件夹 '{source_dir}' 不存在或不是一个有效的目录。")
+
+    print(f"正在扫描文件夹: '{source_dir}'...")
+    duplicate_count = 0
+    moved = 0
+    wasted_bytes = 0
+    taken: Set[pathlib.Path] = set()
+    metrics = worker_metrics("dedupe_files")
+    # 重复组逐组写入报告、移动操作逐条写入计划，内存占用与重复文件数无关
+    with ReportWriter() as groups, \
+            (PlanWriter("dedupe_files", {"source_dir": source_dir, "destination_dir": destination_dir})
+             if dry_run else nullcontext()) as plan:
+        for group in find_duplicate_groups(source_dir, workers, use_cache, shard):
+            groups.write(group)
+            duplicate_count += len(group["duplicates"])
+            wasted_bytes += group["size"] * len(group["duplicates"])
+            for duplicate in group["duplicates"]:
+                relative = pathlib.Path(duplicate).relative_to(source_dir)
+                target_path = _free_target(destination_dir / relative, taken)
+                if dry_run:
+                    plan.add(planned_operation("move", pathlib.Path(duplicate), target_path))
+                    print(f"[演练] 将移动重复文件: '{relative}' -> '{target_path.relative_to(destination_dir)}' "
+                          f"(保留 '{pathlib.Path(group['keep']).name}')")
+                    continue
+                try:
+                    with metrics.stage("move"):
+                        target_path.parent.mkdir(parents=True, exist_ok=True)
+                        throttle.move(duplicate, target_path)
+                    moved += 1
+                except OSError as e:
+                    print(f"错误：移动文件 '{relative}' 时失败: {e}", file=sys.stderr)
+
+    print(f"扫描完成，共发现 {groups.rows} 组重复文件，{duplicate_count} 个多余副本，"
+          f"占用 {wasted_bytes / 1024 / 1024:.1f} MB。")
+    report = {"group_count": groups.rows, "duplicate_count": duplicate_count, "moved": moved,
+              "wasted_bytes": wasted_bytes, "report": groups.summary()}
+    if dry_run:
+        print(f"执行计划已保存: {plan.plan['plan_id']}")
+        report["plan"] = summarize_plan(plan.plan)
+    return report
+
+
+def main(source_folder: pathlib.Path,
+         destination_folder: pathlib.Path,
+         is_dry_run: bool):
+    """
+    主函数，用于配置和运行脚本。
+    """
+    dedupe_files(source_folder, destination_folder, dry_run=is_dry_run)
+
+
+if __name__ == "__main__":
+    # ########################### 参数配置区 ###########################
+    IS_DRY_RUN = True
+    source_folder = pathlib.Path(r"C:\path\to\1_afterunzip")
+    destination_folder = pathlib.Path(r"C:\path\to\duplicates")
+    # ##################################################################
+
+    main(source_folder, destination_folder, is_dry_run=IS_DRY_RUN)
@@ -0,0 +1,319 @@
+# folder_name_migration.py
+
+import json
+import os
+import pathlib
+import re
+import sys
+import time
+import uuid
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+# 与 FolderNameProcessor 相同的命名约定: part[0]_part[1]_part[2]_...
+PART_SEPARATOR = "_"
+JOURNAL_DIRNAME = ".rename_journals"
+
+
+def apply_part_operations(parts: List[str], operations: Sequence[Mapping]) -> List[str]:
+    """
+    在内存中依次执行 add/delete/modify/swap，索引规则与 FolderNameProcessor 的同名方法一致。
+    任何一步越界都会抛出 IndexError，而不是打印后继续。
+
+    Args:
+        parts: 按下划线拆分后的名称片段。
+        operations: 操作列表，例如 {"op": "add", "index": 1, "value": "x"}、
+                    {"op": "swap", "index": 0, "index2": 2}。
+    """
+    parts = list(parts)
+    for step, operation in enumerate(operations, start=1):
+        op = operation["op"]
+        index = operation["index"]
+        if op in ("add", "modify") and operation.get("value") is None:
+            raise ValueError(f"第 {step} 步 {op} 缺少 value")
+        if op == "swap" and operation.get("index2") is None:
+            raise ValueError(f"第 {step} 步 swap 缺少 index2")
+        if op == "add":
+            if not 0 <= index <= len(parts):
+                raise IndexError(f"第 {step} 步 add 的索引 {index} 超出范围")
+            parts.insert(index, operation["value"])
+        elif op == "delete":
+            if not 0 <= index < len(parts):
+                raise IndexError(f"第 {step} 步 delete 的索引 {index} 超出范围")
+            parts.pop(index)
+        elif op == "modify":
+            if not 0 <= index < len(parts):
+                raise IndexError(f"第 {step} 步 modify 的索引 {index} 超出范围")
+            parts[index] = operation["value"]
+        elif op == "swap":
+            index2 = operation["index2"]
+            if not (0 <= index < len(parts) and 0 <= index2 < len(parts)):
+                raise IndexError(f"第 {step} 步 swap 的索引 ({index}, {index2}) 超出范围")
+            parts[index], parts[index2] = parts[index2], parts[index]
+        else:
+            raise ValueError(f"第 {step} 步包含未知操作 '{op}'")
+    return parts
+
+
+def _collect_folders(root_dir: pathlib.Path, recursive: bool) -> List[pathlib.Path]:
+    """收集待处理的文件夹；递归模式下按深度倒序，保证先改子目录、后改父目录时路径依然有效。"""
+    if recursive:
+        folders = [p for p in root_dir.rglob('*') if p.is_dir() and JOURNAL_DIRNAME not in p.parts]
+        folders.sort(key=lambda p: (-len(p.parts), str(p)))
+    else:
+        folders = sorted(p for p in root_dir.iterdir() if p.is_dir() and p.name != JOURNAL_DIRNAME)
+    return folders
+
+
+def plan_folder_renames(root_dir: pathlib.Path,
+                        operations: Optional[Sequence[Mapping]] = None,
+                        pattern: Optional[str] = None,
+                        template: Optional[str] = None,
+                        recursive: bool = False) -> Dict:
+    """
+    只在内存中计算每个文件夹的新名称，并对整个批次做冲突检测，不触碰磁盘上的任何文件夹。
+
+    Args:
+        root_dir: 要处理的根文件夹，默认只处理其直接子文件夹。
+        operations: part 级操作列表，多步操作会先合并，每个文件夹最终只重命名一次。
+        pattern: 正则表达式（与 operations 二选一），需完整匹配文件夹名称，不匹配的文件夹跳过。
+        template: 与 pattern 搭配使用的替换模板，例如 r"\\1_\\3_\\2"。
+        recursive: 是否递归处理所有层级的子文件夹。
+
+    Returns:
+        包含 renames（old -> new）、conflicts、errors、unchanged、unmatched 的计划字典。
+    """
+    if (operations is None) == (pattern is None):
+        raise ValueError("operations 与 pattern/template 必须且只能提供一种。")
+    if pattern is not None and template is None:
+        raise ValueError("使用 pattern 时必须同时提供 template。")
+
+    try:
+        regex = re.compile(pattern) if pattern is not None else None
+    except re.error as e:
+        raise ValueError(f"pattern 不是有效的正则表达式: {e}") from e
+    renames: List[Tuple[pathlib.Path, pathlib.Path]] = []
+    errors: List[Dict] = []
+    unchanged = 0
+    unmatched = 0
+
+    for folder in _collect_folders(root_dir, recursive):
+        if regex is not None:
+            match = regex.fullmatch(folder.name)
+            if match is None:
+                unmatched += 1
+                continue
+            try:
+                new_name = match.expand(template)
+            except re.error as e:
+                # 模板对整批文件夹都一样，引用了不存在的分组等错误没有必要逐个报告
+                raise ValueError(f"template 无效: {e}") from e
+        else:
+            try:
+                new_name = PART_SEPARATOR.join(
+                    apply_part_operations(folder.name.split(PART_SEPARATOR), operations))
+            except (IndexError, ValueError, KeyError) as e:
+                errors.append({"folder": str(folder), "error": str(e)})
+                continue
+
+        if not new_name or new_name in {".", ".."} or "/" in new_name or os.sep in new_name:
+            errors.append({"folder": str(folder), "error": f"新名称 '{new_name}' 不合法"})
+            continue
+        if new_name == folder.name:
+            unchanged += 1
+            continue
+        renames.append((folder, folder.with_name(new_name)))
+
+    # --- 整批冲突检测：同一批次内重名，或目标已存在且不会在本批次中被移走 ---
+    def _key(path: pathlib.Path) -> str:
+        return os.path.normcase(str(path))
+
+    leaving = {_key(src) for src, _ in renames}
+    claimed: Dict[str, pathlib.Path] = {}
+    conflicts: List[Dict] = []
+    for src, dst in renames:
+        key = _key(dst)
+        if key in claimed:
+            conflicts.append({"folder": str(src), "target": str(dst),
+                              "reason": f"与 '{claimed[key]}' 的目标名称相同"})
+            continue
+        claimed[key] = src
+        if key not in leaving and (dst.exists() or dst.is_symlink()):
+            conflicts.append({"folder": str(src), "target": str(dst), "reason": "目标已存在"})
+
+    return {
+        "root_dir": str(root_dir),
+        "renames": [(str(src), str(dst)) for src, dst in renames],
+        "conflicts": conflicts,
+        "errors": errors,
+        "unchanged": unchanged,
+        "unmatched": unmatched,
+    }
+
+
+def _append_journal(journal, record: Dict):
+    journal.write(json.dumps(record, ensure_ascii=False) + "\n")
+    journal.flush()
+    os.fsync(journal.fileno())
+
+
+def apply_folder_renames(plan: Dict, journal_dir: Optional[pathlib.Path] = None) -> Dict:
+    """
+    按计划一次性执行全部重命名，每完成一步立即写入日志，中途失败时可用 rollback_folder_renames 回滚。
+    目标名称恰好是本批次另一个源文件夹时（链式或互换），先改为临时名称再改为最终名称。
+    """
+    if plan["conflicts"] or plan["errors"]:
+        raise ValueError("计划中存在冲突或错误，拒绝执行。")
+
+    root_dir = pathlib.Path(plan["root_dir"])
+    journal_dir = journal_dir or root_dir / JOURNAL_DIRNAME
+    journal_dir.mkdir(parents=True, exist_ok=True)
+    journal_path = journal_dir / f"{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.jsonl"
+
+    renames = [(pathlib.Path(src), pathlib.Path(dst)) for src, dst in plan["renames"]]
+    sources = {os.path.normcase(str(src)) for src, _ in renames}
+
+    # 冲突只可能发生在同级文件夹之间，因此按深度从深到浅逐层执行，保证父目录改名前子目录已处理完毕。
+    # 每一层内：目标被本批次其它文件夹占用的（链式或互换），先挪到临时名称，待其它文件夹让出位置后再改为最终名称。
+    steps: List[Tuple[pathlib.Path, pathlib.Path]] = []
+    for depth in sorted({len(src.parts) for src, _ in renames}, reverse=True):
+        staged, direct, unstaged = [], [], []
+        for src, dst in renames:
+            if len(src.parts) != depth:
+                continue
+            if os.path.normcase(str(dst)) in sources:
+                tmp = src.with_name(f".{src.name}.{uuid.uuid4().hex[:8]}.renaming")
+                staged.append((src, tmp))
+                unstaged.append((tmp, dst))
+            else:
+                direct.append((src, dst))
+        steps.extend(staged + direct + unstaged)
+
+    done = 0
+    failed = None
+    with open(journal_path, "w", encoding="utf-8") as journal:
+        _append_journal(journal, {"type": "plan", "root_dir": str(root_dir), "count": len(renames)})
+        for src, dst in steps:
+            try:
+                src.rename(dst)
+            except OSError as e:
+                failed = {"folder": str(src), "target": str(dst), "error": str(e)}
+                break
+            _append_journal(journal, {"type": "rename", "src": str(src), "dst": str(dst)})
+            done += 1
+        _append_journal(journal, {"type": "end", "completed": failed is None})
+
+    return {"journal": str(journal_path), "steps_done": done, "failed": failed}
+
+
+def _same_entry(a: pathlib.Path, b: pathlib.Path) -> bool:
+    """不区分大小写的文件系统上只改了大小写时，新旧名称指向同一个文件夹。"""
+    try:
+        return os.path.samefile(a, b)
+    except OSError:
+        return False
+
+
+def rollback_folder_renames(journal_path: pathlib.Path) -> Dict:
+    """
+    按日志倒序撤销已完成的重命名。链式和互换重命名的各步互相依赖，因此遇到第一个失败的步骤就停下；
+    每撤销一步都写入日志，排除故障后再次调用会从停下的地方继续。全部撤销后才写入 rollback 记录封存日志。
+
+    Returns:
+        Dict: undone（累计撤销的步数）、total（总步数）、failed（失败的步骤，全部完成时为 None）。
+    """
+    steps = []
+    undone = 0
+    with open(journal_path, encoding="utf-8") as journal:
+        for line in journal:
+            record = json.loads(line)
+            if record["type"] == "rename":
+                steps.append((pathlib.Path(record["src"]), pathlib.Path(record["dst"])))
+            elif record["type"] == "undo":
+                undone += 1
+            elif record["type"] == "rollback":
+                raise ValueError(f"日志 '{journal_path}' 已经回滚过。")
+
+    failed = None
+    with open(journal_path, "a", encoding="utf-8") as journal:
+        # 撤销总是从最后一步开始连续进行，已撤销的一定是末尾的 undone 步
+        for step in range(len(steps) - undone - 1, -1, -1):
+            src, dst = steps[step]
+            src_taken = src.exists() or src.is_symlink()
+            dst_present = dst.exists() or dst.is_symlink()
+            if src_taken and not dst_present:
+                # 上次已经改回但没来得及写日志
+                pass
+            elif src_taken and not _same_entry(src, dst):
+                failed = {"step": step + 1, "folder": str(dst), "target": str(src), "error": "原名称已被占用"}
+                break
+            else:
+                try:
+                    dst.rename(src)
+                except OSError as e:
+                    failed = {"step": step + 1, "folder": str(dst), "target": str(src), "error": str(e)}
+                    break
+            _append_journal(journal, {"type": "undo", "step": step + 1})
+            undone += 1
+        if failed is None:
+            _append_journal(journal, {"type": "rollback", "undone": undone, "total": len(steps)})
+        else:
+            print(f"  [回滚失败] 第 {failed['step']} 步 '{failed['folder']}' -> '{failed['target']}': "
+                  f"{failed['error']}", file=sys.stderr)
+    return {"undone": undone, "total": len(steps), "failed": failed}
+
+
+def rollback_folder_migration(root_dir: pathlib.Path, journal: str) -> Dict:
+    """按 apply_folder_renames 写在 root_dir/.rename_journals 下的日志回滚；journal 只能是日志文件名。"""
+    journal_path = root_dir / JOURNAL_DIRNAME / journal
+    if pathlib.Path(journal).name != journal or not journal_path.is_file():
+        raise FileNotFoundError(f"'{root_dir / JOURNAL_DIRNAME}' 中没有日志 '{journal}'。")
+    return {"journal": str(journal_path), **rollback_folder_renames(journal_path)}
+
+
+def migrate_folder_names(root_dir: pathlib.Path,
+                         operations: Optional[Sequence[Mapping]] = None,
+                         pattern: Optional[str] = None,
+                         template: Optional[str] = None,
+                         recursive: bool = False,
+                         dry_run: bool = True) -> Dict:
+    """
+    批量迁移文件夹命名结构：先计算整批计划并检查冲突，确认无误后在一次带日志的遍历中完成重命名。
+    存在任何冲突或错误时整批都不执行。
+    """
+    if not root_dir.is_dir():
+        raise NotADirectoryError(f"'{root_dir}' 不存在或不是一个有效的文件夹。")
+
+    plan = plan_folder_renames(root_dir, operations, pattern, template, recursive)
+    print(f"计划重命名 {len(plan['renames'])} 个文件夹，"
+          f"冲突 {len(plan['conflicts'])} 个，错误 {len(plan['errors'])} 个。")
+
+    if dry_run or plan["conflicts"] or plan["errors"]:
+        plan["executed"] = False
+        return plan
+
+    plan.update(apply_folder_renames(plan))
+    plan["executed"] = True
+    if plan["failed"]:
+        print(f"重命名在第 {plan['steps_done'] + 1} 步失败: {plan['failed']['error']}，"
+              f"可使用日志 '{pathlib.Path(plan['journal']).name}' 回滚。", file=sys.stderr)
+    return plan
+
+
+def main(root_folder: pathlib.Path, operations: List[Dict], is_dry_run: bool):
+    """
+    主函数，用于配置和运行脚本。
+    """
+    result = migrate_folder_names(root_folder, operations=operations, dry_run=is_dry_run)
+    for old, new in result["renames"][:20]:
+        print(f"  '{pathlib.Path(old).name}' -> '{pathlib.Path(new).name}'")
+    for conflict in result["conflicts"]:
+        print(f"  [冲突] {conflict['folder']}: {conflict['reason']}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    ROOT_FOLDER = pathlib.Path(r'C:\path\to\proj1')
+    OPERATIONS = [
+        {"op": "swap", "index": 1, "index2": 2},
+        {"op": "add", "value": "v2", "index": 3},
+    ]
+    main(ROOT_FOLDER, OPERATIONS, is_dry_run=True)
@@ -0,0 +1,307 @@
+# fused_pre_process.py
+
+import contextvars
+import functools
+import io
+import os
+import pathlib
+import shutil
+import sys
+import tarfile
+import tempfile
+import threading
+import zipfile
+import zlib
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Callable, Dict, IO, Iterator, NamedTuple, Optional, Set, Union
+
+import fitz  # PyMuPDF
+from patoolib.util import PatoolError
+
+from app.core import throttle
+from app.core.metrics import worker_metrics
+from app.core.streams import BoundedQueue
+from app.workers.pre_process_script.decompress_recursively import ARCHIVE_EXTENSIONS, _patool_extract
+
+ZIP_EXTENSIONS = {".zip", ".jar", ".cbz"}
+TAR_EXTENSIONS = {".tar", ".gz", ".bz2", ".xz"}
+# 嵌套压缩包和保留的文件不超过该大小（且不超过内存预算的 1/4）时读入内存，更大的先落到临时文件
+NESTED_IN_MEMORY_LIMIT = 64 * 1024 * 1024
+
+
+class _Member(NamedTuple):
+    name: str
+    data: Optional[bytes]
+    # 太大而落到临时文件的成员：data 为 None，数据在 path 中
+    path: Optional[pathlib.Path] = None
+    nbytes: int = 0
+
+    @property
+    def buffered(self) -> int:
+        """占用内存预算的字节数。"""
+        return len(self.data) if self.data is not None else 0
+
+
+class _Context:
+    """一次运行中各阶段共享的统计、临时目录和内存预算。"""
+
+    def __init__(self, keep_extensions: Set[str], spill_dir: pathlib.Path, metrics, queue: BoundedQueue):
+        self.keep_extensions = keep_extensions
+        self.spill_dir = spill_dir
+        self.metrics = metrics
+        self.queue = queue
+        self.memory_limit = min(NESTED_IN_MEMORY_LIMIT, queue.max_bytes // 4)
+        self.skipped = 0
+        self.spilled_bytes = 0
+        self.failed: Dict[str, str] = {}
+
+    def spill(self, name: str, source: IO[bytes]) -> pathlib.Path:
+        path = pathlib.Path(tempfile.mkstemp(dir=self.spill_dir, suffix=pathlib.PurePosixPath(name).suffix)[1])
+        with open(path, "wb") as f:
+            shutil.copyfileobj(source, f, 1024 * 1024)
+        self.spilled_bytes += path.stat().st_size
+        return path
+
+    def member(self, name: str, size: int, open_member: Callable[[], IO[bytes]]) -> _Member:
+        """读取一个要保留的文件：不超过 memory_limit 的读入内存，更大的直接落到临时文件。"""
+        with open_member() as f:
+            if size > self.memory_limit:
+                return _Member(name, None, self.spill(name, f), size)
+            data = f.read()
+        return _Member(name, data, None, len(data))
+
+
+def _iter_folder(folder: pathlib.Path, context: _Context, prefix: str = "") -> Iterator[_Member]:
+    """按路径排序遍历文件夹，压缩包就地展开，不需要的文件不读取。"""
+    for path in sorted(p for p in folder.rglob("*") if p.is_file()):
+        name = f"{prefix}{path.relative_to(folder).as_posix()}"
+        suffix = path.suffix.lower()
+        if suffix in ARCHIVE_EXTENSIONS:
+            yield from _iter_archive(name, path, context)
+        elif suffix in context.keep_extensions:
+            yield context.member(name, path.stat().st_size, functools.partial(open, path, "rb"))
+        else:
+            context.skipped += 1
+
+
+def _iter_entry(name: str, size: int, open_member: Callable[[], IO[bytes]], context: _Context) -> Iterator[_Member]:
+    """
+    处理压缩包中的一个成员：嵌套压缩包递归展开，需要的文件读入内存（或落到临时文件），其余跳过且不解压。
+    嵌套压缩包只有在内存预算还放得下时才在内存中展开，展开期间一直占用这部分预算。
+    """
+    suffix = pathlib.PurePosixPath(name).suffix.lower()
+    if suffix in ARCHIVE_EXTENSIONS:
+        if size <= context.memory_limit and context.queue.try_reserve(size):
+            try:
+                with open_member() as f:
+                    data = f.read()
+                yield from _iter_archive(name, data, context)
+            finally:
+                context.queue.unreserve(size)
+            return
+        with open_member() as f:
+            spilled = context.spill(name, f)
+        try:
+            yield from _iter_archive(name, spilled, context)
+        finally:
+            spilled.unlink(missing_ok=True)
+    elif suffix in context.keep_extensions:
+        yield context.member(name, size, open_member)
+    else:
+        context.skipped += 1
+
+
+def _iter_archive(name: str, source: Union[pathlib.Path, bytes], context: _Context) -> Iterator[_Member]:
+    """
+    展开一个压缩包（磁盘上的路径或内存中的字节）。zip 与 tar 系列用标准库在内存中逐成员读取；
+    其他格式（rar、7z 等）依赖 patool 调用外部程序，只能先解压到临时文件夹再遍历。
+    """
+    suffix = pathlib.PurePosixPath(name).suffix.lower()
+    fileobj = io.BytesIO(source) if isinstance(source, bytes) else None
+    try:
+        if suffix in ZIP_EXTENSIONS:
+            with zipfile.ZipFile(fileobj or source) as archive:
+                for info in sorted(archive.infolist(), key=lambda i: i.filename):
+                    if not info.is_dir():
+                        yield from _iter_entry(f"{name}/{info.filename}", info.file_size,
+                                               functools.partial(archive.open, info), context)
+            return
+        if suffix in TAR_EXTENSIONS:
+            try:
+                archive = tarfile.open(fileobj=fileobj) if fileobj else tarfile.open(source)
+            except tarfile.ReadError:
+                archive = None  # 单个文件的 .gz/.bz2/.xz，交给 patool
+            if archive is not None:
+                with archive:
+                    for member in archive:
+                        if member.isfile():
+                            yield from _iter_entry(f"{name}/{member.name}", member.size,
+                                                   functools.partial(archive.extractfile, member), context)
+                return
+            if fileobj is not None:
+                fileobj.seek(0)
+
+        with tempfile.TemporaryDirectory(dir=context.spill_dir) as outdir:
+            archive_path = source if fileobj is None else context.spill(name, fileobj)
+            with context.metrics.stage("extract_spilled"):
+                _patool_extract(archive_path, pathlib.Path(outdir))
+            if fileobj is not None:
+                archive_path.unlink()
+            yield from _iter_folder(pathlib.Path(outdir), context, f"{name}/")
+    except (zipfile.BadZipFile, tarfile.TarError, PatoolError, RuntimeError, OSError, EOFError, zlib.error) as e:
+        context.metrics.error()
+        context.failed[name] = str(e)
+        print(f"  [解压失败] {name}: {e}", file=sys.stderr)
+
+
+def _rasterize_pdf(source: Union[bytes, str], stem: str, destination_dir: pathlib.Path, dpi: int) -> Dict:
+    """进程池任务：从内存中的 PDF（或落到临时文件的大 PDF 的路径）逐页栅格化并直接写出 JPG，只把统计传回主进程。"""
+    pages = 0
+    written = 0
+    with (fitz.open(source) if isinstance(source, str) else fitz.open(stream=source, filetype="pdf")) as doc:
+        for page_num in range(doc.page_count):
+            output_path = destination_dir / f"{stem}_page{page_num + 1}.jpg"
+            doc.load_page(page_num).get_pixmap(dpi=dpi).save(output_path)
+            written += output_path.stat().st_size
+            pages += 1
+    return {"pages": pages, "bytes_written": written}
+
+
+def fused_pre_process(source_folder: pathlib.Path,
+                      destination_folder: pathlib.Path,
+                      keep_extensions: Set[str],
+                      dpi: int = 150,
+                      start_counter: int = 1,
+                      workers: Optional[int] = None,
+                      max_buffer_bytes: int = 256 * 1024 * 1024) -> Dict:
+    """
+    把“解压 -> 筛选 -> 重命名 -> PDF 转图片”四步串成一条内存中的流水线，只写出最终图片，
+    不生成 1_afterunzip、2_unwanted_files、3_renamed_mixed_files 等中间文件夹。
+
+    读取线程逐个展开源文件夹中的文件和压缩包（含嵌套压缩包），不需要的成员不解压；
+    需要的文件经有字节上限的队列交给主线程按顺序编号（{counter:04d}），
+    PDF 交给进程池栅格化为 {counter:04d}_page{n}.jpg，其余保留的文件直接写为 {counter:04d}{suffix}。
+    读取、栅格化和写出同时进行；队列和进程池在途任务都有上限，慢的一端会让快的一端等待。
+    排队中的文件、已提交但尚未栅格化完的 PDF、在内存中展开的嵌套压缩包共用 max_buffer_bytes 的内存预算，
+    超过预算 1/4 的单个文件先落到输出文件夹下的临时文件，内存占用不随文件大小增长。
+
+    Args:
+        source_folder: 待处理的源文件夹（相当于 0_foldertobeunzip）。
+        destination_folder: 最终图片的输出文件夹（相当于 4_final_images）。
+        keep_extensions: 要保留的小写扩展名，例如 {'.pdf', '.jpg'}。
+        dpi: PDF 转图片的分辨率。
+        start_counter: 编号的起始数字。
+        workers: 栅格化进程数，默认等于 CPU 核数。
+        max_buffer_bytes: 读取、排队和栅格化中的数据共用的内存预算（字节）。
+
+    Returns:
+        Dict: 保留的文件数、写出的图片与 PDF 页数、跳过的文件数、读写字节数以及失败的压缩包/PDF。
+    """
+    if not source_folder.is_dir():
+        raise NotADirectoryError(f"源文件夹 '{source_folder}' 不存在或不是一个有效的目录。")
+    destination_folder.mkdir(parents=True, exist_ok=True)
+
+    metrics = worker_metrics("fused_pre_process")
+    spill_dir = pathlib.Path(tempfile.mkdtemp(prefix=".fused-", dir=destination_folder))
+    # 主线程取出的文件写出后、PDF 栅格化完成后才归还预算
+    queue = BoundedQueue(max_buffer_bytes, hold=True)
+    context = _Context({extension.lower() for extension in keep_extensions}, spill_dir, metrics, queue)
+    reader_error = []
+
+    def read_sources():
+        try:
+            for member in _iter_folder(source_folder, context):
+                metrics.bytes_read(member.nbytes)
+                if not queue.put(member, member.buffered):
+                    return
+        except BaseException as e:
+            reader_error.append(e)
+        finally:
+            queue.finish()
+
+    stats = {"files": 0, "images": 0, "pdfs": 0, "pages": 0, "bytes_written": 0}
+    workers = workers or os.cpu_count()
+    pending: Dict[Future, _Member] = {}
+
+    def collect(done):
+        for future in done:
+            member = pending.pop(future)
+            queue.release(member.buffered)
+            if member.path is not None:
+                member.path.unlink(missing_ok=True)
+            try:
+                result = future.result()
+            except Exception as e:
+                metrics.error()
+                context.failed[member.name] = str(e)
+                print(f"    [!] 处理PDF '{member.name}' 时出错: {e}", file=sys.stderr)
+                continue
+            stats["pages"] += result["pages"]
+            stats["bytes_written"] += result["bytes_written"]
+            # 栅格化在子进程里写出，回到主线程后按页数和字节数记账，限速时后续写出随之放慢
+            throttle.consume_ops(result["pages"])
+            throttle.consume_bytes(result["bytes_written"])
+            metrics.bytes_written(result["bytes_written"])
+
+    print(f"处理: {source_folder}  ->  {destination_folder}（流水线模式，不生成中间文件夹）")
+    # 读取线程沿用本请求的上下文，解压阶段的 span 才能记到本次分析的时间线上
+    reader = threading.Thread(target=contextvars.copy_context().run, args=(read_sources,),
+                              name="fused-reader", daemon=True)
+    reader.start()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            counter = start_counter
+            while (member := queue.get()) is not None:
+                stem = f"{counter:04d}"
+                counter += 1
+                stats["files"] += 1
+                metrics.files()
+                suffix = pathlib.PurePosixPath(member.name).suffix
+                if suffix.lower() == ".pdf":
+                    # 在途的 PDF 不超过进程数的两倍，栅格化跟不上时读取线程会在队列处等待
+                    if len(pending) >= 2 * workers:
+                        with metrics.stage("rasterize_wait"):
+                            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+                    source = member.data if member.path is None else str(member.path)
+                    pending[pool.submit(_rasterize_pdf, source, stem, destination_folder, dpi)] = member
+                    stats["pdfs"] += 1
+                    continue
+                with metrics.stage("write"):
+                    throttle.consume_ops()
+                    throttle.consume_bytes(member.nbytes)
+                    target = destination_folder / f"{stem}{suffix}"
+                    if member.path is None:
+                        target.write_bytes(member.data)
+                    else:
+                        # 临时文件就在输出文件夹下，直接改名
+                        os.replace(member.path, target)
+                queue.release(member.buffered)
+                stats["images"] += 1
+                stats["bytes_written"] += member.nbytes
+                metrics.bytes_written(member.nbytes)
+            with metrics.stage("rasterize_wait"):
+                done = wait(pending).done
+            collect(done)
+    finally:
+        queue.close()
+        reader.join()
+        shutil.rmtree(spill_dir, ignore_errors=True)
+    if reader_error:
+        raise reader_error[0]
+
+    stats.update(skipped=context.skipped, spilled_bytes=context.spilled_bytes, failed=context.failed)
+    print(f"完成：保留 {stats['files']} 个文件，写出 {stats['images']} 张图片和 {stats['pages']} 页 PDF 图片，"
+          f"跳过 {stats['skipped']} 个不需要的文件，{len(context.failed)} 个失败。")
+    return stats
+
+
+def main(source_folder: pathlib.Path, destination_folder: pathlib.Path, extensions_to_keep: set, image_dpi: int):
+    """主函数，用于被外部脚本调用。"""
+    fused_pre_process(source_folder, destination_folder, extensions_to_keep, dpi=image_dpi)
+
+
+if __name__ == "__main__":
+    SOURCE = pathlib.Path(r'C:\path\to\0_foldertobeunzip')
+    DEST = pathlib.Path(r'C:\path\to\4_final_images')
+    main(SOURCE, DEST, {'.pdf', '.jpg'}, 150)
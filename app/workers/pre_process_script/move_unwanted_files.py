@@ -2,12 +2,17 @@
 
 import pathlib
 import sys
+from typing import Dict
+
+from app.core import throttle
+from app.core.metrics import worker_metrics
+from app.core.plans import create_plan, planned_operation, summarize_plan
 
 
 def move_unwanted_files(source_dir: pathlib.Path,
                         destination_dir: pathlib.Path,
                         keep_extensions: set,
-                        dry_run: bool = True):
+                        dry_run: bool = True) -> Dict:
     """
     Recursively scans a source directory and moves files that do not have
     one of the specified extensions to a destination directory.
@@ -17,12 +22,16 @@ def move_unwanted_files(source_dir: pathlib.Path,
         destination_dir: The directory where non-kept files will be moved.
         keep_extensions: A set of lower-case file extensions to keep (e.g., {'.pdf', '.jpg'}).
         dry_run: If True, only prints the actions that would be taken without
-                 moving any files.
+                 moving any files, and saves them as an execution plan.
+
+    Returns:
+        A summary with the number of files to move and moved; in dry-run mode
+        it also carries the saved plan (see app.core.plans.execute_plan).
     """
     # --- 1. 安全性和有效性检查 ---
     if not source_dir.is_dir():
         print(f"错误：源文件夹 '{source_dir}' 不存在或不是一个有效的目录。", file=sys.stderr)
-        return
+        return {"files_to_move": 0, "moved": 0}
 
     if dry_run:
         print("=" * 50)
@@ -38,8 +47,9 @@ def move_unwanted_files(source_dir: pathlib.Path,
             destination_dir.mkdir(parents=True, exist_ok=True)
         except OSError as e:
             print(f"错误：无法创建目标文件夹 '{destination_dir}': {e}", file=sys.stderr)
-            return
+            return {"files_to_move": 0, "moved": 0}
 
+    metrics = worker_metrics("move_unwanted_files")
     files_to_move = []
     # --- 2. 递归查找所有文件 ---
     print(f"正在扫描文件夹: '{source_dir}'...")
@@ -52,25 +62,29 @@ def move_unwanted_files(source_dir: pathlib.Path,
 
     if not files_to_move:
         print("扫描完成，没有找到需要移动的文件。")
-        return
-
-    print(f"扫描完成，共找到 {len(files_to_move)} 个需要移动的文件。")
+    else:
+        print(f"扫描完成，共找到 {len(files_to_move)} 个需要移动的文件。")
 
     # --- 3. 执行移动操作 ---
+    operations = []
+    planned_targets = set()
+    moved = 0
     for old_path in files_to_move:
         target_path = destination_dir / old_path.name
 
         # --- 核心安全功能：处理目标文件夹中的文件名冲突 ---
-        # 如果目标文件已存在，则在文件名后添加序号
+        # 如果目标文件已存在，则在文件名后添加序号；演练时文件还没移动，还要避开本次计划已占用的名字
         counter = 1
         new_stem = old_path.stem
-        while target_path.exists():
+        while target_path.exists() or target_path in planned_targets:
             new_name = f"{new_stem}({counter}){old_path.suffix}"
             target_path = destination_dir / new_name
             counter += 1
 
         # --- 根据模式执行操作 ---
         if dry_run:
+            planned_targets.add(target_path)
+            operations.append(planned_operation("move", old_path, target_path))
             if new_stem != old_path.stem:  # 如果文件名因冲突而改变
                 print(f"[演练] 将移动: '{old_path.relative_to(source_dir)}' -> '{target_path.name}' (因重名而改名)")
             else:
@@ -78,15 +92,27 @@ def move_unwanted_files(source_dir: pathlib.Path,
         else:
             # 实际移动文件
             try:
-                old_path.rename(target_path)
+                throttle.move(old_path, target_path)
+                metrics.files()
+                moved += 1
                 if new_stem != old_path.stem:
                     print(f"已移动: '{old_path.name}' -> '{target_path.name}' (因重名而改名)")
                 else:
                     print(f"已移动: '{old_path.name}' -> '{target_path.name}'")
             except OSError as e:
+                metrics.error()
                 print(f"错误：移动文件 '{old_path.name}' 时失败: {e}", file=sys.stderr)
 
     print("\n文件移动任务完成。")
+    summary = {"files_to_move": len(files_to_move), "moved": moved}
+    if dry_run:
+        plan = create_plan("move_unwanted_files",
+                           {"source_dir": source_dir, "destination_dir": destination_dir,
+                            "keep_extensions": sorted(keep_extensions)},
+                           operations)
+        print(f"执行计划已保存: {plan['plan_id']}")
+        summary["plan"] = summarize_plan(plan)
+    return summary
 
 
 # ==================== 修改开始 ====================
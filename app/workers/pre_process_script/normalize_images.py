@@ -0,0 +1,205 @@
+# normalize_images.py
+
+import os
+import pathlib
+import shutil
+import sys
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from app.core import throttle
+from app.core.metrics import worker_metrics
+from app.core.sharding import Shard
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp"}
+# 大于目标尺寸这么多倍时先用 reduce() 按整数倍快速缩小，剩下的部分再用 LANCZOS 精确缩放
+REDUCING_GAP = 3.0
+
+
+def normalization_marker(long_edge: int, quality: int) -> bytes:
+    """写进 JPEG 注释段（COM）的标记，记录规范化参数；参数相同的图片再次遇到时不必重新编码。"""
+    return f"normalized long_edge={long_edge} quality={quality}".encode("ascii")
+
+
+def _is_normalized(path: str, marker: bytes) -> bool:
+    """只解析文件头，读取 JPEG 注释段，不解码像素。"""
+    try:
+        with Image.open(path) as img:
+            return img.format == "JPEG" and img.info.get("comment") == marker
+    except Exception:
+        return False
+
+
+def _flatten(img: Image.Image) -> Image.Image:
+    """转换成 JPEG 能保存的 L 或 RGB；带透明度的图片铺在白底上，避免透明区域变黑。"""
+    if img.mode in ("L", "RGB"):
+        return img
+    if img.mode in ("1", "I", "I;16", "F"):
+        return img.convert("L")
+    if img.mode in ("LA", "RGBA", "PA") or (img.mode == "P" and "transparency" in img.info):
+        rgba = img.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return img.convert("RGB")
+
+
+def _normalize_one(source: str, target: str, long_edge: int, quality: int, marker: bytes) -> Tuple[str, int, int]:
+    """
+    规范化一张图片，返回 (结果, 读取的字节数, 写出的字节数)，结果为 skipped、copied 或 normalized。
+    JPEG 先用 draft 模式在解码阶段按 1/2、1/4、1/8 缩小，再按 EXIF 方向旋转，最后 reduce + LANCZOS 缩放到目标长边；
+    只缩小不放大。写临时文件后替换，目标文件夹与源文件夹相同时即为就地规范化。
+    """
+    source_stat = os.stat(source)
+    if os.path.exists(target) and os.stat(target).st_mtime_ns >= source_stat.st_mtime_ns \
+            and _is_normalized(target, marker):
+        return "skipped", 0, 0
+
+    tmp = os.path.join(os.path.dirname(target), f".{uuid.uuid4().hex}.tmp")
+    try:
+        with Image.open(source) as img:
+            if img.format == "JPEG" and img.info.get("comment") == marker:
+                # 源文件已经按相同参数规范化过（例如上一轮的输出），原样复制即可
+                img.close()
+                shutil.copy2(source, tmp)
+                os.replace(tmp, target)
+                return "copied", source_stat.st_size, source_stat.st_size
+
+            scale = min(1.0, long_edge / max(img.size))
+            img.draft("L" if img.mode == "L" else "RGB",
+                      (max(1, round(img.width * scale)), max(1, round(img.height * scale))))
+            oriented = ImageOps.exif_transpose(img)
+            scale = min(1.0, long_edge / max(oriented.size))
+            if scale < 1.0:
+                size = (max(1, round(oriented.width * scale)), max(1, round(oriented.height * scale)))
+                oriented = oriented.resize(size, Image.LANCZOS, reducing_gap=REDUCING_GAP)
+            _flatten(oriented).save(tmp, "JPEG", quality=quality, comment=marker)
+        os.replace(tmp, target)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+    return "normalized", source_stat.st_size, os.path.getsize(target)
+
+
+def _normalize_chunk(jobs: List[Tuple[str, str]], long_edge: int, quality: int,
+                     in_place: bool) -> Tuple[Dict[str, int], Dict[str, int], Dict[str, str]]:
+    """进程池任务：规范化一批图片，返回 ({结果: 数量}, {读写字节数}, {源文件: 错误})。"""
+    marker = normalization_marker(long_edge, quality)
+    counts = {"normalized": 0, "copied": 0, "skipped": 0}
+    io = {"bytes_read": 0, "bytes_written": 0}
+    failed = {}
+    for source, target in jobs:
+        try:
+            outcome, read, written = _normalize_one(source, target, long_edge, quality, marker)
+            counts[outcome] += 1
+            io["bytes_read"] += read
+            io["bytes_written"] += written
+            if outcome != "skipped" and in_place and source != target:
+                if os.path.samefile(source, target):
+                    # 不区分大小写的文件系统上 a.JPG 与 a.jpg 是同一个文件，输出已经替换了源文件，只需改成小写扩展名
+                    os.replace(source, target)
+                else:
+                    # 就地规范化时，非 JPEG 源文件写出同名 .jpg 后删除
+                    os.unlink(source)
+        except Exception as e:
+            failed[source] = str(e)
+    return counts, io, failed
+
+
+def normalize_images(source_dir: pathlib.Path,
+                     destination_dir: pathlib.Path,
+                     long_edge: int = 1600,
+                     quality: int = 90,
+                     workers: Optional[int] = None,
+                     chunk_size: int = 32,
+                     shard: Optional[Shard] = None) -> Dict:
+    """
+    在入库时一次性规范化训练图片：按 EXIF 方向摆正、长边缩小到 long_edge、以 quality 重新编码为 JPEG，
+    训练时每个 epoch 不必再为缩放付出解码大图的代价。
+
+    输出保留源文件夹中的相对路径，扩展名统一为 .jpg；规范化参数写在 JPEG 注释段里，
+    目标文件已按相同参数规范化且不比源文件旧时跳过，所以可以对同一个文件夹反复执行，只处理新增或修改的图片。
+    destination_dir 与 source_dir 相同时就地规范化。
+
+    Args:
+        source_dir: 待规范化图片所在的文件夹（递归扫描）。
+        destination_dir: 输出文件夹。
+        long_edge: 输出图片长边的最大像素数，比它小的图片不放大。
+        quality: JPEG 编码质量。
+        workers: 进程数，默认等于 CPU 核数。
+        chunk_size: 每个进程池任务处理的图片数。
+        shard: 集群模式下只处理属于该分片的图片，默认处理全部。
+
+    Returns:
+        Dict: 扫描、规范化、复制、跳过的图片数，读写字节数，以及失败的图片。
+    """
+    if not source_dir.is_dir():
+        raise NotADirectoryError(f"源文件夹 '{source_dir}' 不存在或不是一个有效的目录。")
+    destination_dir.mkdir(parents=True, exist_ok=True)
+    in_place = destination_dir.resolve() == source_dir.resolve()
+
+    metrics = worker_metrics("normalize_images")
+    print(f"正在扫描文件夹: '{source_dir}'...")
+    jobs: List[Tuple[str, str]] = []
+    targets: Dict[pathlib.Path, pathlib.Path] = {}
+    failed: Dict[str, str] = {}
+    for path in sorted(source_dir.rglob('*')):
+        if not path.is_file() or path.suffix.lower() not in IMAGE_EXTENSIONS:
+            continue
+        if shard is not None and not shard.contains(path, source_dir):
+            continue
+        target = (destination_dir / path.relative_to(source_dir)).with_suffix(".jpg")
+        if target in targets:
+            failed[str(path)] = f"与 '{targets[target]}' 输出到同一个文件 '{target}'"
+            continue
+        targets[target] = path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        jobs.append((str(path), str(target)))
+
+    counts = {"normalized": 0, "copied": 0, "skipped": 0}
+    io = {"bytes_read": 0, "bytes_written": 0}
+    chunks = iter([jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)])
+    workers = workers or os.cpu_count()
+    if jobs:
+        with metrics.stage("normalize"), ProcessPoolExecutor(max_workers=workers) as pool:
+            # 同时在途的任务不超过进程数的两倍，限速时主线程记账阻塞，后面的任务也就晚提交
+            pending = deque(pool.submit(_normalize_chunk, chunk, long_edge, quality, in_place)
+                            for chunk in islice(chunks, 2 * workers))
+            while pending:
+                chunk_counts, chunk_io, chunk_failed = pending.popleft().result()
+                for outcome, count in chunk_counts.items():
+                    counts[outcome] += count
+                for key, value in chunk_io.items():
+                    io[key] += value
+                # 图片在子进程里写出，回到主线程后按写出的图片数和字节数记账
+                throttle.consume_ops(chunk_counts["normalized"] + chunk_counts["copied"])
+                throttle.consume_bytes(chunk_io["bytes_written"])
+                metrics.bytes_read(chunk_io["bytes_read"])
+                metrics.bytes_written(chunk_io["bytes_written"])
+                failed.update(chunk_failed)
+                for chunk in islice(chunks, 1):
+                    pending.append(pool.submit(_normalize_chunk, chunk, long_edge, quality, in_place))
+
+    metrics.files(len(jobs))
+    metrics.error(len(failed))
+    for source, error in failed.items():
+        print(f"  [!] 规范化 '{source}' 失败: {error}", file=sys.stderr)
+    print(f"完成：共 {len(jobs)} 张图片，规范化 {counts['normalized']} 张，复制 {counts['copied']} 张，"
+          f"跳过已规范化的 {counts['skipped']} 张，{len(failed)} 张失败。")
+    return {"scanned": len(jobs), **counts, **io, "failed": failed}
+
+
+def main(source_folder: pathlib.Path, destination_folder: pathlib.Path, long_edge: int, quality: int):
+    """主函数，用于被外部脚本调用。"""
+    normalize_images(source_folder, destination_folder, long_edge=long_edge, quality=quality)
+
+
+if __name__ == "__main__":
+    SOURCE = pathlib.Path(r'C:\path\to\4_final_images')
+    DEST = pathlib.Path(r'C:\path\to\5_normalized_images')
+    main(SOURCE, DEST, 1600, 90)
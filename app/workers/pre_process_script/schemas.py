@@ -1,11 +1,93 @@
-from pydantic import BaseModel, Field, DirectoryPath, FilePath
-from typing import Optional, Any, List
+import re
 
-from app.apis.schemas import InputOutputPaths
+from pydantic import BaseModel, Field, DirectoryPath, FilePath, model_validator
+from typing import Optional, Any, List, Literal
+
+from app.apis.schemas import InputOutputPaths, SingleInputPath
 
 class DecompressRequest(InputOutputPaths):
-    pass
+    cache_dir: Optional[str] = Field(None, description="解压缓存目录；提供后内容相同的压缩包只真正解压一次")
+    cache_max_gb: float = Field(20, gt=0, description="解压缓存的总大小上限（GB）")
 
 
 class MoveUnwantedFilesRequest(InputOutputPaths):
-    keep_extensions : List[str] = Field(..., description="要保留的文件名后缀列表")
\ No newline at end of file
+    keep_extensions : List[str] = Field(..., description="要保留的文件名后缀列表")
+    dry_run: bool = Field(True, description="演练模式，只生成执行计划，不移动")
+
+class FolderPartOperation(BaseModel):
+    """对 part[0]_part[1]_... 名称的单步操作，语义与 FolderNameProcessor 的 add/delete/modify/swap 一致。"""
+    op: Literal["add", "delete", "modify", "swap"] = Field(..., description="操作类型")
+    index: int = Field(..., description="操作的 part 索引")
+    value: Optional[str] = Field(None, description="add/modify 使用的新 part")
+    index2: Optional[int] = Field(None, description="swap 的第二个索引")
+
+    @model_validator(mode="after")
+    def _check_arguments(self):
+        if self.op in ("add", "modify") and self.value is None:
+            raise ValueError(f"{self.op} 操作必须提供 value")
+        if self.op == "swap" and self.index2 is None:
+            raise ValueError("swap 操作必须提供 index2")
+        return self
+
+
+class BatchFolderRenameRequest(SingleInputPath):
+    operations: Optional[List[FolderPartOperation]] = Field(None, description="按顺序执行的 part 级操作列表")
+    pattern: Optional[str] = Field(None, description="需完整匹配文件夹名称的正则表达式，与 operations 二选一")
+    template: Optional[str] = Field(None, description="与 pattern 搭配的替换模板，例如 \\3_\\2_\\1")
+    recursive: bool = Field(False, description="是否递归处理所有层级的子文件夹")
+    dry_run: bool = Field(True, description="演练模式，只返回重命名计划和冲突")
+
+    @model_validator(mode="after")
+    def _check_mode(self):
+        if (self.operations is None) == (self.pattern is None and self.template is None):
+            raise ValueError("operations 与 pattern/template 必须且只能提供一种")
+        if self.operations is None:
+            if self.pattern is None or self.template is None:
+                raise ValueError("pattern 与 template 必须同时提供")
+            try:
+                re.compile(self.pattern)
+            except re.error as e:
+                raise ValueError(f"pattern 不是有效的正则表达式: {e}")
+        return self
+
+
+class RollbackFolderRenamesRequest(SingleInputPath):
+    journal: str = Field(..., description="batch_rename_folders 返回的日志文件名（位于 source_path/.rename_journals 下）")
+
+
+class ScreenImageQualityRequest(InputOutputPaths):
+    decode_size: int = Field(256, gt=8, description="用于计算指标的缩小解码边长")
+    blank_white_ratio: float = Field(0.995, description="接近白色的像素占比达到该值即判定为空白页")
+    blur_threshold: float = Field(100.0, description="拉普拉斯方差低于该值判定为模糊")
+    contrast_threshold: float = Field(40.0, description="5%~95% 亮度差低于该值判定为低对比度")
+    workers: Optional[int] = Field(None, description="进程数，默认等于 CPU 核数")
+    dry_run: bool = Field(True, description="演练模式，只报告不合格图片，不移动")
+
+
+class DedupeFilesRequest(InputOutputPaths):
+    workers: int = Field(8, gt=0, description="计算哈希的线程数")
+    use_cache: bool = Field(True, description="是否复用哈希缓存（保存在 DEDUPE_CACHE_DIR 中，不写入源文件夹）")
+    dry_run: bool = Field(True, description="演练模式，只报告重复文件，不移动")
+
+
+class FindLongImagesRequest(InputOutputPaths):
+    ratio_threshold: float = Field(3.0, gt=0, description="高/宽大于该值即判定为长图")
+
+
+class FusedPreProcessRequest(InputOutputPaths):
+    keep_extensions: List[str] = Field([".pdf", ".jpg"], description="要保留的文件名后缀列表")
+    dpi: int = Field(150, gt=0, description="PDF 转图片的分辨率")
+    start_counter: int = Field(1, ge=0, description="重命名编号的起始数字")
+    workers: Optional[int] = Field(None, gt=0, description="栅格化进程数，默认等于 CPU 核数")
+    max_buffer_mb: int = Field(256, gt=0, description="读取与处理之间缓冲队列的上限（MB）")
+
+
+class NormalizeImagesRequest(InputOutputPaths):
+    long_edge: int = Field(1600, ge=32, description="输出图片长边的最大像素数，小图不放大")
+    quality: int = Field(90, ge=1, le=95, description="JPEG 编码质量")
+    workers: Optional[int] = Field(None, gt=0, description="进程数，默认等于 CPU 核数")
+
+
+class BatchRenameFilesRequest(InputOutputPaths):
+    start_counter: int = Field(1, ge=0, description="目标文件夹还没有映射时的起始编号")
+    dry_run: bool = Field(True, description="演练模式，只生成复制计划")
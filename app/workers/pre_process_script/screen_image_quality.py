@@ -0,0 +1,220 @@
+# screen_image_quality.py
+
+import os
+import pathlib
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from PIL import Image
+
+from app.core import throttle
+from app.core.metrics import worker_metrics
+from app.core.plans import PlanWriter, planned_operation, summarize_plan
+from app.core.reports import ReportWriter
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+
+
+def _fit_long_edge(width: int, height: int, size: int) -> Tuple[int, int]:
+    """长边缩到 size（不放大），短边按原宽高比缩放；短边至少 3 像素，拉普拉斯算子才有输出。"""
+    scale = min(1.0, size / max(width, height))
+    return max(3, round(width * scale)), max(3, round(height * scale))
+
+
+def _decode_batch(paths: List[str], size: int) -> Tuple[List[np.ndarray], List[str], Dict[str, str]]:
+    """
+    以缩小尺寸解码一批图片，返回各自的 (H, W) 灰度数组；长边缩到 size，保持原宽高比，长条小票不会被压扁。
+    JPEG 使用 draft 模式在解码阶段直接按 1/2、1/4、1/8 缩小，耗时取决于缩小后的尺寸而不是原始分辨率。
+    """
+    arrays = []
+    decoded = []
+    failed = {}
+    for path in paths:
+        try:
+            with Image.open(path) as img:
+                target = _fit_long_edge(*img.size, size)
+                img.draft("L", target)
+                img = img.convert("L").resize(target, Image.BILINEAR)
+                arrays.append(np.asarray(img, dtype=np.float32))
+                decoded.append(path)
+        except Exception as e:
+            failed[path] = str(e)
+    return arrays, decoded, failed
+
+
+def _score_arrays(arrays: List[np.ndarray]) -> Dict[str, np.ndarray]:
+    """尺寸相同的图片拼成一个批次计算指标（同一批扫描件通常尺寸一致），再按原顺序排回。"""
+    by_shape: Dict[Tuple[int, int], List[int]] = {}
+    for i, array in enumerate(arrays):
+        by_shape.setdefault(array.shape, []).append(i)
+    scores = {name: np.empty(len(arrays), dtype=np.float64) for name in ("white_ratio", "blur", "contrast")}
+    for indices in by_shape.values():
+        for name, values in compute_quality_metrics(np.stack([arrays[i] for i in indices])).items():
+            scores[name][indices] = values
+    return scores
+
+
+def compute_quality_metrics(batch: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    对 (N, H, W) 的灰度批次一次性计算质量指标（像素取值 0~255）:
+        white_ratio: 接近白色的像素占比，用于识别空白扫描页
+        blur: 拉普拉斯算子响应的方差，越小越模糊
+        contrast: 第 95 与第 5 百分位亮度之差
+    """
+    laplacian = (batch[:, :-2, 1:-1] + batch[:, 2:, 1:-1] + batch[:, 1:-1, :-2] + batch[:, 1:-1, 2:]
+                 - 4 * batch[:, 1:-1, 1:-1])
+    low, high = np.percentile(batch.reshape(len(batch), -1), [5, 95], axis=1)
+    return {
+        "white_ratio": (batch > 235).mean(axis=(1, 2)),
+        "blur": laplacian.var(axis=(1, 2)),
+        "contrast": high - low,
+    }
+
+
+def _screen_chunk(paths: List[str], size: int, blank_white_ratio: float,
+                  blur_threshold: float, contrast_threshold: float) -> Tuple[List[Dict], Dict[str, str]]:
+    """进程池任务：解码并评估一批图片，只把不合格的结果传回主进程。"""
+    arrays, decoded, failed = _decode_batch(paths, size)
+    if not decoded:
+        return [], failed
+
+    metrics = _score_arrays(arrays)
+    offenders = []
+    for i, path in enumerate(decoded):
+        white_ratio = float(metrics["white_ratio"][i])
+        blur = float(metrics["blur"][i])
+        contrast = float(metrics["contrast"][i])
+
+        # 空白页本身也是低对比度、无纹理的，命中空白后不再重复归类
+        if white_ratio >= blank_white_ratio or contrast < 1:
+            reason = "blank"
+        elif contrast < contrast_threshold:
+            reason = "low_contrast"
+        elif blur < blur_threshold:
+            reason = "blurry"
+        else:
+            continue
+        offenders.append({"path": path, "reason": reason, "white_ratio": round(white_ratio, 4),
+                          "blur": round(blur, 2), "contrast": round(contrast, 2)})
+    return offenders, failed
+
+
+def _move_offender(offender: Dict, source_dir: pathlib.Path, destination_dir: pathlib.Path,
+                   plan: Optional[PlanWriter], planned_targets: Set[pathlib.Path]):
+    """把一张不合格图片移到 destination_dir/<reason>/（演练时只记入计划），结果写回 offender。"""
+    old_path = pathlib.Path(offender["path"])
+    reason_dir = destination_dir / offender["reason"]
+    target_path = reason_dir / old_path.name
+
+    # 如果目标文件已存在，则在文件名后添加序号；演练时还要避开本次计划已占用的名字
+    counter = 1
+    while target_path.exists() or target_path in planned_targets:
+        target_path = reason_dir / f"{old_path.stem}({counter}){old_path.suffix}"
+        counter += 1
+    offender["target"] = str(target_path)
+
+    if plan is not None:
+        planned_targets.add(target_path)
+        plan.add(planned_operation("move", old_path, target_path))
+        print(f"[演练] 将移动: '{old_path.relative_to(source_dir)}' -> '{offender['reason']}/{target_path.name}'")
+        return
+    try:
+        reason_dir.mkdir(parents=True, exist_ok=True)
+        throttle.move(old_path, target_path)
+        print(f"已移动: '{old_path.name}' -> '{offender['reason']}/{target_path.name}'")
+    except OSError as e:
+        offender["error"] = str(e)
+        print(f"错误：移动文件 '{old_path.name}' 时失败: {e}", file=sys.stderr)
+
+
+def screen_image_quality(source_dir: pathlib.Path,
+                         destination_dir: pathlib.Path,
+                         decode_size: int = 256,
+                         blank_white_ratio: float = 0.995,
+                         blur_threshold: float = 100.0,
+                         contrast_threshold: float = 40.0,
+                         workers: Optional[int] = None,
+                         chunk_size: int = 64,
+                         dry_run: bool = True) -> Dict:
+    """
+    Recursively screens images in a source directory for blank pages, blurry photos and
+    low-contrast scans, and moves offenders to destination_dir/<reason>/.
+
+    Args:
+        source_dir: The directory to scan for images.
+        destination_dir: The directory where offenders will be moved, grouped by reason.
+        decode_size: Long-edge length of the downscaled decode used for all metrics;
+                     the aspect ratio is kept so tall receipts are not squashed.
+        blank_white_ratio: Minimum ratio of near-white pixels for a page to count as blank.
+        blur_threshold: Laplacian variance below which an image counts as blurry.
+        contrast_threshold: 5th-95th percentile brightness spread below which an image counts as low-contrast.
+        workers: Number of worker processes (defaults to the CPU count).
+        chunk_size: Number of images decoded and scored together in one batch.
+        dry_run: If True, only reports offenders without moving any files,
+                 and saves the moves as an execution plan.
+
+    Returns:
+        Counts per reason plus the id of the NDJSON report holding every offender, its metrics
+        and its (planned) destination; in dry-run mode it also carries the saved plan.
+    """
+    # --- 1. 安全性和有效性检查 ---
+    if not source_dir.is_dir():
+        raise NotADirectoryError(f"源文件夹 '{source_dir}' 不存在或不是一个有效的目录。")
+
+    print(f"正在扫描文件夹: '{source_dir}'...")
+    image_paths = sorted(str(p) for p in source_dir.rglob('*')
+                         if p.is_file() and p.suffix.lower() in IMAGE_EXTENSIONS)
+    chunks = [image_paths[i:i + chunk_size] for i in range(0, len(image_paths), chunk_size)]
+
+    # --- 2. 多进程按批解码并计算指标，每批的不合格图片随到随移动，并逐条写入报告 ---
+    metrics = worker_metrics("screen_image_quality")
+    failed: Dict[str, str] = {}
+    counts: Dict[str, int] = {}
+    planned_targets: Set[pathlib.Path] = set()
+    params = {"source_dir": source_dir, "destination_dir": destination_dir, "decode_size": decode_size,
+              "blank_white_ratio": blank_white_ratio, "blur_threshold": blur_threshold,
+              "contrast_threshold": contrast_threshold}
+    with ReportWriter() as offenders, \
+            (PlanWriter("screen_image_quality", params) if dry_run else nullcontext()) as plan:
+        if chunks:
+            with metrics.stage("decode_and_score"), ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+                futures = [pool.submit(_screen_chunk, chunk, decode_size, blank_white_ratio,
+                                       blur_threshold, contrast_threshold) for chunk in chunks]
+                for future in futures:
+                    chunk_offenders, chunk_failed = future.result()
+                    failed.update(chunk_failed)
+                    for offender in chunk_offenders:
+                        _move_offender(offender, source_dir, destination_dir, plan, planned_targets)
+                        counts[offender["reason"]] = counts.get(offender["reason"], 0) + 1
+                        offenders.write(offender)
+
+    metrics.files(len(image_paths))
+    metrics.error(len(failed))
+    print(f"扫描完成，共检查 {len(image_paths)} 张图片，发现 {offenders.rows} 张不合格，{len(failed)} 张无法解码。")
+    report = {"scanned": len(image_paths), "counts": counts, "failed": failed, "report": offenders.summary()}
+    if dry_run:
+        print(f"执行计划已保存: {plan.plan['plan_id']}")
+        report["plan"] = summarize_plan(plan.plan)
+    return report
+
+
+def main(source_folder: pathlib.Path,
+         destination_folder: pathlib.Path,
+         is_dry_run: bool):
+    """
+    主函数，用于配置和运行脚本。
+    """
+    screen_image_quality(source_folder, destination_folder, dry_run=is_dry_run)
+
+
+if __name__ == "__main__":
+    # ########################### 参数配置区 ###########################
+    IS_DRY_RUN = True
+    source_folder = pathlib.Path(r"C:\path\to\4_final_images")
+    destination_folder = pathlib.Path(r"C:\path\to\low_quality_images")
+    # ##################################################################
+
+    main(source_folder, destination_folder, is_dry_run=IS_DRY_RUN)
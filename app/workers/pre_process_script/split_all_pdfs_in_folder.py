@@ -3,12 +3,17 @@
 import fitz  # PyMuPDF
 import shutil
 from pathlib import Path
+from typing import Dict, Optional
+
+from app.core.metrics import worker_metrics
+from app.core.sharding import Shard
 
 def split_all_pdfs_in_folder(
         source_dir: Path,
         destination_dir: Path,
-        dpi: int
-):
+        dpi: int,
+        shard: Optional[Shard] = None
+) -> Optional[Dict]:
     """
     【最终正确版本】
     将一个文件夹内的所有内容（PDF和JPG）统一处理成图片格式，并输出到目标文件夹。
@@ -18,6 +23,10 @@ def split_all_pdfs_in_folder(
         source_dir (Path): 包含PDF和JPG文件的源文件夹。
         destination_dir (Path): 用于存放最终所有JPG文件的目标文件夹。
         dpi (int): PDF转JPG时的分辨率。
+        shard (Shard): 集群模式下只处理属于该分片的PDF，默认处理全部。
+
+    Returns:
+        Dict: 处理的PDF数、输出的页数以及出错的PDF。
     """
     # --- 1. 准备工作 ---
     if not source_dir.is_dir():
@@ -29,23 +38,36 @@ def split_all_pdfs_in_folder(
         print(f"[!] 错误: 无法创建目标文件夹 '{destination_dir}': {e}")
         return
 
-    pdf_files = list(source_dir.rglob("*.pdf"))
+    metrics = worker_metrics("split_all_pdfs_in_folder")
+    with metrics.stage("scan"):
+        pdf_files = [p for p in source_dir.rglob("*.pdf") if shard is None or shard.contains(p, source_dir)]
+    pages = 0
+    failed = {}
     if not pdf_files:
         print("    - 未找到PDF文件。")
     else:
         for pdf_path in pdf_files:
+            metrics.files()
+            metrics.bytes_read(pdf_path.stat().st_size)
             try:
-                with fitz.open(pdf_path) as doc:
+                with metrics.stage("pdf_file"), fitz.open(pdf_path) as doc:
                     if not doc.page_count:
                         continue
                     for page_num in range(doc.page_count):
                         page = doc.load_page(page_num)
-                        pix = page.get_pixmap(dpi=dpi)
+                        with metrics.stage("rasterize"):
+                            pix = page.get_pixmap(dpi=dpi)
                         output_filename = f"{pdf_path.stem}_page{page_num + 1}.jpg"
-                        pix.save(destination_dir / output_filename)
+                        with metrics.stage("encode"):
+                            pix.save(destination_dir / output_filename)
+                        metrics.bytes_written((destination_dir / output_filename).stat().st_size)
+                        pages += 1
             except Exception as e:
+                metrics.error()
+                failed[str(pdf_path)] = str(e)
                 print(f"    [!] 处理PDF '{pdf_path.name}' 时出错: {e}")
         print(f"    - 完成 {len(pdf_files)} 个PDF文件的转换。")
+    return {"pdfs": len(pdf_files), "pages": pages, "failed": failed}
 
 def main(source_folder: Path, destination_folder: Path, image_dpi: int):
     """主函数，用于被外部脚本调用。"""
@@ -2,6 +2,9 @@ import pathlib
 import sys
 from PIL import Image
 
+from app.core import throttle
+from app.core.profiling import span
+
 
 def find_and_move_long_images(source_dir: pathlib.Path, dest_dir: pathlib.Path, ratio_threshold: float):
     """
@@ -23,10 +26,11 @@ def find_and_move_long_images(source_dir: pathlib.Path, dest_dir: pathlib.Path,
     # 2. 递归查找源文件夹中所有的 jpg/jpeg 文件 (不区分大小写)
     print(f"开始在 '{source_dir}' 中扫描图片文件...")
     image_extensions = {".jpg", ".jpeg"}
-    image_paths = [
-        p for p in source_dir.rglob('*')
-        if p.is_file() and p.suffix.lower() in image_extensions
-    ]
+    with span("scan"):
+        image_paths = [
+            p for p in source_dir.rglob('*')
+            if p.is_file() and p.suffix.lower() in image_extensions
+        ]
 
     if not image_paths:
         print("未找到任何 .jpg 或 .jpeg 文件。")
@@ -39,7 +43,7 @@ def find_and_move_long_images(source_dir: pathlib.Path, dest_dir: pathlib.Path,
     for image_path in image_paths:
         try:
             # 使用 Pillow 打开图片并获取尺寸
-            with Image.open(image_path) as img:
+            with span("decode"), Image.open(image_path) as img:
                 width, height = img.size
 
             # 避免除以零的错误
@@ -72,7 +76,8 @@ def find_and_move_long_images(source_dir: pathlib.Path, dest_dir: pathlib.Path,
 
                 # 移动文件
                 try:
-                    image_path.rename(dest_file_path)
+                    with span("move"):
+                        throttle.move(image_path, dest_file_path)
                     print(f"    - 已成功移动到: {dest_file_path}")
                 except OSError as e:
                     print(f"    - [错误] 移动文件 '{image_path.name}' 失败: {e}", file=sys.stderr)
@@ -0,0 +1,198 @@
+# prewarm.py
+
+import importlib
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Iterable, Optional
+
+from app.core.metrics import QUEUE_DEPTH, REGISTRY, track_worker_run
+from app.core.profiling import ProfileSession, current_session, profiling_session
+from app.core.throttle import (GLOBAL_THROTTLE, child_throttle, current_throttle, enable_shared_limits,
+                               install_shared_limits, shared_slots)
+from app.workers.registry import get_worker
+
+# worker 脚本依赖的重量级第三方库，预热时导入；未安装的库直接跳过
+HEAVY_MODULES = ("fitz", "PIL.Image", "numpy", "patoolib")
+POOL_SIZE_ENV_VAR = "WORKER_POOL_SIZE"
+
+
+def import_heavy_modules(modules: Iterable[str] = HEAVY_MODULES):
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+
+
+def warm_up_in_background(modules: Iterable[str] = HEAVY_MODULES) -> threading.Thread:
+    """在服务进程里用后台线程导入重量级库：不拖慢启动，同时让第一个请求不必再等导入。"""
+    thread = threading.Thread(target=import_heavy_modules, args=(tuple(modules),),
+                              name="worker-prewarm", daemon=True)
+    thread.start()
+    return thread
+
+
+def _init_child(limits, global_slots):
+    install_shared_limits(limits, global_slots)
+    import_heavy_modules()
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _call_worker(name: str, kwargs: dict, profile: bool = False, throttle_slots=None) -> Any:
+    # 子进程一次只执行一个任务：先清零，结束后把本次任务产生的指标增量带回主进程合并
+    REGISTRY.reset()
+    with child_throttle(throttle_slots):
+        if not profile:
+            return get_worker(name)(**kwargs), REGISTRY.export_state(), None
+
+        session = ProfileSession()
+        with profiling_session(session), session.profile():
+            result = get_worker(name)(**kwargs)
+    return result, REGISTRY.export_state(), session.export()
+
+
+class PrewarmedWorkerPool:
+    """
+    预先启动、并已导入 fitz/PIL/patoolib 的 worker 进程池。
+    任务通过 worker 名称提交，在子进程里由注册表解析，主进程不需要导入 worker 模块。
+    全局限速与提交任务时所在请求的限速经共享内存传给子进程，/throttle 的修改对正在执行的任务同样生效。
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # 每重建一次执行器加一，用来判断发现进程池损坏的任务是否已经由别的任务重建过
+        self.generation = 0
+        self._restart_lock = threading.Lock()
+        # 进程池损坏后重试的任务逐个执行，见 _run_in_pool
+        self.retry_lock = threading.Lock()
+
+    def start(self):
+        # 统一使用 spawn：与 Windows 行为一致，也避免在已有线程的服务进程里 fork
+        limits = enable_shared_limits()
+        self._executor = ProcessPoolExecutor(max_workers=self.size,
+                                             mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=_init_child,
+                                             initargs=(limits, GLOBAL_THROTTLE.slots))
+        # ProcessPoolExecutor 按需创建进程，提交 size 个空任务让所有进程立即启动并完成预热
+        for future in [self._executor.submit(_ping) for _ in range(self.size)]:
+            future.result()
+
+    def submit(self, name: str, profile: bool = False, **kwargs: Any) -> Future:
+        if self._executor is None:
+            raise RuntimeError("worker 进程池尚未启动。")
+        QUEUE_DEPTH.inc(pool="prewarmed")
+        future = self._executor.submit(_call_worker, name, kwargs, profile, shared_slots(current_throttle.get()))
+        future.add_done_callback(lambda _: QUEUE_DEPTH.dec(pool="prewarmed"))
+        return future
+
+    def restart(self, generation: int):
+        """
+        有子进程异常退出（崩溃、被杀）后整个执行器都不能再用，换一个新的并重新预热。
+        generation 是任务提交时看到的代号；多个任务同时发现损坏时只重建一次，已关闭的进程池不重建。
+        """
+        with self._restart_lock:
+            if self._executor is None or generation != self.generation:
+                return
+            broken = self._executor
+            self.start()
+            self.generation += 1
+            broken.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+_pool: Optional[PrewarmedWorkerPool] = None
+_pool_lock = threading.Lock()
+
+
+def start_worker_pool(size: Optional[int] = None,
+                      cancelled: Optional[threading.Event] = None) -> Optional[PrewarmedWorkerPool]:
+    """
+    按 WORKER_POOL_SIZE 启动进程池（默认 2，设为 0 则不启用）。
+    在后台线程里启动时传入 cancelled：启动期间服务已经停止（cancelled 已置位）的，启动完成后立即关闭，不会遗留进程。
+    """
+    global _pool
+    if size is None:
+        size = int(os.environ.get(POOL_SIZE_ENV_VAR, "2"))
+    if size <= 0 or (cancelled is not None and cancelled.is_set()):
+        return None
+    pool = PrewarmedWorkerPool(size)
+    pool.start()
+    with _pool_lock:
+        if cancelled is not None and cancelled.is_set():
+            pool.shutdown()
+            return None
+        _pool = pool
+    return pool
+
+
+def stop_worker_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def current_pool() -> Optional[PrewarmedWorkerPool]:
+    return _pool
+
+
+def _submit_once(pool: PrewarmedWorkerPool, name: str, profile: bool, kwargs: dict):
+    """提交并等待一个任务；进程池已损坏时重建，再抛出 BrokenProcessPool。"""
+    generation = pool.generation
+    try:
+        return pool.submit(name, profile=profile, **kwargs).result()
+    except BrokenProcessPool:
+        pool.restart(generation)
+        raise
+
+
+def _run_in_pool(pool: PrewarmedWorkerPool, name: str, profile: bool, kwargs: dict):
+    """
+    在预热进程池中执行一个任务。某个子进程异常退出时，同一时刻在池中执行的任务都会收到 BrokenProcessPool，
+    分不清是谁导致的：重建进程池后每个任务各重试一次。重试逐个进行，导致崩溃的任务重试时再次打坏进程池，
+    不会连累同一批里正常的任务；它第二次失败后只让它自己报错，进程池照样重建好留给后面的任务。
+    """
+    try:
+        return _submit_once(pool, name, profile, kwargs)
+    except BrokenProcessPool:
+        print(f"[进程池] 执行 '{name}' 时有 worker 进程异常退出，已重建进程池，稍后重试一次。", file=sys.stderr)
+    with pool.retry_lock:
+        try:
+            return _submit_once(pool, name, profile, kwargs)
+        except BrokenProcessPool:
+            raise RuntimeError(f"worker '{name}' 的进程连续两次异常退出，已重建进程池。") from None
+
+
+def execute_worker(name: str, in_pool: bool = True, **kwargs: Any) -> Any:
+    """
+    in_pool 且进程池已就绪时在预热进程中执行，否则（IO 型任务、未启用或仍在启动中）在当前进程执行。
+    一般经 app.workers.scheduler.run_worker 调用，由调度器负责限流与路径锁。
+    """
+    session = current_session()
+    with track_worker_run(name):
+        pool = _pool
+        if in_pool and pool is not None:
+            submitted = time.perf_counter()
+            result, metric_state, profile = _run_in_pool(pool, name, session is not None, kwargs)
+            REGISTRY.merge_state(metric_state)
+            if session is not None:
+                session.merge_child(profile, submitted - session.started)
+            return result
+        if session is None:
+            return get_worker(name)(**kwargs)
+        with session.profile():
+            return get_worker(name)(**kwargs)
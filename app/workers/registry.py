@@ -0,0 +1,121 @@
+# registry.py
+
+import ast
+import importlib
+import inspect
+import pathlib
+import threading
+from typing import Any, Callable, Dict, List
+
+from app.core.metrics import track_worker_run
+from app.core.profiling import current_session
+
+WORKERS_DIR = pathlib.Path(__file__).resolve().parent
+WORKERS_PACKAGE = "app.workers"
+# 这些文件只放模型或框架代码，不算 worker 脚本
+_SKIP_FILES = {"__init__.py", "schemas.py", "registry.py", "prewarm.py", "scheduler.py"}
+
+
+def _module_name(path: pathlib.Path) -> str:
+    relative = path.relative_to(WORKERS_DIR).with_suffix("")
+    return ".".join((WORKERS_PACKAGE,) + relative.parts)
+
+
+def discover_workers() -> Dict[str, List[str]]:
+    """
+    只解析源码（ast），不导入任何模块，找出 app/workers/ 下每个脚本的公开顶层函数。
+    返回 {函数名: [定义它的模块名, ...]}。
+    """
+    found: Dict[str, List[str]] = {}
+    for path in sorted(WORKERS_DIR.rglob("*.py")):
+        if path.name in _SKIP_FILES or "__pycache__" in path.parts:
+            continue
+        try:
+            tree = ast.parse(path.read_bytes(), filename=str(path))
+        except SyntaxError:
+            continue
+        for node in tree.body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) \
+                    and not node.name.startswith("_") and node.name != "main":
+                found.setdefault(node.name, []).append(_module_name(path))
+    return found
+
+
+class WorkerRegistry:
+    """
+    worker 函数的懒加载注册表：启动时只扫描源码，第一次调用某个 worker 时才导入它的模块，
+    fitz、PIL、patoolib 等重量级依赖因此不会在服务启动时加载。
+    """
+
+    def __init__(self):
+        self._index: Dict[str, List[str]] = {}
+        self._resolved: Dict[str, Callable] = {}
+        self._lock = threading.Lock()
+        self._discovered = False
+
+    def _ensure_discovered(self):
+        if not self._discovered:
+            with self._lock:
+                if not self._discovered:
+                    self._index = discover_workers()
+                    self._discovered = True
+
+    def names(self) -> Dict[str, List[str]]:
+        self._ensure_discovered()
+        return dict(self._index)
+
+    def module_of(self, name: str) -> str:
+        """name 可以是函数名，也可以是 "模块名:函数名"（函数名重复时必须这样写）。"""
+        if ":" in name:
+            return name.split(":", 1)[0]
+        self._ensure_discovered()
+        modules = self._index.get(name)
+        if not modules:
+            raise KeyError(f"未找到名为 '{name}' 的 worker。")
+        if len(modules) > 1:
+            raise KeyError(f"worker '{name}' 在多个模块中定义: {modules}，请使用 '模块名:函数名'。")
+        return modules[0]
+
+    def get(self, name: str) -> Callable:
+        func = self._resolved.get(name)
+        if func is None:
+            module_name = self.module_of(name)
+            func_name = name.split(":", 1)[1] if ":" in name else name
+            func = getattr(importlib.import_module(module_name), func_name)
+            self._resolved[name] = func
+        return func
+
+    def lazy(self, name: str) -> Callable:
+        """返回一个代理函数，第一次被调用时才导入真正的 worker，每次调用都记录耗时与结果。"""
+        worker = name.rsplit(":", 1)[-1]
+
+        async def _track_coroutine(coroutine):
+            with track_worker_run(worker):
+                return await coroutine
+
+        def _call(*args: Any, **kwargs: Any) -> Any:
+            func = self.get(name)
+            if inspect.iscoroutinefunction(func):
+                return _track_coroutine(func(*args, **kwargs))
+            session = current_session()
+            with track_worker_run(worker):
+                if session is None:
+                    return func(*args, **kwargs)
+                # 仅在本次请求开启了分析时才挂上 cProfile
+                with session.profile():
+                    return func(*args, **kwargs)
+
+        _call.__name__ = worker
+        _call.__qualname__ = _call.__name__
+        return _call
+
+
+registry = WorkerRegistry()
+
+
+def get_worker(name: str) -> Callable:
+    return registry.get(name)
+
+
+def lazy_worker(name: str) -> Callable:
+    return registry.lazy(name)
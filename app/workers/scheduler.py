@@ -0,0 +1,369 @@
+# scheduler.py
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import pathlib
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.core.metrics import QUEUE_DEPTH, SCHEDULER_WAIT
+from app.core.thumbnails import output_folders, pregenerate, pregenerate_enabled
+from app.workers.prewarm import current_pool, execute_worker
+from app.workers.registry import lazy_worker
+
+CPU = "cpu"
+IO = "io"
+# 以解码、栅格化、哈希计算为主的 worker 走 CPU 槽位（在预热进程池中执行），其余按 IO 处理
+WORKER_RESOURCES = {
+    "decompress_recursively": CPU,
+    "split_all_pdfs_in_folder": CPU,
+    "fused_pre_process": CPU,
+    "normalize_images": CPU,
+    "screen_image_quality": CPU,
+    "detect_near_duplicates": CPU,
+}
+# CPU 型 worker 内部再开进程池时用来控制进程数的参数；调度器按 cpu_fanout() 传入，使 CPU 槽位 × 进程数不超过核数
+CPU_FANOUT_PARAMS = {
+    "fused_pre_process": "workers",
+    "normalize_images": "workers",
+    "screen_image_quality": "workers",
+    "detect_near_duplicates": "workers",
+}
+CPU_SLOTS_ENV_VAR = "SCHEDULER_CPU_SLOTS"
+IO_SLOTS_ENV_VAR = "SCHEDULER_IO_SLOTS_PER_DEVICE"
+# 同时排队等待、占着请求线程的任务上限；超出时立即拒绝，而不是让请求线程池被排队的任务占满
+MAX_WAITING_ENV_VAR = "SCHEDULER_MAX_WAITING"
+DEFAULT_MAX_WAITING = 16
+# 名称里带这些词的参数视为路径，用于推断要加锁的文件夹
+_PATH_KEYWORDS = ("dir", "folder", "path")
+# 缓存与状态文件不是任务处理的数据，由各自的文件锁保护；对它们加路径锁只会让共用同一缓存的任务互相排队
+_UNLOCKED_PARAMS = {"cache_dir", "hash_file"}
+# 后台预生成缩略图的优先级，低于请求的默认优先级 0，不会挡住任何请求
+THUMBNAIL_PRIORITY = -100
+
+current_priority: contextvars.ContextVar[int] = contextvars.ContextVar("scheduler_priority", default=0)
+
+
+class SchedulerBusy(RuntimeError):
+    """排队等待的任务已达上限。"""
+
+
+def resource_of(name: str) -> str:
+    return WORKER_RESOURCES.get(name.rsplit(":", 1)[-1], IO)
+
+
+def _normalize(path) -> str:
+    return os.path.normcase(os.path.abspath(os.fspath(path)))
+
+
+def infer_paths(kwargs: Dict[str, Any]) -> List[str]:
+    """
+    从 worker 参数中找出源/目标路径：pathlib.Path，或参数名含 dir/folder/path 的字符串及其字典值；
+    _UNLOCKED_PARAMS 中的缓存/状态路径不算。
+    """
+    paths = []
+    for key, value in kwargs.items():
+        if key in _UNLOCKED_PARAMS:
+            continue
+        is_path_key = any(word in key.lower() for word in _PATH_KEYWORDS)
+        if isinstance(value, pathlib.PurePath):
+            paths.append(_normalize(value))
+        elif is_path_key and isinstance(value, str) and value:
+            paths.append(_normalize(value))
+        elif is_path_key and isinstance(value, dict):
+            paths.extend(_normalize(v) for v in value.values() if isinstance(v, (str, pathlib.PurePath)) and v)
+    return paths
+
+
+def device_of(path: str) -> str:
+    """路径所在的设备（盘符/挂载点），取最近一个已存在的上级目录的 st_dev。"""
+    current = pathlib.Path(path)
+    while True:
+        try:
+            return str(os.stat(current).st_dev)
+        except OSError:
+            if current.parent == current:
+                return current.anchor or path
+            current = current.parent
+
+
+def _overlaps(a: str, b: str) -> bool:
+    return a == b or a.startswith(b.rstrip(os.sep) + os.sep) or b.startswith(a.rstrip(os.sep) + os.sep)
+
+
+class _Job:
+    __slots__ = ("seq", "name", "fn", "resource", "priority", "paths", "exclusive", "devices",
+                 "future", "context", "submitted", "started", "blocking")
+
+    def __init__(self, seq: int, name: str, fn: Callable[[], Any], resource: str, priority: int,
+                 paths: List[str], exclusive: bool, blocking: bool = False):
+        self.seq = seq
+        self.blocking = blocking
+        self.name = name
+        self.fn = fn
+        self.resource = resource
+        self.priority = priority
+        self.paths = paths
+        self.exclusive = exclusive
+        self.devices = sorted({device_of(p) for p in paths}) if resource == IO else []
+        self.future: Future = Future()
+        self.context = contextvars.copy_context()
+        self.submitted = time.perf_counter()
+        self.started: Optional[float] = None
+
+    def sort_key(self) -> Tuple[int, int]:
+        # 优先级高的先执行，同优先级先到先执行
+        return -self.priority, self.seq
+
+    def __lt__(self, other: "_Job") -> bool:
+        return self.sort_key() < other.sort_key()
+
+    def describe(self) -> Dict:
+        return {"name": self.name, "resource": self.resource, "priority": self.priority,
+                "paths": self.paths, "exclusive": self.exclusive, "devices": self.devices}
+
+
+class JobScheduler:
+    """
+    按资源类型调度 worker 任务：
+        - CPU 型任务占用 CPU 槽位（默认等于预热进程池大小），在预热进程池中执行；
+        - IO 型任务按所在设备限流，每个盘/挂载点同时最多 io_slots_per_device 个；
+        - 优先级高的任务先执行，同优先级先到先执行；
+        - 任务开始前一次性获取源/目标路径上的咨询锁：有修改的任务独占，演练（dry_run）任务共享，
+          父子目录视为重叠，因此两个工作流不会同时移动同一个文件夹。
+    资源不满足的任务留在队列中，不影响后面可以执行的任务；但排队中的独占任务会挡住
+    排在它后面、路径重叠的任务，源源不断的共享任务不会让它永远等下去。
+    调用方阻塞等待的任务（blocking=True）排队数量超过 max_waiting 时直接抛出 SchedulerBusy。
+    """
+
+    def __init__(self, cpu_slots: Optional[int] = None, io_slots_per_device: Optional[int] = None,
+                 max_threads: int = 32, max_waiting: Optional[int] = None):
+        self._cpu_slots = cpu_slots
+        self.io_slots_per_device = io_slots_per_device or int(os.environ.get(IO_SLOTS_ENV_VAR, "2"))
+        self.max_waiting = max_waiting or int(os.environ.get(MAX_WAITING_ENV_VAR, DEFAULT_MAX_WAITING))
+        self._executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix="scheduler")
+        self._lock = threading.Lock()
+        self._queue: List[_Job] = []
+        self._running: Dict[int, _Job] = {}
+        self._cpu_running = 0
+        self._io_running: Dict[str, int] = {}
+        self._seq = itertools.count()
+
+    @property
+    def cpu_slots(self) -> int:
+        if self._cpu_slots:
+            return self._cpu_slots
+        configured = os.environ.get(CPU_SLOTS_ENV_VAR)
+        if configured:
+            return int(configured)
+        pool = current_pool()
+        return pool.size if pool is not None else max(1, (os.cpu_count() or 2) // 2)
+
+    def submit(self, name: str, fn: Callable[[], Any], resource: Optional[str] = None,
+               priority: Optional[int] = None, paths: Iterable = (), exclusive: bool = True,
+               blocking: bool = False) -> Future:
+        job = _Job(next(self._seq), name, fn, resource or resource_of(name),
+                   current_priority.get() if priority is None else priority,
+                   sorted({_normalize(p) for p in paths}), exclusive, blocking)
+        with self._lock:
+            heapq.heappush(self._queue, job)
+            QUEUE_DEPTH.inc(pool=f"scheduler_{job.resource}")
+            self._dispatch_locked()
+            if job.blocking and job.started is None \
+                    and sum(1 for queued in self._queue if queued.blocking) > self.max_waiting:
+                self._queue.remove(job)
+                heapq.heapify(self._queue)
+                QUEUE_DEPTH.dec(pool=f"scheduler_{job.resource}")
+                # 它刚才作为排队的独占任务可能挡住了别的任务，撤下后重新分派一次
+                self._dispatch_locked()
+                raise SchedulerBusy(f"已有 {self.max_waiting} 个任务在排队，请稍后重试。")
+        return job.future
+
+    def _can_start(self, job: _Job, waiting_exclusive: List[_Job]) -> bool:
+        if job.resource == CPU and self._cpu_running >= self.cpu_slots:
+            return False
+        if any(self._io_running.get(device, 0) >= self.io_slots_per_device for device in job.devices):
+            return False
+        for running in self._running.values():
+            if not (job.exclusive or running.exclusive):
+                continue
+            if any(_overlaps(a, b) for a in job.paths for b in running.paths):
+                return False
+        # 排在前面（优先级更高或相同且先到）的独占任务还在等，路径重叠的任务不能插队
+        for waiting in waiting_exclusive:
+            if any(_overlaps(a, b) for a in job.paths for b in waiting.paths):
+                return False
+        return True
+
+    def _dispatch_locked(self):
+        started = []
+        waiting_exclusive: List[_Job] = []
+        for job in sorted(self._queue):
+            if self._can_start(job, waiting_exclusive):
+                self._start_locked(job)
+                started.append(job)
+            elif job.exclusive and job.paths:
+                waiting_exclusive.append(job)
+        if started:
+            self._queue = [job for job in self._queue if job not in started]
+            heapq.heapify(self._queue)
+
+    def _start_locked(self, job: _Job):
+        job.started = time.perf_counter()
+        self._running[job.seq] = job
+        if job.resource == CPU:
+            self._cpu_running += 1
+        for device in job.devices:
+            self._io_running[device] = self._io_running.get(device, 0) + 1
+        SCHEDULER_WAIT.observe(job.started - job.submitted, resource=job.resource)
+        self._executor.submit(self._run, job)
+
+    def _run(self, job: _Job):
+        try:
+            result = job.context.run(job.fn)
+        except BaseException as e:
+            job.future.set_exception(e)
+        else:
+            job.future.set_result(result)
+        finally:
+            with self._lock:
+                del self._running[job.seq]
+                if job.resource == CPU:
+                    self._cpu_running -= 1
+                for device in job.devices:
+                    self._io_running[device] -= 1
+                QUEUE_DEPTH.dec(pool=f"scheduler_{job.resource}")
+                self._dispatch_locked()
+
+    def status(self) -> Dict:
+        with self._lock:
+            now = time.perf_counter()
+            return {
+                "cpu_slots": self.cpu_slots,
+                "cpu_running": self._cpu_running,
+                "io_slots_per_device": self.io_slots_per_device,
+                "io_running": dict(self._io_running),
+                "max_waiting": self.max_waiting,
+                "cpu_fanout": cpu_fanout(),
+                "running": [dict(job.describe(), seconds=round(now - job.started, 3))
+                            for job in self._running.values()],
+                "queued": [dict(job.describe(), waiting=round(now - job.submitted, 3))
+                           for job in sorted(self._queue)],
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_scheduler: Optional[JobScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> JobScheduler:
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = JobScheduler()
+    return _scheduler
+
+
+def cpu_fanout(requested: Optional[int] = None) -> int:
+    """CPU 型任务内部进程池的进程数：核数按 CPU 槽位平分，requested 更大时也截到这个预算。"""
+    budget = max(1, (os.cpu_count() or 1) // get_scheduler().cpu_slots)
+    return min(requested, budget) if requested else budget
+
+
+def run_scheduled(name: str, fn: Callable[[], Any], paths: Iterable = (), exclusive: bool = True,
+                  resource: Optional[str] = None, priority: Optional[int] = None) -> Any:
+    """
+    把任意任务交给调度器并等待结果；优先级默认取本次请求的 X-Priority。
+    排队等待的任务已达上限时抛出 SchedulerBusy（接口返回 503）。
+    """
+    return get_scheduler().submit(name, fn, resource=resource, priority=priority,
+                                  paths=paths, exclusive=exclusive, blocking=True).result()
+
+
+def run_worker(name: str, **kwargs: Any) -> Any:
+    """
+    经调度器执行 worker：按 WORKER_RESOURCES 分类，路径锁从参数中推断，dry_run=True 时只加共享锁。
+    实际执行仍由预热进程池（CPU 型）或当前进程（IO 型）完成；CPU 型 worker 的内部进程数按 cpu_fanout() 限制。
+    """
+    resource = resource_of(name)
+    fanout_param = CPU_FANOUT_PARAMS.get(name)
+    if fanout_param is not None:
+        kwargs[fanout_param] = cpu_fanout(kwargs.get(fanout_param))
+    result = run_scheduled(name, lambda: execute_worker(name, in_pool=resource == CPU, **kwargs),
+                           paths=infer_paths(kwargs), exclusive=kwargs.get("dry_run") is not True,
+                           resource=resource)
+    if kwargs.get("dry_run") is not True:
+        pregenerate_thumbnails(name, kwargs)
+    return result
+
+
+async def run_worker_async(name: str, **kwargs: Any) -> Any:
+    """
+    经调度器执行协程型 worker（例如 classify_directory，它的微批处理器跑在服务的事件循环里，不能换到别的线程）。
+    调度器分到槽位、拿到路径锁后才开始执行协程，协程结束前一直占着；资源分类与路径锁的推断同 run_worker。
+    占位期间会占用调度器的一个线程。
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.create_future()
+    finished = threading.Event()
+
+    def hold():
+        loop.call_soon_threadsafe(lambda: started.done() or started.set_result(None))
+        finished.wait()
+
+    dry_run = kwargs.get("dry_run") is True
+    get_scheduler().submit(name, hold, paths=infer_paths(kwargs), exclusive=not dry_run, blocking=True)
+    try:
+        await started
+        result = await lazy_worker(name)(**kwargs)
+    finally:
+        # 请求在排队时被取消的，轮到它时立即释放
+        finished.set()
+    if not dry_run:
+        pregenerate_thumbnails(name, kwargs)
+    return result
+
+
+_pregenerating: Set[str] = set()
+_pregenerating_lock = threading.Lock()
+
+
+def pregenerate_thumbnails(name: str, params: Dict[str, Any]) -> List[Future]:
+    """
+    流水线阶段实际执行完后，把它产出图片的文件夹交给调度器在后台预生成缩略图，不等待结果。
+    以最低优先级占用 CPU 槽位，只加共享锁，正在修改该文件夹的任务结束后才开始；
+    同一个文件夹已在排队时不重复提交。设置环境变量 THUMBNAIL_PREGENERATE=0 可关闭。
+    """
+    if not pregenerate_enabled():
+        return []
+    futures = []
+    for folder in output_folders(name, params):
+        key = _normalize(folder)
+        with _pregenerating_lock:
+            if key in _pregenerating:
+                continue
+            _pregenerating.add(key)
+
+        def run(folder=folder, key=key):
+            # 开始执行就移出集合：执行期间又有文件写入时，可以再排一次
+            with _pregenerating_lock:
+                _pregenerating.discard(key)
+            try:
+                return pregenerate(folder, workers=cpu_fanout())
+            except Exception as e:
+                print(f"[缩略图] 预生成 '{folder}' 失败: {e}", file=sys.stderr)
+                raise
+
+        futures.append(get_scheduler().submit("pregenerate_thumbnails", run, resource=CPU,
+                                              priority=THUMBNAIL_PRIORITY, paths=[folder], exclusive=False))
+    return futures
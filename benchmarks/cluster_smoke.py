@@ -0,0 +1,108 @@
+# benchmarks/cluster_smoke.py
+"""
+在本机启动几个 uvicorn 进程充当工作节点，经第一个节点的 /cluster/run 分片执行 dedupe_files（演练），
+检查合并后的统计与单机执行一致，并打印各分片的节点、尝试次数与耗时。
+各节点共用本机文件系统，满足“各节点能以相同路径访问源/目标文件夹”的要求。
+
+用法:
+    python -m benchmarks.cluster_smoke                          # 3 个节点，临时生成的小数据集
+    python -m benchmarks.cluster_smoke --nodes 4 --shards 8 --kill-one
+    python -m benchmarks.cluster_smoke --source D:\\bench_ws\\mixed
+"""
+
+import argparse
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List
+
+import httpx
+
+from app.workers.pre_process_script.dedupe_files import dedupe_files
+
+BASE_PORT = 8101
+STARTUP_TIMEOUT = 60
+
+
+def _make_source(root: pathlib.Path, files: int = 300) -> pathlib.Path:
+    """每 4 个文件内容相同，分散在不同子文件夹里。"""
+    for i in range(files):
+        folder = root / f"d{i % 7}"
+        folder.mkdir(parents=True, exist_ok=True)
+        (folder / f"{i}.bin").write_bytes(f"content-{i % (files // 4)}".encode() * 64)
+    return root
+
+
+def _start_nodes(count: int, state_dir: pathlib.Path) -> List[subprocess.Popen]:
+    processes = []
+    for i in range(count):
+        # 每个节点的计划、报告放在各自的目录里，与分开部署时一样只能经 HTTP 拉取
+        env = dict(os.environ, PLAN_DIR=str(state_dir / f"node{i}" / "plans"),
+                   REPORT_DIR=str(state_dir / f"node{i}" / "reports"), WORKER_POOL_SIZE="0")
+        processes.append(subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app",
+                                           "--port", str(BASE_PORT + i), "--log-level", "warning"], env=env))
+    return processes
+
+
+def _wait_ready(nodes: List[str]):
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    for node in nodes:
+        while True:
+            try:
+                httpx.get(f"{node}/metrics", timeout=2).raise_for_status()
+                break
+            except httpx.HTTPError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"节点 {node} 在 {STARTUP_TIMEOUT} 秒内没有就绪。")
+                time.sleep(0.5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=3, help="启动的工作节点数")
+    parser.add_argument("--shards", type=int, default=None, help="分片数，默认等于节点数")
+    parser.add_argument("--source", default=None, help="要去重的文件夹，默认临时生成")
+    parser.add_argument("--kill-one", action="store_true", help="发起前停掉最后一个节点，验证失败分片换节点重试")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="cluster-smoke-") as tmp:
+        tmp_path = pathlib.Path(tmp)
+        source = pathlib.Path(args.source) if args.source else _make_source(tmp_path / "source")
+        destination = tmp_path / "duplicates"
+        nodes = [f"http://127.0.0.1:{BASE_PORT + i}" for i in range(args.nodes)]
+        processes = _start_nodes(args.nodes, tmp_path / "state")
+        try:
+            _wait_ready(nodes)
+            if args.kill_one:
+                processes[-1].terminate()
+                processes[-1].wait()
+
+            expected = dedupe_files(source, destination, use_cache=False, dry_run=True)["duplicate_count"]
+            response = httpx.post(f"{nodes[0]}/cluster/run", timeout=None, json={
+                "worker": "dedupe_files",
+                "params": {"source_dir": str(source), "destination_dir": str(destination),
+                           "use_cache": False, "dry_run": True},
+                "nodes": nodes, "shards": args.shards})
+            response.raise_for_status()
+            body = response.json()
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.wait()
+
+    report = body["details"] or {}
+    for run in report.get("runs", []):
+        print(f"  分片 {run['index']}: {run['node']}  尝试 {run['attempts']} 次  {run['seconds']} s  {run['errors']}")
+    actual = report.get("results", {}).get("duplicate_count")
+    print(f"{body['status']}: {body['message']}")
+    print(f"重复副本: 集群 {actual}，单机 {expected}")
+    if body["status"] != "success" or actual != expected:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+# benchmarks/loadgen.py
+"""
+在进程内用 httpx.ASGITransport 直接驱动 app.main:app 的并发压测，不经过网络和 uvicorn。
+报告每类请求与整体的 p50/p95/p99 延迟、吞吐，以及事件循环被阻塞的时间；
+可以与保存的基线比较，尾延迟上涨超过容差时以退出码 1 结束。
+
+所有请求都是只读或演练模式（dry_run），同一个合成工作区可以反复压测。
+
+用法:
+    python -m benchmarks.synthetic_workspace D:\\bench_ws
+    python -m benchmarks.loadgen D:\\bench_ws --concurrency 32 --duration 30
+    python -m benchmarks.loadgen D:\\bench_ws --mix shard_record=10,metrics=5,dedupe=1
+    python -m benchmarks.loadgen D:\\bench_ws --write-baseline
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import os
+import pathlib
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import httpx
+
+from benchmarks.synthetic_workspace import load_manifest
+
+DEFAULT_BASELINE = pathlib.Path(__file__).resolve().parent / "load_baseline.json"
+LAG_INTERVAL = 0.01
+
+
+class LoadContext(NamedTuple):
+    workspace: pathlib.Path
+    shards_dir: pathlib.Path
+    record_count: int
+
+
+class LoadScenario(NamedTuple):
+    name: str
+    method: str
+    # (上下文, 随机数发生器) -> httpx 请求参数 (url/json/params/headers)
+    build: Callable[[LoadContext, random.Random], Dict]
+    weight: float
+
+
+SCENARIOS: List[LoadScenario] = [
+    LoadScenario("metrics", "GET", lambda ctx, rng: {"url": "/metrics"}, 5),
+    LoadScenario("shard_info", "GET",
+                 lambda ctx, rng: {"url": "/train_val_test/shards/info", "params": {"shards_dir": str(ctx.shards_dir)}}, 5),
+    LoadScenario("shard_record", "GET",
+                 lambda ctx, rng: {"url": "/train_val_test/shards/record",
+                                   "params": {"shards_dir": str(ctx.shards_dir), "index": rng.randrange(ctx.record_count)}}, 20),
+    LoadScenario("shard_record_range", "GET",
+                 lambda ctx, rng: {"url": "/train_val_test/shards/record",
+                                   "params": {"shards_dir": str(ctx.shards_dir), "index": rng.randrange(ctx.record_count)},
+                                   "headers": {"Range": "bytes=0-1023"}}, 10),
+    LoadScenario("pack_shards_plan", "POST",
+                 lambda ctx, rng: {"url": "/train_val_test/pack_shards",
+                                   "json": {"split_dirs": {"train": str(ctx.workspace / "images")},
+                                            "destination_path": str(ctx.shards_dir.parent / "plan"), "dry_run": True}}, 2),
+    LoadScenario("split_train_val_plan", "POST",
+                 lambda ctx, rng: {"url": "/train_val_test/split_train_val",
+                                   "json": {"source_path": str(ctx.workspace / "images"),
+                                            "train_path": str(ctx.shards_dir.parent / "train"),
+                                            "valid_path": str(ctx.shards_dir.parent / "valid"), "dry_run": True}}, 2),
+    LoadScenario("rename_folders_plan", "POST",
+                 lambda ctx, rng: {"url": "/pre_process/batch_rename_folders",
+                                   "json": {"source_path": str(ctx.workspace / "mixed"),
+                                            "operations": [{"op": "swap", "index": 0, "index2": 1}], "dry_run": True}}, 2),
+    LoadScenario("dedupe", "POST",
+                 lambda ctx, rng: {"url": "/pre_process/dedupe_files",
+                                   "json": {"source_path": str(ctx.workspace / "mixed"),
+                                            "destination_path": str(ctx.shards_dir.parent / "dupes"),
+                                            "use_cache": False, "dry_run": True}}, 1),
+    LoadScenario("classify", "POST",
+                 lambda ctx, rng: {"url": "/classify_jpg/classify",
+                                   "json": {"source_directory": str(ctx.workspace / "eval_images"),
+                                            "output_directory": str(ctx.shards_dir.parent / "classified"),
+                                            "dry_run": True}}, 1),
+]
+
+
+def _percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """最近秩法百分位数，q 取 0~100。"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def _latency_summary(latencies: List[float]) -> Dict:
+    values = sorted(latencies)
+    return {f"p{q}_ms": round(_percentile(values, q) * 1000, 2) if values else None for q in (50, 95, 99)} | {
+        "max_ms": round(values[-1] * 1000, 2) if values else None}
+
+
+class EventLoopLagMonitor:
+    """
+    每隔 interval 秒醒来一次，实际醒来时间比预期晚的部分就是事件循环被阻塞的时间
+    （async 接口里的同步 IO、CPU 计算都会体现在这里）。客户端与服务共用同一个事件循环，
+    所以结果也包含压测客户端自身的开销，适合前后对比，不代表绝对值。
+    """
+
+    def __init__(self, interval: float = LAG_INTERVAL):
+        self.interval = interval
+        self.lags: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - expected))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+
+    def summary(self) -> Dict:
+        values = sorted(self.lags)
+        return {"samples": len(values),
+                "blocked_ms": round(sum(values) * 1000, 1),
+                "p99_ms": round(_percentile(values, 99) * 1000, 2) if values else None,
+                "max_ms": round(values[-1] * 1000, 2) if values else None}
+
+
+def parse_mix(text: Optional[str]) -> Dict[str, float]:
+    """"shard_record=10,metrics=5" -> {名称: 权重}；为空时使用每个场景的默认权重。"""
+    if not text:
+        return {s.name: s.weight for s in SCENARIOS}
+    known = {s.name for s in SCENARIOS}
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in known:
+            raise ValueError(f"未知的场景 '{name}'，可选: {sorted(known)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def prepare_context(workspace: pathlib.Path, scratch: pathlib.Path) -> LoadContext:
+    """压测前（不计时）把 images/ 打包成分片，供读取分片的场景使用。"""
+    from app.workers.registry import get_worker
+
+    shards_dir = scratch / "shards"
+    with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+        index = get_worker("pack_dataset_shards")(split_dirs={"train": str(workspace / "images")},
+                                                  output_dir=str(shards_dir), dry_run=False)
+    record_count = sum(split["records"] for split in index["splits"].values())
+    return LoadContext(workspace, shards_dir, record_count)
+
+
+async def run_load(context: LoadContext, mix: Dict[str, float], concurrency: int,
+                   duration: Optional[float], total_requests: Optional[int], warmup: int, seed: int) -> Dict:
+    from app.main import app
+
+    scenarios = [s for s in SCENARIOS if mix.get(s.name)]
+    weights = [mix[s.name] for s in scenarios]
+    rng = random.Random(seed)
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    issued = 0
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as client:
+
+            async def send(scenario: LoadScenario) -> Optional[float]:
+                start = time.perf_counter()
+                try:
+                    response = await client.request(scenario.method, **scenario.build(context, rng))
+                    failed = response.status_code >= 400
+                    if not failed and response.headers.get("content-type", "").startswith("application/json"):
+                        # StatusResponse 类接口出错时仍返回 200，需看 status 字段
+                        body = response.json()
+                        failed = isinstance(body, dict) and body.get("status") == "error"
+                except Exception:
+                    failed = True
+                elapsed = time.perf_counter() - start
+                return None if failed else elapsed
+
+            # 预热：触发 worker 模块的懒加载与各接口的首次初始化，不计入结果
+            for scenario in scenarios:
+                for _ in range(warmup):
+                    await send(scenario)
+
+            deadline = time.perf_counter() + duration if duration else None
+
+            def next_scenario() -> Optional[LoadScenario]:
+                nonlocal issued
+                if total_requests is not None and issued >= total_requests:
+                    return None
+                if deadline is not None and time.perf_counter() >= deadline:
+                    return None
+                issued += 1
+                return rng.choices(scenarios, weights)[0]
+
+            async def client_loop():
+                # 闭环客户端：每个虚拟用户收到响应后立即发下一个请求
+                while (scenario := next_scenario()) is not None:
+                    elapsed = await send(scenario)
+                    if elapsed is None:
+                        errors[scenario.name] += 1
+                    else:
+                        latencies[scenario.name].append(elapsed)
+
+            monitor = EventLoopLagMonitor()
+            monitor.start()
+            started = time.perf_counter()
+            await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+            wall = time.perf_counter() - started
+            await monitor.stop()
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    scenarios_report = {
+        s.name: {"requests": len(latencies[s.name]), "errors": errors[s.name], **_latency_summary(latencies[s.name])}
+        for s in scenarios}
+    return {
+        "overall": {"requests": len(all_latencies), "errors": sum(errors.values()),
+                    "seconds": round(wall, 3),
+                    "throughput_rps": round(len(all_latencies) / wall, 2) if wall else None,
+                    **_latency_summary(all_latencies)},
+        "scenarios": scenarios_report,
+        "event_loop_lag": monitor.summary(),
+    }
+
+
+def compare_with_baseline(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """p95/p99 高于基线 (1 + tolerance) 倍、吞吐低于 (1 - tolerance) 倍即视为回退。"""
+    regressions = []
+    pairs = [("overall", report["overall"], baseline.get("overall", {}))]
+    pairs += [(name, current, baseline.get("scenarios", {}).get(name, {})) for name, current in report["scenarios"].items()]
+    for name, current, previous in pairs:
+        for key in ("p95_ms", "p99_ms"):
+            if previous.get(key) and current.get(key) is not None and current[key] > previous[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {previous[key]} -> {current[key]}")
+    previous_rps = baseline.get("overall", {}).get("throughput_rps")
+    current_rps = report["overall"]["throughput_rps"]
+    if previous_rps and current_rps is not None and current_rps < previous_rps * (1 - tolerance):
+        regressions.append(f"overall: throughput_rps {previous_rps} -> {current_rps}")
+    return regressions
+
+
+def _print_report(report: Dict):
+    print(f"{'scenario':<22} {'req':>7} {'err':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    rows = list(report["scenarios"].items()) + [("overall", report["overall"])]
+    for name, row in rows:
+        cells = [f"{row[key]:>9.2f}" if row[key] is not None else f"{'-':>9}"
+                 for key in ("p50_ms", "p95_ms", "p99_ms", "max_ms")]
+        print(f"{name:<22} {row['requests']:>7} {row['errors']:>5} " + " ".join(cells))
+    overall, lag = report["overall"], report["event_loop_lag"]
+    print(f"\n吞吐: {overall['throughput_rps']} req/s（{overall['seconds']} 秒）")
+    print(f"事件循环阻塞: 共 {lag['blocked_ms']} ms，p99 {lag['p99_ms']} ms，最大 {lag['max_ms']} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="进程内 ASGI 并发压测。")
+    parser.add_argument("workspace", type=pathlib.Path, help="由 benchmarks.synthetic_workspace 生成的工作区")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发的虚拟用户数")
+    parser.add_argument("--duration", type=float, default=20, help="压测时长（秒）")
+    parser.add_argument("--requests", type=int, help="总请求数；提供后忽略 --duration")
+    parser.add_argument("--mix", help="场景权重，例如 shard_record=10,metrics=5；默认使用内置权重")
+    parser.add_argument("--warmup", type=int, default=1, help="每个场景的预热请求数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pool-size", type=int, help="预热进程池大小（WORKER_POOL_SIZE），默认沿用环境变量")
+    parser.add_argument("--baseline", type=pathlib.Path, default=DEFAULT_BASELINE, help="基线 JSON 路径")
+    parser.add_argument("--write-baseline", action="store_true", help="把本次结果写为新的基线")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的相对波动")
+    parser.add_argument("--output", type=pathlib.Path, help="把本次结果另存为 JSON")
+    args = parser.parse_args()
+
+    if args.pool_size is not None:
+        os.environ["WORKER_POOL_SIZE"] = str(args.pool_size)
+    manifest = load_manifest(args.workspace)
+    mix = parse_mix(args.mix)
+    settings = {"workspace": manifest["params"], "mix": mix, "concurrency": args.concurrency,
+                "duration": None if args.requests else args.duration, "requests": args.requests}
+
+    with tempfile.TemporaryDirectory(prefix="loadgen-") as scratch:
+        # 演练请求会保存执行计划，压测产生的计划放在临时目录里随之删除
+        os.environ["PLAN_DIR"] = str(pathlib.Path(scratch) / "plans")
+        context = prepare_context(args.workspace, pathlib.Path(scratch))
+        # worker 的逐文件打印会与压测本身争抢终端输出，压测期间丢到 devnull
+        with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+            report = asyncio.run(run_load(context, mix, args.concurrency,
+                                          None if args.requests else args.duration,
+                                          args.requests, args.warmup, args.seed))
+
+    _print_report(report)
+    report = {"settings": settings, **report}
+    if args.output:
+        args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    if args.write_baseline:
+        args.baseline.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\n[*] 已写入基线: {args.baseline}")
+        return
+
+    if args.baseline.is_file():
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        if baseline.get("settings") != settings:
+            print("[!] 基线是在不同的工作区或压测参数下记录的，本次不做比较。", file=sys.stderr)
+            return
+        regressions = compare_with_baseline(report, baseline, args.tolerance)
+        if regressions:
+            print("\n[!] 尾延迟回退:")
+            for line in regressions:
+                print(f"    {line}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+# benchmarks/run_benchmarks.py
+"""
+对 pre_process_script 与 TrainValTest 中的每个 worker 跑基准测试，报告 files/s、MB/s 与峰值内存，
+并与保存的基线比较，吞吐下降或内存上涨超过容差时以退出码 1 结束。
+
+每个用例都在一份新复制的输入上运行（复制不计时），并在独立的 spawn 子进程中执行，
+这样峰值内存只反映该 worker 本身，worker 导入的重量级库也不会被前一个用例预先加载。
+
+基线只在显式传入 --write-baseline 时才写入，数字全部来自本机的实际运行。
+
+用法:
+    python -m benchmarks.synthetic_workspace D:\\bench_ws
+    python -m benchmarks.run_benchmarks D:\\bench_ws                     # 与 benchmarks/baseline.json 比较
+    python -m benchmarks.run_benchmarks D:\\bench_ws --write-baseline    # 记录当前结果为基线
+    python -m benchmarks.run_benchmarks D:\\bench_ws --only dedupe_files --repeat 5
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import pathlib
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from benchmarks.synthetic_workspace import load_manifest
+
+DEFAULT_BASELINE = pathlib.Path(__file__).resolve().parent / "baseline.json"
+
+
+class BenchmarkCase(NamedTuple):
+    name: str
+    worker: str
+    input_dir: str
+    # (输入副本目录, 本用例的临时目录) -> worker 参数
+    build_kwargs: Callable[[pathlib.Path, pathlib.Path], Dict]
+    # 计时前在子进程中执行的准备步骤: (worker 名, 参数构造函数)；峰值内存会包含这一步
+    setup: Optional[Tuple[str, Callable[[pathlib.Path, pathlib.Path], Dict]]] = None
+    # 同样复制到输入副本旁边的其他工作区目录
+    extra_inputs: Tuple[str, ...] = ()
+
+
+def read_all_shard_records(shards_dir: str) -> int:
+    """顺序读取全部分片记录，用于衡量读取分片的吞吐。"""
+    from app.workers.TrainValTest.读取分片 import ShardDatasetReader
+
+    reader = ShardDatasetReader(shards_dir)
+    total = 0
+    for index in range(len(reader)):
+        total += len(reader.get(index))
+    return total
+
+
+CASES: List[BenchmarkCase] = [
+    # --- pre_process_script ---
+    BenchmarkCase("decompress_recursively", "decompress_recursively", "archives",
+                  lambda src, tmp: {"source_folder": src, "output_folder": tmp / "out"}),
+    BenchmarkCase("decompress_recursively_cached", "decompress_recursively", "archives",
+                  lambda src, tmp: {"source_folder": src, "output_folder": tmp / "out", "cache_dir": tmp / "cache"},
+                  setup=("decompress_recursively",
+                         lambda src, tmp: {"source_folder": src, "output_folder": tmp / "warm", "cache_dir": tmp / "cache"})),
+    BenchmarkCase("fused_pre_process", "fused_pre_process", "archives",
+                  lambda src, tmp: {"source_folder": src, "destination_folder": tmp / "out",
+                                    "keep_extensions": {".jpg", ".pdf"}, "dpi": 72}),
+    BenchmarkCase("move_unwanted_files", "move_unwanted_files", "mixed",
+                  lambda src, tmp: {"source_dir": src, "destination_dir": tmp / "out",
+                                    "keep_extensions": {".jpg", ".pdf"}, "dry_run": False}),
+    BenchmarkCase("batch_rename_files", "batch_rename_files", "mixed",
+                  lambda src, tmp: {"source_dir": src, "destination_dir": tmp / "out", "prefix": "", "dry_run": False}),
+    BenchmarkCase("dedupe_files", "dedupe_files", "mixed",
+                  lambda src, tmp: {"source_dir": src, "destination_dir": tmp / "out",
+                                    "use_cache": False, "dry_run": False}),
+    BenchmarkCase("migrate_folder_names", "migrate_folder_names", "mixed",
+                  lambda src, tmp: {"root_dir": src, "operations": [{"op": "swap", "index": 0, "index2": 1}],
+                                    "dry_run": False}),
+    BenchmarkCase("split_all_pdfs_in_folder", "split_all_pdfs_in_folder", "pdfs",
+                  lambda src, tmp: {"source_dir": src, "destination_dir": tmp / "out", "dpi": 72}),
+    BenchmarkCase("screen_image_quality", "screen_image_quality", "images",
+                  lambda src, tmp: {"source_dir": src, "destination_dir": tmp / "out", "dry_run": False}),
+    BenchmarkCase("normalize_images", "normalize_images", "images",
+                  lambda src, tmp: {"source_dir": src, "destination_dir": tmp / "out", "long_edge": 512}),
+    BenchmarkCase("find_and_move_long_images", "find_and_move_long_images", "images",
+                  lambda src, tmp: {"source_dir": src, "dest_dir": tmp / "out", "ratio_threshold": 3.0}),
+    # --- TrainValTest ---
+    BenchmarkCase("analyze_filenames", "analyze_filenames", "images",
+                  lambda src, tmp: {"root_directory": str(src)}),
+    BenchmarkCase("extract_and_move_samples_by_dimension", "extract_and_move_samples_by_dimension", "images",
+                  lambda src, tmp: {"source_dir": str(src), "dest_dir": str(tmp / "out"), "dry_run": False}),
+    BenchmarkCase("split_train_val_sets", "split_train_val_sets", "images",
+                  lambda src, tmp: {"source_dir": str(src), "train_dir": str(tmp / "train"),
+                                    "valid_dir": str(tmp / "valid"), "dry_run": False}),
+    BenchmarkCase("process_end_folders", "process_end_folders", "classes",
+                  lambda src, tmp: {"target_dir": src, "move_to_dir": tmp / "out", "threshold": 20, "dry_run": False}),
+    BenchmarkCase("pack_dataset_shards", "pack_dataset_shards", "images",
+                  lambda src, tmp: {"split_dirs": {"train": str(src)}, "output_dir": str(tmp / "shards"),
+                                    "max_shard_bytes": 16 * 1024 * 1024, "dry_run": False}),
+    BenchmarkCase("read_shards", "benchmarks.run_benchmarks:read_all_shard_records", "images",
+                  lambda src, tmp: {"shards_dir": str(tmp / "shards")},
+                  setup=("pack_dataset_shards",
+                         lambda src, tmp: {"split_dirs": {"train": str(src)}, "output_dir": str(tmp / "shards"),
+                                           "max_shard_bytes": 16 * 1024 * 1024, "dry_run": False})),
+    BenchmarkCase("detect_near_duplicates", "detect_near_duplicates", "images",
+                  lambda src, tmp: {"split_dirs": {"train": str(src), "eval": str(src.parent / "eval_images")},
+                                    "dry_run": True},
+                  extra_inputs=("eval_images",)),
+]
+
+
+def _peak_rss_bytes() -> Optional[int]:
+    """
+    当前进程与其已结束子进程中的最大常驻内存。
+    类 Unix 用标准库 resource 的 ru_maxrss；Windows 没有 resource，用 psutil 的 peak_wset（峰值工作集）。
+    psutil 在类 Unix 上只能给出当前 RSS，不是峰值，所以不用它。
+    """
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return getattr(psutil.Process().memory_info(), "peak_wset", None)
+    # Linux 上 ru_maxrss 单位是 KB，macOS 上是字节
+    scale = 1 if sys.platform == "darwin" else 1024
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * scale
+
+
+def _run_case_in_child(case_name: str, input_dir: str, scratch_dir: str) -> Dict:
+    from app.workers.registry import get_worker
+
+    case = next(c for c in CASES if c.name == case_name)
+    src, tmp = pathlib.Path(input_dir), pathlib.Path(scratch_dir)
+    # worker 的逐文件打印会明显拖慢计时，丢到 devnull 而不是缓存在内存里（那样会虚增峰值内存）
+    with open(os.devnull, "w", encoding="utf-8") as devnull, \
+            contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        if case.setup is not None:
+            setup_worker, setup_kwargs = case.setup
+            get_worker(setup_worker)(**setup_kwargs(src, tmp))
+        func = get_worker(case.worker)
+        kwargs = case.build_kwargs(src, tmp)
+        start = time.perf_counter()
+        try:
+            func(**kwargs)
+        except SystemExit as e:
+            raise RuntimeError(f"worker 以 sys.exit({e.code}) 退出") from None
+        seconds = time.perf_counter() - start
+    return {"seconds": seconds, "peak_rss": _peak_rss_bytes()}
+
+
+def _summarize(directory: pathlib.Path) -> Tuple[int, int]:
+    files = [p for p in directory.rglob("*") if p.is_file()]
+    return len(files), sum(p.stat().st_size for p in files)
+
+
+def run_case(case: BenchmarkCase, workspace: pathlib.Path, scratch_root: pathlib.Path, repeat: int) -> Dict:
+    """重复运行 repeat 次，耗时取中位数，峰值内存取最大值。"""
+    context = multiprocessing.get_context("spawn")
+    timings, peaks = [], []
+    files = total_bytes = 0
+    for _ in range(repeat):
+        scratch = pathlib.Path(tempfile.mkdtemp(prefix=f"{case.name}-", dir=scratch_root))
+        try:
+            src = scratch / "input" / case.input_dir
+            shutil.copytree(workspace / case.input_dir, src)
+            for extra in case.extra_inputs:
+                shutil.copytree(workspace / extra, scratch / "input" / extra)
+            files, total_bytes = _summarize(src)
+            # 每次都用新的子进程：峰值内存互不干扰，也不受前一次运行的导入和缓存影响
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                result = pool.submit(_run_case_in_child, case.name, str(src), str(scratch)).result()
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+        timings.append(result["seconds"])
+        if result["peak_rss"] is not None:
+            peaks.append(result["peak_rss"])
+
+    seconds = statistics.median(timings)
+    return {
+        "files": files,
+        "bytes": total_bytes,
+        "seconds": round(seconds, 4),
+        "files_per_s": round(files / seconds, 2) if seconds else None,
+        "mb_per_s": round(total_bytes / 1024 ** 2 / seconds, 2) if seconds else None,
+        "peak_rss_mb": round(max(peaks) / 1024 ** 2, 1) if peaks else None,
+    }
+
+
+def compare_with_baseline(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    """吞吐（files/s）低于基线 (1 - tolerance) 倍、或峰值内存高于基线 (1 + tolerance) 倍即视为回退。"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None or "error" in current:
+            continue
+        if previous.get("files_per_s") and current.get("files_per_s") is not None \
+                and current["files_per_s"] < previous["files_per_s"] * (1 - tolerance):
+            regressions.append(f"{name}: files/s {previous['files_per_s']} -> {current['files_per_s']}")
+        if previous.get("peak_rss_mb") and current.get("peak_rss_mb") is not None \
+                and current["peak_rss_mb"] > previous["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{name}: peak RSS {previous['peak_rss_mb']} MB -> {current['peak_rss_mb']} MB")
+    return regressions
+
+
+def _print_table(results: Dict[str, Dict], baseline: Dict[str, Dict]):
+    print(f"{'worker':<40} {'files':>7} {'sec':>9} {'files/s':>10} {'MB/s':>8} {'RSS MB':>8} {'vs 基线':>9}")
+    for name, result in results.items():
+        if "error" in result:
+            print(f"{name:<40} 失败: {result['error']}")
+            continue
+        previous = baseline.get(name, {})
+        change = ""
+        if previous.get("files_per_s") and result["files_per_s"]:
+            change = f"{result['files_per_s'] / previous['files_per_s'] - 1:+.1%}"
+        print(f"{name:<40} {result['files']:>7} {result['seconds']:>9.3f} {result['files_per_s'] or 0:>10.1f} "
+              f"{result['mb_per_s'] or 0:>8.2f} {result['peak_rss_mb'] or 0:>8.1f} {change:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="worker 基准测试。")
+    parser.add_argument("workspace", type=pathlib.Path, help="由 benchmarks.synthetic_workspace 生成的工作区")
+    parser.add_argument("--only", nargs="*", help="只运行指定的用例")
+    parser.add_argument("--repeat", type=int, default=3, help="每个用例的运行次数，耗时取中位数")
+    parser.add_argument("--baseline", type=pathlib.Path, default=DEFAULT_BASELINE, help="基线 JSON 路径")
+    parser.add_argument("--write-baseline", action="store_true", help="把本次结果写为新的基线")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="允许的相对波动")
+    parser.add_argument("--output", type=pathlib.Path, help="把本次结果另存为 JSON")
+    parser.add_argument("--scratch", type=pathlib.Path, help="存放输入副本的临时目录，默认系统临时目录")
+    args = parser.parse_args()
+
+    manifest = load_manifest(args.workspace)
+    cases = [c for c in CASES if not args.only or c.name in args.only]
+    scratch_root = args.scratch or pathlib.Path(tempfile.gettempdir())
+    scratch_root.mkdir(parents=True, exist_ok=True)
+
+    baseline_data = {}
+    if args.baseline.is_file():
+        baseline_data = json.loads(args.baseline.read_text(encoding="utf-8"))
+    baseline = baseline_data.get("results", {})
+    if baseline and baseline_data.get("workspace") != manifest["params"]:
+        print("[!] 基线是在不同参数的工作区上记录的，本次不做比较。", file=sys.stderr)
+        baseline = {}
+
+    results: Dict[str, Dict] = {}
+    for case in cases:
+        print(f"[*] {case.name} ...", flush=True)
+        try:
+            results[case.name] = run_case(case, args.workspace, scratch_root, args.repeat)
+        except Exception as e:
+            results[case.name] = {"error": str(e)}
+
+    print()
+    _print_table(results, baseline)
+
+    report = {"workspace": manifest["params"],
+              "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                          "cpu_count": os.cpu_count()},
+              "results": results}
+    if args.output:
+        args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    if args.write_baseline:
+        # 只更新本次运行过的用例，保留其他用例的基线
+        if baseline_data.get("workspace") == manifest["params"]:
+            report["results"] = {**baseline_data.get("results", {}), **results}
+        args.baseline.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\n[*] 已写入基线: {args.baseline}")
+        return
+
+    regressions = compare_with_baseline(results, baseline, args.tolerance)
+    failures = [name for name, result in results.items() if "error" in result]
+    if regressions:
+        print("\n[!] 性能回退:")
+        for line in regressions:
+            print(f"    {line}")
+    if regressions or failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
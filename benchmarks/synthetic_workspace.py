@@ -0,0 +1,290 @@
+# benchmarks/synthetic_workspace.py
+"""
+生成可复现的合成工作区，供基准测试使用。同样的参数和 seed 总是生成完全相同的文件。
+
+目录结构:
+    manifest.json           生成参数与各目录的文件数/字节数
+    archives/               多层嵌套的 zip/tar 压缩包（decompress_recursively）
+    mixed/<bank_年份_类型>/  jpg/pdf 与需要筛掉的 txt/bin，并含若干完全重复的文件
+                            （move_unwanted_files、batch_rename_files、dedupe_files、migrate_folder_names）
+    pdfs/                   多页 PDF（split_all_pdfs_in_folder）
+    images/                 bank_x_style 命名的 jpg，类别大小按 Zipf 分布倾斜，含长图、空白页、模糊图
+    eval_images/            少量评估集图片，其中一部分是 images/ 的近重复（detect_near_duplicates）
+    classes/<bank>/<style>/ 按类别分好的末端文件夹（process_end_folders）
+
+用法:
+    python -m benchmarks.synthetic_workspace D:\\bench_ws --images 2000 --archive-depth 3
+"""
+
+import argparse
+import gzip
+import io
+import json
+import pathlib
+import random
+import shutil
+import tarfile
+import zipfile
+from typing import Dict, List, Tuple
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+MANIFEST_FILENAME = "manifest.json"
+GENERATOR_VERSION = 1
+
+
+def _class_weights(banks: int, styles: int, skew: float) -> Tuple[List[Tuple[int, int]], List[float]]:
+    """(bank, style) 组合按 Zipf 分布取权重：排名第 k 的类别权重为 1 / k^skew。"""
+    classes = [(b, s) for b in range(banks) for s in range(styles)]
+    return classes, [1.0 / (rank ** skew) for rank in range(1, len(classes) + 1)]
+
+
+def _image_bytes(rng: np.random.Generator, width: int, height: int, kind: str) -> bytes:
+    if kind == "blank":
+        array = np.full((height, width, 3), 250, dtype=np.uint8)
+    else:
+        # 渐变背景加随机色块和噪声，接近扫描件的纹理，JPEG 压缩后大小也更真实
+        gradient = np.linspace(60, 220, width, dtype=np.float32)[None, :, None]
+        array = np.broadcast_to(gradient, (height, width, 3)).copy()
+        for _ in range(6):
+            x, y = rng.integers(0, width), rng.integers(0, height)
+            array[y:y + height // 6, x:x + width // 6] = rng.integers(0, 255, 3)
+        array += rng.normal(0, 12, array.shape).astype(np.float32)
+        array = np.clip(array, 0, 255).astype(np.uint8)
+
+    image = Image.fromarray(array)
+    if kind == "blurry":
+        image = image.filter(ImageFilter.GaussianBlur(radius=6))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def _near_duplicate(data: bytes) -> bytes:
+    """轻微缩放并重新编码，得到内容相同但字节不同的近重复图片。"""
+    with Image.open(io.BytesIO(data)) as image:
+        width, height = image.size
+        resized = image.resize((max(8, width - 4), max(8, height - 4)))
+    buffer = io.BytesIO()
+    resized.save(buffer, format="JPEG", quality=75)
+    return buffer.getvalue()
+
+
+def _pdf_bytes(rng: random.Random, pages: int) -> bytes:
+    import fitz
+
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page(width=595, height=842)
+        page.insert_text((72, 72), f"synthetic page {page_num + 1}", fontsize=18)
+        for line in range(20):
+            page.insert_text((72, 120 + line * 30), "".join(rng.choices("abcdefghij0123456789 ", k=60)), fontsize=10)
+        page.draw_rect(fitz.Rect(72, 740, 72 + rng.randint(50, 450), 780), fill=(0.2, 0.4, 0.8))
+    # 固定元数据并不生成新的文件 ID，保证同一 seed 生成的 PDF 逐字节一致
+    doc.set_metadata({"producer": "synthetic_workspace", "creationDate": "D:20240101000000",
+                      "modDate": "D:20240101000000"})
+    data = doc.tobytes(no_new_id=True)
+    doc.close()
+    return data
+
+
+def _write_nested_archive(path: pathlib.Path, members: Dict[str, bytes], depth: int):
+    """按 zip、tar.gz 交替嵌套 depth 层，最内层装入 members。"""
+    payload_name, payload = None, None
+    for level in range(depth, 0, -1):
+        entries = dict(members) if level == depth else {payload_name: payload}
+        buffer = io.BytesIO()
+        # zip 条目时间、tar 条目 mtime 与 gzip 头里的时间都固定下来，保证逐字节可复现
+        if level % 2:
+            with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+                for name, data in entries.items():
+                    archive.writestr(zipfile.ZipInfo(name, date_time=(2024, 1, 1, 0, 0, 0)), data,
+                                     compress_type=zipfile.ZIP_DEFLATED)
+            suffix = ".zip"
+        else:
+            with gzip.GzipFile(fileobj=buffer, mode="wb", mtime=0) as gz, \
+                    tarfile.open(fileobj=gz, mode="w") as archive:
+                for name, data in entries.items():
+                    info = tarfile.TarInfo(name)
+                    info.size = len(data)
+                    archive.addfile(info, io.BytesIO(data))
+            suffix = ".tar.gz"
+        payload_name, payload = f"{path.stem}_level{level}{suffix}", buffer.getvalue()
+    path.with_name(payload_name).write_bytes(payload)
+
+
+def _summarize(directory: pathlib.Path) -> Dict[str, int]:
+    files = [p for p in directory.rglob("*") if p.is_file()]
+    return {"files": len(files), "bytes": sum(p.stat().st_size for p in files)}
+
+
+def generate_workspace(root: pathlib.Path,
+                       seed: int = 0,
+                       images: int = 2000,
+                       eval_images: int = 200,
+                       banks: int = 12,
+                       styles: int = 5,
+                       skew: float = 1.1,
+                       long_image_ratio: float = 0.05,
+                       defect_ratio: float = 0.05,
+                       pdfs: int = 20,
+                       pdf_pages: int = 5,
+                       archives: int = 10,
+                       archive_depth: int = 3,
+                       files_per_archive: int = 20,
+                       mixed_folders: int = 20,
+                       mixed_files: int = 1000,
+                       duplicate_ratio: float = 0.1) -> Dict:
+    """
+    在 root 下生成合成工作区并写出 manifest.json。root 已存在时会先清空。
+
+    Args:
+        root: 工作区根目录。
+        seed: 随机种子，相同参数与种子生成的文件逐字节一致。
+        images: images/ 中的图片数。
+        eval_images: eval_images/ 中的图片数，其中一半是 images/ 的近重复。
+        banks, styles: 银行数和样式数，文件名形如 bank03_000123_style01.jpg。
+        skew: 类别大小的 Zipf 指数，越大越倾斜。
+        long_image_ratio: 长图（高宽比 > 3）占比。
+        defect_ratio: 空白页和模糊图各自的占比。
+        pdfs, pdf_pages: PDF 数量与每个 PDF 的页数。
+        archives, archive_depth, files_per_archive: 压缩包数量、嵌套层数与最内层文件数。
+        mixed_folders, mixed_files: mixed/ 中的文件夹数与文件数。
+        duplicate_ratio: mixed/ 中完全重复文件的占比。
+
+    Returns:
+        manifest 字典：生成参数与各目录的文件数、字节数。
+    """
+    params = {key: value for key, value in locals().items() if key != "root"}
+    params["generator_version"] = GENERATOR_VERSION
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+
+    if root.exists():
+        shutil.rmtree(root)
+    for name in ("archives", "mixed", "pdfs", "images", "eval_images", "classes"):
+        (root / name).mkdir(parents=True)
+
+    classes, weights = _class_weights(banks, styles, skew)
+
+    def draw_image(index: int) -> Tuple[str, bytes]:
+        bank, style = rng.choices(classes, weights)[0]
+        roll = rng.random()
+        width = rng.randint(160, 320)
+        if roll < long_image_ratio:
+            kind, height = "normal", width * rng.randint(4, 6)
+        elif roll < long_image_ratio + defect_ratio:
+            kind, height = "blank", rng.randint(200, 400)
+        elif roll < long_image_ratio + 2 * defect_ratio:
+            kind, height = "blurry", rng.randint(200, 400)
+        else:
+            kind, height = "normal", rng.randint(200, 400)
+        name = f"bank{bank:02d}_{index:06d}_style{style:02d}.jpg"
+        return name, _image_bytes(np_rng, width, height, kind)
+
+    # --- images/ 与 classes/ ---
+    image_samples: List[Tuple[str, bytes]] = []
+    for index in range(images):
+        name, data = draw_image(index)
+        (root / "images" / name).write_bytes(data)
+        bank, _, style = pathlib.Path(name).stem.split("_")
+        leaf = root / "classes" / bank / style
+        leaf.mkdir(parents=True, exist_ok=True)
+        (leaf / name).write_bytes(data)
+        if len(image_samples) < eval_images:
+            image_samples.append((name, data))
+
+    # --- eval_images/: 一半来自 images/ 的近重复，制造跨划分泄漏 ---
+    for index in range(eval_images):
+        if index % 2 == 0 and image_samples:
+            name, data = image_samples[index // 2 % len(image_samples)]
+            (root / "eval_images" / f"eval_{name}").write_bytes(_near_duplicate(data))
+        else:
+            name, data = draw_image(images + index)
+            (root / "eval_images" / name).write_bytes(data)
+
+    # --- pdfs/ ---
+    pdf_samples = []
+    for index in range(pdfs):
+        data = _pdf_bytes(rng, pdf_pages)
+        (root / "pdfs" / f"doc_{index:04d}.pdf").write_bytes(data)
+        pdf_samples.append(data)
+
+    # --- mixed/: 文件夹名 bank_年份_类型，便于 part 级重命名 ---
+    folder_names = [f"bank{i % banks:02d}_{2015 + i // banks}_{rng.choice(['invoice', 'receipt', 'statement'])}"
+                    for i in range(mixed_folders)]
+    mixed_written: List[pathlib.Path] = []
+    for index in range(mixed_files):
+        folder = root / "mixed" / rng.choice(folder_names)
+        folder.mkdir(exist_ok=True)
+        if mixed_written and rng.random() < duplicate_ratio:
+            original = rng.choice(mixed_written)
+            target = folder / f"copy_{index:06d}{original.suffix}"
+            shutil.copyfile(original, target)
+            continue
+        roll = rng.random()
+        if roll < 0.6:
+            target = folder / f"scan_{index:06d}.jpg"
+            target.write_bytes(draw_image(index)[1])
+        elif roll < 0.7 and pdf_samples:
+            target = folder / f"scan_{index:06d}.pdf"
+            target.write_bytes(rng.choice(pdf_samples))
+        elif roll < 0.85:
+            target = folder / f"note_{index:06d}.txt"
+            target.write_text("\n".join(f"line {n}" for n in range(rng.randint(10, 200))), encoding="utf-8")
+        else:
+            target = folder / f"blob_{index:06d}.bin"
+            target.write_bytes(rng.randbytes(rng.randint(1024, 64 * 1024)))
+        mixed_written.append(target)
+
+    # --- archives/ ---
+    for index in range(archives):
+        members = {}
+        for member in range(files_per_archive):
+            if member % 5 == 4 and pdf_samples:
+                members[f"doc_{index:03d}_{member:03d}.pdf"] = rng.choice(pdf_samples)
+            else:
+                name, data = draw_image(index * files_per_archive + member)
+                members[name] = data
+        _write_nested_archive(root / "archives" / f"batch_{index:03d}", members, archive_depth)
+
+    manifest = {"params": params,
+                "dirs": {name: _summarize(root / name)
+                         for name in ("archives", "mixed", "pdfs", "images", "eval_images", "classes")}}
+    (root / MANIFEST_FILENAME).write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    return manifest
+
+
+def load_manifest(root: pathlib.Path) -> Dict:
+    return json.loads((root / MANIFEST_FILENAME).read_text(encoding="utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成可复现的合成基准测试工作区。")
+    parser.add_argument("root", type=pathlib.Path, help="工作区根目录（已存在时会被清空）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--images", type=int, default=2000)
+    parser.add_argument("--eval-images", type=int, default=200)
+    parser.add_argument("--banks", type=int, default=12)
+    parser.add_argument("--styles", type=int, default=5)
+    parser.add_argument("--skew", type=float, default=1.1)
+    parser.add_argument("--pdfs", type=int, default=20)
+    parser.add_argument("--pdf-pages", type=int, default=5)
+    parser.add_argument("--archives", type=int, default=10)
+    parser.add_argument("--archive-depth", type=int, default=3)
+    parser.add_argument("--files-per-archive", type=int, default=20)
+    parser.add_argument("--mixed-files", type=int, default=1000)
+    args = parser.parse_args()
+
+    manifest = generate_workspace(args.root, seed=args.seed, images=args.images, eval_images=args.eval_images,
+                                  banks=args.banks, styles=args.styles, skew=args.skew,
+                                  pdfs=args.pdfs, pdf_pages=args.pdf_pages,
+                                  archives=args.archives, archive_depth=args.archive_depth,
+                                  files_per_archive=args.files_per_archive, mixed_files=args.mixed_files)
+    for name, summary in manifest["dirs"].items():
+        print(f"{name:<12} {summary['files']:>7} 个文件  {summary['bytes'] / 1024 ** 2:>9.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
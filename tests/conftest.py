@@ -0,0 +1,14 @@
+import pathlib
+import sys
+
+import pytest
+
+# tests/ 下的旧脚本不是 pytest 用例；把仓库根目录加入路径以便导入 app
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+
+@pytest.fixture(autouse=True)
+def state_dirs(tmp_path, monkeypatch):
+    """计划、报告、CRC 等状态目录指向每个用例自己的临时目录，互不影响，也不写到系统临时目录。"""
+    for env_var, name in (("PLAN_DIR", "plans"), ("REPORT_DIR", "reports"), ("ZIP_CRC_DIR", "zip_crcs")):
+        monkeypatch.setenv(env_var, str(tmp_path / name))
@@ -0,0 +1,107 @@
+import os
+import pathlib
+import zipfile
+
+import pytest
+
+from app.workers.pre_process_script.archive_cache import ArchiveCache, cache_key, get_archive_cache
+
+
+class ZipExtractor:
+    """代替 patool 的解压函数，记录被真正解压的压缩包。"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, archive, outdir):
+        self.calls.append(archive.name)
+        with zipfile.ZipFile(archive) as z:
+            z.extractall(outdir)
+
+
+@pytest.fixture
+def extractor():
+    return ZipExtractor()
+
+
+def _zip(path, members):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with zipfile.ZipFile(path, "w") as z:
+        for name, data in members.items():
+            z.writestr(name, data)
+    return path
+
+
+def _tree(root):
+    return {path.relative_to(root).as_posix(): path.read_bytes() for path in root.rglob("*") if path.is_file()}
+
+
+def test_repeat_archive_is_copied_from_cache(tmp_path, extractor):
+    cache = ArchiveCache(tmp_path / "cache")
+    first = _zip(tmp_path / "a.zip", {"x.jpg": b"x" * 10, "sub/y.pdf": b"y" * 5})
+    again = _zip(tmp_path / "other" / "renamed.zip", {"x.jpg": b"x" * 10, "sub/y.pdf": b"y" * 5})
+
+    assert cache.extract(first, tmp_path / "out1", extractor) is False
+    assert cache.extract(again, tmp_path / "out2", extractor) is True
+
+    assert extractor.calls == ["a.zip"]
+    assert _tree(tmp_path / "out1") == _tree(tmp_path / "out2") == {"x.jpg": b"x" * 10, "sub/y.pdf": b"y" * 5}
+    assert cache.stats() == {"entries": 1, "bytes": 15, "hits": 1, "misses": 1}
+
+
+def test_outputs_are_copies_not_links(tmp_path, extractor):
+    cache = ArchiveCache(tmp_path / "cache")
+    archive = _zip(tmp_path / "a.zip", {"x.jpg": b"original"})
+    cache.extract(archive, tmp_path / "out1", extractor)
+    cache.extract(archive, tmp_path / "out2", extractor)
+
+    (tmp_path / "out2" / "x.jpg").write_bytes(b"edited")
+    cache.extract(archive, tmp_path / "out3", extractor)
+
+    assert (tmp_path / "out3" / "x.jpg").read_bytes() == b"original"
+    assert os.stat(tmp_path / "out2" / "x.jpg").st_nlink == 1
+
+
+def test_shared_members_are_stored_once_and_evicted_by_refcount(tmp_path, extractor):
+    cache = ArchiveCache(tmp_path / "cache", max_bytes=25)
+    cache.extract(_zip(tmp_path / "a.zip", {"shared": b"s" * 10, "a": b"a" * 5}), tmp_path / "out", extractor)
+    cache.extract(_zip(tmp_path / "b.zip", {"shared": b"s" * 10, "b": b"b" * 5}), tmp_path / "out", extractor)
+    assert cache.total_bytes == 20
+
+    # 第三个压缩包让总量超过上限，最久未用的 a 被淘汰；shared 仍被 b 引用，不删除
+    cache.extract(_zip(tmp_path / "c.zip", {"c": b"c" * 8}), tmp_path / "out", extractor)
+
+    blobs = {path.read_bytes() for path in (tmp_path / "cache" / "blobs").rglob("*") if path.is_file()}
+    assert blobs == {b"s" * 10, b"b" * 5, b"c" * 8}
+    assert cache.total_bytes == 23 and cache.stats()["entries"] == 2
+
+
+def test_instances_sharing_a_directory_see_each_others_entries(tmp_path, extractor):
+    archive = _zip(tmp_path / "a.zip", {"x": b"x"})
+    ArchiveCache(tmp_path / "cache").extract(archive, tmp_path / "out1", extractor)
+
+    other = ArchiveCache(tmp_path / "cache")
+
+    assert other.stats()["entries"] == 1
+    assert other.extract(archive, tmp_path / "out2", extractor) is True
+    assert get_archive_cache(tmp_path / "cache") is get_archive_cache(pathlib.Path(str(tmp_path / "cache")))
+
+
+def test_missing_blob_falls_back_to_extraction(tmp_path, extractor):
+    cache = ArchiveCache(tmp_path / "cache")
+    archive = _zip(tmp_path / "a.zip", {"x": b"x"})
+    cache.extract(archive, tmp_path / "out1", extractor)
+    for blob in (tmp_path / "cache" / "blobs").rglob("*"):
+        if blob.is_file():
+            blob.unlink()
+
+    assert cache.extract(archive, tmp_path / "out2", extractor) is False
+    assert extractor.calls == ["a.zip", "a.zip"]
+    assert _tree(tmp_path / "out2") == {"x": b"x"}
+    assert cache.total_bytes == 1
+
+
+def test_single_file_archives_are_keyed_by_name():
+    assert cache_key(pathlib.Path("a.txt.gz"), "d") == "d:a.txt.gz"
+    assert cache_key(pathlib.Path("a.tar.gz"), "d") == "d"
+    assert cache_key(pathlib.Path("a.zip"), "d") == "d"
@@ -0,0 +1,139 @@
+import pytest
+
+from app.core.plans import execute_plan
+from app.workers.pre_process_script import batch_rename_files as module
+from app.workers.pre_process_script.batch_rename_files import (MAPPING_DIR_ENV_VAR, batch_rename_files,
+                                                               lookup_rename_mapping, mapping_path)
+
+
+@pytest.fixture(autouse=True)
+def mapping_dir(tmp_path, monkeypatch):
+    path = tmp_path / "mappings"
+    monkeypatch.setenv(MAPPING_DIR_ENV_VAR, str(path))
+    monkeypatch.setattr(module, "LEGACY_MAPPING_DIR", tmp_path / "legacy_tmp")
+    return path
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    source, destination = tmp_path / "source", tmp_path / "destination"
+    source.mkdir()
+    for name in ("b.jpg", "c.jpg", "d.png"):
+        (source / name).write_bytes(name.encode())
+    return source, destination
+
+
+def _run(source, destination, dry_run=False):
+    return batch_rename_files(source, destination, prefix="", dry_run=dry_run)
+
+
+def _names(destination):
+    return {path.name: path.read_bytes() for path in destination.iterdir()}
+
+
+def test_new_file_does_not_renumber_existing(dirs):
+    source, destination = dirs
+    _run(source, destination)
+    assert _names(destination) == {"0001.jpg": b"b.jpg", "0002.jpg": b"c.jpg", "0003.png": b"d.png"}
+
+    # 排在最前面的新文件取下一个编号，已有文件不改号也不重复复制
+    (source / "a.jpg").write_bytes(b"a.jpg")
+    summary = _run(source, destination)
+
+    assert summary["processed"] == 1 and summary["unchanged"] == 3
+    assert _names(destination)["0004.jpg"] == b"a.jpg"
+    assert _names(destination)["0001.jpg"] == b"b.jpg"
+
+
+def test_changed_content_gets_new_number_and_keeps_history(dirs):
+    source, destination = dirs
+    _run(source, destination)
+    (source / "b.jpg").write_bytes(b"b changed")
+
+    _run(source, destination)
+
+    assert _names(destination)["0004.jpg"] == b"b changed"
+    rows = lookup_rename_mapping(destination, source="b.jpg")["rows"]
+    assert [row["name"] for row in rows] == ["0001.jpg", "0004.jpg"]
+
+
+def test_deleted_target_is_restored_under_its_number(dirs):
+    source, destination = dirs
+    _run(source, destination)
+    (destination / "0002.jpg").unlink()
+
+    summary = _run(source, destination)
+
+    assert summary["processed"] == 1
+    assert _names(destination)["0002.jpg"] == b"c.jpg"
+
+
+def test_unmapped_targets_are_adopted_by_content(dirs, mapping_dir):
+    source, destination = dirs
+    _run(source, destination)
+    mapping_path(destination).unlink()
+
+    summary = _run(source, destination)
+
+    assert summary["adopted"] == 3 and summary["processed"] == 0
+    assert lookup_rename_mapping(destination, source="c.jpg")["rows"][0]["name"] == "0002.jpg"
+
+
+def test_dry_run_plan_records_mapping_on_execute(dirs):
+    source, destination = dirs
+    summary = _run(source, destination, dry_run=True)
+    assert not destination.exists() and not mapping_path(destination).exists()
+
+    execute_plan(summary["plan"]["plan_id"])
+
+    assert len(_names(destination)) == 3
+    assert len(lookup_rename_mapping(destination)["rows"]) == 3
+    assert _run(source, destination)["unchanged"] == 3
+
+
+def test_lookup_pages_with_cursor(dirs):
+    source, destination = dirs
+    _run(source, destination)
+
+    first = lookup_rename_mapping(destination, limit=2)
+    second = lookup_rename_mapping(destination, cursor=first["next_cursor"], limit=2)
+
+    assert [row["source"] for row in first["rows"] + second["rows"]] == ["b.jpg", "c.jpg", "d.png"]
+    assert second["next_cursor"] is None
+    assert lookup_rename_mapping(destination, name="0003.png")["rows"][0]["source"] == "d.png"
+
+
+def test_lookup_rejects_bad_cursor(dirs):
+    source, destination = dirs
+    _run(source, destination)
+
+    with pytest.raises(ValueError):
+        lookup_rename_mapping(destination, cursor=3)
+    with pytest.raises(ValueError):
+        lookup_rename_mapping(destination, cursor=10 ** 9)
+
+
+def test_mapping_endpoint_reports_bad_cursor(dirs):
+    pytest.importorskip("fastapi")
+    from app.apis.pre_process import batch_rename_mapping
+
+    source, destination = dirs
+    _run(source, destination)
+
+    response = batch_rename_mapping(str(destination), cursor=3, limit=10)
+
+    assert response.status == "error" and "游标" in response.message
+
+
+def test_mapping_left_in_temp_dir_is_migrated(dirs, tmp_path):
+    source, destination = dirs
+    _run(source, destination)
+    path = mapping_path(destination)
+    legacy = tmp_path / "legacy_tmp" / path.name
+    legacy.parent.mkdir()
+    path.replace(legacy)
+
+    summary = _run(source, destination)
+
+    assert summary["unchanged"] == 3 and summary["adopted"] == 0
+    assert path.is_file() and not legacy.exists()
@@ -0,0 +1,94 @@
+import gzip
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("PIL")
+
+from benchmarks.run_benchmarks import CASES, _peak_rss_bytes, compare_with_baseline, run_case  # noqa: E402
+from benchmarks.synthetic_workspace import _class_weights, generate_workspace, load_manifest  # noqa: E402
+
+SMALL = dict(images=12, eval_images=4, banks=3, styles=2, pdfs=0, archives=2, archive_depth=3,
+             files_per_archive=3, mixed_folders=3, mixed_files=20, duplicate_ratio=0.3)
+
+
+def _snapshot(root):
+    return {path.relative_to(root).as_posix(): path.read_bytes() for path in root.rglob("*") if path.is_file()}
+
+
+@pytest.fixture(scope="module")
+def workspace(tmp_path_factory):
+    root = tmp_path_factory.mktemp("bench") / "ws"
+    generate_workspace(root, seed=7, **SMALL)
+    return root
+
+
+def test_same_seed_generates_identical_bytes(workspace, tmp_path):
+    again = tmp_path / "again"
+    generate_workspace(again, seed=7, **SMALL)
+    other = tmp_path / "other"
+    generate_workspace(other, seed=8, **SMALL)
+
+    assert _snapshot(again) == _snapshot(workspace)
+    assert _snapshot(other) != _snapshot(workspace)
+
+
+def test_manifest_counts_files(workspace):
+    manifest = load_manifest(workspace)
+
+    assert manifest["params"]["seed"] == 7 and manifest["params"]["images"] == 12
+    assert manifest["dirs"]["images"]["files"] == manifest["dirs"]["classes"]["files"] == 12
+    assert manifest["dirs"]["eval_images"]["files"] == 4
+    assert manifest["dirs"]["mixed"]["files"] == 20
+    assert all(name.startswith("bank") and name.endswith(".jpg") for name in
+               (path.name for path in (workspace / "images").iterdir()))
+
+
+def test_archives_are_nested_to_the_requested_depth(workspace):
+    archive = workspace / "archives" / "batch_000_level1.zip"
+    with zipfile.ZipFile(archive) as outer:
+        assert outer.namelist() == ["batch_000_level2.tar.gz"]
+        inner = outer.read("batch_000_level2.tar.gz")
+    with tarfile.open(fileobj=io.BytesIO(gzip.decompress(inner))) as middle:
+        assert middle.getnames() == ["batch_000_level3.zip"]
+        innermost = middle.extractfile("batch_000_level3.zip").read()
+    with zipfile.ZipFile(io.BytesIO(innermost)) as last:
+        assert len(last.namelist()) == 3
+
+
+def test_class_weights_follow_zipf():
+    classes, weights = _class_weights(2, 2, 1.0)
+
+    assert classes == [(0, 0), (0, 1), (1, 0), (1, 1)]
+    assert weights == pytest.approx([1, 1 / 2, 1 / 3, 1 / 4])
+
+
+def test_regressions_beyond_tolerance_are_reported():
+    baseline = {"a": {"files_per_s": 100, "peak_rss_mb": 50}, "b": {"files_per_s": 100, "peak_rss_mb": 50}}
+    results = {"a": {"files_per_s": 90, "peak_rss_mb": 55},
+               "b": {"files_per_s": 70, "peak_rss_mb": 70},
+               "c": {"files_per_s": 1, "peak_rss_mb": 1},
+               "d": {"error": "boom"}}
+
+    regressions = compare_with_baseline(results, baseline, tolerance=0.15)
+
+    assert regressions == ["b: files/s 100 -> 70", "b: peak RSS 50 MB -> 70 MB"]
+
+
+def test_run_case_measures_a_worker_in_a_child_process(workspace, tmp_path):
+    case = next(c for c in CASES if c.name == "dedupe_files")
+    scratch = tmp_path / "scratch"
+    scratch.mkdir()
+
+    result = run_case(case, workspace, scratch, repeat=1)
+
+    assert result["files"] == 20 and result["seconds"] > 0
+    assert result["files_per_s"] > 0
+    # 输入副本用完即删，原工作区不动
+    assert list(scratch.iterdir()) == []
+    assert load_manifest(workspace)["dirs"]["mixed"]["files"] == 20
+    if _peak_rss_bytes() is not None:
+        assert result["peak_rss_mb"] > 0
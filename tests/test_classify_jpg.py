@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+np = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+
+from app.workers.classify_jpg import classify_jpg  # noqa: E402
+from app.workers.classify_jpg.classify_jpg import (BUILTIN_MODEL, MODEL_ENV_VAR, MicroBatcher, TinyCentroidModel,  # noqa: E402
+                                                   allowed_models, classify_directory, load_model)
+
+
+@pytest.fixture(autouse=True)
+def fresh_models(monkeypatch):
+    """每个用例重新加载模型和微批处理器，不受其它用例的环境变量影响。"""
+    monkeypatch.delenv(MODEL_ENV_VAR, raising=False)
+    monkeypatch.setattr(classify_jpg, "_models", {})
+    monkeypatch.setattr(classify_jpg, "_batchers", {})
+
+
+def _save(path, pixels):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.fromarray(pixels.astype(np.uint8), mode="L").save(path, "JPEG", quality=95)
+
+
+@pytest.fixture
+def images(tmp_path):
+    source = tmp_path / "source"
+    rng = np.random.default_rng(0)
+    for i in range(3):
+        _save(source / f"blank_{i}.jpg", np.full((200, 160), 250))
+    document = np.full((200, 160), 235)
+    document[::8, 10:150] = 0
+    _save(source / "sub" / "document.jpg", document)
+    _save(source / "photo.jpg", rng.normal(115, 50, (200, 160)).clip(0, 255))
+    (source / "broken.jpg").write_bytes(b"not a jpeg")
+    return source
+
+
+def test_builtin_model_labels(images):
+    result = asyncio.run(classify_directory(images, model_spec=BUILTIN_MODEL))
+
+    assert result["labels"]["blank_0.jpg"] == "blank"
+    assert result["labels"]["sub/document.jpg"] == "document"
+    assert result["labels"]["photo.jpg"] == "photo"
+    assert list(result["failed"]) == ["broken.jpg"]
+    assert result["counts"] == {"blank": 3, "document": 1, "photo": 1}
+
+
+def test_copies_by_label_when_not_dry_run(images, tmp_path):
+    output = tmp_path / "output"
+
+    asyncio.run(classify_directory(images, output, dry_run=False))
+
+    assert (output / "blank" / "blank_1.jpg").is_file()
+    assert (output / "document" / "sub" / "document.jpg").is_file()
+    assert not (output / "broken.jpg").exists()
+
+
+def test_concurrent_requests_share_batches(images):
+    async def classify_twice():
+        return await asyncio.gather(classify_directory(images), classify_directory(images))
+
+    first, second = asyncio.run(classify_twice())
+
+    assert first["labels"] == second["labels"]
+    # 10 张能解码的图片合并成的批次数少于图片数
+    assert 1 <= classify_jpg.get_batcher().batches_run < 10
+
+
+def test_micro_batcher_caps_batch_size():
+    class Recording(TinyCentroidModel):
+        sizes = []
+
+        def predict(self, batch):
+            self.sizes.append(len(batch))
+            return super().predict(batch)
+
+    model = Recording()
+    batcher = MicroBatcher(model, max_batch=4, max_wait_ms=50)
+
+    async def submit_all():
+        return await asyncio.gather(*(batcher.submit(np.full((64, 64), 0.97, dtype=np.float32)) for _ in range(10)))
+
+    labels = asyncio.run(submit_all())
+
+    assert labels == ["blank"] * 10
+    assert max(model.sizes) <= 4 and sum(model.sizes) == 10
+
+
+def test_model_errors_reach_every_waiter():
+    class Failing(TinyCentroidModel):
+        def predict(self, batch):
+            raise RuntimeError("boom")
+
+    batcher = MicroBatcher(Failing(), max_wait_ms=20)
+
+    async def submit_two():
+        return await asyncio.gather(*(batcher.submit(np.zeros((64, 64), dtype=np.float32)) for _ in range(2)),
+                                    return_exceptions=True)
+
+    assert [str(e) for e in asyncio.run(submit_two())] == ["boom", "boom"]
+
+
+def test_unlisted_model_is_rejected(images):
+    assert allowed_models() == [BUILTIN_MODEL]
+    with pytest.raises(ValueError):
+        load_model("os:getcwd")
+    with pytest.raises(ValueError):
+        asyncio.run(classify_directory(images, model_spec="os:system"))
+
+
+def test_configured_model_is_allowed(monkeypatch):
+    monkeypatch.setenv(MODEL_ENV_VAR, "collections:OrderedDict")
+
+    assert allowed_models() == [BUILTIN_MODEL, "collections:OrderedDict"]
+    assert load_model() == {}
+    assert isinstance(load_model(BUILTIN_MODEL), TinyCentroidModel)
+
+
+def test_failing_configured_model_raises_value_error(monkeypatch):
+    monkeypatch.setenv(MODEL_ENV_VAR, "no_such_module_here:build")
+
+    with pytest.raises(ValueError):
+        load_model()
@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from app.core import cluster  # noqa: E402
+from app.core.cluster import merge_results, run_sharded, shard_kwargs  # noqa: E402
+from app.core.ndjson import read_page  # noqa: E402
+from app.core.plans import _operations_path, load_plan  # noqa: E402
+from app.core.sharding import Shard  # noqa: E402
+from app.workers.pre_process_script.dedupe_files import dedupe_files  # noqa: E402
+
+NODES = ["http://127.0.0.1:8001", "http://127.0.0.1:8002", "http://127.0.0.1:8003"]
+
+
+class FakeNodes:
+    """用 httpx.MockTransport 模拟几个工作节点：在本进程里执行分片，dead 中的节点拒绝连接，hang 中的节点读超时。"""
+
+    def __init__(self, dead=(), hang=()):
+        self.dead = set(dead)
+        self.hang = set(hang)
+        self.calls = []
+
+    def __call__(self, request):
+        node = f"{request.url.scheme}://{request.url.host}:{request.url.port}"
+        self.calls.append((node, request.url.path))
+        if node in self.dead:
+            raise httpx.ConnectError("connection refused", request=request)
+        if node in self.hang:
+            raise httpx.ReadTimeout("timed out", request=request)
+        if request.url.path == "/cluster/shard":
+            body = json.loads(request.content)
+            kwargs = shard_kwargs(body["worker"], body["params"])
+            result = dedupe_files(**kwargs, shard=Shard(body["index"], body["count"], body["strategy"]))
+            return httpx.Response(200, json={"status": "success", "message": "",
+                                             "details": json.loads(json.dumps(result, default=str))})
+        plan_id = request.url.path.split("/")[2]
+        lines, cursor = read_page(_operations_path(plan_id), int(request.url.params.get("cursor", 0)),
+                                  int(request.url.params["limit"]))
+        return httpx.Response(200, content=b"".join(lines),
+                              headers={} if cursor is None else {"X-Next-Cursor": str(cursor)})
+
+
+@pytest.fixture
+def nodes(monkeypatch):
+    fake = FakeNodes()
+    real_client = httpx.Client
+    monkeypatch.setattr(httpx, "Client", lambda **kwargs: real_client(transport=httpx.MockTransport(fake), **kwargs))
+    return fake
+
+
+@pytest.fixture
+def params(tmp_path):
+    source = tmp_path / "source"
+    for i in range(12):
+        folder = source / f"d{i % 3}"
+        folder.mkdir(parents=True, exist_ok=True)
+        (folder / f"{i}.bin").write_bytes(b"same-%d" % (i % 4) * (i % 4 + 1))
+    return {"source_dir": str(source), "destination_dir": str(tmp_path / "dupes"), "use_cache": False}
+
+
+def test_shards_cover_all_files_and_plans_are_merged(nodes, params, monkeypatch):
+    monkeypatch.setattr(cluster, "OPERATIONS_PAGE_ROWS", 2)
+    single = dedupe_files(**shard_kwargs("dedupe_files", params))
+
+    report = run_sharded("dedupe_files", dict(params, dry_run=True), NODES, shards=4)
+
+    assert report["failed_shards"] == []
+    assert report["results"]["duplicate_count"] == single["duplicate_count"] == 8
+    assert report["results"]["group_count"] == single["group_count"]
+    assert load_plan(report["plan"]["plan_id"])["operations"] == 8
+    assert [run["node"] for run in report["runs"]] == NODES + NODES[:1]
+
+
+def test_failed_node_is_retried_elsewhere(nodes, params):
+    nodes.dead.add(NODES[0])
+
+    report = run_sharded("dedupe_files", dict(params, dry_run=True), NODES)
+
+    assert report["failed_shards"] == []
+    assert report["runs"][0]["node"] == NODES[1] and report["runs"][0]["attempts"] == 2
+    assert report["results"]["duplicate_count"] == 8
+
+
+def test_timed_out_shard_is_not_rerun_when_not_dry_run(nodes, params):
+    nodes.hang.add(NODES[1])
+
+    report = run_sharded("dedupe_files", dict(params, dry_run=False), NODES)
+
+    assert report["failed_shards"] == [1]
+    assert report["runs"][1]["may_still_run"] and report["runs"][1]["attempts"] == 1
+    assert "plan" not in report
+
+
+def test_merge_results_adds_counts_and_joins_lists():
+    merged = merge_results([{"moved": 1, "failed": ["a"], "stats": {"x": 1}, "plan": {}},
+                            {"moved": 2, "failed": ["b"], "stats": {"x": 2, "y": 1}}])
+
+    assert merged == {"moved": 3, "failed": ["a", "b"], "stats": {"x": 3, "y": 1}}
@@ -0,0 +1,127 @@
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+pytest.importorskip("patoolib")
+
+from app.workers.pre_process_script.decompress_recursively import decompress_stream, upload_spill_name  # noqa: E402
+
+
+class _Unseekable(io.RawIOBase):
+    """只能顺序写的流：zipfile 写入时只能用数据描述符，和 Java 等流式压缩工具的输出一样。"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+
+class _Chunked(io.RawIOBase):
+    """每次最多返回 n 字节，模拟分块到达的上传。"""
+
+    def __init__(self, data: bytes, n: int = 7):
+        self._data = memoryview(data)
+        self._n = n
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        size = self._n if size < 0 else min(size, self._n)
+        chunk, self._data = bytes(self._data[:size]), self._data[size:]
+        return chunk
+
+
+def _zip_bytes(members, unseekable=False, compression=zipfile.ZIP_DEFLATED) -> bytes:
+    target = _Unseekable() if unseekable else io.BytesIO()
+    with zipfile.ZipFile(target, "w", compression=compression) as archive:
+        for name, data in members:
+            if name.endswith("/"):
+                archive.writestr(zipfile.ZipInfo(name), b"")
+            else:
+                archive.writestr(name, data)
+    return bytes(target.buffer) if unseekable else target.getvalue()
+
+
+MEMBERS = [("a.txt", b"alpha" * 100), ("dir/", b""), ("dir/b.txt", b"bravo"), ("dir/sub/", b""),
+           ("dir/sub/c.jpg", b"\xff\xd8" + b"c" * 5000)]
+
+
+@pytest.mark.parametrize("compression", [zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED])
+def test_unseekable_zip_with_directories(tmp_path, compression):
+    data = _zip_bytes(MEMBERS, unseekable=True, compression=compression)
+    assert zipfile.ZipFile(io.BytesIO(data)).infolist()[1].flag_bits & 0x08
+
+    stats = decompress_stream(_Chunked(data), tmp_path / "out", "upload.zip")
+
+    assert stats["format"] == "zip" and stats["extracted"] == 3
+    assert (tmp_path / "out" / "a.txt").read_bytes() == b"alpha" * 100
+    assert (tmp_path / "out" / "dir" / "b.txt").read_bytes() == b"bravo"
+    assert (tmp_path / "out" / "dir" / "sub" / "c.jpg").read_bytes() == MEMBERS[-1][1]
+    assert stats["spilled_bytes"] == 0
+
+
+def test_keep_extensions_filter_and_unsafe_names(tmp_path):
+    data = _zip_bytes([("keep.jpg", b"j"), ("drop.txt", b"t"), ("../escape.jpg", b"x")])
+
+    stats = decompress_stream(io.BytesIO(data), tmp_path / "out", "upload.zip", keep_extensions={".jpg"})
+
+    assert sorted(p.name for p in (tmp_path / "out").iterdir()) == ["keep.jpg"]
+    assert stats["extracted"] == 1 and stats["skipped"] == 2
+    assert not (tmp_path / "escape.jpg").exists()
+
+
+def test_tar_gz_stream(tmp_path):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        for name, data in (("x/one.txt", b"1"), ("two.txt", b"22")):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+
+    stats = decompress_stream(_Chunked(buffer.getvalue(), 64), tmp_path / "out", "upload.tar.gz")
+
+    assert stats["format"] == "tar" and stats["extracted"] == 2
+    assert (tmp_path / "out" / "x" / "one.txt").read_bytes() == b"1"
+
+
+def test_nested_archives_from_this_upload_only(tmp_path):
+    output = tmp_path / "out"
+    output.mkdir()
+    existing = _zip_bytes([("old.txt", b"old")])
+    (output / "existing.zip").write_bytes(existing)
+    inner = _zip_bytes([("inner.txt", b"inner")])
+
+    stats = decompress_stream(io.BytesIO(_zip_bytes([("nested.zip", inner)])), output, "upload.zip")
+
+    assert stats["nested"] == 1
+    assert (output / "inner.txt").read_bytes() == b"inner"
+    assert not (output / "nested.zip").exists()
+    assert (output / "existing.zip").read_bytes() == existing
+    assert not (output / "old.txt").exists()
+
+
+def test_truncated_zip_raises_value_error(tmp_path):
+    data = _zip_bytes([("a.txt", b"a" * 10000)], compression=zipfile.ZIP_STORED)
+
+    with pytest.raises(ValueError):
+        decompress_stream(io.BytesIO(data[:200]), tmp_path / "out", "upload.zip")
+
+
+@pytest.mark.parametrize("filename, expected", [("data.ZIP", "upload.zip"), ("x/../a.tar.gz", "upload.tar.gz"),
+                                                ("C:\\up\\b.7z", "upload.7z"), ("noext", "upload")])
+def test_upload_spill_name(filename, expected):
+    assert upload_spill_name(filename) == expected
+
+
+@pytest.mark.parametrize("filename", [".", "..", "a/.."])
+def test_upload_spill_name_rejects_dot_names(filename):
+    with pytest.raises(ValueError):
+        upload_spill_name(filename)
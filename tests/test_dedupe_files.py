@@ -0,0 +1,107 @@
+import os
+
+import pytest
+
+from app.workers.pre_process_script import dedupe_files as dedupe
+from app.workers.pre_process_script.dedupe_files import PARTIAL_BLOCK, dedupe_files, find_duplicate_groups
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    path = tmp_path / "cache"
+    monkeypatch.setenv(dedupe.CACHE_DIR_ENV_VAR, str(path))
+    return path
+
+
+@pytest.fixture
+def hashed(monkeypatch):
+    """记录每次真正读取文件计算的哈希。"""
+    calls = []
+    partial, full = dedupe.partial_hash, dedupe.full_hash
+
+    def counting_partial(path, size):
+        calls.append(("partial", path))
+        return partial(path, size)
+
+    def counting_full(path):
+        calls.append(("full", path))
+        return full(path)
+
+    monkeypatch.setattr(dedupe, "partial_hash", counting_partial)
+    monkeypatch.setattr(dedupe, "full_hash", counting_full)
+    return calls
+
+
+def _write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_unique_sizes_are_never_read(tmp_path, hashed):
+    source = tmp_path / "source"
+    _write(source / "unique.bin", b"x" * 10)
+    first = _write(source / "a.bin", b"same")
+    second = _write(source / "sub" / "b.bin", b"same")
+
+    groups = list(find_duplicate_groups(source, workers=2, use_cache=False))
+
+    assert len(groups) == 1 and sorted([groups[0]["keep"], *groups[0]["duplicates"]]) == sorted([first, second])
+    assert {path for _, path in hashed} == {first, second}
+    # 不超过两块的文件，部分哈希已经是全量哈希
+    assert all(kind == "partial" for kind, _ in hashed)
+
+
+def test_same_head_and_tail_needs_full_hash(tmp_path, hashed):
+    source = tmp_path / "source"
+    head, tail = b"h" * PARTIAL_BLOCK, b"t" * PARTIAL_BLOCK
+    _write(source / "a.bin", head + b"1" * 10 + tail)
+    _write(source / "b.bin", head + b"2" * 10 + tail)
+
+    assert list(find_duplicate_groups(source, use_cache=False)) == []
+    assert sum(kind == "full" for kind, _ in hashed) == 2
+
+
+def test_copy_suffix_loses_to_original_and_parked_copies_are_kept(tmp_path):
+    source, destination = tmp_path / "source", tmp_path / "dupes"
+    _write(source / "receipt.jpg", b"r")
+    _write(source / "receipt(1).jpg", b"r")
+    _write(source / "receipt_2.jpg", b"r")
+    _write(destination / "receipt_2.jpg", b"parked earlier")
+
+    result = dedupe_files(source, destination, use_cache=False, dry_run=False)
+
+    assert result["moved"] == 2 and result["duplicate_count"] == 2
+    assert [path.name for path in source.iterdir()] == ["receipt.jpg"]
+    assert (destination / "receipt_2.jpg").read_bytes() == b"parked earlier"
+    assert sorted(path.name for path in destination.iterdir()) == ["receipt(1).jpg", "receipt_2(1).jpg", "receipt_2.jpg"]
+
+
+def test_dry_run_saves_plan_without_moving(tmp_path):
+    source = tmp_path / "source"
+    _write(source / "a.bin", b"same")
+    _write(source / "b.bin", b"same")
+
+    result = dedupe_files(source, tmp_path / "dupes", use_cache=False)
+
+    assert result["plan"]["operations"] == 1 and result["wasted_bytes"] == 4
+    assert len(list(source.iterdir())) == 2 and not (tmp_path / "dupes").exists()
+
+
+def test_hash_cache_is_reused_and_kept_outside_source(tmp_path, hashed, cache_dir):
+    source = tmp_path / "source"
+    _write(source / "a.bin", b"same")
+    _write(source / "b.bin", b"same")
+    list(find_duplicate_groups(source))
+    hashed.clear()
+
+    assert len(list(find_duplicate_groups(source))) == 1
+    assert hashed == []
+    assert [path.name for path in cache_dir.iterdir()] == [dedupe.cache_path(source).name]
+    assert sorted(path.name for path in source.iterdir()) == ["a.bin", "b.bin"]
+
+    # 只有内容变了（mtime 随之变化）的文件重新计算
+    _write(source / "b.bin", b"diff")
+    os.utime(source / "b.bin", ns=(0, 10 ** 9))
+    assert list(find_duplicate_groups(source)) == []
+    assert {path for _, path in hashed} == {str(source / "b.bin")}
@@ -0,0 +1,95 @@
+import os
+import time
+
+import pytest
+
+from app.core import fingerprints
+from app.core.fingerprints import FINGERPRINT_DIR_ENV_VAR, build_fingerprint, diff_fingerprints, prune_fingerprints
+from app.core.reports import iter_report
+
+
+@pytest.fixture(autouse=True)
+def fingerprint_dir(tmp_path, monkeypatch):
+    path = tmp_path / "fingerprints"
+    monkeypatch.setenv(FINGERPRINT_DIR_ENV_VAR, str(path))
+    monkeypatch.setattr(fingerprints, "_last_prune", 0.0)
+    return path
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "tree"
+    for relative, data in (("a.txt", b"a"), ("sub/b.txt", b"bb"), ("sub/deep/c.txt", b"ccc"), ("other/d.txt", b"d")):
+        path = root / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    return root
+
+
+def _stored_ids(directory):
+    return {path.stem for path in directory.glob("*.json")}
+
+
+def test_diff_reports_only_changed_paths(tree):
+    before = build_fingerprint(tree, content=True)
+    (tree / "sub" / "deep" / "c.txt").write_bytes(b"changed")
+    (tree / "a.txt").unlink()
+    (tree / "new").mkdir()
+    (tree / "new" / "e.txt").write_bytes(b"e")
+
+    after = build_fingerprint(tree, content=True)
+    diff = diff_fingerprints(before["fingerprint_id"], after["fingerprint_id"])
+
+    assert not diff["identical"]
+    assert diff["counts"] == {"added": 1, "removed": 1, "modified": 1}
+    rows = {(row["path"], row["change"]) for row in iter_report(diff["report"]["report_id"])}
+    assert rows == {("a.txt", "removed"), ("new", "added"), ("sub/deep/c.txt", "modified")}
+    assert after["reused"] == 2 and after["hashed"] == 2
+
+
+def test_identical_trees_have_same_root_hash(tree):
+    first = build_fingerprint(tree)
+    second = build_fingerprint(tree)
+
+    assert first["root_hash"] == second["root_hash"]
+    assert diff_fingerprints(first["fingerprint_id"], second["fingerprint_id"])["dirs_compared"] == 0
+
+
+def test_prune_keeps_latest_targets(tree, tmp_path, fingerprint_dir):
+    other = tmp_path / "other_tree"
+    other.mkdir()
+    old_ids = [build_fingerprint(tree)["fingerprint_id"] for _ in range(3)]
+    other_id = build_fingerprint(other)["fingerprint_id"]
+    # 把其他指纹都改成很久以前生成的
+    stale = time.time() - 30 * 24 * 3600
+    for path in fingerprint_dir.iterdir():
+        os.utime(path, (stale, stale))
+
+    removed = prune_fingerprints(max_age_hours=24)
+
+    assert removed == 2
+    assert _stored_ids(fingerprint_dir) == {old_ids[-1], other_id}
+    assert len(list(fingerprint_dir.glob("latest-*.txt"))) == 2
+
+
+def test_prune_by_count_and_dangling_latest(tree, fingerprint_dir):
+    ids = [build_fingerprint(tree, mtime=mtime)["fingerprint_id"] for mtime in (True, True, False)]
+
+    assert prune_fingerprints(max_count=1) == 1
+    assert _stored_ids(fingerprint_dir) == {ids[1], ids[2]}
+
+    for suffix in (".json", ".ndjson"):
+        (fingerprint_dir / f"{ids[2]}{suffix}").unlink()
+    prune_fingerprints()
+    assert len(list(fingerprint_dir.glob("latest-*.txt"))) == 1
+
+
+def test_build_prunes_old_fingerprints(tree, fingerprint_dir, monkeypatch):
+    first = build_fingerprint(tree, mtime=False)["fingerprint_id"]
+    build_fingerprint(tree, mtime=False)
+    monkeypatch.setenv(fingerprints.FINGERPRINT_MAX_COUNT_ENV_VAR, "1")
+    monkeypatch.setattr(fingerprints, "_last_prune", 0.0)
+
+    build_fingerprint(tree)
+
+    assert first not in _stored_ids(fingerprint_dir)
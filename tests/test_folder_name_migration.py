@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+from app.workers.pre_process_script.folder_name_migration import (apply_folder_renames, migrate_folder_names,
+                                                                   plan_folder_renames, rollback_folder_migration)
+
+SWAP_FIRST_TWO = [{"op": "swap", "index": 0, "index2": 1}]
+
+
+def _make_folders(root, names):
+    for name in names:
+        (root / name).mkdir(parents=True)
+        (root / name / "marker.txt").write_text(name, encoding="utf-8")
+
+
+def _names(root):
+    return sorted(path.name for path in root.iterdir() if not path.name.startswith("."))
+
+
+def test_duplicate_targets_are_conflicts(tmp_path):
+    _make_folders(tmp_path, ["a_x_1", "b_x_1"])
+
+    plan = plan_folder_renames(tmp_path, [{"op": "modify", "index": 0, "value": "c"}])
+
+    assert len(plan["conflicts"]) == 1
+    assert "目标名称相同" in plan["conflicts"][0]["reason"]
+
+
+def test_existing_target_is_a_conflict(tmp_path):
+    _make_folders(tmp_path, ["a_b"])
+    (tmp_path / "b_a").mkdir()
+
+    plan = plan_folder_renames(tmp_path, pattern=r"a_b", template="b_a")
+
+    assert plan["conflicts"] == [{"folder": str(tmp_path / "a_b"), "target": str(tmp_path / "b_a"),
+                                  "reason": "目标已存在"}]
+
+
+def test_conflicting_batch_is_not_executed(tmp_path):
+    _make_folders(tmp_path, ["a_x_1", "b_x_1"])
+
+    result = migrate_folder_names(tmp_path, [{"op": "modify", "index": 0, "value": "c"}], dry_run=False)
+
+    assert result["executed"] is False
+    assert _names(tmp_path) == ["a_x_1", "b_x_1"]
+    with pytest.raises(ValueError):
+        apply_folder_renames(result)
+
+
+def test_chained_renames_and_rollback(tmp_path):
+    # a_b -> b_a 与 b_a -> a_b 互换，需要经过临时名称
+    _make_folders(tmp_path, ["a_b", "b_a", "c_d"])
+
+    result = migrate_folder_names(tmp_path, SWAP_FIRST_TWO, dry_run=False)
+
+    assert result["executed"] and result["failed"] is None
+    assert _names(tmp_path) == ["a_b", "b_a", "d_c"]
+    assert (tmp_path / "a_b" / "marker.txt").read_text(encoding="utf-8") == "b_a"
+
+    journal = result["journal"].rsplit("/", 1)[-1]
+    rollback = rollback_folder_migration(tmp_path, journal)
+
+    assert rollback["failed"] is None and rollback["undone"] == rollback["total"]
+    assert _names(tmp_path) == ["a_b", "b_a", "c_d"]
+    assert (tmp_path / "a_b" / "marker.txt").read_text(encoding="utf-8") == "a_b"
+    with pytest.raises(ValueError):
+        rollback_folder_migration(tmp_path, journal)
+
+
+def test_rollback_stops_at_first_failure_and_resumes(tmp_path):
+    _make_folders(tmp_path, ["a_1", "b_2"])
+    result = migrate_folder_names(tmp_path, SWAP_FIRST_TWO, dry_run=False)
+    assert _names(tmp_path) == ["1_a", "2_b"]
+    journal = result["journal"].rsplit("/", 1)[-1]
+
+    # 有人占用了 b_2 原来的名称：回滚停在这一步，之前的步骤不受影响
+    (tmp_path / "b_2").mkdir()
+    first = rollback_folder_migration(tmp_path, journal)
+
+    assert first["failed"] is not None and first["failed"]["error"] == "原名称已被占用"
+    assert first["undone"] < first["total"]
+    records = [json.loads(line) for line in open(first["journal"], encoding="utf-8")]
+    assert not any(record["type"] == "rollback" for record in records)
+
+    (tmp_path / "b_2").rmdir()
+    second = rollback_folder_migration(tmp_path, journal)
+
+    assert second["failed"] is None and second["undone"] == second["total"]
+    assert _names(tmp_path) == ["a_1", "b_2"]
+
+
+def test_rollback_rejects_journal_paths(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        rollback_folder_migration(tmp_path, "../escape.jsonl")
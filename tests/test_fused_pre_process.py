@@ -0,0 +1,125 @@
+import io
+import threading
+import time
+import zipfile
+
+import pytest
+
+from app.core.streams import BoundedQueue
+
+
+def _put_in_thread(queue, item, size):
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault("ok", queue.put(item, size)))
+    thread.start()
+    return thread, result
+
+
+def test_put_waits_until_consumer_frees_budget():
+    queue = BoundedQueue(10)
+    assert queue.put("a", 8)
+    thread, result = _put_in_thread(queue, "b", 5)
+    time.sleep(0.1)
+    assert thread.is_alive()
+
+    assert queue.get() == "a"
+    thread.join(5)
+
+    assert result == {"ok": True} and queue.get() == "b"
+
+
+def test_held_items_count_until_released():
+    queue = BoundedQueue(10, hold=True)
+    queue.put("a", 8)
+    assert queue.get() == "a"
+    thread, _ = _put_in_thread(queue, "b", 5)
+    time.sleep(0.1)
+    assert thread.is_alive()
+
+    queue.release(8)
+    thread.join(5)
+    assert not thread.is_alive()
+
+
+def test_oversized_item_passes_when_queue_is_empty_and_reservations_count():
+    queue = BoundedQueue(10)
+    assert queue.put("big", 100)
+    assert queue.get() == "big"
+
+    assert queue.try_reserve(7)
+    assert not queue.try_reserve(4)
+    queue.unreserve(7)
+    assert queue.try_reserve(4)
+
+
+def test_close_wakes_producer_and_finish_ends_consumer():
+    queue = BoundedQueue(10)
+    queue.put("a", 10)
+    thread, result = _put_in_thread(queue, "b", 5)
+    queue.close()
+    thread.join(5)
+    assert result == {"ok": False}
+
+    other = BoundedQueue(10)
+    other.put("x", 1)
+    other.finish()
+    assert other.get() == "x" and other.get() is None
+
+
+def _zip_bytes(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def _pdf_bytes(pages):
+    fitz = pytest.importorskip("fitz")
+    doc = fitz.open()
+    for page_num in range(pages):
+        doc.new_page(width=200, height=200).insert_text((20, 40), f"page {page_num + 1}")
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+@pytest.fixture
+def fused():
+    pytest.importorskip("fitz")
+    pytest.importorskip("patoolib")
+    from app.workers.pre_process_script.fused_pre_process import fused_pre_process
+    return fused_pre_process
+
+
+def test_pipeline_writes_only_final_images(fused, tmp_path):
+    source, destination = tmp_path / "source", tmp_path / "final"
+    source.mkdir()
+    (source / "a.jpg").write_bytes(b"\xff\xd8a")
+    (source / "notes.txt").write_text("skip me")
+    inner = _zip_bytes({"c.jpg": b"\xff\xd8c", "d.pdf": _pdf_bytes(2), "e.txt": b"skip"})
+    (source / "b.zip").write_bytes(_zip_bytes({"b1.jpg": b"\xff\xd8b1", "inner.zip": inner}))
+    (source / "broken.zip").write_bytes(b"PK not really")
+
+    stats = fused(source, destination, {".jpg", ".pdf"}, dpi=36, workers=1)
+
+    # 按路径顺序编号：a.jpg, b.zip/b1.jpg, b.zip/inner.zip/c.jpg, b.zip/inner.zip/d.pdf
+    assert sorted(path.name for path in destination.iterdir()) == [
+        "0001.jpg", "0002.jpg", "0003.jpg", "0004_page1.jpg", "0004_page2.jpg"]
+    assert (destination / "0003.jpg").read_bytes() == b"\xff\xd8c"
+    assert stats["files"] == 4 and stats["images"] == 3 and stats["pdfs"] == 1 and stats["pages"] == 2
+    assert stats["skipped"] == 2
+    assert list(stats["failed"]) == ["broken.zip"]
+
+
+def test_large_members_spill_to_disk_within_budget(fused, tmp_path):
+    source, destination = tmp_path / "source", tmp_path / "final"
+    source.mkdir()
+    big = b"\xff\xd8" + b"x" * 5000
+    (source / "bundle.zip").write_bytes(_zip_bytes({f"{i}.jpg": big for i in range(5)}))
+
+    stats = fused(source, destination, {".jpg"}, workers=1, max_buffer_bytes=8000, start_counter=10)
+
+    assert sorted(path.name for path in destination.iterdir()) == [f"{i:04d}.jpg" for i in range(10, 15)]
+    assert all(path.read_bytes() == big for path in destination.iterdir())
+    assert stats["spilled_bytes"] == 5 * len(big)
@@ -0,0 +1,44 @@
+import pytest
+
+pytest.importorskip("httpx")
+
+from benchmarks.loadgen import SCENARIOS, _latency_summary, _percentile, compare_with_baseline, parse_mix  # noqa: E402
+
+
+def test_percentile_nearest_rank():
+    values = [float(i) for i in range(1, 101)]
+
+    assert _percentile(values, 50) == 50.0
+    assert _percentile(values, 99) == 99.0
+    assert _percentile(values, 100) == 100.0
+    assert _percentile([], 50) is None
+
+
+def test_latency_summary_in_milliseconds():
+    summary = _latency_summary([0.001, 0.002, 0.010])
+
+    assert summary == {"p50_ms": 2.0, "p95_ms": 10.0, "p99_ms": 10.0, "max_ms": 10.0}
+    assert _latency_summary([])["p99_ms"] is None
+
+
+def test_parse_mix():
+    assert parse_mix(None) == {s.name: s.weight for s in SCENARIOS}
+    assert parse_mix("metrics=3, shard_record") == {"metrics": 3.0, "shard_record": 1.0}
+    with pytest.raises(ValueError):
+        parse_mix("no_such_scenario=1")
+
+
+def _report(p95, p99, rps):
+    row = {"p95_ms": p95, "p99_ms": p99}
+    return {"overall": {**row, "throughput_rps": rps}, "scenarios": {"metrics": dict(row)}}
+
+
+def test_compare_with_baseline_flags_tail_and_throughput_regressions():
+    baseline = _report(10, 20, 100)
+
+    assert compare_with_baseline(_report(11, 23, 90), baseline, tolerance=0.2) == []
+    regressions = compare_with_baseline(_report(13, 20, 70), baseline, tolerance=0.2)
+
+    assert "overall: p95_ms 10 -> 13" in regressions
+    assert "metrics: p95_ms 10 -> 13" in regressions
+    assert "overall: throughput_rps 100 -> 70" in regressions
@@ -0,0 +1,122 @@
+import threading
+
+import pytest
+
+from app.core import metrics
+from app.core.metrics import Counter, Gauge, Histogram, MetricsRegistry, track_worker_run, worker_metrics
+
+
+@pytest.fixture
+def registry():
+    registry = MetricsRegistry()
+    return (registry,
+            registry.register(Counter("files_total", "files", ("worker",))),
+            registry.register(Histogram("duration_seconds", "duration", ("worker",), buckets=(0.1, 1))),
+            registry.register(Gauge("depth", "depth", ("pool",))))
+
+
+def test_render_uses_prometheus_text_format(registry):
+    registry, files, duration, depth = registry
+    files.inc(3, worker='a"b')
+    for value in (0.05, 0.5, 5):
+        duration.observe(value, worker="w")
+    depth.set(2, pool="cpu")
+
+    lines = registry.render().splitlines()
+
+    assert "# TYPE files_total counter" in lines
+    assert 'files_total{worker="a\\"b"} 3' in lines
+    assert lines[lines.index("# TYPE duration_seconds histogram") + 1:][:5] == [
+        'duration_seconds_bucket{worker="w",le="0.1"} 1',
+        'duration_seconds_bucket{worker="w",le="1"} 2',
+        'duration_seconds_bucket{worker="w",le="+Inf"} 3',
+        'duration_seconds_sum{worker="w"} 5.55',
+        'duration_seconds_count{worker="w"} 3',
+    ]
+    assert 'depth{pool="cpu"} 2' in lines
+
+
+def test_child_state_is_merged_without_gauges(registry):
+    registry, files, duration, depth = registry
+    child = MetricsRegistry()
+    child_files = child.register(Counter("files_total", "files", ("worker",)))
+    child_duration = child.register(Histogram("duration_seconds", "duration", ("worker",), buckets=(0.1, 1)))
+    child_depth = child.register(Gauge("depth", "depth", ("pool",)))
+    files.inc(1, worker="w")
+    child_files.inc(2, worker="w")
+    child_duration.observe(0.5, worker="w")
+    child_depth.set(9, pool="cpu")
+
+    registry.merge_state(child.export_state())
+
+    assert files.state() == {("w",): 3}
+    assert duration.state() == {("w",): [[0, 1], 0.5, 1]}
+    assert depth.state() == {}
+
+
+def test_render_during_concurrent_updates(registry):
+    registry, files, duration, _ = registry
+    stop = threading.Event()
+
+    def update():
+        i = 0
+        while not stop.is_set():
+            files.inc(worker=str(i % 500))
+            duration.observe(0.01, worker=str(i % 500))
+            i += 1
+
+    thread = threading.Thread(target=update)
+    thread.start()
+    try:
+        for _ in range(50):
+            registry.render()
+    finally:
+        stop.set()
+        thread.join()
+
+
+def test_worker_metrics_record_stages_and_runs():
+    metrics.REGISTRY.reset()
+    worker = worker_metrics("test_worker")
+    with track_worker_run("test_worker"):
+        with worker.stage("scan"):
+            worker.files(2)
+            worker.bytes_read(100)
+    with pytest.raises(RuntimeError), track_worker_run("test_worker"):
+        worker.error()
+        raise RuntimeError("boom")
+
+    text = metrics.render_metrics()
+
+    assert 'worker_files_processed_total{worker="test_worker"} 2' in text
+    assert 'worker_bytes_read_total{worker="test_worker"} 100' in text
+    assert 'worker_errors_total{worker="test_worker"} 1' in text
+    assert 'worker_stage_duration_seconds_count{worker="test_worker",stage="scan"} 1' in text
+    assert 'worker_runs_total{worker="test_worker",outcome="ok"} 1' in text
+    assert 'worker_runs_total{worker="test_worker",outcome="error"} 1' in text
+
+
+def test_metrics_endpoint_reports_route_templates():
+    fastapi = pytest.importorskip("fastapi")
+    pytest.importorskip("httpx")
+    from fastapi.testclient import TestClient
+
+    from app.apis.metrics import metrics_middleware, router
+
+    metrics.REGISTRY.reset()
+    app = fastapi.FastAPI()
+    app.middleware("http")(metrics_middleware)
+    app.include_router(router)
+
+    @app.get("/items/{item_id}")
+    def item(item_id: int):
+        return {"id": item_id}
+
+    client = TestClient(app)
+    client.get("/items/1")
+    client.get("/items/2")
+    response = client.get("/metrics")
+
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'http_requests_total{method="GET",path="/items/{item_id}",status="200"} 2' in response.text
+    assert 'http_request_duration_seconds_count{method="GET",path="/items/{item_id}"} 2' in response.text
@@ -0,0 +1,108 @@
+import os
+import time
+
+import pytest
+
+from app.core import reports
+from app.core.ndjson import dumps, loads, read_lines, read_page
+from app.core.reports import ReportWriter, iter_report, prune_reports, report_path
+
+
+def _report(rows):
+    with ReportWriter() as writer:
+        for row in rows:
+            writer.write(row)
+    return writer.summary()
+
+
+def test_pages_cover_every_row_once():
+    summary = _report({"i": i, "name": f"文件{i}"} for i in range(25))
+    path = report_path(summary["report_id"])
+
+    rows, cursor, pages = [], 0, 0
+    while cursor is not None:
+        lines, cursor = read_page(path, cursor, limit=10)
+        rows.extend(loads(line) for line in lines)
+        pages += 1
+
+    assert summary["rows"] == 25 and pages == 3
+    assert rows == list(iter_report(summary["report_id"]))
+    assert rows[3] == {"i": 3, "name": "文件3"}
+
+
+def test_exact_page_boundary_ends_without_cursor():
+    path = report_path(_report({"i": i} for i in range(4))["report_id"])
+
+    lines, cursor = read_page(path, 0, limit=4)
+
+    assert len(lines) == 4 and cursor is None
+
+
+def test_cursor_must_point_at_a_line_start():
+    path = report_path(_report({"i": i} for i in range(3))["report_id"])
+    second = len(dumps({"i": 0}))
+
+    assert [loads(line) for line in read_lines(path, second)] == [{"i": 1}, {"i": 2}]
+    for cursor in (second + 1, -1, path.stat().st_size + 1):
+        with pytest.raises(ValueError):
+            list(read_lines(path, cursor))
+
+
+def test_report_ids_are_validated():
+    with pytest.raises(ValueError):
+        report_path("../etc/passwd")
+    with pytest.raises(FileNotFoundError):
+        report_path("0" * 32)
+
+
+def test_prune_reports_by_age_and_count():
+    ids = [_report([{"i": i}])["report_id"] for i in range(3)]
+    stale = time.time() - 30 * 24 * 3600
+    os.utime(report_path(ids[0]), (stale, stale))
+    for rank, report_id in enumerate(ids[1:], start=1):
+        recent = time.time() - 100 + rank
+        os.utime(report_path(report_id), (recent, recent))
+
+    assert prune_reports(max_age_hours=24) == 1
+    assert prune_reports(max_count=1) == 1
+    assert [path.stem for path in reports.report_dir().glob("*.ndjson")] == [ids[2]]
+
+
+@pytest.fixture
+def client():
+    fastapi = pytest.importorskip("fastapi")
+    pytest.importorskip("httpx")
+    from fastapi.testclient import TestClient
+
+    from app.apis.reports import router
+
+    app = fastapi.FastAPI()
+    app.include_router(router)
+    return TestClient(app)
+
+
+def test_report_endpoint_streams_and_pages(client):
+    rows = [{"i": i, "pad": "x" * 1000} for i in range(200)]
+    report_id = _report(rows)["report_id"]
+
+    streamed = client.get(f"/reports/{report_id}")
+    assert streamed.headers["content-type"] == "application/x-ndjson"
+    assert [loads(line) for line in streamed.content.splitlines()] == rows
+
+    paged, cursor = [], None
+    while True:
+        response = client.get(f"/reports/{report_id}", params={"limit": 64, **({"cursor": cursor} if cursor else {})})
+        paged.extend(loads(line) for line in response.content.splitlines())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert paged == rows
+
+
+def test_report_endpoint_errors(client):
+    report_id = _report([{"i": 0}, {"i": 1}])["report_id"]
+
+    assert client.get(f"/reports/{report_id}", params={"cursor": "3"}).status_code == 400
+    assert client.get(f"/reports/{report_id}", params={"cursor": "abc"}).status_code == 400
+    assert client.get(f"/reports/{report_id}", params={"limit": 0}).status_code == 422
+    assert client.get(f"/reports/{'0' * 32}").status_code == 404
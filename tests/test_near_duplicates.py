@@ -0,0 +1,62 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+
+from app.core.plans import load_plan  # noqa: E402
+from app.core.reports import iter_report  # noqa: E402
+from app.workers.TrainValTest.近重复与泄漏检测 import (  # noqa: E402
+    detect_near_duplicates, find_near_duplicate_pairs, hamming_distance)
+
+
+def _save_gradient(path, seed):
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 256, size=(8, 9), dtype=np.uint8)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.fromarray(pixels, "L").resize((90, 80), Image.NEAREST).save(path, "JPEG", quality=95)
+
+
+@pytest.fixture
+def splits(tmp_path):
+    train, val = tmp_path / "train", tmp_path / "val"
+    _save_gradient(train / "a.jpg", 1)
+    _save_gradient(train / "a_copy.jpg", 1)
+    _save_gradient(val / "a_leak.jpg", 1)
+    _save_gradient(train / "b.jpg", 2)
+    _save_gradient(val / "c.jpg", 3)
+    return {"train": str(train), "val": str(val)}
+
+
+def test_hash_file_without_suffix_is_saved_as_npy(splits, tmp_path):
+    hash_file = tmp_path / "hashes" / "dhash"
+
+    result = detect_near_duplicates(splits, hash_file=str(hash_file), workers=1)
+
+    saved = np.load(hash_file.with_suffix(".npy"))
+    paths = hash_file.with_suffix(".txt").read_text(encoding="utf-8").split()
+    assert len(saved) == len(paths) == result["scanned"] == 5
+    assert not hash_file.exists()
+
+
+def test_cross_split_group_is_reported_and_regrouped_in_plan(splits):
+    result = detect_near_duplicates(splits, workers=1, regroup=True, dry_run=True)
+
+    assert result["group_count"] == 1 and result["leak_count"] == 1
+    group = next(iter_report(result["report"]["report_id"]))
+    assert group["home"] == "train" and group["splits"] == {"train": 2, "val": 1}
+    assert result["moved"] == 1
+    assert load_plan(result["plan"]["plan_id"])["operations"] == 1
+
+
+def test_pairs_within_distance_are_found():
+    hashes = np.array([0, 0b111, 2 ** 64 - 1, 0b1], dtype=np.uint64)
+
+    pairs = set(find_near_duplicate_pairs(hashes, max_distance=3))
+
+    assert pairs == {(0, 1), (0, 3), (1, 3)}
+    assert list(hamming_distance(hashes[:1], hashes[1:2])) == [3]
+
+
+def test_max_distance_is_validated(splits):
+    with pytest.raises(ValueError):
+        detect_near_duplicates(splits, max_distance=64)
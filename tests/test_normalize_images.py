@@ -0,0 +1,63 @@
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+from app.core import throttle  # noqa: E402
+from app.workers.pre_process_script.normalize_images import normalize_images  # noqa: E402
+
+
+def _save(path, size, fmt, mode="RGB"):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.new(mode, size, "red").save(path, fmt)
+
+
+@pytest.fixture
+def images(tmp_path):
+    source = tmp_path / "source"
+    _save(source / "big.jpg", (400, 100), "JPEG")
+    _save(source / "sub" / "small.png", (50, 80), "PNG", mode="RGBA")
+    _save(source / "upper.JPG", (300, 300), "JPEG")
+    return source
+
+
+def _sizes(root):
+    return {path.relative_to(root).as_posix(): Image.open(path).size for path in sorted(root.rglob("*"))
+            if path.is_file()}
+
+
+def test_long_edge_and_rerun_skips(images, tmp_path):
+    output = tmp_path / "output"
+
+    first = normalize_images(images, output, long_edge=200, workers=2, chunk_size=1)
+    second = normalize_images(images, output, long_edge=200, workers=2, chunk_size=1)
+
+    assert _sizes(output) == {"big.jpg": (200, 50), "sub/small.jpg": (50, 80), "upper.jpg": (200, 200)}
+    assert first["normalized"] == 3 and not first["failed"]
+    assert second["skipped"] == 3 and second["normalized"] == 0
+
+
+def test_in_place_replaces_sources_with_jpg(images):
+    result = normalize_images(images, images, long_edge=200, workers=1)
+
+    assert not result["failed"]
+    assert _sizes(images) == {"big.jpg": (200, 50), "sub/small.jpg": (50, 80), "upper.jpg": (200, 200)}
+
+
+def test_colliding_targets_are_reported(images, tmp_path):
+    _save(images / "big.png", (10, 10), "PNG")
+
+    result = normalize_images(images, tmp_path / "output", workers=1)
+
+    assert list(result["failed"]) == [str(images / "big.png")]
+    assert Image.open(tmp_path / "output" / "big.jpg").size == (400, 100)
+
+
+def test_writes_are_charged_to_throttle(images, tmp_path, monkeypatch):
+    charged = {"ops": 0, "bytes": 0}
+    monkeypatch.setattr(throttle, "consume_ops", lambda count=1: charged.__setitem__("ops", charged["ops"] + count))
+    monkeypatch.setattr(throttle, "consume_bytes", lambda count: charged.__setitem__("bytes", charged["bytes"] + count))
+
+    result = normalize_images(images, tmp_path / "output", workers=1, chunk_size=1)
+
+    assert charged == {"ops": 3, "bytes": result["bytes_written"]}
+    assert result["bytes_written"] == sum(path.stat().st_size for path in (tmp_path / "output").rglob("*.jpg"))
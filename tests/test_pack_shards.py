@@ -0,0 +1,105 @@
+import json
+import tarfile
+
+import pytest
+
+from app.workers.TrainValTest.打包成分片 import INDEX_FILENAME, INDEX_RECORD, pack_dataset_shards
+
+
+@pytest.fixture
+def splits(tmp_path):
+    dirs = {}
+    for split, count in (("train", 5), ("eval", 2)):
+        root = tmp_path / split
+        (root / "sub").mkdir(parents=True)
+        for i in range(count):
+            (root / f"工行_{i}_回单.jpg").write_bytes(b"\xff\xd8" + bytes([i]) * (100 + i))
+        (root / "sub" / "建行_x_凭证.jpg").write_bytes(b"\xff\xd8sub")
+        (root / "bad.jpg").write_bytes(b"\xff\xd8")
+        dirs[split] = str(root)
+    return dirs
+
+
+def _pack(splits, output, **kwargs):
+    return pack_dataset_shards(splits, str(output), max_shard_records=kwargs.pop("max_shard_records", 4),
+                               dry_run=False, **kwargs)
+
+
+def _shard_files(output):
+    return sorted(path.name for path in output.iterdir() if path.name != INDEX_FILENAME)
+
+
+def test_index_records_point_at_image_bytes(splits, tmp_path):
+    output = tmp_path / "shards"
+    index = _pack(splits, output)
+
+    assert index["malformed"] == 2 and index["generation"] == 1
+    assert [shard["records"] for shard in index["splits"]["train"]["shards"]] == [4, 2]
+    shard = output / index["splits"]["train"]["shards"][0]["name"]
+    idx = shard.with_suffix(".idx").read_bytes()
+    keys = shard.with_suffix(".keys").read_text(encoding="utf-8").splitlines()
+    data = shard.read_bytes()
+    with tarfile.open(shard) as tar:
+        members = {member.name: tar.extractfile(member).read() for member in tar}
+    for i, key in enumerate(keys):
+        offset, size, _ = INDEX_RECORD.unpack_from(idx, i * INDEX_RECORD.size)
+        assert data[offset:offset + size] == members[f"{key}.jpg"]
+        assert json.loads(members[f"{key}.json"])["key"] == key
+    assert "sub%2F建行_x_凭证" in keys
+
+
+def test_repack_publishes_new_generation_and_keeps_previous(splits, tmp_path):
+    output = tmp_path / "shards"
+    first = _pack(splits, output)
+    first_names = {shard["name"] for info in first["splits"].values() for shard in info["shards"]}
+
+    second = _pack(splits, output, max_shard_records=100)
+
+    assert second["generation"] == 2
+    assert json.loads((output / INDEX_FILENAME).read_text(encoding="utf-8"))["generation"] == 2
+    # 上一代仍在，按旧索引打开的读取端可以读完
+    assert all((output / name).is_file() for name in first_names)
+
+    third = _pack(splits, output, max_shard_records=100)
+
+    assert third["generation"] == 3
+    assert _shard_files(output) == sorted(f"{split}-g{g:06d}-000000.{ext}" for split in ("train", "eval")
+                                          for g in (2, 3) for ext in ("idx", "keys", "tar"))
+
+
+def test_legacy_shard_names_are_removed(splits, tmp_path):
+    output = tmp_path / "shards"
+    output.mkdir()
+    for ext in ("tar", "idx", "keys"):
+        (output / f"train-000000.{ext}").write_bytes(b"old")
+    (output / "trainee-000000.tar").write_bytes(b"not ours")
+
+    _pack(splits, output)
+
+    assert not any(name.startswith("train-000000") for name in _shard_files(output))
+    assert (output / "trainee-000000.tar").exists()
+
+
+@pytest.mark.parametrize("split", ["../x", "a/b", "", "a.b"])
+def test_unsafe_split_names_are_rejected(splits, tmp_path, split):
+    with pytest.raises(ValueError):
+        _pack({split: splits["train"]}, tmp_path / "shards")
+    assert not (tmp_path / "shards").exists()
+
+
+def test_schema_rejects_unsafe_split_names():
+    pytest.importorskip("pydantic")
+    from pydantic import ValidationError
+
+    from app.workers.TrainValTest.schemas import PackShardsRequest
+
+    assert PackShardsRequest(split_dirs={"train-1": "x"}, destination_path="y").split_dirs == {"train-1": "x"}
+    with pytest.raises(ValidationError):
+        PackShardsRequest(split_dirs={"../x": "x"}, destination_path="y")
+
+
+def test_dry_run_writes_nothing(splits, tmp_path):
+    index = pack_dataset_shards(splits, str(tmp_path / "shards"), max_shard_records=4)
+
+    assert [shard["name"] for shard in index["splits"]["eval"]["shards"]] == ["eval-g000001-000000.tar"]
+    assert not (tmp_path / "shards").exists()
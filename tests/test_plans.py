@@ -0,0 +1,121 @@
+import json
+import os
+
+import pytest
+
+from app.core.plans import _operations_path, create_plan, execute_plan, load_plan, planned_operation
+
+
+def _make_files(root, names):
+    root.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for name in names:
+        path = root / name
+        path.write_bytes(name.encode())
+        paths.append(path)
+    return paths
+
+
+def test_execute_applies_planned_moves(tmp_path):
+    src = _make_files(tmp_path / "src", ["a.jpg", "b.jpg"])
+    dst_dir = tmp_path / "dst"
+    plan = create_plan("test", {"dst": dst_dir}, [planned_operation("move", p, dst_dir / p.name) for p in src])
+
+    result = execute_plan(plan["plan_id"])
+
+    assert result["applied"] == 2
+    assert not result["stale"] and not result["conflicts"] and not result["errors"]
+    assert sorted(p.name for p in dst_dir.iterdir()) == ["a.jpg", "b.jpg"]
+    assert load_plan(plan["plan_id"])["status"] == "executed"
+
+
+def test_plan_executes_only_once(tmp_path):
+    (src,) = _make_files(tmp_path / "src", ["a.jpg"])
+    plan = create_plan("test", {}, [planned_operation("copy", src, tmp_path / "dst" / "a.jpg")])
+    execute_plan(plan["plan_id"])
+
+    with pytest.raises(ValueError):
+        execute_plan(plan["plan_id"])
+
+
+def test_changed_and_missing_sources_are_stale(tmp_path):
+    changed, missing, fine = _make_files(tmp_path / "src", ["changed.jpg", "missing.jpg", "fine.jpg"])
+    dst_dir = tmp_path / "dst"
+    plan = create_plan("test", {}, [planned_operation("move", p, dst_dir / p.name) for p in (changed, missing, fine)])
+    changed.write_bytes(b"different size now")
+    missing.unlink()
+
+    result = execute_plan(plan["plan_id"])
+
+    assert result["applied"] == 1
+    assert {(item["src"], item["reason"]) for item in result["stale"]} == {
+        (str(changed), "changed"), (str(missing), "missing")}
+    assert changed.exists()
+    assert (dst_dir / "fine.jpg").exists()
+
+
+def test_occupied_destination_is_a_conflict(tmp_path):
+    (src,) = _make_files(tmp_path / "src", ["a.jpg"])
+    dst = tmp_path / "dst" / "a.jpg"
+    plan = create_plan("test", {}, [planned_operation("move", src, dst)])
+    dst.parent.mkdir()
+    dst.write_bytes(b"someone else")
+
+    result = execute_plan(plan["plan_id"])
+
+    assert result["applied"] == 0
+    assert result["conflicts"] == [{"src": str(src), "dst": str(dst)}]
+    assert src.exists() and dst.read_bytes() == b"someone else"
+
+
+def test_tampered_operations_are_rejected(tmp_path):
+    a, b = _make_files(tmp_path / "src", ["a.jpg", "b.jpg"])
+    plan = create_plan("test", {}, [planned_operation("move", p, tmp_path / "dst" / p.name) for p in (a, b)])
+    operations = _operations_path(plan["plan_id"])
+    # 截掉最后一条操作：操作文件与计划头的指纹不再一致
+    lines = operations.read_bytes().splitlines(keepends=True)
+    operations.write_bytes(b"".join(lines[:-1]))
+
+    with pytest.raises(ValueError):
+        execute_plan(plan["plan_id"])
+    assert a.exists() and b.exists()
+    assert load_plan(plan["plan_id"])["status"] == "planned"
+
+
+def test_fingerprint_ignores_operation_order(tmp_path):
+    a, b = _make_files(tmp_path / "src", ["a.jpg", "b.jpg"])
+    operations = [planned_operation("move", p, tmp_path / "dst" / p.name) for p in (a, b)]
+
+    forward = create_plan("test", {}, operations)
+    backward = create_plan("test", {}, list(reversed(operations)))
+
+    assert forward["fingerprint"] == backward["fingerprint"]
+    assert forward["operations"] == 2
+    assert os.path.exists(_operations_path(forward["plan_id"]))
+
+
+@pytest.mark.parametrize("field, value", [("row", {"name": "9999.jpg"}), ("path", "elsewhere.ndjson")])
+def test_tampered_record_is_rejected(tmp_path, field, value):
+    (src,) = _make_files(tmp_path / "src", ["a.jpg"])
+    mapping = tmp_path / "mapping.ndjson"
+    plan = create_plan("test", {}, [planned_operation("copy", src, tmp_path / "dst" / "0001.jpg",
+                                                      record=mapping, row={"name": "0001.jpg"})])
+    operations = _operations_path(plan["plan_id"])
+    operation = json.loads(operations.read_bytes())
+    operation["record"][field] = str(tmp_path / value) if field == "path" else value
+    operations.write_text(json.dumps(operation) + "\n", encoding="utf-8")
+
+    with pytest.raises(ValueError):
+        execute_plan(plan["plan_id"])
+    assert not (tmp_path / "dst").exists() and not mapping.exists()
+
+
+def test_record_row_is_appended_after_execute(tmp_path):
+    (src,) = _make_files(tmp_path / "src", ["a.jpg"])
+    mapping = tmp_path / "mapping.ndjson"
+    plan = create_plan("test", {}, [planned_operation("copy", src, tmp_path / "dst" / "0001.jpg",
+                                                      record=mapping, row={"name": "0001.jpg"})])
+
+    execute_plan(plan["plan_id"])
+
+    assert [json.loads(line) for line in mapping.read_text(encoding="utf-8").splitlines()] == [{"name": "0001.jpg"}]
@@ -0,0 +1,72 @@
+import os
+import threading
+import time
+
+import pytest
+
+from app.workers import prewarm
+from app.workers.prewarm import PrewarmedWorkerPool, execute_worker
+
+# 子进程按 "模块名:函数名" 解析 worker；spawn 的子进程沿用本进程的 sys.path，可以导入本测试模块
+MODULE = __name__
+
+
+def echo(value):
+    return value
+
+
+def slow_echo(value, seconds):
+    time.sleep(seconds)
+    return value
+
+
+def crash():
+    os._exit(3)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    instance = PrewarmedWorkerPool(2)
+    instance.start()
+    monkeypatch.setattr(prewarm, "_pool", instance)
+    yield instance
+    instance.shutdown()
+
+
+def test_runs_worker_in_child_process(pool):
+    assert execute_worker(f"{MODULE}:echo", value=[1, "a"]) == [1, "a"]
+    assert execute_worker(f"{MODULE}:echo", in_pool=False, value=5) == 5
+
+
+def test_crashing_job_fails_alone_and_pool_recovers(pool):
+    with pytest.raises(RuntimeError):
+        execute_worker(f"{MODULE}:crash")
+
+    assert pool.generation == 2
+    assert execute_worker(f"{MODULE}:echo", value="after") == "after"
+
+
+def test_jobs_running_beside_a_crash_are_retried(pool):
+    results = {}
+
+    def run_slow():
+        results["slow"] = execute_worker(f"{MODULE}:slow_echo", value="slow", seconds=1.0)
+
+    thread = threading.Thread(target=run_slow)
+    thread.start()
+    time.sleep(0.3)
+    with pytest.raises(RuntimeError):
+        execute_worker(f"{MODULE}:crash")
+    thread.join(30)
+
+    assert results == {"slow": "slow"}
+
+
+def test_restart_is_skipped_for_stale_generation_and_closed_pool(pool):
+    executor = pool._executor
+    pool.restart(pool.generation + 1)
+    assert pool._executor is executor
+
+    pool.shutdown()
+    pool.restart(pool.generation)
+    assert pool._executor is None
@@ -0,0 +1,100 @@
+import os
+import time
+
+import pytest
+
+from app.core import profiling
+from app.core.profiling import PROFILE_DIR_ENV_VAR, ProfileSession, profiling_session, prune_profiles
+from app.workers.pre_process_script.dedupe_files import dedupe_files
+
+
+@pytest.fixture(autouse=True)
+def profile_dir(tmp_path, monkeypatch):
+    path = tmp_path / "profiles"
+    monkeypatch.setenv(PROFILE_DIR_ENV_VAR, str(path))
+    monkeypatch.setattr(profiling, "_last_prune", 0.0)
+    return path
+
+
+def _span_names(session):
+    return {span["name"] for span in session.spans}
+
+
+def _saved_ids(directory):
+    return {path.name.split(".")[0] for path in directory.iterdir()}
+
+
+def test_dedupe_records_stage_spans(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    for name in ("a.bin", "b.bin", "c.bin"):
+        (source / name).write_bytes(b"same")
+
+    session = ProfileSession()
+    with profiling_session(session):
+        dedupe_files(source, tmp_path / "dupes", use_cache=False, dry_run=False)
+
+    assert {"scan", "partial_hash", "move"} <= _span_names(session)
+    assert session.to_speedscope()["profiles"]
+
+
+def test_decompress_records_stage_spans(tmp_path):
+    pytest.importorskip("patoolib")
+    import zipfile
+
+    from app.workers.pre_process_script.decompress_recursively import decompress_recursively
+
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "plain.txt").write_text("x")
+    with zipfile.ZipFile(source / "bundle.zip", "w") as archive:
+        archive.writestr("inner.txt", "y")
+
+    session = ProfileSession()
+    with profiling_session(session):
+        decompress_recursively(source, tmp_path / "out")
+
+    assert {"scan", "copy", "extract", "nested"} <= _span_names(session)
+
+
+def test_no_spans_without_session(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "a.bin").write_bytes(b"a")
+
+    assert profiling.current_session() is None
+    assert dedupe_files(source, tmp_path / "dupes", use_cache=False)["duplicate_count"] == 0
+
+
+def test_prune_profiles_by_age_and_count(profile_dir):
+    sessions = [ProfileSession() for _ in range(4)]
+    for session in sessions:
+        session.save(profiling.profile_dir())
+    stale = time.time() - 30 * 24 * 3600
+    for path in profile_dir.glob(f"{sessions[0].job_id}*"):
+        os.utime(path, (stale, stale))
+    (profile_dir / "notes.txt").write_text("keep")
+
+    assert prune_profiles(max_age_hours=24) == 1
+    for i, session in enumerate(sessions[1:], start=1):
+        newer = time.time() - 100 + i
+        for path in profile_dir.glob(f"{session.job_id}*"):
+            os.utime(path, (newer, newer))
+    assert prune_profiles(max_count=2) == 1
+
+    assert _saved_ids(profile_dir) == {sessions[2].job_id, sessions[3].job_id, "notes"}
+
+
+def test_save_prunes_old_profiles(profile_dir, monkeypatch):
+    first = ProfileSession()
+    first.save()
+    stale = time.time() - 3600
+    for path in profile_dir.iterdir():
+        os.utime(path, (stale, stale))
+    monkeypatch.setenv(profiling.PROFILE_MAX_COUNT_ENV_VAR, "1")
+    monkeypatch.setattr(profiling, "_last_prune", 0.0)
+
+    second = ProfileSession()
+    second.save()
+
+    assert _saved_ids(profile_dir) == {second.job_id}
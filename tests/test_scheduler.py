@@ -0,0 +1,165 @@
+import asyncio
+import os
+import pathlib
+import threading
+import time
+
+import pytest
+
+from app.workers import scheduler
+from app.workers.registry import registry
+from app.workers.scheduler import CPU, IO, JobScheduler, SchedulerBusy, infer_paths, run_worker_async
+
+
+@pytest.fixture
+def sched(monkeypatch):
+    instance = JobScheduler(cpu_slots=1, io_slots_per_device=8, max_waiting=2)
+    monkeypatch.setattr(scheduler, "_scheduler", instance)
+    yield instance
+    instance.shutdown()
+
+
+class Gate:
+    """任务开始时记录顺序，然后阻塞到 open()。"""
+
+    def __init__(self, order, name):
+        self.order = order
+        self.name = name
+        self.started = threading.Event()
+        self._release = threading.Event()
+
+    def __call__(self):
+        self.order.append(self.name)
+        self.started.set()
+        assert self._release.wait(5)
+        return self.name
+
+    def open(self):
+        self._release.set()
+
+
+def _wait_started(*gates):
+    for gate in gates:
+        assert gate.started.wait(5)
+
+
+def test_infer_paths_skips_cache_and_state_dirs(tmp_path):
+    paths = infer_paths({"source_dir": tmp_path / "src", "output_folder": str(tmp_path / "out"),
+                         "split_dirs": {"train": str(tmp_path / "train")},
+                         "cache_dir": tmp_path / "cache", "hash_file": str(tmp_path / "h.npy"),
+                         "dry_run": False, "prefix": "x"})
+
+    assert sorted(paths) == sorted(os.path.normcase(str(tmp_path / name)) for name in ("src", "out", "train"))
+
+
+def test_exclusive_jobs_on_overlapping_paths_run_one_at_a_time(sched, tmp_path):
+    order = []
+    parent, child, other = Gate(order, "parent"), Gate(order, "child"), Gate(order, "other")
+
+    first = sched.submit("a", parent, resource=IO, paths=[tmp_path / "data"])
+    second = sched.submit("b", child, resource=IO, paths=[tmp_path / "data" / "sub"])
+    third = sched.submit("c", other, resource=IO, paths=[tmp_path / "elsewhere"])
+    _wait_started(parent, other)
+
+    assert not child.started.is_set()
+    parent.open()
+    _wait_started(child)
+    child.open(), other.open()
+    assert [f.result(5) for f in (first, second, third)] == ["parent", "child", "other"]
+
+
+def test_shared_jobs_run_together_but_not_past_waiting_exclusive(sched, tmp_path):
+    order = []
+    reader1, writer, reader2 = Gate(order, "reader1"), Gate(order, "writer"), Gate(order, "reader2")
+
+    sched.submit("r1", reader1, resource=IO, paths=[tmp_path], exclusive=False)
+    sched.submit("w", writer, resource=IO, paths=[tmp_path])
+    sched.submit("r2", reader2, resource=IO, paths=[tmp_path], exclusive=False)
+    _wait_started(reader1)
+
+    # 排队的独占任务挡住后到的共享任务，不会被源源不断的读取饿死
+    assert not reader2.started.is_set()
+    reader1.open()
+    _wait_started(writer)
+    writer.open()
+    _wait_started(reader2)
+    reader2.open()
+    assert order == ["reader1", "writer", "reader2"]
+
+
+def test_cpu_slots_and_priority(sched):
+    order = []
+    running, low, high = Gate(order, "running"), Gate(order, "low"), Gate(order, "high")
+
+    sched.submit("x", running, resource=CPU)
+    _wait_started(running)
+    sched.submit("low", low, resource=CPU, priority=-5)
+    sched.submit("high", high, resource=CPU, priority=5)
+    assert [job["name"] for job in sched.status()["queued"]] == ["high", "low"]
+
+    running.open()
+    _wait_started(high)
+    high.open()
+    _wait_started(low)
+    low.open()
+    assert order == ["running", "high", "low"]
+
+
+def test_blocking_jobs_over_limit_are_rejected(sched):
+    gate = Gate([], "running")
+    sched.submit("x", gate, resource=CPU)
+    _wait_started(gate)
+    for _ in range(2):
+        sched.submit("queued", lambda: None, resource=CPU, blocking=True)
+
+    with pytest.raises(SchedulerBusy):
+        sched.submit("rejected", lambda: None, resource=CPU, blocking=True)
+    assert len(sched.status()["queued"]) == 2
+    gate.open()
+
+
+def test_async_worker_holds_path_lock_until_done(sched, tmp_path, monkeypatch):
+    output = tmp_path / "out"
+    events = []
+
+    async def fake_classify(source_dir: pathlib.Path, output_dir: pathlib.Path, dry_run: bool):
+        events.append("classify start")
+        await asyncio.sleep(0.2)
+        events.append("classify end")
+        return {"labels": {}}
+
+    monkeypatch.setitem(registry._resolved, "fake_classify", fake_classify)
+
+    async def scenario():
+        task = asyncio.create_task(run_worker_async("fake_classify", source_dir=tmp_path / "src",
+                                                    output_dir=output, dry_run=False))
+        await asyncio.sleep(0.05)
+        mover = sched.submit("mover", lambda: events.append("mover"), resource=IO, paths=[output])
+        result = await task
+        await asyncio.wrap_future(mover)
+        return result
+
+    assert asyncio.run(scenario()) == {"labels": {}}
+    assert events == ["classify start", "classify end", "mover"]
+
+
+def test_async_worker_waits_for_running_job(sched, tmp_path, monkeypatch):
+    gate = Gate([], "mover")
+    sched.submit("mover", gate, resource=IO, paths=[tmp_path / "out"])
+    _wait_started(gate)
+    started = []
+
+    async def fake_classify(output_dir: pathlib.Path, dry_run: bool):
+        started.append(time.perf_counter())
+        return "done"
+
+    monkeypatch.setitem(registry._resolved, "fake_classify", fake_classify)
+
+    async def scenario():
+        task = asyncio.create_task(run_worker_async("fake_classify", output_dir=tmp_path / "out", dry_run=True))
+        await asyncio.sleep(0.1)
+        assert not started
+        gate.open()
+        return await task
+
+    assert asyncio.run(scenario()) == "done"
@@ -0,0 +1,59 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+
+from app.core.plans import load_plan  # noqa: E402
+from app.core.reports import iter_report  # noqa: E402
+from app.workers.pre_process_script.screen_image_quality import (  # noqa: E402
+    _decode_batch, _score_arrays, compute_quality_metrics, screen_image_quality)
+
+
+def _save_noise(path, size, seed=0):
+    pixels = np.random.default_rng(seed).integers(0, 256, size=(size[1], size[0]), dtype=np.uint8)
+    Image.fromarray(pixels, "L").save(path)
+
+
+def test_tall_receipt_keeps_its_aspect_ratio(tmp_path):
+    receipt, small = tmp_path / "receipt.png", tmp_path / "small.png"
+    _save_noise(receipt, (200, 2000))
+    _save_noise(small, (40, 30))
+
+    arrays, decoded, failed = _decode_batch([str(receipt), str(small)], 256)
+
+    assert decoded == [str(receipt), str(small)] and failed == {}
+    assert arrays[0].shape == (256, 26)
+    # 比 decode_size 小的图片不放大
+    assert arrays[1].shape == (30, 40)
+
+
+def test_mixed_sizes_are_scored_in_original_order(tmp_path):
+    rng = np.random.default_rng(1)
+    arrays = [rng.uniform(0, 255, shape).astype(np.float32) for shape in ((20, 10), (8, 8), (20, 10))]
+
+    scores = _score_arrays(arrays)
+
+    for i, array in enumerate(arrays):
+        expected = compute_quality_metrics(array[None])
+        for name in ("white_ratio", "blur", "contrast"):
+            assert scores[name][i] == pytest.approx(float(expected[name][0]))
+
+
+def test_blank_receipt_is_planned_for_move(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    Image.new("L", (300, 3000), 255).save(source / "blank.png")
+    receipt = np.full((3000, 300), 255, dtype=np.uint8)
+    for top in range(0, 3000, 60):
+        receipt[top:top + 30, 20:280] = 0
+    Image.fromarray(receipt, "L").save(source / "receipt.png")
+    (source / "broken.png").write_bytes(b"not a png")
+
+    result = screen_image_quality(source, tmp_path / "rejects", workers=1, dry_run=True)
+
+    assert result["counts"] == {"blank": 1}
+    assert list(result["failed"]) == [str(source / "broken.png")]
+    rows = list(iter_report(result["report"]["report_id"]))
+    assert rows[0]["path"] == str(source / "blank.png") and rows[0]["target"].endswith("blank.png")
+    assert load_plan(result["plan"]["plan_id"])["operations"] == 1
+    assert (source / "blank.png").exists()
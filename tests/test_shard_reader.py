@@ -0,0 +1,82 @@
+import pickle
+
+import pytest
+
+from app.workers.TrainValTest.打包成分片 import INDEX_RECORD, pack_dataset_shards
+from app.workers.TrainValTest.读取分片 import ShardDatasetReader, get_reader
+
+
+@pytest.fixture
+def splits(tmp_path):
+    dirs = {}
+    for split, count in (("train", 5), ("eval", 2)):
+        root = tmp_path / split
+        root.mkdir()
+        for i in range(count):
+            (root / f"工行_{split}{i}_回单.jpg").write_bytes(b"\xff\xd8" + split.encode() + bytes([i]) * 50)
+        dirs[split] = str(root)
+    return dirs
+
+
+def _pack(splits, output, max_shard_records=2):
+    return pack_dataset_shards(splits, str(output), max_shard_records=max_shard_records, dry_run=False)
+
+
+def _expected(splits):
+    return {f"工行_{split}{i}_回单": b"\xff\xd8" + split.encode() + bytes([i]) * 50
+            for split, count in (("train", 5), ("eval", 2)) for i in range(count)}
+
+
+def test_reads_every_record_by_index_and_key(splits, tmp_path):
+    output = tmp_path / "shards"
+    _pack(splits, output)
+    reader = ShardDatasetReader(str(output))
+    expected = _expected(splits)
+
+    assert len(reader) == 7 and reader.splits == {"train": (0, 5), "eval": (5, 7)}
+    for i in range(len(reader)):
+        key = reader.key(i)
+        assert bytes(reader.get(i)) == bytes(reader.get_by_key(key)) == expected[key]
+        assert reader.label(i) == ("工行", "回单")
+    with pytest.raises(IndexError):
+        reader.get(7)
+    assert len(pickle.loads(pickle.dumps(reader))) == 7
+    reader.close()
+
+
+def test_reader_reloads_after_old_generation_is_removed(splits, tmp_path):
+    output = tmp_path / "shards"
+    _pack(splits, output)
+    reader = ShardDatasetReader(str(output))
+    # 再打包两次后第一代分片已被清理，读取器持有的旧索引指向不存在的文件
+    _pack(splits, output, max_shard_records=10)
+    _pack(splits, output, max_shard_records=10)
+
+    assert bytes(reader.get(6)) == _expected(splits)[reader.key(6)]
+    assert reader.index["generation"] == 3
+    assert reader._layout.shards[0].tar_path.name == "train-g000003-000000.tar"
+
+
+def test_idx_shorter_than_index_is_detected(splits, tmp_path):
+    output = tmp_path / "shards"
+    index = _pack(splits, output)
+    idx_path = (output / index["splits"]["train"]["shards"][0]["name"]).with_suffix(".idx")
+    idx_path.write_bytes(idx_path.read_bytes()[:INDEX_RECORD.size])
+    reader = ShardDatasetReader(str(output))
+
+    # 重新加载后仍然对不上，说明目录本身不一致，报错而不是读出越界的字节
+    with pytest.raises(ValueError):
+        reader.get(1)
+    assert bytes(reader.get(2)) == _expected(splits)[reader.key(2)]
+
+
+def test_get_reader_switches_to_new_index(splits, tmp_path):
+    output = tmp_path / "shards"
+    _pack(splits, output)
+    first = get_reader(str(output))
+    assert get_reader(str(output)) is first
+
+    _pack({"train": splits["train"]}, output)
+
+    second = get_reader(str(output))
+    assert second is not first and len(second) == 5
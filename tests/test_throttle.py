@@ -0,0 +1,91 @@
+import errno
+import os
+import time
+
+import pytest
+
+from app.core import throttle
+from app.core.throttle import Throttle, TokenBucket, current_throttle, register_throttle, unregister_throttle
+
+
+@pytest.fixture
+def limited():
+    """本用例内生效的请求限速，用完注销。"""
+    limit = Throttle("test", bytes_per_sec=None, ops_per_sec=None)
+    register_throttle(limit)
+    token = current_throttle.set(limit)
+    yield limit
+    current_throttle.reset(token)
+    unregister_throttle(limit)
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(rate=100, burst=10)
+    assert bucket.consume(10) < 0.01
+
+    waited = bucket.consume(5)
+
+    assert 0.03 < waited < 0.5
+
+
+def test_token_bucket_allows_requests_larger_than_burst():
+    bucket = TokenBucket(rate=1000, burst=10)
+
+    assert bucket.consume(50) < 0.01
+    # 欠下的 40 个令牌由下一次调用等待补齐
+    assert bucket.consume(1) > 0.03
+
+
+def test_unlimited_bucket_never_waits():
+    assert TokenBucket().consume(10 ** 9) == 0.0
+
+
+def test_move_replaces_existing_destination(tmp_path):
+    src, dst = tmp_path / "a.jpg", tmp_path / "b.jpg"
+    src.write_bytes(b"new")
+    dst.write_bytes(b"old")
+
+    throttle.move(src, dst)
+
+    assert dst.read_bytes() == b"new" and not src.exists()
+
+
+@pytest.mark.parametrize("error", [errno.EXDEV, errno.EEXIST])
+def test_move_falls_back_to_copy_when_rename_fails(tmp_path, monkeypatch, limited, error):
+    src, dst = tmp_path / "a.jpg", tmp_path / "b.jpg"
+    src.write_bytes(b"x" * 1000)
+    os.utime(src, ns=(0, 10 ** 9))
+
+    def failing_replace(a, b):
+        raise OSError(error, os.strerror(error))
+
+    monkeypatch.setattr(throttle.os, "replace", failing_replace)
+    limited.set_limits(bytes_per_sec=10 ** 6, ops_per_sec=None)
+    charged = []
+    monkeypatch.setattr(limited, "consume_bytes", charged.append)
+
+    throttle.move(src, dst)
+
+    assert dst.read_bytes() == b"x" * 1000 and not src.exists()
+    assert dst.stat().st_mtime_ns == 10 ** 9
+    assert sum(charged) == 1000
+
+
+def test_copy_is_paced_by_request_throttle(tmp_path, limited, monkeypatch):
+    monkeypatch.setattr(throttle, "COPY_CHUNK", 100)
+    src = tmp_path / "a.bin"
+    src.write_bytes(b"y" * 3000)
+    limited.set_limits(bytes_per_sec=2000, ops_per_sec=None)
+
+    started = time.monotonic()
+    throttle.copy(src, tmp_path / "b.bin")
+
+    assert (tmp_path / "b.bin").read_bytes() == b"y" * 3000
+    # 第一秒的量（burst）立即放行，剩下的 1000 字节按 2000 B/s 约需 0.5 秒
+    assert 0.3 < time.monotonic() - started < 2
+
+
+def test_duplicate_throttle_id_is_rejected(limited):
+    with pytest.raises(ValueError):
+        register_throttle(Throttle("test"))
+    assert throttle.active_throttles()["test"]["name"] == "test"
@@ -0,0 +1,95 @@
+import json
+import os
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+from app.core import thumbnails  # noqa: E402
+from app.core.thumbnails import INDEX_FILENAME, ThumbnailCache, list_images, output_folders  # noqa: E402
+
+
+@pytest.fixture
+def folder(tmp_path):
+    root = tmp_path / "images"
+    root.mkdir()
+    for i in range(4):
+        Image.new("RGB", (800, 400 + i), "blue").save(root / f"工行_{i}_回单.jpg", "JPEG")
+    (root / "broken.png").write_bytes(b"not an image")
+    (root / "notes.txt").write_text("x", encoding="utf-8")
+    return root
+
+
+def _jpgs(folder):
+    return [path for path in list_images(folder) if path.suffix == ".jpg"]
+
+
+def test_get_renders_once_then_hits(folder, tmp_path):
+    cache = ThumbnailCache(tmp_path / "cache")
+    source = _jpgs(folder)[0]
+
+    key, path = cache.get(source, 128)
+    again, _ = cache.get(source, 128)
+
+    assert key == again and (cache.hits, cache.misses) == (1, 1)
+    assert max(Image.open(path).size) == 128
+
+
+def test_changed_source_misses(folder, tmp_path):
+    cache = ThumbnailCache(tmp_path / "cache")
+    source = _jpgs(folder)[0]
+    key, _ = cache.get(source)
+
+    os.utime(source, ns=(0, 0))
+
+    assert cache.get(source)[0] != key
+
+
+def test_ensure_uses_spawn_pool_and_skips_cached(folder, tmp_path, monkeypatch):
+    contexts = []
+    real_pool = thumbnails.ProcessPoolExecutor
+
+    def recording_pool(*args, **kwargs):
+        contexts.append(kwargs.get("mp_context").get_start_method())
+        return real_pool(*args, **kwargs)
+
+    monkeypatch.setattr(thumbnails, "ProcessPoolExecutor", recording_pool)
+    cache = ThumbnailCache(tmp_path / "cache")
+    cache.get(_jpgs(folder)[0])
+
+    stats = cache.ensure(list_images(folder), workers=2)
+
+    assert contexts == ["spawn"]
+    assert stats["images"] == 5 and stats["generated"] == 3 and stats["cached"] == 1
+    assert list(stats["failed"]) == [str(folder / "broken.png")]
+    saved = json.loads((tmp_path / "cache" / INDEX_FILENAME).read_text(encoding="utf-8"))
+    assert len(saved) == 4
+
+
+def test_eviction_keeps_recently_used(folder, tmp_path):
+    cache = ThumbnailCache(tmp_path / "cache")
+    sources = _jpgs(folder)
+    first_key, first_path = cache.get(sources[0])
+    cache.max_bytes = first_path.stat().st_size * 2
+
+    for source in sources[1:]:
+        cache.get(source)
+
+    assert cache.total_bytes <= cache.max_bytes
+    assert not first_path.exists() and first_key not in cache.entries
+    assert cache.path_of(cache.get(sources[3])[0]).exists()
+
+
+def test_index_written_on_flush(folder, tmp_path):
+    cache = ThumbnailCache(tmp_path / "cache")
+    cache.get(_jpgs(folder)[0])
+    assert not (tmp_path / "cache" / INDEX_FILENAME).exists()
+
+    cache.flush()
+
+    assert len(ThumbnailCache(tmp_path / "cache").entries) == 1
+
+
+def test_output_folders():
+    assert output_folders("normalize_images", {"destination_dir": "/x", "source_dir": "/y"})[0].as_posix() == "/x"
+    assert output_folders("dedupe_files", {"destination_dir": "/x"}) == []